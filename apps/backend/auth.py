@@ -0,0 +1,227 @@
+"""
+Clerk session authentication, verified locally.
+
+The frontend sends the Clerk session token as `Authorization: Bearer …`.
+It is verified (RS256) against the instance's JWKS, which is held in
+memory: fetched once, refreshed in the background every
+JWKS_REFRESH_INTERVAL, and re-fetched early (at most once per
+JWKS_MIN_REFETCH) when a token names a key id we have not seen — that is
+how a key rotation shows up. Verified claims are memoized until the token
+expires, and the caller's User row (id + role) for ROLE_CACHE_TTL, so an
+authenticated request normally costs two dict lookups.
+"""
+
+import asyncio
+import os
+import time
+from typing import NamedTuple, Optional
+
+import httpx
+from fastapi import Depends, Header, HTTPException
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from database import async_session
+from metrics import http_client
+from models import User
+from response_cache import invalidate_on_commit
+
+CLERK_ISSUER = os.getenv("CLERK_ISSUER", "").rstrip("/")  # e.g. https://clerk.modeststyle.pk
+CLERK_JWKS_URL = os.getenv("CLERK_JWKS_URL", f"{CLERK_ISSUER}/.well-known/jwks.json" if CLERK_ISSUER else "")
+# Origins allowed in the token's `azp` claim (comma separated); empty accepts any
+CLERK_AUTHORIZED_PARTIES = [p.strip() for p in os.getenv("CLERK_AUTHORIZED_PARTIES", "").split(",") if p.strip()]
+# Clerk user ids that are made admins the first time they sign in
+ADMIN_CLERK_IDS = {i.strip() for i in os.getenv("ADMIN_CLERK_IDS", "").split(",") if i.strip()}
+JWKS_REFRESH_INTERVAL = int(os.getenv("JWKS_REFRESH_INTERVAL", "3600"))  # seconds
+JWKS_MIN_REFETCH = 30  # seconds between refetches triggered by unknown key ids
+ROLE_CACHE_TTL = int(os.getenv("AUTH_ROLE_CACHE_TTL", "60"))  # seconds a role change takes to apply
+CLAIMS_CACHE_SIZE = 10_000
+LEEWAY = 5  # seconds of clock skew tolerated on exp/nbf
+
+
+class AuthError(Exception):
+    pass
+
+
+class Principal(NamedTuple):
+    """The authenticated caller — what routes get instead of a session-bound User."""
+    id: str  # users.id
+    clerk_id: str
+    email: str
+    role: str
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == "admin"
+
+
+# ─── JWKS ────────────────────────────────────────────────────────
+class JWKSCache:
+    def __init__(self, url: str = CLERK_JWKS_URL, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.url = url
+        self.transport = transport  # tests pass an ASGITransport serving a local key set
+        self.keys: dict[str, object] = {}
+        self.fetched_at = 0.0  # monotonic
+        self.fetches = 0
+        self._lock = asyncio.Lock()
+
+    async def refresh(self):
+        if not self.url:
+            raise AuthError("Authentication is not configured")
+        async with http_client(self.transport, timeout=10.0) as client:
+            res = await client.get(self.url)
+            res.raise_for_status()
+        import jwt  # PyJWT and cryptography load on first use — they are a large share of a cold start
+
+        keys = {}
+        for jwk in res.json().get("keys", []):
+            if jwk.get("kid") and jwk.get("use", "sig") == "sig":
+                keys[jwk["kid"]] = jwt.PyJWK(jwk).key
+        self.keys = keys  # swapped whole, readers never see a partial set
+        self.fetched_at = time.monotonic()
+        self.fetches += 1
+
+    async def get(self, kid: Optional[str]):
+        key = self.keys.get(kid)
+        if key is not None:
+            return key
+        async with self._lock:  # one fetch however many requests carry the new kid
+            key = self.keys.get(kid)
+            if key is None and (not self.fetches or time.monotonic() - self.fetched_at >= JWKS_MIN_REFETCH):
+                try:
+                    await self.refresh()
+                except httpx.HTTPError as e:
+                    raise AuthError(f"Could not fetch signing keys: {e}") from e
+                key = self.keys.get(kid)
+        if key is None:
+            raise AuthError("Unknown signing key")
+        return key
+
+
+jwks = JWKSCache()
+
+
+async def jwks_refresh_loop():
+    """Background task run by worker.py."""
+    while True:
+        if jwks.url:
+            try:
+                await jwks.refresh()
+            except Exception:
+                pass  # keep the keys we have; unknown kids still trigger a refetch
+        await asyncio.sleep(JWKS_REFRESH_INTERVAL)
+
+
+# ─── Tokens ──────────────────────────────────────────────────────
+_claims_cache: dict[str, dict] = {}
+
+
+def _remember(token: str, claims: dict):
+    if len(_claims_cache) >= CLAIMS_CACHE_SIZE:
+        now = time.time()
+        for t in [t for t, c in _claims_cache.items() if c["exp"] <= now]:
+            del _claims_cache[t]
+        if len(_claims_cache) >= CLAIMS_CACHE_SIZE:
+            _claims_cache.clear()
+    _claims_cache[token] = claims
+
+
+async def verify_token(token: str) -> dict:
+    """Claims of a valid Clerk session token; AuthError otherwise."""
+    claims = _claims_cache.get(token)
+    if claims is not None:
+        if claims["exp"] + LEEWAY > time.time():
+            return claims
+        del _claims_cache[token]
+    import jwt
+
+    try:
+        kid = jwt.get_unverified_header(token).get("kid")
+        claims = jwt.decode(
+            token,
+            await jwks.get(kid),
+            algorithms=["RS256"],
+            issuer=CLERK_ISSUER or None,
+            leeway=LEEWAY,
+            options={"require": ["exp", "sub"], "verify_iss": bool(CLERK_ISSUER)},
+        )
+    except jwt.PyJWTError as e:
+        raise AuthError(str(e)) from e
+    if CLERK_AUTHORIZED_PARTIES and claims.get("azp") not in CLERK_AUTHORIZED_PARTIES:
+        raise AuthError("Token was issued for another origin")
+    # nbf is in the past once verified, so only exp needs re-checking on a cache hit
+    _remember(token, claims)
+    return claims
+
+
+# ─── Users ───────────────────────────────────────────────────────
+_principals: dict[str, tuple[Principal, float]] = {}  # clerk id → (principal, monotonic expiry)
+
+
+def forget_user(clerk_id: str):
+    """Drop a cached role (call after changing User.role)."""
+    _principals.pop(clerk_id, None)
+
+
+async def _load_principal(claims: dict) -> Principal:
+    clerk_id = claims["sub"]
+    async with async_session() as db:
+        user = await db.scalar(select(User).where(User.clerk_id == clerk_id))
+        if user is None:
+            user = User(
+                clerk_id=clerk_id,
+                email=claims.get("email", ""),
+                name=claims.get("name", ""),
+                role="admin" if clerk_id in ADMIN_CLERK_IDS else "user",
+            )
+            db.add(user)
+            invalidate_on_commit(db, "users")
+            try:
+                await db.commit()
+            except IntegrityError:
+                await db.rollback()  # created by a concurrent request
+                user = await db.scalar(select(User).where(User.clerk_id == clerk_id))
+        return Principal(user.id, user.clerk_id, user.email, user.role or "user")
+
+
+async def principal_for(claims: dict) -> Principal:
+    cached = _principals.get(claims["sub"])
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+    principal = await _load_principal(claims)
+    _principals[principal.clerk_id] = (principal, time.monotonic() + ROLE_CACHE_TTL)
+    return principal
+
+
+# ─── Dependencies ────────────────────────────────────────────────
+def _bearer(authorization: Optional[str]) -> Optional[str]:
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(401, "Expected a Bearer token")
+    return token.strip()
+
+
+async def optional_user(authorization: Optional[str] = Header(None)) -> Optional[Principal]:
+    """The signed-in user, or None for guests. A token that fails verification is a 401."""
+    token = _bearer(authorization)
+    if token is None:
+        return None
+    try:
+        claims = await verify_token(token)
+    except AuthError as e:
+        raise HTTPException(401, f"Invalid session: {e}")
+    return await principal_for(claims)
+
+
+async def current_user(user: Optional[Principal] = Depends(optional_user)) -> Principal:
+    if user is None:
+        raise HTTPException(401, "Sign in required")
+    return user
+
+
+async def require_admin(user: Principal = Depends(current_user)) -> Principal:
+    if not user.is_admin:
+        raise HTTPException(403, "Admin access required")
+    return user
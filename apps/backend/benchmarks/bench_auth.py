@@ -0,0 +1,108 @@
+"""
+Benchmark: Clerk session verification cost, and its correctness checks.
+
+    python -m benchmarks.bench_auth [--requests 20000]
+
+Uses a locally generated key set served by benchmarks/fake_clerk.py.
+Checks that valid tokens pass and expired, foreign-key, wrong-issuer and
+tampered ones fail; that a key rotation costs exactly one JWKS fetch even
+under a burst of concurrent requests; then reports the cost of the auth
+dependency per request — first sight of a token (signature check + user
+row) vs. every request after (memoized claims + cached role).
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+from benchmarks.fixtures import create_schema, scratch_database
+
+DATABASE_URL = scratch_database("bench_auth")
+
+import httpx  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import rsa  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+
+import auth  # noqa: E402
+from benchmarks.fake_clerk import ISSUER, LocalKeySet, create_app  # noqa: E402
+from database import engine  # noqa: E402
+
+TARGET_CACHED_US = 50
+
+
+async def rejected(authorization: str) -> bool:
+    try:
+        await auth.optional_user(authorization)
+    except HTTPException as e:
+        return e.status_code == 401
+    return False
+
+
+async def run_all(n: int) -> bool:
+    await create_schema()
+
+    keys = LocalKeySet()
+    fake = create_app(keys)
+    auth.CLERK_ISSUER = ISSUER
+    auth.jwks = auth.JWKSCache("http://clerk.local/.well-known/jwks.json", transport=httpx.ASGITransport(app=fake))
+    auth.JWKS_MIN_REFETCH = 0
+    checks = {}
+
+    token = keys.token("user_bench")
+    checks["valid token accepted"] = (await auth.optional_user(f"Bearer {token}")).clerk_id == "user_bench"
+    checks["expired rejected"] = await rejected(f"Bearer {keys.token('user_bench', ttl=-60)}")
+    stranger = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    checks["foreign key rejected"] = await rejected(f"Bearer {keys.token('user_bench', private=stranger)}")
+    checks["wrong issuer rejected"] = await rejected(f"Bearer {keys.token('user_bench', iss='https://evil.example')}")
+    head, body, sig = token.split(".")
+    checks["tampered rejected"] = await rejected(f"Bearer {head}.{body}x.{sig}")
+    checks["not bearer rejected"] = await rejected(f"Basic {token}")
+
+    before = fake.state.requests
+    keys.rotate()
+    burst = [keys.token(f"user_{i}") for i in range(50)]
+    await asyncio.gather(*(auth.optional_user(f"Bearer {t}") for t in burst))
+    checks["rotation: one JWKS fetch for 50 concurrent requests"] = fake.state.requests - before == 1
+    checks["old key still accepted after rotation"] = (await auth.optional_user(f"Bearer {token}")) is not None
+
+    # First sight of a token: signature check (+ user row for new users)
+    fresh = [keys.token("user_bench") for _ in range(min(n, 2000))]
+    start = time.perf_counter()
+    for t in fresh:
+        await auth.optional_user(f"Bearer {t}")
+    first_us = (time.perf_counter() - start) / len(fresh) * 1e6
+
+    # Every request after: memoized claims + cached principal
+    header = f"Bearer {token}"
+    samples = []
+    for _ in range(n):
+        t = time.perf_counter()
+        await auth.optional_user(header)
+        samples.append(time.perf_counter() - t)
+    await engine.dispose()
+
+    q = statistics.quantiles(samples, n=100)
+    print()
+    for name, ok in checks.items():
+        print(f"  {'ok  ' if ok else 'FAIL'} {name}")
+    print(f"\n  JWKS fetches   {fake.state.requests}")
+    print(f"  first sight    {first_us:,.0f} µs/token (RS256 verify)")
+    print(f"  cached         p50 {q[49] * 1e6:.1f} µs  p99 {q[98] * 1e6:.1f} µs over {n:,} requests")
+    ok = all(checks.values()) and q[49] * 1e6 <= TARGET_CACHED_US
+    print(f"  target cached p50 ≤{TARGET_CACHED_US} µs: {'PASS' if ok else 'FAIL'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"database: {DATABASE_URL}")
+    sys.exit(0 if asyncio.run(run_all(args.requests)) else 1)
+
+
+if __name__ == "__main__":
+    main()
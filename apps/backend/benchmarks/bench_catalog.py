@@ -0,0 +1,101 @@
+"""
+Benchmark: catalog mirror sync + /api/products latency.
+
+    python -m benchmarks.bench_catalog [--products 5000] [--queries 2000]
+
+Syncs from the local Sanity stand-in (benchmarks/fake_sanity.py), then runs
+a mix of filtered/faceted/sorted listing queries and reports p50/p95/p99
+for the index alone and through the full ASGI app.
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import httpx
+
+import catalog
+from benchmarks.fake_sanity import create_app as create_fake_sanity
+from benchmarks.fixtures import COLORS, MATERIALS, OCCASIONS, SIZES, CATEGORIES, make_products
+from catalog_mirror import SORTS, product_mirror
+
+
+def percentiles(samples: list[float]) -> str:
+    q = statistics.quantiles(samples, n=100)
+    return f"p50 {q[49] * 1e3:.3f} ms  p95 {q[94] * 1e3:.3f} ms  p99 {q[98] * 1e3:.3f} ms"
+
+
+def random_query(rng: random.Random) -> dict:
+    params: dict = {"sort": rng.choice(SORTS), "limit": 24, "offset": rng.choice([0, 0, 0, 24, 48])}
+    if rng.random() < 0.7:
+        params["category"] = [rng.choice(list(CATEGORIES))]
+    if rng.random() < 0.3:
+        params["material"] = [rng.choice(MATERIALS)]
+    if rng.random() < 0.3:
+        params["size"] = rng.sample(SIZES, 2)
+    if rng.random() < 0.4:
+        params["color"] = [rng.choice(COLORS)[0]]
+    if rng.random() < 0.2:
+        params["occasion"] = [rng.choice(OCCASIONS)]
+    if rng.random() < 0.3:
+        params["minPrice"] = rng.choice([0, 1000, 2000, 5000])
+        params["maxPrice"] = params["minPrice"] + rng.choice([1500, 3000, 6000])
+    if rng.random() < 0.1:
+        params["filter"] = rng.choice(["new", "bestseller"])
+    return params
+
+
+async def run(n_products: int, n_queries: int):
+    fake = create_fake_sanity(make_products(n_products))
+    catalog.SANITY_API_URL = "http://sanity.local"
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=fake)) as client:
+        start = time.perf_counter()
+        await catalog.sync_catalog(client, full=True)
+        print(f"full sync: {n_products:,} products in {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+        start = time.perf_counter()
+        product_mirror.query({})
+        print(f"index build: {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+        for i in range(10):
+            fake.state.touch({**fake.state.products[f"product-{i}"], "price": 999})
+        await catalog.sync_catalog(client)  # primes the ETag for the current state
+        start = time.perf_counter()
+        applied = await catalog.sync_catalog(client)
+        print(f"unchanged poll: {applied} docs, {(time.perf_counter() - start) * 1e3:.2f} ms (304)")
+
+    rng = random.Random(3)
+    queries = [random_query(rng) for _ in range(n_queries)]
+
+    samples = []
+    for params in queries:
+        filters = {k: params.get(k, []) for k in ("category", "material", "size", "color", "occasion")}
+        start = time.perf_counter()
+        product_mirror.query(filters, params.get("minPrice"), params.get("maxPrice"),
+                             params.get("filter"), params["sort"], params["limit"], params["offset"])
+        samples.append(time.perf_counter() - start)
+    print(f"index query ({n_queries:,}): {percentiles(samples)}")
+
+    import main
+    samples = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://api") as client:
+        for params in queries:
+            start = time.perf_counter()
+            resp = await client.get("/api/products", params=params)
+            samples.append(time.perf_counter() - start)
+            resp.raise_for_status()
+    print(f"GET /api/products ({n_queries:,}): {percentiles(samples)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run(args.products, args.queries))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark: response compression — CPU cost vs bytes saved.
+
+    python -m benchmarks.bench_compression [--seconds 0.5] [--link-kbps 1000]
+
+Encodes realistic responses (admin order lists, a product listing page
+with facets, the full catalog, search results) with gzip and Brotli at
+the levels compression.py uses, and reports ratio, compress time, and the
+transfer time saved on a slow mobile link. Then pushes a large body
+through CompressionMiddleware while a ticker measures event-loop stalls,
+with and without the worker-thread offload.
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI
+
+import compression
+from benchmarks.bench_json import make_orders, new_path
+from benchmarks.fixtures import make_products
+from catalog_mirror import product_mirror
+from compression import CompressionMiddleware, compress
+from responses import FastJSONResponse, dumps
+
+
+def payloads() -> dict[str, bytes]:
+    products = make_products(5000)
+    product_mirror.load(products)
+    return {
+        "admin orders ×50": new_path(make_orders(50, random.Random(1))),
+        "admin orders ×500": new_path(make_orders(500, random.Random(2))),
+        "products page (24 + facets)": dumps(product_mirror.query({}, sort="newest", limit=24, offset=0)),
+        "search results ×20": dumps({"query": "abaya", "products": products[:20]}),
+        "full catalog ×5,000": dumps(products),
+    }
+
+
+def timed(fn, seconds: float) -> float:
+    runs, start = 0, time.perf_counter()
+    while runs == 0 or time.perf_counter() - start < seconds:
+        fn()
+        runs += 1
+    return (time.perf_counter() - start) / runs
+
+
+def cost_table(seconds: float, link_kbps: float):
+    codings = ["gzip"] + (["br"] if compression.brotli is not None else [])
+    if compression.brotli is None:
+        print("(brotli not installed — gzip only)")
+    bytes_per_ms = link_kbps * 1000 / 8 / 1000
+    print(f"\n{'response':30} {'size':>10} {'coding':>6} {'ratio':>7} {'cpu ms':>8} {'saved':>10} {'link ms saved':>14}")
+    for name, body in payloads().items():
+        for coding in codings:
+            out = compress(body, coding)
+            cpu = timed(lambda: compress(body, coding), seconds) * 1e3
+            saved = len(body) - len(out)
+            print(
+                f"{name:30} {len(body) / 1024:>8.1f}Ki {coding:>6} {len(body) / len(out):>6.1f}x"
+                f" {cpu:>8.2f} {saved / 1024:>8.1f}Ki {saved / bytes_per_ms:>14,.0f}"
+            )
+
+
+async def loop_stall(body: dict, offload_size: int, requests: int = 5) -> tuple[float, float]:
+    """(worst event-loop gap ms, mean request ms) while compressing `body` through the middleware."""
+    app = FastAPI()
+
+    @app.get("/big")
+    async def big():
+        return FastJSONResponse(body)
+
+    wrapped = CompressionMiddleware(app, offload_size=offload_size)
+    worst, running = 0.0, True
+
+    async def ticker():
+        nonlocal worst
+        last = time.perf_counter()
+        while running:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            worst = max(worst, now - last - 0.001)
+            last = now
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0.005)  # ticker running before the first request
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=wrapped), base_url="http://t") as client:
+        start = time.perf_counter()
+        for _ in range(requests):
+            res = await client.get("/big", headers={"Accept-Encoding": "gzip"})
+            assert res.headers["content-encoding"] == "gzip"
+        elapsed = (time.perf_counter() - start) / requests
+    running = False
+    await tick
+    return worst * 1e3, elapsed * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=0.5)
+    parser.add_argument("--link-kbps", type=float, default=1000, help="slow mobile link for the 'saved' column")
+    args = parser.parse_args()
+
+    cost_table(args.seconds, args.link_kbps)
+
+    body = {"products": make_products(10000)}
+    inline = asyncio.run(loop_stall(body, offload_size=10**12))
+    offloaded = asyncio.run(loop_stall(body, offload_size=compression.COMPRESS_OFFLOAD_SIZE))
+    print(f"\nevent loop while gzipping a {len(dumps(body)) / 2**20:.1f} MiB response:")
+    print(f"  inline      worst stall {inline[0]:7.1f} ms   request {inline[1]:7.1f} ms")
+    print(f"  offloaded   worst stall {offloaded[0]:7.1f} ms   request {offloaded[1]:7.1f} ms")
+    ok = offloaded[0] < inline[0] / 2
+    print(f"  offload at least halves the worst stall: {'PASS' if ok else 'FAIL'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
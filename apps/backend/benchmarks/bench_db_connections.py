@@ -0,0 +1,115 @@
+"""
+Benchmark: database connections held by serverless instances, per DB_MODE.
+
+    python -m benchmarks.bench_db_connections [--instances 30] [--waves 40] [--max-connections 100]
+
+Simulates a serverless deployment: `--instances` function instances, each
+with its own engine built from database.engine_options(), receive waves
+of concurrent invocations. An instance that gets no traffic in a wave is
+frozen — whatever its pool holds stays open on the server. For each mode
+reports connections opened (each one a TCP + TLS handshake against Neon),
+the peak held at once across all instances, and how many are left open
+by idle instances at the end. Runs on a scratch SQLite file; the counts
+come from the pool, so they are the same against Postgres.
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import tempfile
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database import engine_options
+
+MODES = ("server", "serverless", "nopool")
+
+
+class Counts:
+    def __init__(self):
+        self.open = 0
+        self.peak = 0
+        self.opened = 0
+        self.requests = 0
+
+
+def instance_engine(url: str, mode: str, counts: Counts):
+    engine = create_async_engine(url, **engine_options(url, mode))
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def connected(*_):
+        counts.open += 1
+        counts.opened += 1
+        counts.peak = max(counts.peak, counts.open)
+
+    @event.listens_for(engine.sync_engine, "close")
+    def closed(*_):
+        counts.open -= 1
+
+    return engine
+
+
+async def invocation(engine, work_ms: float, counts: Counts):
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+        await asyncio.sleep(work_ms / 1000)  # the rest of the request, connection still checked out
+    counts.requests += 1
+
+
+async def simulate(url: str, mode: str, instances: int, waves: int, rng: random.Random, work_ms: float) -> Counts:
+    counts = Counts()
+    engines = [instance_engine(url, mode, counts) for _ in range(instances)]
+    for _ in range(waves):
+        active = rng.sample(engines, rng.randint(1, instances))
+        burst = [
+            invocation(engine, work_ms, counts)
+            for engine in active
+            for _ in range(rng.choice([1, 1, 1, 2, 3, 6]))  # mostly single requests, the odd burst
+        ]
+        await asyncio.gather(*burst)
+        await asyncio.sleep(0.01)  # frozen until the next wave
+    left = counts.open
+    for engine in engines:
+        await engine.dispose()
+    counts.open = left
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--instances", type=int, default=30)
+    parser.add_argument("--waves", type=int, default=40)
+    parser.add_argument("--work-ms", type=float, default=20)
+    parser.add_argument("--handshake-ms", type=float, default=40, help="TCP + TLS + auth to Neon, for the cost column")
+    parser.add_argument("--max-connections", type=int, default=100, help="server connection slots")
+    args = parser.parse_args()
+
+    url = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench_db_connections.db"
+    print(f"instances={args.instances}  waves={args.waves}  server slots={args.max_connections}")
+    print(f"\n{'mode':11} {'requests':>9} {'opened':>7} {'per req':>8} {'handshake s':>12} {'peak':>6} {'left open':>10}")
+    results = {}
+    for mode in MODES:
+        c = asyncio.run(simulate(url, mode, args.instances, args.waves, random.Random(1), args.work_ms))
+        results[mode] = c
+        print(
+            f"{mode:11} {c.requests:9,} {c.opened:7,} {c.opened / c.requests:8.2f}"
+            f" {c.opened * args.handshake_ms / 1000:12.1f} {c.peak:6} {c.open:10}"
+        )
+
+    server, serverless = results["server"], results["serverless"]
+    ok = (
+        serverless.peak <= args.max_connections
+        and serverless.open <= args.instances
+        and serverless.opened < results["nopool"].opened
+    )
+    print(
+        f"\nserverless: peak {serverless.peak} vs {server.peak}, left open {serverless.open} vs {server.open},"
+        f" {results['nopool'].opened / max(1, serverless.opened):.0f}x fewer handshakes than nopool: {'PASS' if ok else 'FAIL'}"
+    )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
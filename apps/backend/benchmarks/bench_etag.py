@@ -0,0 +1,119 @@
+"""
+Benchmark: conditional GET — server time of a 304 against a full 200.
+
+    python -m benchmarks.bench_etag [--orders 200000] [--requests 200]
+
+Seeds a scratch database like bench_response_cache and calls each read
+endpoint in-process, first plainly (200, the response cache disabled so
+the full query runs) and then with the ETag it returned (304). Also
+checks that a write changes the ETag of every list it appears in and
+that a compressed response carries the weak form of the same tag.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+from benchmarks.fixtures import create_schema, scratch_database
+
+scratch_database("bench_etag")
+os.environ.setdefault("ADMIN_CLERK_IDS", "user_admin")
+
+import httpx  # noqa: E402
+
+import auth  # noqa: E402
+from benchmarks.bench_response_cache import seed  # noqa: E402
+from benchmarks.fake_clerk import ISSUER, LocalKeySet, create_app  # noqa: E402
+from database import engine  # noqa: E402
+from main import app  # noqa: E402
+from response_cache import response_cache  # noqa: E402
+
+TARGET_SPEEDUP = 5
+
+
+async def timed(client: httpx.AsyncClient, path: str, headers: dict, n: int) -> tuple[float, httpx.Response]:
+    samples, res = [], None
+    for _ in range(n):
+        t = time.perf_counter()
+        res = await client.get(path, headers=headers)
+        samples.append(time.perf_counter() - t)
+    return statistics.median(samples), res
+
+
+async def run_all(n_orders: int, n: int) -> bool:
+    await create_schema(fresh=True)
+
+    keys = LocalKeySet()
+    auth.CLERK_ISSUER = ISSUER
+    auth.jwks = auth.JWKSCache("http://clerk.local/.well-known/jwks.json", transport=httpx.ASGITransport(app=create_app(keys)))
+    admin = {"Authorization": f"Bearer {keys.token('user_admin', ttl=3600)}", "Accept-Encoding": "identity"}
+    customer = {"Authorization": f"Bearer {keys.token('user_customer', ttl=3600)}", "Accept-Encoding": "identity"}
+    response_cache.max_bytes = 0  # disabled: a 200 runs its queries
+
+    checks = {}
+    ok = True
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        await client.get("/api/admin/stats", headers=admin)
+        await client.get("/api/orders/mine", headers=customer)
+        customer_id = (await auth.optional_user(customer["Authorization"])).id
+        await seed(n_orders, customer_id, random.Random(3))
+        some_order = (await client.get("/api/admin/orders", headers=admin)).json()["orders"][0]["id"]
+
+        endpoints = [
+            ("/api/admin/orders", admin),
+            (f"/api/admin/orders/{some_order}", admin),
+            ("/api/admin/stats", admin),
+            ("/api/admin/users", admin),
+            ("/api/admin/promos", admin),
+            ("/api/orders/mine?limit=20", customer),
+        ]
+        print(f"\norders={n_orders:,}  requests={n} per row  (median server time)")
+        print(f"  {'endpoint':32} {'200 ms':>8} {'304 ms':>8} {'speedup':>8} {'body':>9}")
+        for path, headers in endpoints:
+            full, res = await timed(client, path, headers, n)
+            etag = res.headers["etag"]
+            cond, res304 = await timed(client, path, {**headers, "If-None-Match": etag}, n)
+            checks[f"{path}: 304 with the same ETag"] = res304.status_code == 304 and res304.headers["etag"] == etag
+            speedup = full / cond
+            print(f"  {path[:32]:32} {full * 1e3:8.2f} {cond * 1e3:8.2f} {speedup:7.1f}x {len(res.content) / 1024:7.1f}Ki")
+            if path in ("/api/admin/orders", "/api/admin/stats"):  # the rest are index lookups either way
+                ok = ok and speedup >= TARGET_SPEEDUP
+
+        before = {p: (await client.get(p, headers=h)).headers["etag"] for p, h in endpoints}
+        mine = (await client.get("/api/orders/mine?limit=1", headers=customer)).json()["orders"][0]["id"]
+        await client.patch(f"/api/admin/orders/{mine}", json={"status": "shipped"}, headers=admin)
+        after = {p: (await client.get(p, headers=h)).headers["etag"] for p, h in endpoints}
+        checks["write changes admin orders, stats and the owner's history ETags"] = all(
+            before[p] != after[p] for p in ("/api/admin/orders", "/api/admin/stats", "/api/orders/mine?limit=20")
+        )
+        checks["write leaves users and promos ETags alone"] = all(
+            before[p] == after[p] for p in ("/api/admin/users", "/api/admin/promos")
+        )
+        gz = await client.get("/api/admin/orders", headers={**admin, "Accept-Encoding": "gzip"})
+        checks["gzip response has the weak ETag"] = gz.headers["etag"] == f"W/{after['/api/admin/orders']}"
+        weak = await client.get("/api/admin/orders", headers={**admin, "If-None-Match": gz.headers["etag"]})
+        checks["weak ETag revalidates"] = weak.status_code == 304
+    await engine.dispose()
+
+    print()
+    for name, passed in checks.items():
+        print(f"  {'ok  ' if passed else 'FAIL'} {name}")
+    ok = ok and all(checks.values())
+    print(f"\n  304 ≥{TARGET_SPEEDUP}x faster on admin orders and stats, all checks: {'PASS' if ok else 'FAIL'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=200_000)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run_all(args.orders, args.requests)) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark: try-on image post-processing throughput and bytes saved.
+
+    python -m benchmarks.bench_images [--images 16] [--size 1024]
+
+Uses a synthetic FLUX-sized photo (gradient + noise) encoded as PNG and JPEG.
+Variants are written to a throwaway SQLite database unless DATABASE_URL is set.
+"""
+
+import argparse
+import asyncio
+import io
+import random
+import time
+
+from benchmarks.fixtures import create_schema, scratch_database
+
+scratch_database("bench_images")
+
+from PIL import Image  # noqa: E402
+
+from database import get_engine  # noqa: E402
+from images import get_pool, process_generated_image, render_variants, shutdown_pool  # noqa: E402
+
+
+def synthetic_image(size: int, fmt: str) -> bytes:
+    rng = random.Random(42)
+    img = Image.linear_gradient("L").resize((size, size)).convert("RGB")
+    noise = Image.effect_noise((size, size), 40).convert("RGB")
+    img = Image.blend(img, noise, 0.35)
+    for _ in range(30):
+        x, y = rng.randrange(size), rng.randrange(size)
+        img.paste((rng.randrange(256), rng.randrange(256), rng.randrange(256)), (x, y, x + size // 8, y + size // 8))
+    buf = io.BytesIO()
+    img.save(buf, format=fmt, quality=92)
+    return buf.getvalue()
+
+
+async def run(images: int, size: int):
+    await create_schema()
+    for fmt in ("PNG", "JPEG"):
+        data = synthetic_image(size, fmt)
+
+        start = time.perf_counter()
+        rendered = render_variants(data)
+        single = time.perf_counter() - start
+
+        get_pool()  # warm workers so pool start-up is not timed
+        await process_generated_image(data, "/bench")
+        start = time.perf_counter()
+        results = await asyncio.gather(*[process_generated_image(data, "/bench") for _ in range(images)])
+        elapsed = time.perf_counter() - start
+
+        largest = max(v["width"] for v in rendered["variants"])
+        print(f"\n{fmt} source {size}x{size}: {len(data):,} bytes")
+        print(f"  single image (in-process): {single * 1000:.1f} ms")
+        print(f"  pool throughput: {images / elapsed:.2f} images/s ({images} images, {elapsed:.2f}s)")
+        for v in results[0]["variants"]:
+            saved = 1 - v["bytes"] / len(data)
+            print(f"  {v['format']:>5} {v['width']:>5}w: {v['bytes']:>9,} bytes ({saved:6.1%} saved)")
+        mobile = min(
+            (v for v in results[0]["variants"] if v["width"] == min(640, largest)),
+            key=lambda v: v["bytes"],
+        )
+        print(f"  typical mobile download ({mobile['format']} {mobile['width']}w) saves "
+              f"{len(data) - mobile['bytes']:,} bytes per image")
+        print(f"  placeholder: {len(results[0]['placeholder'])} chars")
+    shutdown_pool()
+    await get_engine().dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=16)
+    parser.add_argument("--size", type=int, default=1024)
+    args = parser.parse_args()
+    asyncio.run(run(args.images, args.size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Stress test: concurrent checkouts racing for one SKU must never oversell.
+
+    python -m benchmarks.bench_inventory [--checkouts 1000] [--stock 100] [--shards 1 8]
+
+Runs the COD checkout endpoint in-process against a scratch database
+(DATABASE_URL, default a temp SQLite file) once per shard count. Point
+DATABASE_URL at Postgres to measure the row-contention difference sharding makes.
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from benchmarks.fixtures import scratch_database
+
+DATABASE_URL = scratch_database("bench_inventory")
+
+import httpx  # noqa: E402
+
+PRODUCT_ID = "bench-hot-item"
+
+
+def load_catalog():
+    """Checkouts are priced from the catalog index — give it the one product they buy."""
+    from catalog import price_index
+
+    price_index.load([{"_id": PRODUCT_ID, "name": "Hot Item", "price": 2500}])
+
+
+def checkout_body(i: int) -> dict:
+    return {
+        "items": [{"product_id": PRODUCT_ID, "name": "Hot Item", "price": 2500, "quantity": 1,
+                   "size": "M", "color": "Black"}],
+        "customer_name": f"Buyer {i}",
+        "customer_phone": "03000000000",
+        "payment_method": "cod",
+    }
+
+
+async def run(checkouts: int, stock: int, shards: int, concurrency: int) -> bool:
+    from sqlalchemy import delete, func, select
+
+    import main
+    from database import async_session
+    from inventory import get_stock, set_stock, sku_for
+    from models import InventoryReservation, InventoryShard
+
+    sku = sku_for(PRODUCT_ID, "M", "Black")
+    async with main.lifespan(main.app):
+        load_catalog()
+        async with async_session() as db:
+            await db.execute(delete(InventoryReservation).where(InventoryReservation.sku == sku))
+            await set_stock(db, sku, stock, shards)
+            await db.commit()
+
+        statuses: dict[int, int] = {}
+        gate = asyncio.Semaphore(concurrency)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+
+            async def one(i: int):
+                async with gate:
+                    resp = await client.post("/api/payment/cod/create", json=checkout_body(i))
+                statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(checkouts)))
+            elapsed = time.perf_counter() - start
+
+        async with async_session() as db:
+            level = await get_stock(db, sku)
+            lowest = await db.scalar(select(func.min(InventoryShard.available)).where(InventoryShard.sku == sku))
+            sold = await db.scalar(
+                select(func.coalesce(func.sum(InventoryReservation.quantity), 0))
+                .where(InventoryReservation.sku == sku, InventoryReservation.status == "committed")
+            )
+
+    ok = statuses.get(200, 0)
+    print(f"\nshards={shards}  stock={stock}  checkouts={checkouts}  concurrency={concurrency}")
+    print(f"  responses      {dict(sorted(statuses.items()))}")
+    print(f"  sold           {ok} orders, {sold} units committed, {level['available']} left")
+    print(f"  throughput     {checkouts / elapsed:,.0f} checkouts/s ({elapsed:.2f}s)")
+
+    passed = ok == sold <= stock and level["available"] == stock - sold and lowest >= 0
+    if statuses.get(409, 0) + ok == checkouts:
+        passed = passed and sold == stock  # with no errors, every unit must be sold
+    print("  PASS" if passed else "  FAIL — inventory oversold or lost")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkouts", type=int, default=1000)
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--concurrency", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"database: {DATABASE_URL}")
+
+    async def run_all():
+        # One event loop for every run — the engine's pool is bound to it
+        return [await run(args.checkouts, args.stock, shards, args.concurrency) for shards in args.shards]
+
+    sys.exit(0 if all(asyncio.run(run_all())) else 1)
+
+
+if __name__ == "__main__":
+    main()
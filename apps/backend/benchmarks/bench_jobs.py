@@ -0,0 +1,84 @@
+"""
+Benchmark: background job queue throughput.
+
+    python -m benchmarks.bench_jobs [--jobs 5000] [--workers 4 16 64]
+
+Measures enqueue rate (one submit() per job) and drain rate (no-op jobs
+claimed, run and marked done) against a scratch database (DATABASE_URL,
+default a temp SQLite file).
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from benchmarks.fixtures import create_schema, scratch_database
+
+DATABASE_URL = scratch_database("bench_jobs")
+
+from sqlalchemy import delete, func, select  # noqa: E402
+
+from database import async_session, engine  # noqa: E402
+from jobs import JobQueue, submit, task  # noqa: E402
+from models import Job  # noqa: E402
+
+TARGET_JOBS_PER_SEC = 500
+
+
+@task("bench.noop")
+async def noop(i: int):
+    await asyncio.sleep(0)
+
+
+async def run(jobs: int, workers: int) -> bool:
+    async with async_session() as db:
+        await db.execute(delete(Job))
+        await db.commit()
+
+    start = time.perf_counter()
+    for i in range(jobs):
+        await submit("bench.noop", {"i": i})
+    enqueue_elapsed = time.perf_counter() - start
+
+    queue = JobQueue()
+    start = time.perf_counter()
+    await queue.start(workers)
+    while queue.processed < jobs:
+        await asyncio.sleep(0.01)
+    drain_elapsed = time.perf_counter() - start
+    await queue.stop()
+    metrics = await queue.metrics()
+
+    async with async_session() as db:
+        done = await db.scalar(select(func.count()).select_from(Job).where(Job.name == "bench.noop", Job.status == "done"))
+
+    rate = jobs / drain_elapsed
+    print(f"\nworkers={workers}  jobs={jobs:,}")
+    print(f"  enqueue        {jobs / enqueue_elapsed:,.0f} jobs/s")
+    print(f"  drain          {rate:,.0f} jobs/s ({drain_elapsed:.2f}s), {done:,} marked done")
+    print(f"  wait ms        {metrics['wait_ms']}")
+    ok = done == jobs and rate >= TARGET_JOBS_PER_SEC
+    print(f"  target ≥{TARGET_JOBS_PER_SEC} jobs/s: {'PASS' if ok else 'FAIL'}")
+    return ok
+
+
+async def run_all(jobs: int, workers: list[int]) -> bool:
+    await create_schema()
+    results = [await run(jobs, w) for w in workers]
+    await engine.dispose()
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[4, 16, 64])
+    args = parser.parse_args()
+
+    print(f"database: {DATABASE_URL}")
+    sys.exit(0 if asyncio.run(run_all(args.jobs, args.workers)) else 1)
+
+
+if __name__ == "__main__":
+    main()
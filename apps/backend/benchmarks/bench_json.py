@@ -0,0 +1,105 @@
+"""
+Benchmark: JSON encoding of admin list responses.
+
+    python -m benchmarks.bench_json [--rows 50 500 5000] [--seconds 1]
+
+Builds /api/admin/orders-shaped responses from Order objects and times
+the old path (.isoformat() per row, jsonable_encoder, stdlib json via
+JSONResponse) against the new one (raw values, FastJSONResponse / orjson).
+Checks both produce the same JSON.
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from models import Order
+from responses import FastJSONResponse
+
+TARGET_SPEEDUP = 3
+
+
+def make_orders(n: int, rng: random.Random) -> list[Order]:
+    start = datetime(2025, 1, 1)
+    return [
+        Order(
+            id=f"{rng.getrandbits(128):032x}",
+            customer_name=rng.choice(["Ayesha Khan", "Fatima Ali", "Zainab Raza", "Guest"]),
+            customer_email=f"customer{i}@example.com",
+            customer_phone="03001234567",
+            total=float(rng.choice([1800, 3500, 6800, 12400])),
+            status=rng.choice(["pending", "processing", "shipped", "delivered"]),
+            payment_method=rng.choice(["cod", "safepay", "jazzcash", "easypaisa"]),
+            payment_status=rng.choice(["unpaid", "pending", "paid"]),
+            transaction_id=None if rng.random() < 0.5 else f"T{rng.randrange(10**9)}",
+            created_at=start + timedelta(seconds=rng.randrange(10**7), microseconds=rng.randrange(10**6)),
+        )
+        for i in range(n)
+    ]
+
+
+def row(o: Order, created_at) -> dict:
+    return {
+        "id": o.id,
+        "customer_name": o.customer_name,
+        "customer_email": o.customer_email,
+        "customer_phone": o.customer_phone,
+        "total": o.total,
+        "status": o.status,
+        "payment_method": o.payment_method,
+        "payment_status": o.payment_status,
+        "transaction_id": o.transaction_id,
+        "created_at": created_at,
+        "items_count": 2,
+    }
+
+
+def old_path(orders: list[Order]) -> bytes:
+    content = {"orders": [row(o, o.created_at.isoformat()) for o in orders]}
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def new_path(orders: list[Order]) -> bytes:
+    return FastJSONResponse({"orders": [row(o, o.created_at) for o in orders]}).body
+
+
+def measure(fn, orders, seconds: float) -> tuple[float, int]:
+    """(mean seconds per response, bytes per response)"""
+    body = fn(orders)
+    runs, start = 0, time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        fn(orders)
+        runs += 1
+    return (time.perf_counter() - start) / runs, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[50, 500, 5000])
+    parser.add_argument("--seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    ok = True
+    for n in args.rows:
+        orders = make_orders(n, random.Random(n))
+        same = json.loads(old_path(orders)) == json.loads(new_path(orders))
+        old_t, size = measure(old_path, orders, args.seconds)
+        new_t, _ = measure(new_path, orders, args.seconds)
+        speedup = old_t / new_t
+        print(f"\nrows={n:,}  body={size / 1024:,.1f} KiB  identical JSON: {same}")
+        print(f"  jsonable_encoder + json   {old_t * 1e3:8.3f} ms  {1 / old_t:8,.0f} resp/s  {size / old_t / 2**20:7.1f} MiB/s")
+        print(f"  FastJSONResponse (orjson) {new_t * 1e3:8.3f} ms  {1 / new_t:8,.0f} resp/s  {size / new_t / 2**20:7.1f} MiB/s")
+        print(f"  speedup {speedup:.1f}x")
+        ok = ok and same and speedup >= TARGET_SPEEDUP
+    print(f"\ntarget ≥{TARGET_SPEEDUP}x at every size: {'PASS' if ok else 'FAIL'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Benchmark: cost of recording Prometheus metrics, per request and per scrape.
+
+    python -m benchmarks.bench_metrics [--requests 20000] [--budget-us 25]
+
+Three measurements:
+  record     Histogram.observe and the in-flight gauge in a tight loop
+  request    MetricsMiddleware + route_started around a bare ASGI app,
+             against the bare app — the overhead every request pays
+  end to end /health and /api/products through the real app in process,
+             with the middleware and without it (the stack below it)
+and the time to render a scrape with a realistic number of series.
+Fails if the per-request overhead exceeds the budget (METRICS_BUDGET_US
+overrides the default).
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from benchmarks.fixtures import scratch_database
+
+scratch_database("bench_metrics")
+
+import httpx  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+
+import metrics  # noqa: E402
+from database import get_engine  # noqa: E402
+from main import app  # noqa: E402
+
+METRICS_BUDGET_US = float(os.getenv("METRICS_BUDGET_US", "25"))
+
+
+class FakeRoute:
+    path_format = "/api/admin/orders/{order_id}"
+
+
+async def bare_app(scope, receive, send):
+    scope["route"] = FakeRoute
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def routed_app(scope, receive, send):
+    scope["route"] = FakeRoute
+    await metrics.route_started(Request(scope))
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def _receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def _send(message):
+    pass
+
+
+async def per_call_us(asgi, n: int) -> float:
+    scope = {"type": "http", "method": "GET", "path": "/api/admin/orders/o1", "headers": []}
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(n):
+            await asgi(dict(scope), _receive, _send)
+        best = min(best, (time.perf_counter() - start) / n * 1e6)
+    return best
+
+
+def record_ns(n: int) -> tuple[float, float]:
+    h = metrics.Histogram("bench_seconds", "bench", ("method", "route", "status"))
+    g = metrics.Gauge("bench_in_flight", "bench", ("method", "route"))
+    metrics.registry.remove(h)
+    metrics.registry.remove(g)
+    start = time.perf_counter()
+    for i in range(n):
+        h.observe("GET", "/api/orders/mine", "200", value=(i % 300) / 1000)
+    observe = (time.perf_counter() - start) / n * 1e9
+    start = time.perf_counter()
+    for _ in range(n):
+        g.inc("GET", "/api/orders/mine")
+        g.dec("GET", "/api/orders/mine")
+    gauge = (time.perf_counter() - start) / n * 1e9
+    return observe, gauge
+
+
+async def end_to_end(asgi, path: str, n: int) -> float:
+    latencies = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi), base_url="http://bench") as client:
+        for _ in range(n):
+            t = time.perf_counter()
+            res = await client.get(path)
+            latencies.append(time.perf_counter() - t)
+            assert res.status_code == 200, (path, res.status_code)
+    return statistics.median(latencies) * 1e6
+
+
+def scrape_ms(routes: int, statuses: int) -> tuple[float, int]:
+    for r in range(routes):
+        for s in range(statuses):
+            metrics.http_requests.observe("GET", f"/api/bench/{r}", str(200 + s), value=0.01 * s)
+    start = time.perf_counter()
+    body = metrics.render()
+    return (time.perf_counter() - start) * 1e3, body.count("\n")
+
+
+async def run(n: int, budget_us: float) -> bool:
+    observe_ns, gauge_ns = record_ns(n * 10)
+    print(f"record:     Histogram.observe {observe_ns:6.0f} ns   gauge inc+dec {gauge_ns:6.0f} ns")
+
+    bare = await per_call_us(bare_app, n)
+    wrapped = await per_call_us(metrics.MetricsMiddleware(routed_app), n)
+    overhead = wrapped - bare
+    print(f"request:    bare {bare:6.2f} µs   with metrics {wrapped:6.2f} µs   overhead {overhead:5.2f} µs/request")
+
+    async with app.router.lifespan_context(app):
+        await end_to_end(app, "/health", 200)  # builds the middleware stack, warms up
+        outer = app.middleware_stack  # Starlette's own error middleware sits above ours
+        while not isinstance(outer.app, metrics.MetricsMiddleware):
+            outer = outer.app
+        middleware = outer.app
+        for path in ("/health", "/api/products"):
+            outer.app = middleware.app
+            off = await end_to_end(app, path, n // 10)
+            outer.app = middleware
+            on = await end_to_end(app, path, n // 10)
+            print(f"end to end: {path:14} without {off:7.1f} µs   with {on:7.1f} µs   (median, includes the httpx client)")
+    await get_engine().dispose()
+
+    ms, lines = scrape_ms(routes=60, statuses=4)
+    print(f"scrape:     {lines:,} lines rendered in {ms:.1f} ms")
+
+    ok = overhead <= budget_us
+    print(f"\nper-request overhead {overhead:.2f} µs (budget {budget_us:.0f} µs): {'PASS' if ok else 'FAIL'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--budget-us", type=float, default=METRICS_BUDGET_US)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run(args.requests, args.budget_us)) else 1)
+
+
+if __name__ == "__main__":
+    main()
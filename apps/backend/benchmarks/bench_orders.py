@@ -0,0 +1,134 @@
+"""
+Benchmark: per-user order history (/api/orders/mine) on a large orders table.
+
+    python -m benchmarks.bench_orders [--orders 2000000] [--mine 5000] [--limit 20]
+
+Seeds a scratch database (DATABASE_URL, default a temp SQLite file) with
+`--orders` orders spread over many customers plus `--mine` orders of one
+customer, each with items, then pages through that customer's history by
+cursor and reports per-page latency. Also prints the query plan so a
+full scan (a missing ix_orders_user_created) is obvious.
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.fixtures import create_schema, scratch_database
+
+DATABASE_URL = scratch_database("bench_orders")
+
+from sqlalchemy import insert, text  # noqa: E402
+
+from database import async_session, engine  # noqa: E402
+from models import Order, OrderItem, User  # noqa: E402
+from routes.orders import orders_page  # noqa: E402
+
+CHUNK = 20_000
+CUSTOMERS = 200_000
+TARGET_P95_MS = 25
+
+
+async def seed(n_orders: int, n_mine: int, rng: random.Random) -> str:
+    start = datetime(2023, 1, 1)
+    span = 3 * 365 * 24 * 3600
+    async with async_session() as db:
+        me = User(clerk_id="user_bench", email="me@example.com")
+        db.add(me)
+        await db.commit()
+
+    total = n_orders + n_mine
+    mine_every = max(1, total // max(1, n_mine))
+    mine_left = n_mine
+    seeded = 0
+    while seeded < total:
+        orders, items = [], []
+        for i in range(seeded, min(total, seeded + CHUNK)):
+            mine = mine_left > 0 and i % mine_every == 0
+            mine_left -= mine
+            order_id = f"o{i:09d}"
+            created = start + timedelta(seconds=rng.randrange(span))
+            orders.append({
+                "id": order_id,
+                "user_id": me.id if mine else f"u{rng.randrange(CUSTOMERS):06d}",
+                "customer_name": "Bench",
+                "customer_email": "",
+                "total": rng.choice([1800, 3500, 6800]),
+                "status": "delivered",
+                "payment_method": "cod",
+                "payment_status": "paid",
+                "created_at": created,
+                "updated_at": created,
+            })
+            for j in range(rng.randint(1, 3)):
+                items.append({
+                    "id": f"{order_id}-{j}",
+                    "order_id": order_id,
+                    "product_id": f"product-{rng.randrange(5000)}",
+                    "name": "Bench item",
+                    "price": 1800,
+                    "quantity": 1,
+                })
+        async with engine.begin() as conn:
+            await conn.execute(insert(Order), orders)
+            await conn.execute(insert(OrderItem), items)
+        seeded += len(orders)
+        print(f"\r  seeded {seeded:,}/{total:,}", end="", flush=True)
+    print()
+    return me.id
+
+
+async def run_all(n_orders: int, n_mine: int, limit: int) -> bool:
+    await create_schema(fresh=True)
+
+    start = time.perf_counter()
+    user_id = await seed(n_orders, n_mine, random.Random(3))
+    print(f"seed: {time.perf_counter() - start:.1f}s")
+
+    if engine.dialect.name == "sqlite":
+        async with engine.connect() as conn:
+            plan = (await conn.execute(text(
+                "EXPLAIN QUERY PLAN SELECT id FROM orders WHERE user_id = :u AND (created_at, id) < (:c, :i)"
+                " ORDER BY created_at DESC, id DESC LIMIT 21"
+            ), {"u": user_id, "c": datetime(2025, 1, 1), "i": ""})).all()
+        print("plan:", " / ".join(row[-1] for row in plan))
+
+    latencies, seen, cursor = [], 0, None
+    async with async_session() as db:
+        while True:
+            t = time.perf_counter()
+            orders, cursor = await orders_page(db, user_id, limit, cursor)
+            latencies.append(time.perf_counter() - t)
+            seen += len(orders)
+            db.expunge_all()
+            if cursor is None:
+                break
+    await engine.dispose()
+
+    q = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    print(f"\norders={n_orders + n_mine:,}  mine={n_mine:,}  page={limit}")
+    print(f"  pages          {len(latencies):,} ({seen:,} orders walked)")
+    print(f"  first page     {latencies[0] * 1e3:.2f} ms   last page {latencies[-1] * 1e3:.2f} ms")
+    print(f"  per page       p50 {q[49] * 1e3:.2f} ms  p95 {q[94] * 1e3:.2f} ms  p99 {q[98] * 1e3:.2f} ms")
+    ok = seen == n_mine and q[94] * 1e3 <= TARGET_P95_MS
+    print(f"  target p95 ≤{TARGET_P95_MS} ms, every order once: {'PASS' if ok else 'FAIL'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=2_000_000)
+    parser.add_argument("--mine", type=int, default=5000)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"database: {DATABASE_URL}")
+    sys.exit(0 if asyncio.run(run_all(args.orders, args.mine, args.limit)) else 1)
+
+
+if __name__ == "__main__":
+    main()
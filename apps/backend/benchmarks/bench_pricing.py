@@ -0,0 +1,71 @@
+"""
+Benchmark: server-side cart pricing against the in-memory price index.
+
+    python -m benchmarks.bench_pricing [--products 5000] [--carts 100000]
+
+Target: ≥10,000 carts/s on one core.
+"""
+
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+from catalog import PriceIndex
+from pricing import price_cart
+
+TARGET_CARTS_PER_SEC = 10_000
+
+
+def build_index(n: int) -> PriceIndex:
+    rng = random.Random(1)
+    index = PriceIndex()
+    index.load([
+        {
+            "_id": f"product-{i}",
+            "_updatedAt": "2025-01-01T00:00:00Z",
+            "name": f"Product {i}",
+            "price": rng.choice([1200, 1800, 2200, 3500, 5800, 6800, 8500]),
+            "categorySlug": rng.choice(["hijabs", "abayas", "accessories"]),
+        }
+        for i in range(n)
+    ])
+    return index
+
+
+def build_carts(n: int, products: int) -> list[list[SimpleNamespace]]:
+    rng = random.Random(2)
+    return [
+        [
+            SimpleNamespace(product_id=f"product-{rng.randrange(products)}", quantity=rng.randint(1, 3),
+                            name="", price=0)
+            for _ in range(rng.randint(1, 6))
+        ]
+        for _ in range(n)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--carts", type=int, default=100_000)
+    args = parser.parse_args()
+
+    index = build_index(args.products)
+    carts = build_carts(args.carts, args.products)
+    promos = [None, None, None, "MODEST10"]
+
+    start = time.perf_counter()
+    for i, cart in enumerate(carts):
+        price_cart(cart, "standard", "cod" if i % 3 == 0 else "safepay", promos[i % 4], index=index)
+    elapsed = time.perf_counter() - start
+
+    rate = args.carts / elapsed
+    items = sum(len(c) for c in carts)
+    print(f"priced {args.carts:,} carts ({items:,} lines) in {elapsed:.3f}s")
+    print(f"  {rate:,.0f} carts/s, {elapsed / args.carts * 1e6:.2f} µs/cart")
+    print(f"  target {TARGET_CARTS_PER_SEC:,} carts/s: {'OK' if rate >= TARGET_CARTS_PER_SEC else 'MISSED'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Benchmark: promo evaluation cost per cart, and redemption throughput under contention.
+
+    python -m benchmarks.bench_promo [--carts 100000] [--redemptions 1000] [--limit 100]
+
+Evaluation runs the compiled rules against priced carts in memory.
+Redemption fires concurrent redeem() calls at one code with a global
+limit against a scratch database (DATABASE_URL, default a temp SQLite
+file) and checks the limit is never exceeded.
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.fixtures import create_schema, scratch_database
+
+scratch_database("bench_promo")
+
+from pricing import PricedLine  # noqa: E402
+from promo import PromoEngine, PromoError  # noqa: E402
+
+TARGET_EVALS_PER_SEC = 100_000
+CATEGORIES = ["hijabs", "abayas", "accessories", "niqabs"]
+
+
+def build_engine(n: int) -> PromoEngine:
+    rng = random.Random(1)
+    now = datetime.utcnow()
+    rules = []
+    for i in range(n):
+        rule = {"code": f"CODE{i}", "kind": rng.choice(["percent", "flat"]), "value": rng.choice([5, 10, 15, 500])}
+        if rule["kind"] == "percent" and rule["value"] > 100:
+            rule["value"] = 10
+        if rng.random() < 0.5:
+            rule["min_subtotal"] = rng.choice([2000, 4000, 6000])
+        if rng.random() < 0.3:
+            rule["categories"] = rng.sample(CATEGORIES, 2)
+        if rng.random() < 0.5:
+            rule["starts_at"] = now - timedelta(days=1)
+            rule["ends_at"] = now + timedelta(days=rng.choice([-1, 7]))
+        rules.append(rule)
+    engine = PromoEngine()
+    engine.load(rules)
+    return engine
+
+
+def build_carts(n: int) -> list[tuple[list[PricedLine], float]]:
+    rng = random.Random(2)
+    carts = []
+    for _ in range(n):
+        lines = []
+        for j in range(rng.randint(1, 6)):
+            price, qty = rng.choice([1200, 1800, 2200, 3500, 5800]), rng.randint(1, 3)
+            lines.append(PricedLine(f"product-{j}", "", price, qty, price * qty, rng.choice(CATEGORIES)))
+        carts.append((lines, sum(l.line_total for l in lines)))
+    return carts
+
+
+def bench_evaluate(carts: int, rules: int) -> bool:
+    engine = build_engine(rules)
+    priced = build_carts(carts)
+    codes = [f"CODE{i % rules}" for i in range(carts)]
+    now = datetime.utcnow()
+    applied = 0
+
+    start = time.perf_counter()
+    for code, (lines, subtotal) in zip(codes, priced):
+        try:
+            engine.evaluate(code, lines, subtotal, now)
+            applied += 1
+        except PromoError:
+            pass
+    elapsed = time.perf_counter() - start
+
+    rate = carts / elapsed
+    print(f"evaluate: {carts:,} carts over {rules} rules in {elapsed:.3f}s")
+    print(f"  {rate:,.0f} carts/s, {elapsed / carts * 1e6:.2f} µs/cart ({applied:,} applied)")
+    ok = rate >= TARGET_EVALS_PER_SEC
+    print(f"  target ≥{TARGET_EVALS_PER_SEC:,} carts/s: {'PASS' if ok else 'FAIL'}")
+    return ok
+
+
+async def bench_redeem(redemptions: int, limit: int, concurrency: int) -> bool:
+    from sqlalchemy import delete, func, select
+
+    from database import async_session, engine
+    from models import PromoRedemption, Promotion
+    from promo import load_promotions, redeem
+
+    await create_schema()
+    async with async_session() as db:
+        await db.execute(delete(PromoRedemption).where(PromoRedemption.code == "BENCH"))
+        await db.execute(delete(Promotion).where(Promotion.code == "BENCH"))
+        db.add(Promotion(code="BENCH", kind="percent", value=10, usage_limit=limit, used_count=0))
+        await db.commit()
+    await load_promotions()
+
+    outcomes: dict[str, int] = {}
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with gate:
+            try:
+                await redeem("BENCH", f"order-{i}", f"user{i}@example.com")
+                key = "redeemed"
+            except PromoError as e:
+                key = str(e)
+        outcomes[key] = outcomes.get(key, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(redemptions)))
+    elapsed = time.perf_counter() - start
+
+    async with async_session() as db:
+        used = await db.scalar(select(Promotion.used_count).where(Promotion.code == "BENCH"))
+        rows = await db.scalar(select(func.count()).select_from(PromoRedemption).where(PromoRedemption.code == "BENCH"))
+    await engine.dispose()
+
+    print(f"\nredeem: {redemptions:,} concurrent attempts on one code, limit {limit}")
+    print(f"  outcomes       {outcomes}")
+    print(f"  used_count     {used}, redemption rows {rows}")
+    print(f"  throughput     {redemptions / elapsed:,.0f} attempts/s ({elapsed:.2f}s)")
+    ok = outcomes.get("redeemed", 0) == used == rows <= limit
+    print("  PASS" if ok else "  FAIL — limit exceeded or counters out of sync")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--carts", type=int, default=100_000)
+    parser.add_argument("--rules", type=int, default=200)
+    parser.add_argument("--redemptions", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    ok = bench_evaluate(args.carts, args.rules)
+    ok = asyncio.run(bench_redeem(args.redemptions, args.limit, args.concurrency)) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Benchmark: SQL statements per endpoint against per-endpoint query budgets.
+
+    python -m benchmarks.bench_queries [--orders 2000] [--items 3]
+
+Seeds a scratch database (orders with `--items` line items each), then
+calls each endpoint in-process inside sql_stats.query_budget() with the
+response cache disabled, so every statement the handler and its ETag
+check need is counted. Prints statements and DB time per endpoint and
+fails if any endpoint goes over its budget or repeats a statement shape
+(an N+1). Also checks that the detector itself flags a loop of lookups.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+
+from benchmarks.fixtures import create_schema, scratch_database
+
+scratch_database("bench_queries")
+os.environ.setdefault("ADMIN_CLERK_IDS", "user_admin")
+
+import httpx  # noqa: E402
+from sqlalchemy import insert, select  # noqa: E402
+
+import auth  # noqa: E402
+from benchmarks.bench_inventory import PRODUCT_ID, checkout_body, load_catalog  # noqa: E402
+from benchmarks.bench_response_cache import seed  # noqa: E402
+from benchmarks.fake_clerk import ISSUER, LocalKeySet, create_app  # noqa: E402
+from database import async_session, engine  # noqa: E402
+from inventory import set_stock, sku_for  # noqa: E402
+from main import app  # noqa: E402
+from models import Order, OrderItem  # noqa: E402
+from promo import load_promotions  # noqa: E402
+from response_cache import response_cache  # noqa: E402
+from sql_stats import QueryBudgetExceeded, QueryLog, current, query_budget, sql_stats  # noqa: E402
+
+# (method, path, who) → most statements one request may run, auth included
+QUERY_BUDGETS = {
+    ("GET", "/api/admin/orders", "admin"): 2,
+    ("GET", "/api/admin/orders/{order_id}", "admin"): 2,
+    ("GET", "/api/admin/stats", "admin"): 3,
+    ("GET", "/api/admin/users", "admin"): 2,
+    ("GET", "/api/admin/promos", "admin"): 2,
+    ("GET", "/api/orders/mine", "customer"): 2,
+    ("PATCH", "/api/admin/orders/{order_id}", "admin"): 2,
+    ("POST", "/api/payment/cod/create", "customer"): 9,
+}
+
+
+async def seed_items(per_order: int):
+    async with async_session() as db:
+        ids = (await db.execute(select(Order.id))).scalars().all()
+    rows = [
+        {"id": f"{order_id}-{k}", "order_id": order_id, "product_id": f"p{k}", "name": "Item", "price": 1800, "quantity": 1}
+        for order_id in ids
+        for k in range(per_order)
+    ]
+    async with engine.begin() as conn:
+        await conn.execute(insert(OrderItem), rows)
+
+
+async def detector_flags_a_loop(order_ids: list[str]) -> bool:
+    log = QueryLog()
+    token = current.set(log)
+    try:
+        async with async_session() as db:
+            for order_id in order_ids[:6]:
+                await db.scalar(select(Order.total).where(Order.id == order_id))
+    finally:
+        current.reset(token)
+    return len(log.repeated()) == 1
+
+
+async def run_all(n_orders: int, per_order: int) -> bool:
+    await create_schema(fresh=True)
+
+    keys = LocalKeySet()
+    auth.CLERK_ISSUER = ISSUER
+    auth.jwks = auth.JWKSCache("http://clerk.local/.well-known/jwks.json", transport=httpx.ASGITransport(app=create_app(keys)))
+    headers = {
+        "admin": {"Authorization": f"Bearer {keys.token('user_admin', ttl=3600)}"},
+        "customer": {"Authorization": f"Bearer {keys.token('user_customer', ttl=3600)}"},
+    }
+    response_cache.max_bytes = 0  # disabled: every request runs its queries
+
+    ok = True
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        await client.get("/api/admin/stats", headers=headers["admin"])  # creates both user rows
+        await client.get("/api/orders/mine", headers=headers["customer"])
+        customer_id = (await auth.optional_user(headers["customer"]["Authorization"])).id
+        await seed(n_orders, customer_id, random.Random(3))
+        await seed_items(per_order)
+        load_catalog()
+        await load_promotions()  # warm, as after the first checkout: first use loads them
+        async with async_session() as db:
+            await set_stock(db, sku_for(PRODUCT_ID, "M", "Black"), 10_000, 1)
+            await db.commit()
+            order_ids = (await db.execute(select(Order.id).limit(10))).scalars().all()
+        sql_stats.clear()
+
+        print(f"orders={n_orders:,}  items per order={per_order}\n")
+        print(f"{'endpoint':45} {'statements':>10} {'budget':>7} {'db ms':>7}")
+        for i, ((method, template, who), budget) in enumerate(QUERY_BUDGETS.items()):
+            path = template.replace("{order_id}", order_ids[i % len(order_ids)])
+            body = {"status": "shipped"} if method == "PATCH" else checkout_body(i) if method == "POST" else None
+            error = ""
+            try:
+                with query_budget(budget) as log:
+                    res = await client.request(method, path, json=body, headers=headers[who])
+            except QueryBudgetExceeded as e:
+                error, ok = str(e), False
+            if res.status_code != 200:
+                error, ok = f"HTTP {res.status_code}: {res.text[:200]}", False
+            print(f"{method + ' ' + template:45} {log.count:10} {budget:7} {log.seconds * 1000:7.2f}  {'ok' if not error else 'OVER'}")
+            if error:
+                print(f"    {error}")
+
+        flagged = await detector_flags_a_loop(order_ids)
+        print(f"\nN+1 detector flags a loop of 6 identical lookups: {flagged}")
+        ok = ok and flagged
+    await engine.dispose()
+
+    print(f"\nevery endpoint within its query budget, no repeated statement shapes: {'PASS' if ok else 'FAIL'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--items", type=int, default=3)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run_all(args.orders, args.items)) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark: payment reconciliation against the local gateway stand-ins.
+
+    python -m benchmarks.bench_reconcile [--orders 600] [--rate 50] [--latency-ms 80]
+
+Creates pending Safepay/JazzCash/EasyPaisa orders that look stuck (their
+webhook never came), answers 60% paid / 20% failed / 20% still pending
+from benchmarks/fake_gateways.py, runs one reconcile pass and checks every
+order ended in the gateway's state, that no gateway saw more than `--rate`
+inquiries in any second, and that a second pass changes nothing.
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.fixtures import create_schema, scratch_database
+
+DATABASE_URL = scratch_database("bench_reconcile")
+
+import httpx  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+import reconcile  # noqa: E402
+from benchmarks.fake_gateways import create_app as create_fake_gateways, peak_rate  # noqa: E402
+from database import async_session, engine  # noqa: E402
+from models import Order, OutboxEvent  # noqa: E402
+from payment_events import GATEWAYS  # noqa: E402
+
+
+async def seed(n: int, rng: random.Random) -> dict[str, str]:
+    """Insert `n` stuck orders; returns gateway reference → the state the fake gateway reports."""
+    payments = {}
+    stuck_since = datetime.utcnow() - timedelta(minutes=30)
+    async with async_session() as db:
+        for i in range(n):
+            gateway = GATEWAYS[i % len(GATEWAYS)]
+            ref = f"{gateway}-ref-{i:06d}"
+            payments[ref] = rng.choices(["paid", "failed", "pending"], weights=[6, 2, 2])[0]
+            db.add(Order(
+                payment_method=gateway,
+                payment_status="pending",
+                gateway_session_id=ref,
+                total=rng.choice([1800, 3500, 6800]),
+                created_at=stuck_since,
+                updated_at=stuck_since + timedelta(seconds=rng.uniform(0, 600)),
+            ))
+        await db.commit()
+    return payments
+
+
+async def run_all(n: int, rate: float, latency_ms: float) -> bool:
+    await create_schema(fresh=True)
+
+    payments = await seed(n, random.Random(5))
+    fake = create_fake_gateways(payments, latency_ms=latency_ms)
+    reconcile.SAFEPAY_BASE = "http://gateway.local"
+    reconcile.JAZZCASH_INQUIRY_URL = "http://gateway.local/ApplicationAPI/API/PaymentInquiry/Inquire"
+    reconcile.EASYPAISA_INQUIRY_URL = "http://gateway.local/easypay-service/rest/v4/inquire-transaction"
+    reconcile.RECONCILE_RATE = {g: rate for g in GATEWAYS}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=fake)) as client:
+        start = time.perf_counter()
+        first = await reconcile.reconcile_pending(client, gateways=list(GATEWAYS))
+        elapsed = time.perf_counter() - start
+        second = await reconcile.reconcile_pending(client, gateways=list(GATEWAYS))
+
+    async with async_session() as db:
+        actual = dict((await db.execute(select(Order.gateway_session_id, Order.payment_status))).all())
+        events = dict((await db.execute(
+            select(OutboxEvent.topic, func.count()).group_by(OutboxEvent.topic)
+        )).all())
+    await engine.dispose()
+
+    mismatched = sum(1 for ref, state in payments.items() if actual[ref] != state)
+    peaks = {g: peak_rate(fake.state.calls[g]) for g in GATEWAYS}
+    ideal = (n / len(GATEWAYS)) / rate  # gateways are polled in parallel, each at `rate`
+
+    print(f"\norders={n:,}  rate={rate:g}/s per gateway  latency≈{latency_ms:g} ms")
+    print(f"  first pass     {first}  in {elapsed:.2f}s (rate-limit floor {ideal:.2f}s)")
+    print(f"  second pass    {second}")
+    print(f"  outbox         {events}")
+    print(f"  peak req/s     {peaks}")
+    print(f"  lag closed     {reconcile.stats.snapshot()['lag_seconds']}")
+    ok = (
+        mismatched == 0
+        and first["paid"] == sum(1 for s in payments.values() if s == "paid")
+        and second["paid"] == second["failed"] == 0
+        and events.get("order.confirmed", 0) == first["paid"]
+        and all(p <= rate + 1 for p in peaks.values())
+    )
+    print(f"  {mismatched} orders mismatched: {'PASS' if ok else 'FAIL'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=600)
+    parser.add_argument("--rate", type=float, default=50)
+    parser.add_argument("--latency-ms", type=float, default=80)
+    args = parser.parse_args()
+
+    print(f"database: {DATABASE_URL}")
+    sys.exit(0 if asyncio.run(run_all(args.orders, args.rate, args.latency_ms)) else 1)
+
+
+if __name__ == "__main__":
+    main()
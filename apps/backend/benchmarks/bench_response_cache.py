@@ -0,0 +1,177 @@
+"""
+Benchmark: dashboard and account-page polling with and without the response cache.
+
+    python -m benchmarks.bench_response_cache [--orders 200000] [--pollers 20] [--seconds 5]
+
+Seeds a scratch database, then runs the app in-process (auth against
+benchmarks/fake_clerk.py) while `--pollers` clients poll /api/admin/stats,
+/api/admin/orders and /api/orders/mine and an admin PATCHes an order's
+status a few times a second. Runs once with the cache disabled and once
+enabled, reporting throughput, latency, SQL statements per request and
+hit rates. Every PATCH is followed by a read that must already show the
+new status — invalidation, not the TTL, keeps the lists correct.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.fixtures import create_schema, scratch_database
+
+DATABASE_URL = scratch_database("bench_response_cache")
+os.environ.setdefault("ADMIN_CLERK_IDS", "user_admin")
+
+import httpx  # noqa: E402
+from sqlalchemy import event, insert  # noqa: E402
+
+import auth  # noqa: E402
+from benchmarks.fake_clerk import ISSUER, LocalKeySet, create_app  # noqa: E402
+from database import engine  # noqa: E402
+from main import app  # noqa: E402
+from models import Order  # noqa: E402
+from response_cache import response_cache  # noqa: E402
+
+CHUNK = 20_000
+MY_ORDERS = 60
+STATUSES = ("pending", "processing", "shipped", "delivered")
+TARGET_SPEEDUP = 5
+
+statements = 0
+
+
+def _count(*_):
+    global statements
+    statements += 1
+
+
+async def seed(n: int, customer_id: str, rng: random.Random):
+    start = datetime(2024, 1, 1)
+    seeded = 0
+    while seeded < n:
+        rows = []
+        for i in range(seeded, min(n, seeded + CHUNK)):
+            created = start + timedelta(seconds=rng.randrange(2 * 365 * 24 * 3600))
+            rows.append({
+                "id": f"o{i:09d}",
+                "user_id": customer_id if i < MY_ORDERS else f"u{rng.randrange(50_000):05d}",
+                "customer_name": "Bench",
+                "customer_email": "",
+                "total": rng.choice([1800, 3500, 6800]),
+                "status": rng.choice(STATUSES),
+                "payment_method": "cod",
+                "payment_status": "unpaid",
+                "created_at": created,
+                "updated_at": created,
+            })
+        async with engine.begin() as conn:
+            await conn.execute(insert(Order), rows)
+        seeded += len(rows)
+
+
+async def phase(client: httpx.AsyncClient, admin: dict, customer: dict, pollers: int, seconds: float) -> dict:
+    global statements
+    latencies: list[float] = []
+    stale_reads = 0
+    statements = 0
+    deadline = time.perf_counter() + seconds
+    paths = [("/api/admin/stats", admin), ("/api/admin/orders", admin), ("/api/orders/mine?limit=20", customer)]
+
+    async def poll(i: int):
+        n = i
+        while time.perf_counter() < deadline:
+            path, headers = paths[n % len(paths)]
+            n += 1
+            t = time.perf_counter()
+            res = await client.get(path, headers=headers)
+            latencies.append(time.perf_counter() - t)
+            assert res.status_code == 200, (path, res.status_code, res.text)
+
+    async def write():
+        nonlocal stale_reads
+        rng = random.Random(7)
+        while time.perf_counter() < deadline:
+            listed = (await client.get("/api/admin/orders", headers=admin)).json()["orders"]
+            target = rng.choice(listed)
+            status = rng.choice([s for s in STATUSES if s != target["status"]])
+            res = await client.patch(f"/api/admin/orders/{target['id']}", json={"status": status}, headers=admin)
+            assert res.status_code == 200
+            after = (await client.get("/api/admin/orders", headers=admin)).json()["orders"]
+            stale_reads += next(o["status"] for o in after if o["id"] == target["id"]) != status
+            await asyncio.sleep(0.25)
+
+    start = time.perf_counter()
+    await asyncio.gather(write(), *(poll(i) for i in range(pollers)))
+    elapsed = time.perf_counter() - start
+    q = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50": q[49] * 1e3,
+        "p95": q[94] * 1e3,
+        "sql_per_request": statements / max(1, len(latencies)),
+        "stale_reads": stale_reads,
+    }
+
+
+async def run_all(n_orders: int, pollers: int, seconds: float) -> bool:
+    await create_schema(fresh=True)
+
+    keys = LocalKeySet()
+    auth.CLERK_ISSUER = ISSUER
+    auth.jwks = auth.JWKSCache("http://clerk.local/.well-known/jwks.json", transport=httpx.ASGITransport(app=create_app(keys)))
+    admin = {"Authorization": f"Bearer {keys.token('user_admin', ttl=3600)}"}
+    customer = {"Authorization": f"Bearer {keys.token('user_customer', ttl=3600)}"}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        await client.get("/api/admin/stats", headers=admin)  # creates both user rows
+        await client.get("/api/orders/mine", headers=customer)
+        customer_id = (await auth.optional_user(customer["Authorization"])).id
+        start = time.perf_counter()
+        await seed(n_orders, customer_id, random.Random(3))
+        print(f"seeded {n_orders:,} orders in {time.perf_counter() - start:.1f}s")
+
+        event.listen(engine.sync_engine, "before_cursor_execute", _count)
+        budget = response_cache.max_bytes
+        response_cache.max_bytes = 0  # disabled — every request runs its queries
+        response_cache.clear()
+        off = await phase(client, admin, customer, pollers, seconds)
+        response_cache.max_bytes = budget
+        response_cache.counters.clear()
+        on = await phase(client, admin, customer, pollers, seconds)
+    await engine.dispose()
+
+    print(f"\npollers={pollers}  seconds={seconds}  orders={n_orders:,}")
+    for name, r in (("no cache", off), ("cache", on)):
+        print(
+            f"  {name:9} {r['rps']:8,.0f} req/s  p50 {r['p50']:7.2f} ms  p95 {r['p95']:7.2f} ms"
+            f"  sql/request {r['sql_per_request']:5.2f}  stale reads after write {r['stale_reads']}"
+        )
+    snapshot = response_cache.snapshot()
+    for namespace, c in snapshot["routes"].items():
+        print(f"  {namespace:14} hit rate {c['hit_rate']:.1%}  misses {c['misses']}  stale {c['stale_hits']}  coalesced {c['coalesced']}")
+    print(f"  cache: {snapshot['entries']} entries, {snapshot['bytes'] / 1024:.1f} KiB, {snapshot['invalidated']} invalidated")
+
+    speedup = on["rps"] / off["rps"]
+    ok = speedup >= TARGET_SPEEDUP and on["stale_reads"] == 0 and off["stale_reads"] == 0
+    print(f"\n  throughput {speedup:.1f}x (target ≥{TARGET_SPEEDUP}x), no stale read after a write: {'PASS' if ok else 'FAIL'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=200_000)
+    parser.add_argument("--pollers", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"database: {DATABASE_URL}")
+    sys.exit(0 if asyncio.run(run_all(args.orders, args.pollers, args.seconds)) else 1)
+
+
+if __name__ == "__main__":
+    main()
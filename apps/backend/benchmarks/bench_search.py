@@ -0,0 +1,57 @@
+"""
+Benchmark: product search throughput and index memory.
+
+    python -m benchmarks.bench_search [--products 50000] [--queries 2000]
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from benchmarks.fixtures import make_products
+from search import SearchIndex
+
+QUERIES = [
+    "kala abaya", "chiffon hijab", "jilbab navy", "embroiderd abya", "chifon", "reshmi dupatta",
+    "georgette", "black pleated abaya", "safaid lawn", "prayer", "cashmere stole", "maroon silk",
+    "crinkle hijab beige", "neela jilbab", "party abaya", "dusty pink", "jersey", "linen",
+]
+PREFIXES = ["a", "ab", "aba", "chif", "emb", "kala ab", "hij", "navy ji", "sil", "prem"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    docs = make_products(args.products)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = SearchIndex()
+    index.load(docs)
+    build = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"index {args.products:,} products: {build:.2f}s, {memory / 1e6:.1f} MB, "
+          f"{len(index.vocab):,} terms")
+
+    rng = random.Random(4)
+    for label, pool, prefix in (("search", QUERIES, False), ("autocomplete", PREFIXES, True)):
+        queries = [rng.choice(pool) for _ in range(args.queries)]
+        start = time.perf_counter()
+        for q in queries:
+            index.search(q, limit=20, prefix=prefix)
+        elapsed = time.perf_counter() - start
+        print(f"{label}: {args.queries / elapsed:,.0f} queries/s ({elapsed / args.queries * 1e3:.2f} ms/query)")
+
+    start = time.perf_counter()
+    for doc in docs[:1000]:
+        index.add({**doc, "name": doc["name"] + " updated"})
+    print(f"incremental update: {(time.perf_counter() - start) / 1000 * 1e6:.0f} µs/product")
+
+
+if __name__ == "__main__":
+    main()
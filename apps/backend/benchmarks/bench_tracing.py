@@ -0,0 +1,195 @@
+"""
+Benchmark: tracing overhead per request, and a check of what gets exported.
+
+    python -m benchmarks.bench_tracing [--requests 600] [--budget-pct 10]
+
+Times recording and encoding one span, then runs the COD checkout
+(pricing, stock reservation, an order with its items, the commit) and
+/health in process with tracing off, on but not sampled
+(TRACE_SAMPLE_RATE=0) and sampled, interleaving the three modes
+in rounds so drift hits them equally (the best round's median counts).
+Then it checks the output:
+
+  * otlp: batches posted to benchmarks/fake_collector.py parse as OTLP/JSON
+  * file: every line of TRACE_FILE does too
+  * a request sent with a traceparent keeps its trace id, hangs under the
+    caller's span, answers with X-Trace-Id, and its trace is printed as a
+    tree (handler, pricing, reservation, SQL, flush, commit)
+
+Fails if a sampled checkout is slower than tracing off by more than the
+budget, as a share of the checkout (TRACE_BUDGET_PCT overrides the
+default), or if any check does.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.fixtures import scratch_database
+
+scratch_database("bench_tracing")
+
+import httpx  # noqa: E402
+
+import tracing  # noqa: E402
+from benchmarks.bench_inventory import PRODUCT_ID, checkout_body, load_catalog  # noqa: E402
+from benchmarks.fake_collector import create_app as create_collector, flatten  # noqa: E402
+from database import async_session, get_engine  # noqa: E402
+from inventory import set_stock, sku_for  # noqa: E402
+from main import app  # noqa: E402
+
+TRACE_BUDGET_PCT = float(os.getenv("TRACE_BUDGET_PCT", "10"))
+MODES = {"off": ("", 1.0), "unsampled": ("otlp", 0.0), "sampled": ("otlp", 1.0)}
+REMOTE_TRACE = "4bf92f3577b34da6a3ce929d0e0e4736"
+REMOTE_PARENT = "00f067aa0ba902b7"
+
+
+def set_mode(mode: str):
+    tracing.TRACE_EXPORTER, tracing.TRACE_SAMPLE_RATE = MODES[mode]
+
+
+async def timed(client: httpx.AsyncClient, method: str, path: str, i: int) -> float:
+    start = time.perf_counter()
+    res = await client.request(method, path, json=checkout_body(i) if method == "POST" else None)
+    elapsed = time.perf_counter() - start
+    assert res.status_code == 200, (path, res.status_code, res.text[:200])
+    return elapsed
+
+
+async def overhead(client: httpx.AsyncClient, method: str, path: str, n: int, rounds: int = 10) -> dict[str, float]:
+    best = {mode: float("inf") for mode in MODES}
+    i = 0
+    for _ in range(rounds):
+        for mode in MODES:
+            set_mode(mode)
+            latencies = []
+            for _ in range(n // rounds):
+                i += 1
+                latencies.append(await timed(client, method, path, i))
+            await tracing.flush()  # export outside the timed requests
+            best[mode] = min(best[mode], statistics.median(latencies) * 1e6)
+    return best
+
+
+def span_us(n: int) -> tuple[float, float]:
+    """Recording one child span, and encoding one for export."""
+    set_mode("sampled")
+    token = tracing.current.set(tracing.start_span("bench", tracing.SERVER))
+    start = time.perf_counter()
+    for _ in range(n):
+        s = tracing.child_span("SELECT", tracing.CLIENT)
+        s.set("db.query.text", "SELECT orders.id FROM orders WHERE orders.id = ?")
+        tracing.end_span(s)
+    record = (time.perf_counter() - start) / n * 1e6
+    tracing.current.reset(token)
+    start = time.perf_counter()
+    tracing.encode(tracing._queue)
+    encode = (time.perf_counter() - start) / n * 1e6
+    tracing._queue.clear()
+    tracing.stats.started = tracing.stats.exported = 0
+    set_mode("off")
+    return record, encode
+
+
+def tree(spans: list[dict]) -> list[str]:
+    children: dict[str, list[dict]] = {}
+    for s in spans:
+        children.setdefault(s["parentSpanId"], []).append(s)
+    ids = {s["spanId"] for s in spans}
+    lines = []
+
+    def walk(s: dict, depth: int):
+        ms = (int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])) / 1e6
+        lines.append(f"    {'  ' * depth}{s['name'][:60]:{62 - 2 * depth}} {ms:7.2f} ms")
+        for child in sorted(children.get(s["spanId"], []), key=lambda c: int(c["startTimeUnixNano"])):
+            walk(child, depth + 1)
+
+    for root in (s for s in spans if s["parentSpanId"] not in ids):
+        walk(root, 0)
+    return lines
+
+
+async def run(n: int, budget_pct: float) -> bool:
+    record, encode = span_us(10_000)
+    print(f"span:  record {record:5.2f} µs   encode for export {encode:5.2f} µs\n")
+
+    collector = create_collector()
+    tracing._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=collector), base_url="http://collector")
+    tracing.TRACE_OTLP_ENDPOINT = "http://collector/v1/traces"
+    ok = True
+
+    async with app.router.lifespan_context(app):
+        load_catalog()
+        async with async_session() as db:
+            await set_stock(db, sku_for(PRODUCT_ID, "M", "Black"), 10 * n, 1)
+            await db.commit()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            for _ in range(20):  # warm up: middleware stack, compiled statements
+                await timed(client, "POST", "/api/payment/cod/create", 0)
+
+            print(f"{'endpoint':30} {'off':>9} {'unsampled':>10} {'sampled':>9}   (median µs, in process)")
+            results = {}
+            for method, path in (("GET", "/health"), ("POST", "/api/payment/cod/create")):
+                results[path] = r = await overhead(client, method, path, n)
+                print(f"{method + ' ' + path:30} {r['off']:9.1f} {r['unsampled']:10.1f} {r['sampled']:9.1f}")
+
+            # one traced checkout, continuing a caller's trace
+            set_mode("sampled")
+            res = await client.post(
+                "/api/payment/cod/create",
+                json=checkout_body(n + 1),
+                headers={"traceparent": f"00-{REMOTE_TRACE}-{REMOTE_PARENT}-01"},
+            )
+            await tracing.flush()
+            spans = [s for s in collector.state.spans if s["traceId"] == REMOTE_TRACE]
+            root = next((s for s in spans if s["parentSpanId"] == REMOTE_PARENT), None)
+            propagated = res.headers.get("x-trace-id") == REMOTE_TRACE and root is not None
+            print(f"\ncheckout trace ({len(spans)} spans):")
+            print("\n".join(tree(spans)))
+            print(f"\ntraceparent continued (trace id kept, root under the caller's span): {propagated}")
+            ok = ok and propagated and root["attributes"].get("http.route") == "/api/payment/cod/create"
+
+            # file exporter
+            path = os.path.join(tempfile.mkdtemp(), "traces.jsonl")
+            tracing.TRACE_EXPORTER, tracing.TRACE_FILE = "file", path
+            for i in range(5):
+                await timed(client, "POST", "/api/payment/cod/create", n + 2 + i)
+            await tracing.flush()
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+            exported = sum(len(flatten(body)) for body in lines)
+            print(f"file exporter: {len(lines)} batch(es), {exported} spans, all valid OTLP/JSON")
+            ok = ok and exported > 0
+            set_mode("off")
+
+        print(f"otlp exporter: {collector.state.batches} batches accepted; "
+              f"stats: started={tracing.stats.started} exported={tracing.stats.exported} "
+              f"dropped={tracing.stats.dropped} export errors={tracing.stats.export_errors}")
+        ok = ok and tracing.stats.export_errors == 0 and tracing.stats.dropped == 0
+    await tracing._client.aclose()
+    await get_engine().dispose()
+
+    checkout = results["/api/payment/cod/create"]
+    cost = (checkout["sampled"] - checkout["off"]) / checkout["off"] * 100
+    within = cost <= budget_pct
+    print(f"\nsampled checkout {cost:+.1f}% over tracing off (budget {budget_pct:.0f}%), "
+          f"unsampled {(checkout['unsampled'] - checkout['off']) / checkout['off'] * 100:+.1f}%: "
+          f"{'PASS' if within and ok else 'FAIL'}")
+    return within and ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--budget-pct", type=float, default=TRACE_BUDGET_PCT)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run(args.requests, args.budget_pct)) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Local stand-in for a Clerk instance's JWKS endpoint, with a locally generated key set.
+
+    keys = LocalKeySet()
+    app = create_app(keys)                   # serves /.well-known/jwks.json
+    token = keys.token("user_123", ttl=60)   # RS256 session token signed by the current key
+    keys.rotate()                            # new current key; the old one stays published
+
+Used by benchmarks/bench_auth.py so nothing talks to Clerk.
+"""
+
+import time
+import uuid
+from typing import Optional
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import FastAPI
+
+ISSUER = "https://clerk.bench.local"
+
+
+class LocalKeySet:
+    def __init__(self):
+        self.keys: list[tuple[str, rsa.RSAPrivateKey]] = []
+        self.rotate()
+
+    def rotate(self, keep: int = 2):
+        """Start signing with a fresh key; publish the last `keep` keys."""
+        self.keys.append((uuid.uuid4().hex[:12], rsa.generate_private_key(public_exponent=65537, key_size=2048)))
+        self.keys = self.keys[-keep:]
+
+    @property
+    def current(self) -> tuple[str, rsa.RSAPrivateKey]:
+        return self.keys[-1]
+
+    def jwks(self) -> dict:
+        keys = []
+        for kid, private in self.keys:
+            jwk = jwt.algorithms.RSAAlgorithm.to_jwk(private.public_key(), as_dict=True)
+            keys.append({**jwk, "kid": kid, "use": "sig", "alg": "RS256"})
+        return {"keys": keys}
+
+    def token(
+        self,
+        sub: str,
+        ttl: int = 60,
+        kid: Optional[str] = None,
+        private: Optional[rsa.RSAPrivateKey] = None,
+        **claims,
+    ) -> str:
+        current_kid, current_private = self.current
+        now = int(time.time())
+        payload = {
+            "sub": sub, "iss": ISSUER, "iat": now, "nbf": now - 1, "exp": now + ttl,
+            "jti": uuid.uuid4().hex,  # every token distinct, as Clerk's are
+            **claims,
+        }
+        return jwt.encode(payload, private or current_private, algorithm="RS256", headers={"kid": kid or current_kid})
+
+
+def create_app(keys: LocalKeySet) -> FastAPI:
+    app = FastAPI()
+    app.state.requests = 0
+
+    @app.get("/.well-known/jwks.json")
+    async def jwks():
+        app.state.requests += 1
+        return keys.jwks()
+
+    return app
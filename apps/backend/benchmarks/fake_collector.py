@@ -0,0 +1,76 @@
+"""
+Local stand-in for an OpenTelemetry collector's OTLP/HTTP JSON receiver.
+
+    python -m benchmarks.fake_collector [--port 4318] [--latency-ms 0]
+    TRACE_EXPORTER=otlp TRACE_OTLP_ENDPOINT=http://127.0.0.1:4318/v1/traces uvicorn main:app
+
+Accepts POST /v1/traces with an ExportTraceServiceRequest body, checks the
+fields tracing.py must always send and keeps every span (flattened, with
+attributes as a plain dict) in `app.state.spans`. A malformed batch gets
+a 400, as a real collector would.
+"""
+
+import argparse
+import asyncio
+import json
+import re
+
+from fastapi import FastAPI, Request, Response
+
+HEX = {"traceId": re.compile(r"^[0-9a-f]{32}$"), "spanId": re.compile(r"^[0-9a-f]{16}$")}
+
+
+def flatten(body: dict) -> list[dict]:
+    """Spans out of an ExportTraceServiceRequest. Raises ValueError on anything malformed."""
+    spans = []
+    for resource in body["resourceSpans"]:
+        service = {a["key"]: a["value"] for a in resource["resource"]["attributes"]}.get("service.name", {})
+        for scope in resource["scopeSpans"]:
+            for s in scope["spans"]:
+                for key, pattern in HEX.items():
+                    if not pattern.match(s[key]):
+                        raise ValueError(f"bad {key}: {s[key]!r}")
+                if s["parentSpanId"] and not HEX["spanId"].match(s["parentSpanId"]):
+                    raise ValueError(f"bad parentSpanId: {s['parentSpanId']!r}")
+                if int(s["endTimeUnixNano"]) < int(s["startTimeUnixNano"]):
+                    raise ValueError(f"span {s['name']!r} ends before it starts")
+                spans.append({
+                    **s,
+                    "service": service.get("stringValue"),
+                    "attributes": {a["key"]: next(iter(a["value"].values())) for a in s["attributes"]},
+                })
+    return spans
+
+
+def create_app(latency_ms: float = 0) -> FastAPI:
+    app = FastAPI()
+    app.state.spans = []
+    app.state.batches = 0
+
+    @app.post("/v1/traces")
+    async def traces(request: Request):
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        try:
+            spans = flatten(json.loads(await request.body()))
+        except (ValueError, KeyError, TypeError) as e:
+            return Response(str(e), status_code=400)
+        app.state.batches += 1
+        app.state.spans.extend(spans)
+        return {"partialSuccess": {}}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+    uvicorn.run(create_app(latency_ms=args.latency_ms), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Local stand-ins for Stripe Checkout and the Safepay, JazzCash and EasyPaisa APIs.
+
+    python -m benchmarks.fake_gateways [--port 3334] [--latency-ms 80] [--error-rate 0.01]
+    STRIPE_API_BASE=http://127.0.0.1:3334 \\
+    SAFEPAY_BASE_URL=http://127.0.0.1:3334 \\
+    JAZZCASH_BASE_URL=http://127.0.0.1:3334/ApplicationAPI/API/2.0/Purchase/DoMWalletTransaction \\
+    JAZZCASH_INQUIRY_URL=http://127.0.0.1:3334/ApplicationAPI/API/PaymentInquiry/Inquire \\
+    EASYPAISA_BASE_URL=http://127.0.0.1:3334/easypay/Index.jsf \\
+    EASYPAISA_INQUIRY_URL=http://127.0.0.1:3334/easypay-service/rest/v4/inquire-transaction \\
+        uvicorn main:app
+
+Serves, on the real paths, the payment-creation calls routes/orders.py
+and routes/payment.py make and the four inquiry endpoints reconcile.py
+calls. `app.state.payments` maps a gateway reference to "paid", "failed"
+or "pending" (unknown references are pending); every request is
+timestamped per endpoint in `app.state.calls` so callers can check rate
+limits. Each call waits `latency_ms` (±50%) and fails with probability
+`error_rate`, the way that gateway fails; failures are counted in
+`app.state.failures`. JazzCash transaction references are kept in
+`app.state.wallet_refs` by bill reference ("order-<first 8 of the order
+id>"), so a caller can send the callback the gateway would.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import Counter, defaultdict
+from urllib.parse import parse_qsl
+
+from fastapi import FastAPI, Request, Response
+
+SAFEPAY_STATES = {"paid": "TRACKER_ENDED", "failed": "TRACKER_EXPIRED", "pending": "TRACKER_STARTED"}
+JAZZCASH_CODES = {"paid": "121", "failed": "199", "pending": "157"}
+EASYPAISA_STATUSES = {"paid": "PAID", "failed": "FAILED", "pending": "PENDING"}
+
+
+def create_app(payments: dict[str, str] | None = None, latency_ms: float = 0, error_rate: float = 0) -> FastAPI:
+    app = FastAPI()
+    app.state.payments = dict(payments or {})
+    app.state.calls = defaultdict(list)
+    app.state.failures = Counter()
+    app.state.wallet_refs = {}
+    rng = random.Random(11)
+
+    async def answer(endpoint: str) -> bool:
+        """Wait like the real API; False when this call should fail."""
+        app.state.calls[endpoint].append(time.monotonic())
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000 * rng.uniform(0.5, 1.5))
+        if error_rate and rng.random() < error_rate:
+            app.state.failures[endpoint] += 1
+            return False
+        return True
+
+    async def respond(gateway: str, ref: str):
+        if not await answer(gateway):
+            return None
+        return app.state.payments.get(ref, "pending")
+
+    # ─── Payment creation ───────────────────────────────────────
+    @app.post("/v1/checkout/sessions")
+    async def stripe_checkout_session():
+        if not await answer("stripe.create"):
+            return Response(
+                '{"error": {"type": "api_error", "message": "Service unavailable"}}',
+                status_code=503,
+                media_type="application/json",
+            )
+        session_id = f"cs_test_{uuid.uuid4().hex}"
+        return {
+            "id": session_id,
+            "object": "checkout.session",
+            "mode": "payment",
+            "payment_status": "unpaid",
+            "status": "open",
+            "url": f"https://checkout.stripe.com/c/pay/{session_id}",
+        }
+
+    @app.post("/v1/coupons")
+    async def stripe_coupon():
+        if not await answer("stripe.coupon"):
+            return Response(
+                '{"error": {"type": "api_error", "message": "Service unavailable"}}',
+                status_code=503,
+                media_type="application/json",
+            )
+        return {"id": f"coupon_{uuid.uuid4().hex[:12]}", "object": "coupon", "duration": "once"}
+
+    @app.post("/order/payments/v3/")
+    async def safepay_tracker():
+        if not await answer("safepay.create"):
+            return Response('{"message": "Service unavailable"}', status_code=503, media_type="application/json")
+        return {"data": {"token": f"track_{uuid.uuid4()}"}}
+
+    @app.post("/ApplicationAPI/API/2.0/Purchase/DoMWalletTransaction")
+    async def jazzcash_wallet(request: Request):
+        fields = dict(parse_qsl((await request.body()).decode()))
+        if not await answer("jazzcash.create"):
+            return {"pp_ResponseCode": "110", "pp_ResponseMessage": "Service unavailable"}
+        ref = fields.get("pp_TxnRefNo", "")
+        app.state.wallet_refs[fields.get("pp_BillReference", "")] = ref
+        return {"pp_ResponseCode": "124", "pp_ResponseMessage": "Request sent to customer", "pp_TxnRefNo": ref}
+
+    @app.post("/easypay/Index.jsf")
+    async def easypaisa_wallet():
+        if not await answer("easypaisa.create"):
+            return Response(status_code=503)
+        return {"responseCode": "0000", "responseDesc": "SUCCESS"}
+
+    # ─── Status inquiry ─────────────────────────────────────────
+
+    @app.get("/v1/checkout/sessions/{ref}")
+    async def stripe(ref: str):
+        status = await respond("stripe", ref)
+        if status is None:
+            return Response('{"error": {"type": "api_error"}}', status_code=503, media_type="application/json")
+        return {
+            "id": ref,
+            "object": "checkout.session",
+            "payment_status": "paid" if status == "paid" else "unpaid",
+            "status": {"paid": "complete", "failed": "expired"}.get(status, "open"),
+            "payment_intent": f"pi_{ref[-12:]}" if status == "paid" else None,
+        }
+
+    @app.get("/reporter/api/v1/payments/{ref}")
+    async def safepay(ref: str):
+        status = await respond("safepay", ref)
+        if status is None:
+            return Response(status_code=503)
+        return {"data": {"token": ref, "state": SAFEPAY_STATES[status], "reference": f"SP-{ref[-8:]}"}}
+
+    @app.post("/ApplicationAPI/API/PaymentInquiry/Inquire")
+    async def jazzcash(request: Request):
+        ref = (await request.json()).get("pp_TxnRefNo", "")
+        status = await respond("jazzcash", ref)
+        if status is None:
+            return {"pp_ResponseCode": "110", "pp_ResponseMessage": "Service unavailable"}
+        return {
+            "pp_ResponseCode": "000",
+            "pp_PaymentResponseCode": JAZZCASH_CODES[status],
+            "pp_RetreivalReferenceNo": f"JC-{ref[-8:]}",
+            "pp_TxnRefNo": ref,
+        }
+
+    @app.post("/easypay-service/rest/v4/inquire-transaction")
+    async def easypaisa(request: Request):
+        ref = (await request.json()).get("orderId", "")
+        status = await respond("easypaisa", ref)
+        if status is None:
+            return {"responseCode": "0001", "responseDesc": "System error"}
+        return {"responseCode": "0000", "transactionStatus": EASYPAISA_STATUSES[status], "transactionId": f"EP-{ref[-8:]}"}
+
+    return app
+
+
+def peak_rate(timestamps: list[float], window: float = 1.0) -> int:
+    """Most calls seen in any `window`-second span."""
+    peak, start = 0, 0
+    ordered = sorted(timestamps)
+    for end, t in enumerate(ordered):
+        while t - ordered[start] >= window:
+            start += 1
+        peak = max(peak, end - start + 1)
+    return peak
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=3334)
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--error-rate", type=float, default=0)  # share of calls that fail
+    args = parser.parse_args()
+    uvicorn.run(create_app(latency_ms=args.latency_ms, error_rate=args.error_rate), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
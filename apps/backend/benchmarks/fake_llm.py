@@ -0,0 +1,146 @@
+"""
+Local stand-ins for the chat APIs (OpenAI-compatible and Gemini) and the
+HuggingFace / Replicate image APIs.
+
+    python -m benchmarks.fake_llm [--port 3335] [--latency-ms 600] [--error-rate 0.01]
+    OPENAI_API_KEY=fake OPENAI_BASE_URL=http://127.0.0.1:3335/v1 \\
+    HF_TOKEN=fake HF_INFERENCE_URL=http://127.0.0.1:3335 \\
+    REPLICATE_API_TOKEN=fake REPLICATE_API_URL=http://127.0.0.1:3335 \\
+        uvicorn main:app
+
+(GEMINI_API_KEY=fake GEMINI_API_URL=http://127.0.0.1:3335 for Gemini.)
+Chat completions answer with a canned reply whose length follows
+`max_tokens` (Gemini: `maxOutputTokens`), after `latency_ms` (±50%) plus
+`ms_per_token` for every token "generated". HuggingFace returns a PNG,
+Replicate a finished prediction whose output URL serves the same PNG.
+Failures come at `error_rate`, shaped like each service's: 429 from the
+chat APIs, 503 "model loading" from HuggingFace, 500 from Replicate.
+Calls and failures are counted per endpoint in `app.state.calls` /
+`app.state.failures`.
+"""
+
+import argparse
+import asyncio
+import io
+import random
+import time
+import uuid
+from collections import Counter
+
+from fastapi import FastAPI, Request, Response
+
+WORDS = (
+    "Our crinkle chiffon hijabs are a customer favourite, light enough for everyday wear and available in "
+    "over twenty colours. For formal occasions the embroidered abaya pairs well with a georgette hijab."
+).split()
+
+
+def placeholder_png(size: int = 512) -> bytes:
+    from PIL import Image
+
+    image = Image.linear_gradient("L").resize((size, size)).convert("RGB")
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def create_app(latency_ms: float = 0, error_rate: float = 0, ms_per_token: float = 0) -> FastAPI:
+    app = FastAPI()
+    app.state.calls = Counter()
+    app.state.failures = Counter()
+    rng = random.Random(13)
+    png = placeholder_png()
+
+    async def answer(endpoint: str, tokens: int = 0) -> bool:
+        """Wait like the real API; False when this call should fail."""
+        app.state.calls[endpoint] += 1
+        wait = latency_ms / 1000 * rng.uniform(0.5, 1.5) + tokens * ms_per_token / 1000
+        if wait:
+            await asyncio.sleep(wait)
+        if error_rate and rng.random() < error_rate:
+            app.state.failures[endpoint] += 1
+            return False
+        return True
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        tokens = min(int(body.get("max_tokens") or 256), rng.randint(40, 120))
+        if not await answer("chat", tokens):
+            return Response(
+                '{"error": {"message": "Rate limit reached", "type": "rate_limit_error"}}',
+                status_code=429,
+                media_type="application/json",
+            )
+        content = " ".join(WORDS[i % len(WORDS)] for i in range(tokens * 3 // 4))
+        prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": tokens, "total_tokens": prompt_tokens + tokens},
+        }
+
+    @app.post("/v1beta/models/{model}:generateContent")
+    async def gemini(model: str, request: Request):
+        body = await request.json()
+        tokens = min(int(body.get("generationConfig", {}).get("maxOutputTokens") or 256), rng.randint(40, 120))
+        if not await answer("gemini", tokens):
+            return Response(
+                '{"error": {"code": 429, "message": "Resource has been exhausted", "status": "RESOURCE_EXHAUSTED"}}',
+                status_code=429,
+                media_type="application/json",
+            )
+        content = " ".join(WORDS[i % len(WORDS)] for i in range(tokens * 3 // 4))
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": content}]}, "finishReason": "STOP"}],
+            "usageMetadata": {"candidatesTokenCount": tokens},
+        }
+
+    @app.post("/models/{owner}/{model}")
+    async def huggingface(owner: str, model: str):
+        if not await answer("huggingface"):
+            return Response(
+                '{"error": "Model is currently loading", "estimated_time": 10.0}',
+                status_code=503,
+                media_type="application/json",
+            )
+        return Response(png, media_type="image/png")
+
+    @app.post("/v1/models/{owner}/{model}/predictions")
+    async def replicate(owner: str, model: str, request: Request):
+        if not await answer("replicate"):
+            return Response('{"detail": "Internal server error"}', status_code=500, media_type="application/json")
+        prediction_id = uuid.uuid4().hex[:16]
+        return {
+            "id": prediction_id,
+            "model": f"{owner}/{model}",
+            "status": "succeeded",
+            "output": [f"{str(request.base_url).rstrip('/')}/delivery/{prediction_id}/out-0.png"],
+            "urls": {"get": f"/v1/predictions/{prediction_id}"},
+        }
+
+    @app.get("/delivery/{prediction_id}/{name}")
+    async def replicate_output(prediction_id: str, name: str):
+        return Response(png, media_type="image/png")
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=3335)
+    parser.add_argument("--latency-ms", type=float, default=600)
+    parser.add_argument("--ms-per-token", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)  # share of calls that fail
+    args = parser.parse_args()
+    app = create_app(latency_ms=args.latency_ms, error_rate=args.error_rate, ms_per_token=args.ms_per_token)
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Local stand-in for Sanity's query API, for tests and benchmarks.
+
+    python -m benchmarks.fake_sanity [--products 5000] [--port 3333]
+    SANITY_API_URL=http://127.0.0.1:3333 uvicorn main:app
+
+Answers the two query shapes catalog.py sends — all products, and products
+with `_updatedAt > $since` — with ETag / If-None-Match support.
+"""
+
+import argparse
+import hashlib
+import json
+from datetime import datetime
+
+from fastapi import FastAPI, Request, Response
+
+from benchmarks.fixtures import make_products
+
+
+def create_app(products: list[dict]) -> FastAPI:
+    app = FastAPI()
+    app.state.products = {p["_id"]: p for p in products}
+    app.state.requests = 0
+
+    def touch(doc: dict):
+        """Edit a product the way Studio would — bumps _updatedAt."""
+        doc["_updatedAt"] = datetime.utcnow().isoformat() + "Z"
+        app.state.products[doc["_id"]] = doc
+
+    app.state.touch = touch
+
+    @app.get("/v{version}/data/query/{dataset}")
+    async def query(version: str, dataset: str, request: Request):
+        app.state.requests += 1
+        q = request.query_params.get("query", "")
+        docs = list(app.state.products.values())
+        if "$since" in q:
+            since = json.loads(request.query_params.get("$since", '""'))
+            docs = [d for d in docs if d["_updatedAt"] > since]
+        body = json.dumps({"ms": 1, "query": q, "result": docs}).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(body, media_type="application/json", headers={"ETag": etag})
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--port", type=int, default=3333)
+    args = parser.parse_args()
+    uvicorn.run(create_app(make_products(args.products)), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
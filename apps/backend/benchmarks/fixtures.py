@@ -0,0 +1,85 @@
+"""Synthetic catalog data shaped like the Sanity product projection, and the scratch database benchmarks run on"""
+
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+CATEGORIES = {
+    "hijabs": ("Hijabs", [1200, 1400, 1800, 2200, 2800, 3500]),
+    "abayas": ("Abayas", [5800, 6500, 6800, 7500, 8500]),
+    "jilbabs": ("Jilbabs", [3500, 4500, 6000]),
+    "prayer-wear": ("Prayer Wear", [1800, 2500, 4000]),
+    "accessories": ("Accessories", [200, 500, 1200, 2500]),
+}
+MATERIALS = ["Georgette", "Chiffon", "Crinkle", "Silk", "Lawn", "Cotton", "Cashmere", "Nida", "Jersey", "Linen"]
+SIZES = ["free", "xs", "s", "m", "l", "xl", "xxl", "52", "54", "56", "58"]
+COLORS = [
+    ("Black", "#000000"), ("Navy", "#1f2a44"), ("Maroon", "#800000"), ("Beige", "#d9c7a7"),
+    ("White", "#ffffff"), ("Grey", "#808080"), ("Olive", "#556b2f"), ("Dusty Pink", "#d8a7b1"),
+    ("Mint", "#98ff98"), ("Mustard", "#e1ad01"),
+]
+OCCASIONS = ["casual", "office", "formal", "party", "bridal", "everyday"]
+STYLES = ["Classic", "Pleated", "Embroidered", "Open", "Textured", "Premium", "Everyday", "Fancy", "Crinkle", "Printed"]
+
+
+def make_products(n: int, seed: int = 7) -> list[dict]:
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    products = []
+    for i in range(n):
+        slug = rng.choice(list(CATEGORIES))
+        cat_name, prices = CATEGORIES[slug]
+        material = rng.choice(MATERIALS)
+        style = rng.choice(STYLES)
+        created = start + timedelta(minutes=i * 7)
+        colors = rng.sample(COLORS, rng.randint(1, 4))
+        name = f"{style} {material} {cat_name.rstrip('s')}"
+        products.append({
+            "_id": f"product-{i}",
+            "_createdAt": created.isoformat() + "Z",
+            "_updatedAt": created.isoformat() + "Z",
+            "name": name,
+            "slug": f"{name.lower().replace(' ', '-')}-{i}",
+            "price": rng.choice(prices),
+            "compareAtPrice": None,
+            "image": f"https://cdn.sanity.io/images/demo/production/{i}.jpg",
+            "images": [f"https://cdn.sanity.io/images/demo/production/{i}.jpg"],
+            "category": cat_name,
+            "categorySlug": slug,
+            "material": material,
+            "sizes": rng.sample(SIZES, rng.randint(1, 5)) if slug in ("abayas", "jilbabs") else ["free"],
+            "colors": [{"_key": f"c{j}", "name": c, "hex": h} for j, (c, h) in enumerate(colors)],
+            "stock": rng.randint(0, 80),
+            "occasion": rng.sample(OCCASIONS, rng.randint(1, 2)),
+            "isFeatured": rng.random() < 0.05,
+            "isNewArrival": rng.random() < 0.1,
+            "isBestseller": rng.random() < 0.1,
+            "rating": round(rng.uniform(3, 5), 1),
+            "reviewCount": rng.randint(0, 200),
+            "tags": rng.sample(["modest", "summer", "winter", "eid", "wedding", "daily", "soft", "breathable"], 2),
+        })
+    return products
+
+
+# ─── Scratch database ───────────────────────────────────────────
+def scratch_database(name: str) -> str:
+    """
+    Point DATABASE_URL at a throwaway SQLite file unless one is set, and
+    return it. Call before importing app modules: database.py reads it at import.
+    """
+    if "DATABASE_URL" not in os.environ:
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/{name}.db"
+    return os.environ["DATABASE_URL"]
+
+
+async def create_schema(fresh: bool = False):
+    """Create every table on the benchmark database; `fresh` drops them first."""
+    # Imported on call: this module is imported before scratch_database() has set DATABASE_URL
+    import models  # noqa: F401 — registers every table on Base.metadata
+    from database import Base, get_engine
+
+    async with get_engine().begin() as conn:
+        if fresh:
+            await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
@@ -0,0 +1,253 @@
+"""
+Catalog sync — in-memory price index, product mirror and search index, kept in sync with Sanity.
+
+Loaded from a snapshot (CATALOG_SNAPSHOT_PATH JSON export or a full Sanity
+query) and refreshed incrementally by the Sanity webhook or an ETag poll —
+the poll loop in worker.py, or ensure_catalog() on use where no loop runs.
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import NamedTuple, Optional
+
+import httpx
+
+from catalog_mirror import product_mirror
+from metrics import http_client
+from search import search_index
+
+SANITY_PROJECT_ID = os.getenv("SANITY_PROJECT_ID", os.getenv("NEXT_PUBLIC_SANITY_PROJECT_ID", ""))
+SANITY_DATASET = os.getenv("SANITY_DATASET", "production")
+SANITY_API_VERSION = os.getenv("SANITY_API_VERSION", "2024-01-01")
+SANITY_TOKEN = os.getenv("SANITY_TOKEN", "")
+SANITY_WEBHOOK_SECRET = os.getenv("SANITY_WEBHOOK_SECRET", "")
+SANITY_API_URL = os.getenv("SANITY_API_URL", "")  # override for a local stand-in server
+CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH", "")
+CATALOG_POLL_INTERVAL = int(os.getenv("CATALOG_POLL_INTERVAL", "60"))  # seconds, 0 disables polling
+FULL_RELOAD_EVERY = 60  # polls — a full reload also picks up deletions missed by webhooks
+WEBHOOK_TOLERANCE = 300  # seconds a signed webhook stays valid — older ones are replays
+
+# Same fields as the frontend's PRODUCTS_QUERY listing, plus _updatedAt for incremental sync
+PRODUCT_PROJECTION = """{
+  _id, _createdAt, _updatedAt, name, "slug": slug.current, price, compareAtPrice,
+  "image": images[0].asset->url,
+  "images": images[].asset->url,
+  "category": category->name, "categorySlug": category->slug.current,
+  material, sizes, colors, stock, occasion,
+  isFeatured, isNewArrival, isBestseller,
+  rating, reviewCount, tags
+}"""
+
+
+class ProductPrice(NamedTuple):
+    price: float
+    name: str
+    category_slug: Optional[str]
+
+
+class PriceIndex:
+    """product_id → ProductPrice. Reads are a single dict lookup."""
+
+    def __init__(self):
+        self.prices: dict[str, ProductPrice] = {}
+        self.loaded = False
+        self.version = 0
+        self.last_updated_at = ""  # max Sanity _updatedAt seen, for incremental queries
+        self.etag: Optional[str] = None
+        self.synced_at = 0.0  # monotonic, last pull from Sanity
+        self.full_synced_at = 0.0  # monotonic, last full reload
+
+    def get(self, product_id: str) -> Optional[ProductPrice]:
+        return self.prices.get(product_id)
+
+    def upsert(self, doc: dict):
+        if doc.get("price") is None:
+            self.prices.pop(doc["_id"], None)
+        else:
+            self.prices[doc["_id"]] = ProductPrice(
+                float(doc["price"]), doc.get("name") or "", doc.get("categorySlug"),
+            )
+        updated_at = doc.get("_updatedAt") or ""
+        if updated_at > self.last_updated_at:
+            self.last_updated_at = updated_at
+        self.version += 1
+
+    def remove(self, product_id: str):
+        if self.prices.pop(product_id, None) is not None:
+            self.version += 1
+
+    def load(self, docs: list[dict]):
+        """Replace the whole index from a snapshot."""
+        self.prices = {}
+        self.last_updated_at = ""
+        for doc in docs:
+            if not doc.get("_id", "").startswith("drafts."):
+                self.upsert(doc)
+        self.loaded = True
+
+
+price_index = PriceIndex()
+
+
+# Every product change fans out to all in-memory views of the catalog
+def _load_all(docs: list[dict]):
+    price_index.load(docs)
+    product_mirror.load(docs)
+    search_index.load(docs)
+
+
+def _upsert(doc: dict):
+    price_index.upsert(doc)
+    product_mirror.upsert(doc)
+    search_index.add(doc)
+
+
+def _remove(product_id: str):
+    price_index.remove(product_id)
+    product_mirror.remove(product_id)
+    search_index.remove(product_id)
+
+
+def load_snapshot(path: str = CATALOG_SNAPSHOT_PATH) -> bool:
+    """Load a JSON array of product documents (or a Sanity `{"result": [...]}` response)."""
+    if not path or not os.path.exists(path):
+        return False
+    with open(path) as f:
+        data = json.load(f)
+    _load_all(data["result"] if isinstance(data, dict) else data)
+    return True
+
+
+# ─── Sanity sync ─────────────────────────────────────────────────
+def _query_url() -> str:
+    if SANITY_API_URL:
+        return f"{SANITY_API_URL}/v{SANITY_API_VERSION}/data/query/{SANITY_DATASET}"
+    host = "api" if SANITY_TOKEN else "apicdn"  # CDN answers If-None-Match with 304
+    return f"https://{SANITY_PROJECT_ID}.{host}.sanity.io/v{SANITY_API_VERSION}/data/query/{SANITY_DATASET}"
+
+
+async def fetch_products(client: httpx.AsyncClient, since: str = "", etag: Optional[str] = None):
+    """Returns (docs or None if unchanged, etag)."""
+    if since:
+        query = f'*[_type == "product" && _updatedAt > $since] {PRODUCT_PROJECTION}'
+        params = {"query": query, "$since": json.dumps(since)}
+    else:
+        params = {"query": f'*[_type == "product"] {PRODUCT_PROJECTION}'}
+    headers = {}
+    if SANITY_TOKEN:
+        headers["Authorization"] = f"Bearer {SANITY_TOKEN}"
+    if etag:
+        headers["If-None-Match"] = etag
+    resp = await client.get(_query_url(), params=params, headers=headers, timeout=15.0)
+    if resp.status_code == 304:
+        return None, etag
+    resp.raise_for_status()
+    return resp.json().get("result", []), resp.headers.get("etag")
+
+
+async def sync_catalog(client: httpx.AsyncClient, full: bool = False) -> int:
+    """Pull changes from Sanity into the in-memory catalog. Returns documents applied."""
+    if full or not price_index.loaded:
+        docs, _ = await fetch_products(client)
+        _load_all(docs)
+        price_index.etag = None
+        price_index.synced_at = price_index.full_synced_at = time.monotonic()
+        return len(docs)
+    docs, etag = await fetch_products(client, since=price_index.last_updated_at, etag=price_index.etag)
+    price_index.etag = etag
+    price_index.synced_at = time.monotonic()
+    for doc in docs or []:
+        if not doc["_id"].startswith("drafts."):
+            _upsert(doc)
+    return len(docs or [])
+
+
+_sync_lock = asyncio.Lock()
+
+
+async def ensure_catalog():
+    """
+    Sync on use where no poll loop runs (serverless): a full load while the
+    index is empty, then an incremental pull once two poll intervals have passed
+    without one (so it stays a no-op while the loop keeps up). Like the poll
+    loop, it reloads in full once FULL_RELOAD_EVERY intervals have passed
+    since the last full load — an incremental pull never sees a deletion.
+    """
+    if not (SANITY_PROJECT_ID or SANITY_API_URL):
+        return
+
+    def fresh() -> bool:
+        return price_index.loaded and (
+            CATALOG_POLL_INTERVAL <= 0 or time.monotonic() - price_index.synced_at < 2 * CATALOG_POLL_INTERVAL
+        )
+
+    if fresh():
+        return
+    async with _sync_lock:  # one pull however many requests find the index cold
+        if fresh():
+            return
+        full = time.monotonic() - price_index.full_synced_at >= FULL_RELOAD_EVERY * CATALOG_POLL_INTERVAL
+        try:
+            async with http_client() as client:
+                await sync_catalog(client, full=full)
+        except Exception:
+            pass  # keep serving the last good index; an empty one prices nothing (CatalogUnavailable)
+
+
+async def poll_loop():
+    """Background task run by worker.py."""
+    if not (SANITY_PROJECT_ID or SANITY_API_URL) or CATALOG_POLL_INTERVAL <= 0:
+        return
+    polls = 0
+    async with http_client() as client:
+        while True:
+            try:
+                await sync_catalog(client, full=polls % FULL_RELOAD_EVERY == 0)
+            except Exception:
+                pass  # keep serving the last good index
+            polls += 1
+            await asyncio.sleep(CATALOG_POLL_INTERVAL)
+
+
+def verify_webhook_signature(body: bytes, header: str) -> bool:
+    """
+    Sanity signs webhooks as `t=<ts>,v1=<base64 HMAC-SHA256 of "<ts>.<body>">`.
+    Nothing verifies without SANITY_WEBHOOK_SECRET — an unsigned webhook could set any price —
+    and a signature more than WEBHOOK_TOLERANCE from now is refused, so a captured
+    payload cannot be replayed later (say, to restore an old price).
+    """
+    if not SANITY_WEBHOOK_SECRET:
+        return False
+    parts = dict(p.split("=", 1) for p in header.split(",") if "=" in p)
+    ts, sig = parts.get("t", ""), parts.get("v1", "")
+    try:
+        signed_at = int(ts)
+    except ValueError:
+        return False
+    if signed_at > 10**12:  # Sanity sends milliseconds
+        signed_at /= 1000
+    if abs(time.time() - signed_at) > WEBHOOK_TOLERANCE:
+        return False
+    expected = hmac.new(
+        SANITY_WEBHOOK_SECRET.encode(), f"{ts}.".encode() + body, hashlib.sha256,
+    ).digest()
+    expected_b64 = base64.urlsafe_b64encode(expected).decode().rstrip("=")
+    return hmac.compare_digest(sig.rstrip("="), expected_b64) or hmac.compare_digest(
+        sig, base64.b64encode(expected).decode()
+    )
+
+
+def apply_webhook(doc: dict, operation: str):
+    """Apply one Sanity webhook payload (the product projection) to the in-memory catalog."""
+    product_id = doc.get("_id", "")
+    if not product_id or product_id.startswith("drafts."):
+        return
+    if operation == "delete":
+        _remove(product_id)
+    else:
+        _upsert(doc)
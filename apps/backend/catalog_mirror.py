@@ -0,0 +1,221 @@
+"""
+Local product catalog mirror — filtered/faceted listing without a Sanity round-trip.
+
+Documents are synced incrementally from Sanity (see catalog.py). Query
+indexes are rebuilt lazily after changes: one bitmap (a Python int, bit
+i = product at position i) per facet value, plus precomputed sort orders.
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Optional
+
+FACETS = ("category", "material", "size", "color", "occasion")
+FLAGS = {"new": "isNewArrival", "bestseller": "isBestseller", "featured": "isFeatured"}
+SORTS = ("newest", "price-asc", "price-desc", "rating")
+PRICE_BUCKETS = ((0, 2000), (2000, 5000), (5000, 8000), (8000, None))
+
+
+def _facet_values(doc: dict, facet: str) -> list[str]:
+    if facet == "category":
+        return [doc["categorySlug"]] if doc.get("categorySlug") else []
+    if facet == "material":
+        return [doc["material"]] if doc.get("material") else []
+    if facet == "size":
+        return [s.lower() for s in doc.get("sizes") or []]
+    if facet == "color":
+        return [c["name"].lower() for c in doc.get("colors") or [] if isinstance(c, dict) and c.get("name")]
+    if facet == "occasion":
+        return list(doc.get("occasion") or [])
+    return []
+
+
+def _mask(positions, size: int) -> int:
+    buf = bytearray(size // 8 + 1)
+    for pos in positions:
+        buf[pos >> 3] |= 1 << (pos & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _rank(order: list[int]) -> list[int]:
+    rank = [0] * len(order)
+    for r, pos in enumerate(order):
+        rank[pos] = r
+    return rank
+
+
+def _positions(mask: int) -> list[int]:
+    bits = bin(mask)[:1:-1]  # least significant bit first
+    out = []
+    i = bits.find("1")
+    while i != -1:
+        out.append(i)
+        i = bits.find("1", i + 1)
+    return out
+
+
+class ProductMirror:
+    def __init__(self):
+        self.docs: dict[str, dict] = {}
+        self.version = 0
+        self._built_version = -1
+        self._docs: list[dict] = []
+        self._all = 0
+        self._facets: dict[str, dict[str, int]] = {}
+        self._flags: dict[str, int] = {}
+        self._sorts: dict[str, list[int]] = {}
+        self._ranks: dict[str, list[int]] = {}
+        self._price_order: list[int] = []
+        self._prices_sorted: list[float] = []
+        self._by_slug: dict[str, dict] = {}
+        self._price_buckets: dict[str, int] = {}
+
+    # ─── Sync ────────────────────────────────────────────────────
+    def upsert(self, doc: dict):
+        self.docs[doc["_id"]] = doc
+        self.version += 1
+
+    def remove(self, product_id: str):
+        if self.docs.pop(product_id, None) is not None:
+            self.version += 1
+
+    def load(self, docs: list[dict]):
+        self.docs = {d["_id"]: d for d in docs if not d.get("_id", "").startswith("drafts.")}
+        self.version += 1
+
+    # ─── Index build ─────────────────────────────────────────────
+    def _build(self):
+        docs = list(self.docs.values())
+        size = len(docs)
+        facet_positions: dict[str, dict[str, list[int]]] = {f: {} for f in FACETS}
+        flag_positions: dict[str, list[int]] = {name: [] for name in FLAGS}
+        for pos, doc in enumerate(docs):
+            for facet in FACETS:
+                index = facet_positions[facet]
+                for value in _facet_values(doc, facet):
+                    index.setdefault(value, []).append(pos)
+            for name, field in FLAGS.items():
+                if doc.get(field):
+                    flag_positions[name].append(pos)
+        facets = {
+            facet: {value: _mask(p, size) for value, p in index.items()}
+            for facet, index in facet_positions.items()
+        }
+        flags = {name: _mask(p, size) for name, p in flag_positions.items()}
+
+        positions = range(len(docs))
+        price = lambda i: docs[i].get("price") or 0
+        self._price_order = sorted(positions, key=price)
+        self._prices_sorted = [price(i) for i in self._price_order]
+        self._sorts = {
+            "newest": sorted(positions, key=lambda i: docs[i].get("_createdAt") or "", reverse=True),
+            "price-asc": self._price_order,
+            "price-desc": self._price_order[::-1],
+            "rating": sorted(positions, key=lambda i: (docs[i].get("rating") or 0, docs[i].get("reviewCount") or 0), reverse=True),
+        }
+        self._ranks = {name: _rank(order) for name, order in self._sorts.items()}
+        self._docs = docs
+        self._all = (1 << size) - 1
+        self._facets = facets
+        self._flags = flags
+        self._by_slug = {d["slug"]: d for d in docs if d.get("slug")}
+        self._price_buckets = {
+            f"{lo}-{hi if hi is not None else ''}": self._price_mask(lo, None if hi is None else hi - 0.01)
+            for lo, hi in PRICE_BUCKETS
+        }
+        self._built_version = self.version
+
+    def _ensure_built(self):
+        if self._built_version != self.version:
+            self._build()
+
+    def _price_mask(self, min_price: Optional[float], max_price: Optional[float]) -> int:
+        if min_price is None and max_price is None:
+            return self._all
+        lo = 0 if min_price is None else bisect_left(self._prices_sorted, min_price)
+        hi = len(self._prices_sorted) if max_price is None else bisect_right(self._prices_sorted, max_price)
+        return _mask(self._price_order[lo:hi], len(self._docs))
+
+    # ─── Query ───────────────────────────────────────────────────
+    def get_by_slug(self, slug: str) -> Optional[dict]:
+        self._ensure_built()
+        return self._by_slug.get(slug)
+
+    def query(
+        self,
+        filters: dict[str, list[str]],
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        flag: Optional[str] = None,
+        sort: str = "newest",
+        limit: int = 24,
+        offset: int = 0,
+    ) -> dict:
+        """
+        Filters are OR within a facet and AND across facets. Facet counts
+        for a facet ignore that facet's own selection, so the UI can show
+        how many results each alternative value would give.
+        """
+        self._ensure_built()
+
+        base = self._price_mask(min_price, max_price)
+        if flag in self._flags:
+            base &= self._flags[flag]
+
+        facet_masks: dict[str, int] = {}
+        for facet, values in filters.items():
+            if facet not in self._facets or not values:
+                continue
+            index = self._facets[facet]
+            mask = 0
+            for value in values:
+                mask |= index.get(value.lower() if facet in ("size", "color") else value, 0)
+            facet_masks[facet] = mask
+
+        result = base
+        for mask in facet_masks.values():
+            result &= mask
+
+        facet_counts = {}
+        for facet, index in self._facets.items():
+            others = base
+            for other, mask in facet_masks.items():
+                if other != facet:
+                    others &= mask
+            counts = {value: (bits & others).bit_count() for value, bits in index.items()}
+            facet_counts[facet] = {v: c for v, c in sorted(counts.items()) if c}
+
+        # Price buckets count everything except the price range itself
+        unpriced = self._flags[flag] if flag in self._flags else self._all
+        for mask in facet_masks.values():
+            unpriced &= mask
+        facet_counts["price"] = {
+            label: (unpriced & bits).bit_count() for label, bits in self._price_buckets.items()
+        }
+
+        if sort not in self._sorts:
+            sort = "newest"
+        total = result.bit_count()
+        end = offset + limit
+        if total <= 4 * end:
+            # Sparse result: rank just the matching positions
+            rank = self._ranks[sort]
+            matched = sorted(_positions(result), key=rank.__getitem__)
+        else:
+            # Dense result: walk the precomputed order until the page is full
+            members = set(_positions(result))
+            matched = []
+            for pos in self._sorts[sort]:
+                if pos in members:
+                    matched.append(pos)
+                    if len(matched) >= end:
+                        break
+        page = [self._docs[pos] for pos in matched[offset:end]]
+
+        return {
+            "products": page,
+            "total": total,
+            "facets": facet_counts,
+        }
+
+
+product_mirror = ProductMirror()
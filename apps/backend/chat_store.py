@@ -0,0 +1,259 @@
+"""Server-side chat sessions — bounded TTL store (memory/SQLite/app database) + token-budgeted context"""
+
+import asyncio
+import json
+import os
+import secrets
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import delete, select
+
+from database import SERVERLESS, async_session
+from jobs import task
+from models import StoredChatSession
+
+# memory | sqlite | database — serverless instances share nothing but the database
+CHAT_STORE = os.getenv("CHAT_STORE") or ("database" if SERVERLESS else "memory")
+CHAT_STORE_PATH = os.getenv("CHAT_STORE_PATH", "./chat_sessions.db")
+CHAT_SESSION_TTL = int(os.getenv("CHAT_SESSION_TTL", str(6 * 3600)))  # seconds idle before eviction
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "10000"))
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "1500"))  # budget for history sent upstream
+CHAT_MAX_STORED_MESSAGES = 40  # older turns are folded into the summary
+
+EVICT_INTERVAL = 60  # seconds between expiry sweeps triggered from save()
+SUMMARY_TOKENS = 200
+SUMMARY_SNIPPET_CHARS = 80
+
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(16)
+
+
+def estimate_tokens(text: str) -> int:
+    """~4 chars per token for English/Roman-Urdu text, plus per-message overhead."""
+    return len(text) // 4 + 4
+
+
+class ChatSession:
+    __slots__ = ("messages", "summary", "updated_at")
+
+    def __init__(self, messages: Optional[list[dict]] = None, summary: str = "", updated_at: float = 0.0):
+        self.messages = messages or []
+        self.summary = summary
+        self.updated_at = updated_at or time.time()
+
+    def append(self, role: str, content: str):
+        self.messages.append({"role": role, "content": content})
+        if len(self.messages) > CHAT_MAX_STORED_MESSAGES:
+            overflow = self.messages[:-CHAT_MAX_STORED_MESSAGES]
+            self.messages = self.messages[-CHAT_MAX_STORED_MESSAGES:]
+            self.summary = summarize(overflow, self.summary)
+        self.updated_at = time.time()
+
+
+def summarize(messages: list[dict], previous: str = "") -> str:
+    """
+    Extractive summary of older turns — the customer's earlier questions,
+    clipped, newest kept when over budget. Costs no upstream LLM call.
+    """
+    asked = [
+        " ".join(m["content"].split())[:SUMMARY_SNIPPET_CHARS]
+        for m in messages
+        if m["role"] == "user" and m["content"].strip()
+    ]
+    if previous:
+        asked = [previous.removeprefix("Earlier the customer asked about: ")] + asked
+    while asked and estimate_tokens("; ".join(asked)) > SUMMARY_TOKENS:
+        asked.pop(0)
+    return f"Earlier the customer asked about: {'; '.join(asked)}" if asked else ""
+
+
+def build_context(session: ChatSession, budget: int = CHAT_CONTEXT_TOKENS) -> list[dict]:
+    """
+    Newest messages that fit in `budget` tokens. Anything older that does
+    not fit is summarized into a single system message instead of dropped.
+    """
+    if session.summary or sum(estimate_tokens(m["content"]) for m in session.messages) > budget:
+        budget -= SUMMARY_TOKENS  # leave room for the summary message
+    kept: list[dict] = []
+    used = 0
+    cut = len(session.messages)
+    for i in range(len(session.messages) - 1, -1, -1):
+        cost = estimate_tokens(session.messages[i]["content"])
+        if kept and used + cost > budget:
+            break
+        kept.append(session.messages[i])
+        used += cost
+        cut = i
+    kept.reverse()
+
+    summary = summarize(session.messages[:cut], session.summary) if cut else session.summary
+    if summary:
+        return [{"role": "system", "content": summary}, *kept]
+    return kept
+
+
+# ─── Backends ────────────────────────────────────────────────────
+class MemoryChatStore:
+    """LRU-bounded dict; idle sessions expire after CHAT_SESSION_TTL."""
+
+    def __init__(self, max_sessions: int = CHAT_MAX_SESSIONS, ttl: int = CHAT_SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._last_sweep = time.time()
+
+    async def get(self, session_id: str) -> Optional[ChatSession]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if time.time() - session.updated_at > self.ttl:
+            del self._sessions[session_id]
+            return None
+        self._sessions.move_to_end(session_id)
+        return session
+
+    async def save(self, session_id: str, session: ChatSession):
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        if time.time() - self._last_sweep > EVICT_INTERVAL:
+            await self.evict_expired()
+
+    async def evict_expired(self) -> int:
+        self._last_sweep = time.time()
+        cutoff = time.time() - self.ttl
+        expired = [sid for sid, s in self._sessions.items() if s.updated_at < cutoff]
+        for sid in expired:
+            del self._sessions[sid]
+        return len(expired)
+
+
+class SQLiteChatStore:
+    """Single-file SQLite store — survives restarts; blocking I/O runs in a thread."""
+
+    def __init__(self, path: str = CHAT_STORE_PATH, max_sessions: int = CHAT_MAX_SESSIONS, ttl: int = CHAT_SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_sessions ("
+            " id TEXT PRIMARY KEY, messages TEXT NOT NULL, summary TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_chat_sessions_updated ON chat_sessions (updated_at)")
+        self._lock = asyncio.Lock()
+        self._last_sweep = time.time()
+
+    def _get(self, session_id: str) -> Optional[ChatSession]:
+        row = self._conn.execute(
+            "SELECT messages, summary, updated_at FROM chat_sessions WHERE id = ? AND updated_at >= ?",
+            (session_id, time.time() - self.ttl),
+        ).fetchone()
+        if row is None:
+            return None
+        return ChatSession(json.loads(row[0]), row[1], row[2])
+
+    def _save(self, session_id: str, session: ChatSession):
+        self._conn.execute(
+            "INSERT INTO chat_sessions (id, messages, summary, updated_at) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT(id) DO UPDATE SET messages = excluded.messages,"
+            " summary = excluded.summary, updated_at = excluded.updated_at",
+            (session_id, json.dumps(session.messages), session.summary, session.updated_at),
+        )
+
+    def _evict(self) -> int:
+        cur = self._conn.execute("DELETE FROM chat_sessions WHERE updated_at < ?", (time.time() - self.ttl,))
+        removed = cur.rowcount
+        cur = self._conn.execute(
+            "DELETE FROM chat_sessions WHERE id IN ("
+            " SELECT id FROM chat_sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,),
+        )
+        return removed + cur.rowcount
+
+    async def get(self, session_id: str) -> Optional[ChatSession]:
+        async with self._lock:
+            return await asyncio.to_thread(self._get, session_id)
+
+    async def save(self, session_id: str, session: ChatSession):
+        async with self._lock:
+            await asyncio.to_thread(self._save, session_id, session)
+        if time.time() - self._last_sweep > EVICT_INTERVAL:
+            await self.evict_expired()
+
+    async def evict_expired(self) -> int:
+        self._last_sweep = time.time()
+        async with self._lock:
+            return await asyncio.to_thread(self._evict)
+
+
+class DatabaseChatStore:
+    """
+    The chat_sessions table on the app's own database, so a conversation
+    survives cold starts and requests landing on other instances. Idle
+    sessions are purged by the chat.purge_expired job; each new session
+    also drops the least recently used ones past max_sessions.
+    """
+
+    def __init__(self, max_sessions: int = CHAT_MAX_SESSIONS, ttl: int = CHAT_SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+
+    async def get(self, session_id: str) -> Optional[ChatSession]:
+        async with async_session() as db:
+            row = (await db.execute(
+                select(StoredChatSession).where(
+                    StoredChatSession.id == session_id,
+                    StoredChatSession.updated_at >= time.time() - self.ttl,
+                )
+            )).scalar_one_or_none()
+        if row is None:
+            return None
+        return ChatSession(row.messages, row.summary, row.updated_at)
+
+    async def save(self, session_id: str, session: ChatSession):
+        async with async_session() as db:
+            new = await db.get(StoredChatSession, session_id) is None
+            await db.merge(StoredChatSession(
+                id=session_id, messages=session.messages, summary=session.summary, updated_at=session.updated_at,
+            ))
+            if new:  # only a new session can push the table over the cap
+                await db.flush()
+                oldest_kept = (
+                    select(StoredChatSession.updated_at)
+                    .order_by(StoredChatSession.updated_at.desc())
+                    .offset(self.max_sessions - 1).limit(1)
+                    .scalar_subquery()
+                )
+                await db.execute(delete(StoredChatSession).where(StoredChatSession.updated_at < oldest_kept))
+            await db.commit()
+
+    async def evict_expired(self) -> int:
+        return await purge_expired_sessions()
+
+
+@task("chat.purge_expired", every=3600)
+async def purge_expired_sessions() -> int:
+    async with async_session() as db:
+        result = await db.execute(
+            delete(StoredChatSession).where(StoredChatSession.updated_at < time.time() - CHAT_SESSION_TTL)
+        )
+        await db.commit()
+        return result.rowcount or 0
+
+
+STORES = {"memory": MemoryChatStore, "sqlite": SQLiteChatStore, "database": DatabaseChatStore}
+_store = None
+
+
+def get_chat_store():
+    global _store
+    if _store is None:
+        _store = STORES.get(CHAT_STORE, MemoryChatStore)()
+    return _store
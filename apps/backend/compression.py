@@ -0,0 +1,126 @@
+"""
+Response compression — Brotli or gzip, negotiated from Accept-Encoding.
+
+Only complete (non-streaming) responses of an allowlisted text type and at
+least COMPRESS_MIN_SIZE bytes are compressed; images, already-encoded and
+streamed bodies pass through untouched. Bodies over COMPRESS_OFFLOAD_SIZE
+are compressed in a worker thread (zlib and brotli release the GIL), so a
+5 MB order export does not stall every other request on the event loop.
+Brotli is used when the `brotli` package is installed and the client
+prefers it; otherwise gzip.
+"""
+
+import asyncio
+import gzip
+import os
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # optional — gzip only
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))  # bytes; smaller bodies gain nothing
+COMPRESS_OFFLOAD_SIZE = int(os.getenv("COMPRESS_OFFLOAD_SIZE", str(64 * 1024)))  # bytes
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # 4–5 is the usual dynamic-content sweet spot; 11 is for static assets
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+
+
+def _compressible(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return any(media_type == t or (t.endswith("/") and media_type.startswith(t)) for t in COMPRESSIBLE_TYPES)
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Best supported coding in an Accept-Encoding header ("br", "gzip" or None)."""
+    offered = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if coding:
+            offered[coding.strip()] = q
+    supported = (["br"] if brotli is not None else []) + ["gzip"]
+    best = None
+    for coding in supported:  # server preference breaks ties
+        q = offered.get(coding, offered.get("*", 0.0))
+        if q > 0 and (best is None or q > best[1]):
+            best = (coding, q)
+    return best[0] if best else None
+
+
+def compress(body: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = COMPRESS_MIN_SIZE,
+        offload_size: int = COMPRESS_OFFLOAD_SIZE,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        coding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        start: Optional[Message] = None
+        passthrough = False
+
+        async def send_wrapper(message: Message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message  # held until the body shows whether to compress
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                return await send(message)
+
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            if (
+                coding is None
+                or message.get("more_body", False)  # streamed — sent as is
+                or "content-encoding" in headers
+                or len(body) < self.minimum_size
+                or not _compressible(headers.get("content-type", ""))
+            ):
+                passthrough = True
+                if _compressible(headers.get("content-type", "")):
+                    headers.add_vary_header("Accept-Encoding")  # caches must not reuse it for other encodings
+                await send(start)
+                return await send(message)
+
+            if len(body) >= self.offload_size:
+                compressed = await asyncio.to_thread(compress, body, coding)
+            else:
+                compressed = compress(body, coding)
+            headers["Content-Encoding"] = coding
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"  # same content, different bytes — no longer a strong match
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
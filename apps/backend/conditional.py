@@ -0,0 +1,91 @@
+"""
+Conditional GET — ETags from data versions, 304 before the response is built.
+
+    @router.get("/orders")
+    @conditional("admin.orders", version=orders_version)
+    async def list_orders(db: AsyncSession = Depends(get_db)): ...
+
+`version` is called with the handler's arguments and returns a small
+tuple that changes whenever the response would — typically
+(count, max(updated_at)) from one aggregate query. The ETag is a hash of
+it, so If-None-Match is answered with 304 after that query alone; the
+full query and encoding run only on a 200. The version is read before the
+body is built, so a write in between can only make the next check miss,
+never serve an outdated body as current.
+
+The version is also published in `current_version` while the handler
+runs, so a @cached layer underneath serves only a body computed at that
+same version — never another worker's older copy under a newer ETag.
+
+ETags are strong; CompressionMiddleware weakens them on encoded bodies,
+and If-None-Match is compared weakly, as RFC 9110 requires.
+"""
+
+import functools
+import hashlib
+import inspect
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional
+
+from fastapi import Header, Response
+
+from responses import FastJSONResponse
+
+CACHE_CONTROL = "private, no-cache"  # browsers keep the body but revalidate every time
+
+current_version: ContextVar[Optional[tuple]] = ContextVar("current_version", default=None)
+
+
+def etag_for(namespace: str, version: tuple) -> str:
+    digest = hashlib.blake2b(repr((namespace, version)).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against `etag`."""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def conditional(namespace: str, *, version: Callable[..., Awaitable[Optional[tuple]]]):
+    """
+    Route decorator: tag 200 responses with an ETag derived from
+    `version(**handler kwargs)` and answer a matching If-None-Match with
+    304. A version of None (e.g. the row does not exist) skips both and
+    lets the handler respond.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, if_none_match: Optional[str] = None, **kwargs):
+            current = await version(**kwargs)
+            if current is None:
+                return await func(*args, **kwargs)
+            etag = etag_for(namespace, current)
+            headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+            if if_none_match and matches(if_none_match, etag):
+                return Response(status_code=304, headers=headers)
+
+            token = current_version.set(current)
+            try:
+                response = await func(*args, **kwargs)
+            finally:
+                current_version.reset(token)
+            if not isinstance(response, Response):
+                response = FastJSONResponse(response)
+            if response.status_code == 200:
+                response.headers.update(headers)
+            return response
+
+        header = inspect.Parameter(
+            "if_none_match",
+            inspect.Parameter.KEYWORD_ONLY,
+            default=Header(None, alias="If-None-Match"),
+            annotation=Optional[str],
+        )
+        sig = inspect.signature(func)
+        wrapper.__signature__ = sig.replace(parameters=[*sig.parameters.values(), header])
+        return wrapper
+
+    return decorator
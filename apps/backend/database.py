@@ -1,7 +1,28 @@
-"""Database setup — async SQLAlchemy + PostgreSQL"""
+"""
+Database setup — async SQLAlchemy + PostgreSQL
+
+The engine (and with it the psycopg / aiosqlite driver) is created on
+first use rather than at import, so a cold start that never touches the
+database — /health, the catalog and search routes — does not pay for it.
+
+DB_MODE picks the connection strategy (default: "serverless" on Vercel or
+Lambda, "server" elsewhere):
+  server      a pool per process (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+  serverless  one connection kept for warm invocations, a couple more for
+              bursts that close as soon as they are returned; pre-pinged,
+              since a frozen instance's connection may have been dropped
+  nopool      a connection per session, closed after — for when an
+              external pooler should own every connection
+Behind a transaction-mode pooler (Neon's "-pooler" host, or
+DB_PGBOUNCER=1) psycopg's server-side prepared statements are disabled:
+the next transaction may run on a backend that never saw them.
+"""
 
 import os
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from typing import Optional
+
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 
 DATABASE_URL = os.getenv(
@@ -16,8 +37,62 @@ if DATABASE_URL.startswith("postgres://"):
 elif DATABASE_URL.startswith("postgresql://") and "+psycopg" not in DATABASE_URL:
     DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+psycopg://", 1)
 
-engine = create_async_engine(DATABASE_URL, echo=False)
-async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+DIALECT = make_url(DATABASE_URL).get_backend_name()  # "postgresql" | "sqlite", known without the driver
+
+SERVERLESS = bool(os.getenv("VERCEL") or os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
+DB_MODE = os.getenv("DB_MODE") or ("serverless" if SERVERLESS else "server")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_SERVERLESS_OVERFLOW = int(os.getenv("DB_SERVERLESS_OVERFLOW", "2"))  # burst connections per instance
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "240"))  # seconds; under Neon's 5 min idle suspend
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "") == "1"
+
+
+def behind_pooler(url: URL) -> bool:
+    return DB_PGBOUNCER or "-pooler" in (url.host or "")
+
+
+def engine_options(database_url: str = DATABASE_URL, mode: str = DB_MODE) -> dict:
+    """create_async_engine keyword arguments for a deployment mode."""
+    url = make_url(database_url)
+    options: dict = {"echo": False}
+    if mode == "nopool":
+        from sqlalchemy.pool import NullPool
+
+        options["poolclass"] = NullPool
+    elif url.database not in (None, "", ":memory:"):  # in-memory SQLite keeps its single static connection
+        if mode == "serverless":
+            options.update(pool_size=1, max_overflow=DB_SERVERLESS_OVERFLOW, pool_pre_ping=True, pool_recycle=DB_POOL_RECYCLE)
+        else:
+            options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+    if url.get_backend_name() == "postgresql" and behind_pooler(url):
+        options["connect_args"] = {"prepare_threshold": None}
+    return options
+
+_engine: Optional[AsyncEngine] = None
+_sessionmaker: Optional[async_sessionmaker] = None
+
+
+def get_engine() -> AsyncEngine:
+    global _engine
+    if _engine is None:
+        _engine = create_async_engine(DATABASE_URL, **engine_options())
+    return _engine
+
+
+def async_session() -> AsyncSession:
+    """A new session — `async with async_session() as db:`"""
+    global _sessionmaker
+    if _sessionmaker is None:
+        _sessionmaker = async_sessionmaker(get_engine(), class_=AsyncSession, expire_on_commit=False)
+    return _sessionmaker()
+
+
+def __getattr__(name: str):
+    # `from database import engine` still works; it just creates the engine at that point
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class Base(DeclarativeBase):
@@ -0,0 +1,188 @@
+"""Idempotency-Key support for order/payment creation — stored responses replayed on retry"""
+
+import asyncio
+import functools
+import hashlib
+import inspect
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import Header, HTTPException
+from pydantic import BaseModel
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+
+from database import async_session
+from jobs import task
+from models import IdempotencyKey
+from responses import FastJSONResponse
+
+IDEMPOTENCY_TTL = timedelta(hours=int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")))
+IDEMPOTENCY_WAIT = 15.0  # seconds a duplicate waits for the first request in another process
+STALE_AFTER = timedelta(minutes=2)  # in-progress rows older than this belong to a crashed worker
+POLL_INTERVAL = 0.1
+CLEANUP_INTERVAL = 3600
+
+# (future, request hash) for keys currently being processed in this process — duplicates await these
+_inflight: dict[str, tuple[asyncio.Future, str]] = {}
+
+
+def _request_hash(kwargs: dict) -> str:
+    h = hashlib.sha256()
+    for name in sorted(kwargs):
+        value = kwargs[name]
+        if isinstance(value, BaseModel):
+            h.update(name.encode())
+            h.update(value.model_dump_json().encode())
+    return h.hexdigest()
+
+
+def _replay(row_code: int, row_body) -> FastJSONResponse:
+    if row_code >= 400:
+        raise HTTPException(row_code, row_body.get("detail") if isinstance(row_body, dict) else row_body)
+    return FastJSONResponse(row_body, status_code=row_code, headers={"Idempotent-Replayed": "true"})
+
+
+async def _claim(key: str, request_hash: str) -> Optional[IdempotencyKey]:
+    """Insert an in-progress row for `key`. Returns the existing row if someone else owns it."""
+    async with async_session() as db:
+        for _ in range(2):
+            now = datetime.utcnow()
+            db.add(IdempotencyKey(
+                key=key,
+                request_hash=request_hash,
+                status="in_progress",
+                created_at=now,
+                expires_at=now + IDEMPOTENCY_TTL,
+            ))
+            try:
+                await db.commit()
+                return None
+            except IntegrityError:
+                await db.rollback()
+            existing = await db.get(IdempotencyKey, key)
+            if existing is None:
+                continue
+            stale = existing.status == "in_progress" and existing.created_at < now - STALE_AFTER
+            if stale or existing.expires_at < now:  # expired but not purged yet: the key is free again
+                await db.delete(existing)
+                await db.commit()
+                continue
+            return existing
+        raise HTTPException(409, "A request with this Idempotency-Key is still in progress")
+
+
+async def _wait_for_completion(key: str) -> IdempotencyKey:
+    """Another process owns the key — poll until it stores a response."""
+    deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT
+    while asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(POLL_INTERVAL)
+        async with async_session() as db:
+            row = await db.get(IdempotencyKey, key)
+        if row is None or row.status == "completed":
+            return row
+    raise HTTPException(409, "A request with this Idempotency-Key is still in progress")
+
+
+async def _finish(key: str, code: int, body):
+    async with async_session() as db:
+        row = await db.get(IdempotencyKey, key)
+        if row is None:
+            return
+        if code >= 500:
+            # Server/gateway failures are not final — let the client retry with the same key
+            await db.delete(row)
+        else:
+            row.status = "completed"
+            row.response_code = code
+            row.response_body = body
+        await db.commit()
+
+
+def idempotent(scope: str):
+    """
+    Route decorator: honour an optional `Idempotency-Key` header.
+
+    First request with a key runs the handler and stores its response;
+    repeats replay the stored response without running the handler, and
+    concurrent duplicates wait for the first one instead of racing it.
+    Keys are scoped per endpoint and per caller (the route's `user`, or
+    "guest"), so one customer's key never replays another's response,
+    and must be reused with the same body.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, idempotency_key: Optional[str] = None, **kwargs):
+            if not idempotency_key:
+                return await func(*args, **kwargs)
+
+            owner = getattr(kwargs.get("user"), "id", None) or "guest"
+            key = f"{scope}:{owner}:{idempotency_key[:200]}"
+            request_hash = _request_hash(kwargs)
+
+            inflight = _inflight.get(key)
+            if inflight is not None:
+                if inflight[1] != request_hash:
+                    raise HTTPException(422, "Idempotency-Key was already used with a different request")
+                code, body = await asyncio.shield(inflight[0])
+                return _replay(code, body)
+
+            future = asyncio.get_running_loop().create_future()
+            _inflight[key] = (future, request_hash)
+            try:
+                existing = await _claim(key, request_hash)
+                if existing is not None:
+                    if existing.request_hash != request_hash:
+                        raise HTTPException(422, "Idempotency-Key was already used with a different request")
+                    if existing.status != "completed":
+                        existing = await _wait_for_completion(key)
+                    if existing is None:
+                        raise HTTPException(409, "Previous request with this Idempotency-Key failed; retry")
+                    result = (existing.response_code, existing.response_body)
+                    future.set_result(result)
+                    return _replay(*result)
+
+                try:
+                    response = await func(*args, **kwargs)
+                except HTTPException as e:
+                    result = (e.status_code, {"detail": e.detail})
+                    await _finish(key, *result)
+                    future.set_result(result)
+                    raise
+                except BaseException:
+                    await _finish(key, 500, None)
+                    future.set_result((500, {"detail": "Internal Server Error"}))
+                    raise
+
+                result = (200, response)
+                await _finish(key, *result)
+                future.set_result(result)
+                return response
+            finally:
+                if not future.done():
+                    future.set_result((500, {"detail": "Request was cancelled"}))
+                _inflight.pop(key, None)
+
+        header = inspect.Parameter(
+            "idempotency_key",
+            inspect.Parameter.KEYWORD_ONLY,
+            default=Header(None, alias="Idempotency-Key"),
+            annotation=Optional[str],
+        )
+        sig = inspect.signature(func)
+        wrapper.__signature__ = sig.replace(parameters=[*sig.parameters.values(), header])
+        return wrapper
+
+    return decorator
+
+
+@task("idempotency.purge_expired", every=CLEANUP_INTERVAL)
+async def purge_expired_keys() -> int:
+    async with async_session() as db:
+        result = await db.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.expires_at < datetime.utcnow())
+        )
+        await db.commit()
+        return result.rowcount or 0
+
@@ -0,0 +1,214 @@
+"""Image post-processing for generated try-on output — WebP/AVIF variants + blur placeholder"""
+
+import asyncio
+import base64
+import io
+import os
+import secrets
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Optional
+
+from sqlalchemy import delete, select
+
+from database import SERVERLESS, async_session
+from jobs import task
+from models import GeneratedImage
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+VARIANT_WIDTHS = (320, 640, 1024)
+VARIANT_QUALITY = {"avif": 50, "webp": 72}
+PLACEHOLDER_WIDTH = 16
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_STORE_SIZE = int(os.getenv("IMAGE_STORE_SIZE", "64"))  # generated images also cached in memory
+IMAGE_TTL = timedelta(hours=int(os.getenv("IMAGE_TTL_HOURS", "24")))  # how long variants stay servable
+
+MIME_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+
+
+def _formats() -> list[str]:
+    """AVIF first (smallest) when this Pillow build can encode it, WebP always."""
+    from PIL import features  # Pillow is imported on first use, not at startup
+
+    return [f for f in ("avif", "webp") if features.check(f)]
+
+
+def _encode(img: "Image.Image", fmt: str, quality: int) -> bytes:
+    buf = io.BytesIO()
+    options = {"method": 4} if fmt == "webp" else {"speed": 8}
+    img.save(buf, format=fmt.upper(), quality=quality, **options)
+    return buf.getvalue()
+
+
+def render_variants(data: bytes) -> dict:
+    """
+    Decode the generated image and encode every width × format variant.
+    CPU-bound — runs inside the process pool (a thread where there is
+    none), never on the event loop.
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as src:
+        img = src.convert("RGB")
+    width, height = img.size
+
+    variants = []
+    for fmt in _formats():
+        for w in VARIANT_WIDTHS:
+            if w > width:
+                continue
+            resized = img if w == width else img.resize((w, round(height * w / width)), Image.LANCZOS)
+            variants.append({
+                "format": fmt,
+                "width": w,
+                "data": _encode(resized, fmt, VARIANT_QUALITY[fmt]),
+            })
+        if width not in VARIANT_WIDTHS and width < VARIANT_WIDTHS[-1]:
+            # Source smaller than the largest breakpoint — keep a full-size variant too
+            variants.append({"format": fmt, "width": width, "data": _encode(img, fmt, VARIANT_QUALITY[fmt])})
+
+    tiny = img.resize((PLACEHOLDER_WIDTH, max(1, round(height * PLACEHOLDER_WIDTH / width))), Image.BILINEAR)
+    placeholder = base64.b64encode(_encode(tiny, "webp", 30)).decode("ascii")
+
+    return {
+        "width": width,
+        "height": height,
+        "original_bytes": len(data),
+        "variants": variants,
+        "placeholder": f"data:image/webp;base64,{placeholder}",
+    }
+
+
+# ─── Process pool ────────────────────────────────────────────────
+# Serverless runtimes (Vercel, Lambda) have no /dev/shm semaphores, so a
+# process pool cannot start there; variants are then encoded on a thread —
+# Pillow releases the GIL while it encodes.
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_unavailable = SERVERLESS
+
+
+def get_pool() -> Optional[ProcessPoolExecutor]:
+    """The shared process pool, or None where processes cannot be started."""
+    global _pool, _pool_unavailable
+    if _pool is None and not _pool_unavailable:
+        try:
+            _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+        except (OSError, NotImplementedError, ImportError):
+            _pool_unavailable = True
+    return _pool
+
+
+async def _render(data: bytes) -> dict:
+    global _pool_unavailable
+    pool = get_pool()
+    if pool is not None:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, render_variants, data)
+        except (BrokenProcessPool, OSError, NotImplementedError):
+            shutdown_pool()
+            _pool_unavailable = True
+    return await asyncio.to_thread(render_variants, data)
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+# ─── Variant store ───────────────────────────────────────────────
+# Variants live in the generated_images table, so any instance (or uvicorn
+# worker) can serve GET /api/ai/imagine/images/{image_id}/{name}; a bounded
+# LRU in front of it saves the round trip for images this process just made.
+_store: "OrderedDict[str, dict[str, bytes]]" = OrderedDict()
+
+
+def _cache(image_id: str, files: dict[str, bytes]):
+    _store.setdefault(image_id, {}).update(files)
+    _store.move_to_end(image_id)
+    while len(_store) > IMAGE_STORE_SIZE:
+        _store.popitem(last=False)
+
+
+async def store_variants(variants: list[dict]) -> str:
+    image_id = secrets.token_urlsafe(12)
+    files = {f"{v['width']}.{v['format']}": v["data"] for v in variants}
+    expires_at = datetime.utcnow() + IMAGE_TTL
+    async with async_session() as db:
+        db.add_all(
+            GeneratedImage(image_id=image_id, name=name, data=data, expires_at=expires_at)
+            for name, data in files.items()
+        )
+        await db.commit()
+    _cache(image_id, files)
+    return image_id
+
+
+async def get_variant(image_id: str, name: str) -> Optional[bytes]:
+    files = _store.get(image_id)
+    if files is not None and name in files:
+        _store.move_to_end(image_id)
+        return files[name]
+
+    async with async_session() as db:
+        data = (await db.execute(
+            select(GeneratedImage.data).where(
+                GeneratedImage.image_id == image_id,
+                GeneratedImage.name == name,
+                GeneratedImage.expires_at > datetime.utcnow(),
+            )
+        )).scalar_one_or_none()
+    if data is not None:
+        _cache(image_id, {name: data})
+    return data
+
+
+@task("images.purge_expired", every=3600)
+async def purge_expired_images() -> int:
+    async with async_session() as db:
+        result = await db.execute(delete(GeneratedImage).where(GeneratedImage.expires_at < datetime.utcnow()))
+        await db.commit()
+        return result.rowcount or 0
+
+
+async def process_generated_image(data: bytes, url_prefix: str) -> dict:
+    """
+    Post-process raw generated bytes into a srcset-style response.
+    `url_prefix` is the route the variants are served from.
+    """
+    rendered = await _render(data)
+    variants = rendered["variants"]
+    if not variants:
+        raise ValueError("no encodable image variants")
+
+    image_id = await store_variants(variants)
+    base = f"{url_prefix}/{image_id}"
+
+    srcset: dict[str, str] = {}
+    for fmt in _formats():
+        entries = [v for v in variants if v["format"] == fmt]
+        if entries:
+            srcset[MIME_TYPES[fmt]] = ", ".join(
+                f"{base}/{v['width']}.{fmt} {v['width']}w" for v in entries
+            )
+
+    # Widest WebP is the universal fallback for <img src>
+    fallback = max((v for v in variants if v["format"] == "webp"), key=lambda v: v["width"], default=variants[-1])
+    return {
+        "image_url": f"{base}/{fallback['width']}.{fallback['format']}",
+        "srcset": srcset,
+        "sizes": "(max-width: 640px) 100vw, 640px",
+        "placeholder": rendered["placeholder"],
+        "width": rendered["width"],
+        "height": rendered["height"],
+        "variants": [
+            {"format": v["format"], "width": v["width"], "bytes": len(v["data"])}
+            for v in variants
+        ],
+        "original_bytes": rendered["original_bytes"],
+    }
@@ -0,0 +1,325 @@
+"""
+Inventory — per-SKU stock with atomic reservations at checkout.
+
+Stock is taken with conditional UPDATEs (`available >= :qty`) in a short
+transaction of its own, so no row stays locked while a gateway call is in
+flight. Hot SKUs spread their stock over several shard rows; a checkout
+starts at a random shard so concurrent buyers rarely touch the same row.
+A checkout takes its SKUs in sorted order, so two carts holding the same
+items never lock them in opposite orders; a deadlock that still happens
+(two buyers each needing several shards of one SKU) is retried.
+Reservations for unpaid orders are held as long as the order stays
+payable: order_expiry.py returns them when it cancels the order, and the
+sweeper here only catches holds whose order row was never written. A
+payment that still lands after its stock went back takes it again.
+"""
+
+import asyncio
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import async_session
+from jobs import task
+from models import InventoryReservation, InventoryShard
+from tracing import traced
+
+# An unpaid order is payable until ORDER_EXPIRY_HOURS (order_expiry.py), so its stock is held that long,
+# plus a margin for the expiry sweep to cancel the order (and return the stock) first
+RESERVATION_TTL = timedelta(hours=float(os.getenv("ORDER_EXPIRY_HOURS", "24")) + 1)
+SWEEP_INTERVAL = 60
+SWEEP_BATCH = 500
+TAKE_ROUNDS = 3  # re-read shard levels this many times when racing other buyers
+RESERVE_ATTEMPTS = 3  # tries when the database aborts a reservation as a deadlock
+CONFLICT_SQLSTATES = ("40P01", "40001")  # deadlock_detected, serialization_failure
+
+
+class OutOfStock(Exception):
+    def __init__(self, sku: str):
+        super().__init__(f"Out of stock: {sku}")
+        self.sku = sku
+
+
+class StockContention(Exception):
+    """The reservation kept losing deadlocks to concurrent checkouts."""
+
+
+def sku_for(product_id: str, size: Optional[str] = None, color: Optional[str] = None) -> str:
+    return f"{product_id}:{(size or '').strip().lower()}:{(color or '').strip().lower()}"
+
+
+async def _product_tracked(db: AsyncSession, sku: str) -> bool:
+    """Whether any variant of the SKU's product has inventory rows (a key range, so an index seek)."""
+    product_id = sku.split(":", 1)[0]
+    return await db.scalar(
+        select(InventoryShard.sku)
+        .where(InventoryShard.sku >= f"{product_id}:", InventoryShard.sku < f"{product_id};")  # ";" follows ":"
+        .limit(1)
+    ) is not None
+
+
+async def _take(db: AsyncSession, sku: str, quantity: int) -> Optional[list[tuple[int, int]]]:
+    """
+    Decrement `quantity` across the SKU's shards. Returns [(shard, taken)],
+    None if the product is not tracked at all, or raises OutOfStock — also
+    for a variant with no rows of a product that has tracked ones, so a size
+    or colour the client made up cannot skip the stock limit.
+    """
+    taken: list[tuple[int, int]] = []
+    remaining = quantity
+    for _ in range(TAKE_ROUNDS):
+        rows = (await db.execute(
+            select(InventoryShard.shard, InventoryShard.available).where(InventoryShard.sku == sku)
+        )).all()
+        if not rows:
+            if await _product_tracked(db, sku):
+                raise OutOfStock(sku)
+            return None
+        if sum(r.available for r in rows) < remaining:
+            raise OutOfStock(sku)
+        start = random.randrange(len(rows))
+        for shard, available in rows[start:] + rows[:start]:
+            if available <= 0:
+                continue
+            take = min(remaining, available)
+            result = await db.execute(
+                update(InventoryShard)
+                .where(
+                    InventoryShard.sku == sku,
+                    InventoryShard.shard == shard,
+                    InventoryShard.available >= take,
+                )
+                .values(available=InventoryShard.available - take)
+            )
+            if result.rowcount == 1:
+                taken.append((shard, take))
+                remaining -= take
+                if remaining == 0:
+                    return taken
+    raise OutOfStock(sku)
+
+
+@traced()
+async def reserve_or_409(order_id: str, items: list, hold: bool = True) -> int:
+    """reserve_order_items for route handlers — OutOfStock becomes a 409 naming the item."""
+    try:
+        return await reserve_order_items(order_id, items, hold)
+    except OutOfStock as e:
+        name = next(
+            (i.name for i in items if sku_for(i.product_id, i.size, i.color) == e.sku), "An item in your cart"
+        )
+        raise HTTPException(409, f"Sorry, {name} is out of stock")
+    except StockContention:
+        raise HTTPException(409, "Stock is being updated by other orders — please try again")
+
+
+def _lines(items: Iterable) -> list[tuple[str, int]]:
+    """(sku, quantity) per distinct SKU, sorted — every checkout locks shard rows in the same order."""
+    quantities: dict[str, int] = {}
+    for item in items:
+        sku = sku_for(item.product_id, item.size, item.color)
+        quantities[sku] = quantities.get(sku, 0) + item.quantity
+    return sorted(quantities.items())
+
+
+def _conflict(e: DBAPIError) -> bool:
+    return getattr(e.orig, "sqlstate", None) in CONFLICT_SQLSTATES
+
+
+async def reserve_order_items(order_id: str, items: Iterable, hold: bool = True) -> int:
+    """
+    Reserve stock for every line of an order in one short transaction —
+    all lines or none. `hold=False` commits immediately (COD); otherwise
+    the reservation expires after RESERVATION_TTL unless committed.
+    Products with no inventory rows are not limited. Raises OutOfStock,
+    or StockContention once RESERVE_ATTEMPTS tries have all deadlocked.
+    """
+    lines = _lines(items)
+    for attempt in range(1, RESERVE_ATTEMPTS + 1):
+        try:
+            return await _reserve(order_id, lines, hold)
+        except DBAPIError as e:
+            if not _conflict(e):
+                raise
+            if attempt == RESERVE_ATTEMPTS:
+                raise StockContention() from e
+            await asyncio.sleep(random.uniform(0.01, 0.05) * attempt)
+
+
+async def _reserve(order_id: str, lines: list[tuple[str, int]], hold: bool) -> int:
+    now = datetime.utcnow()
+    reserved = 0
+    async with async_session() as db:
+        try:
+            for sku, line_quantity in lines:
+                pieces = await _take(db, sku, line_quantity)
+                for shard, quantity in pieces or ():
+                    db.add(InventoryReservation(
+                        order_id=order_id,
+                        sku=sku,
+                        shard=shard,
+                        quantity=quantity,
+                        status="reserved" if hold else "committed",
+                        created_at=now,
+                        expires_at=now + RESERVATION_TTL if hold else None,
+                    ))
+                    reserved += quantity
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            raise
+    return reserved
+
+
+async def commit_reservations(db: AsyncSession, order_id: str) -> bool:
+    """
+    Payment completed — make the order's reservations permanent (caller commits).
+    Reservations already returned to stock (the order expired before the
+    payment landed) are taken again. Returns False, with none of that stock
+    taken, when it has been sold since.
+    """
+    await db.execute(
+        update(InventoryReservation)
+        .where(InventoryReservation.order_id == order_id, InventoryReservation.status == "reserved")
+        .values(status="committed", expires_at=None)
+    )
+    released = (await db.execute(
+        select(InventoryReservation.id, InventoryReservation.sku, InventoryReservation.quantity)
+        .where(InventoryReservation.order_id == order_id, InventoryReservation.status == "released")
+    )).all()
+    if not released:
+        return True
+    try:
+        async with db.begin_nested():
+            for r in released:
+                result = await db.execute(
+                    update(InventoryReservation)
+                    .where(InventoryReservation.id == r.id, InventoryReservation.status == "released")
+                    .values(status="committed", expires_at=None)
+                )
+                if result.rowcount != 1:
+                    continue
+                pieces = await _take(db, r.sku, r.quantity) or ()
+                for i, (shard, quantity) in enumerate(pieces):
+                    if i == 0:
+                        await db.execute(
+                            update(InventoryReservation)
+                            .where(InventoryReservation.id == r.id)
+                            .values(shard=shard, quantity=quantity)
+                        )
+                    else:
+                        db.add(InventoryReservation(
+                            order_id=order_id, sku=r.sku, shard=shard, quantity=quantity, status="committed",
+                        ))
+    except OutOfStock:
+        return False
+    return True
+
+
+async def _release(db: AsyncSession, reservations, statuses=("reserved",)) -> int:
+    released = 0
+    for r in reservations:
+        # Conditional status flip so a reservation is only ever returned once
+        result = await db.execute(
+            update(InventoryReservation)
+            .where(InventoryReservation.id == r.id, InventoryReservation.status.in_(statuses))
+            .values(status="released")
+        )
+        if result.rowcount == 1:
+            returned = await db.execute(
+                update(InventoryShard)
+                .where(InventoryShard.sku == r.sku, InventoryShard.shard == r.shard)
+                .values(available=InventoryShard.available + r.quantity)
+            )
+            if returned.rowcount == 0:
+                # set_stock has since re-split the SKU over fewer shards — shard 0 always exists
+                await db.execute(
+                    update(InventoryShard)
+                    .where(InventoryShard.sku == r.sku, InventoryShard.shard == 0)
+                    .values(available=InventoryShard.available + r.quantity)
+                )
+            released += r.quantity
+    return released
+
+
+async def release_reservations(db: AsyncSession, order_id: str, statuses=("reserved",)) -> int:
+    """Payment failed — return held stock (caller commits)."""
+    rows = (await db.execute(
+        select(InventoryReservation.id, InventoryReservation.sku, InventoryReservation.shard, InventoryReservation.quantity)
+        .where(InventoryReservation.order_id == order_id, InventoryReservation.status.in_(statuses))
+    )).all()
+    return await _release(db, rows, statuses)
+
+
+async def release_many(db: AsyncSession, order_ids: list[str], statuses=("reserved",)) -> int:
+    """
+    release_reservations for a batch of orders: one query finds their
+    reservations, each is then returned by its own conditional UPDATE (caller commits).
+    """
+    rows = (await db.execute(
+        select(InventoryReservation.id, InventoryReservation.sku, InventoryReservation.shard, InventoryReservation.quantity)
+        .where(InventoryReservation.order_id.in_(order_ids), InventoryReservation.status.in_(statuses))
+    )).all()
+    return await _release(db, rows, statuses)
+
+
+async def release_order(order_id: str) -> int:
+    """
+    The order was never created (gateway or DB error) — return everything
+    reserved for it, committed or not, in its own transaction.
+    """
+    async with async_session() as db:
+        released = await release_reservations(db, order_id, ("reserved", "committed"))
+        await db.commit()
+        return released
+
+
+@task("inventory.release_expired", every=SWEEP_INTERVAL)
+async def release_expired(batch: int = SWEEP_BATCH) -> int:
+    """Return stock held by reservations past their expiry. Returns units released."""
+    total = 0
+    while True:
+        async with async_session() as db:
+            rows = (await db.execute(
+                select(InventoryReservation.id, InventoryReservation.sku, InventoryReservation.shard, InventoryReservation.quantity)
+                .where(InventoryReservation.status == "reserved", InventoryReservation.expires_at < datetime.utcnow())
+                .limit(batch)
+            )).all()
+            if not rows:
+                return total
+            total += await _release(db, rows)
+            await db.commit()
+        if len(rows) < batch:
+            return total
+
+
+# ─── Admin ───────────────────────────────────────────────────────
+async def set_stock(db: AsyncSession, sku: str, stock: int, shards: int = 1):
+    """Replace a SKU's stock, split evenly over `shards` counters (caller commits)."""
+    await db.execute(delete(InventoryShard).where(InventoryShard.sku == sku))
+    base, extra = divmod(stock, shards)
+    for shard in range(shards):
+        db.add(InventoryShard(sku=sku, shard=shard, available=base + (1 if shard < extra else 0)))
+
+
+async def get_stock(db: AsyncSession, sku: str) -> dict:
+    rows = (await db.execute(
+        select(InventoryShard.shard, InventoryShard.available).where(InventoryShard.sku == sku)
+    )).all()
+    reserved = await db.scalar(
+        select(func.coalesce(func.sum(InventoryReservation.quantity), 0))
+        .where(InventoryReservation.sku == sku, InventoryReservation.status == "reserved")
+    )
+    return {
+        "sku": sku,
+        "available": sum(r.available for r in rows),
+        "reserved": reserved or 0,
+        "shards": len(rows),
+        "tracked": bool(rows),
+    }
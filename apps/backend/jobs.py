@@ -0,0 +1,376 @@
+"""
+Background jobs — a small durable queue on the app's own database.
+
+Jobs are rows in `jobs`. Workers started by worker.py (on serverless, one
+run_due() round per cron tick) claim due jobs in priority order —
+`FOR UPDATE SKIP LOCKED` on Postgres; on SQLite, where there is a single
+writer anyway, claims are serialised in-process and made safe across
+processes by a conditional UPDATE.
+A claimed job holds a lease; if its worker dies the reaper requeues it,
+so a job runs at least once. Failures retry with exponential backoff up
+to the task's max_attempts. Periodic tasks keep a single row that is
+rescheduled after every run, so each runs once per interval across all
+workers rather than once per process. Finished jobs are purged after
+JOB_RETENTION_DAYS, dead ones after JOB_DEAD_RETENTION_DAYS.
+
+    @task("emails.receipt", max_attempts=5)
+    async def send_receipt(order_id: str): ...
+
+    await submit("emails.receipt", {"order_id": order.id}, delay=30)
+"""
+
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import DIALECT, async_session
+from models import Job
+from tracing import CONSUMER, span
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))  # concurrent jobs per process, 0 disables
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))  # seconds between polls when idle
+JOB_LEASE = timedelta(seconds=int(os.getenv("JOB_LEASE_SECONDS", "300")))
+DRAIN_TIMEOUT = 10  # seconds shutdown waits for running jobs before requeueing them
+REAP_INTERVAL = 30
+BACKOFF_BASE = 2  # seconds; doubles per attempt
+BACKOFF_MAX = 600
+LATENCY_WINDOW = 1000  # recent jobs kept for the latency percentiles
+JOB_RETENTION = timedelta(days=int(os.getenv("JOB_RETENTION_DAYS", "7")))  # finished jobs kept this long
+JOB_DEAD_RETENTION = timedelta(days=int(os.getenv("JOB_DEAD_RETENTION_DAYS", "30")))  # dead ones, for inspection
+PURGE_BATCH = 1000
+
+
+class Task(NamedTuple):
+    name: str
+    fn: Callable[..., Awaitable]
+    max_attempts: int
+    priority: int
+    timeout: Optional[float]
+    every: Optional[float]  # seconds, for periodic tasks
+
+
+TASKS: dict[str, Task] = {}
+
+
+def task(
+    name: str,
+    *,
+    max_attempts: int = 3,
+    priority: int = 0,
+    timeout: Optional[float] = None,
+    every: Optional[float] = None,
+):
+    """Register an async function as a job. With `every`, it also runs periodically."""
+    def register(fn):
+        TASKS[name] = Task(name, fn, max_attempts, priority, timeout, every)
+        return fn
+    return register
+
+
+def _new_job(name: str, args: Optional[dict], priority: Optional[int], run_at: datetime) -> Job:
+    spec = TASKS.get(name)
+    if spec is None:
+        raise KeyError(f"Unknown job: {name}")
+    return Job(
+        name=name,
+        args=args or {},
+        priority=spec.priority if priority is None else priority,
+        max_attempts=spec.max_attempts,
+        run_at=run_at,
+    )
+
+
+async def submit(
+    name: str,
+    args: Optional[dict] = None,
+    *,
+    priority: Optional[int] = None,
+    delay: float = 0,
+    run_at: Optional[datetime] = None,
+    db: Optional[AsyncSession] = None,
+) -> str:
+    """
+    Queue a job. Pass `db` to enqueue in the caller's transaction (it runs
+    only if that commits); otherwise it is committed here.
+    """
+    job = _new_job(name, args, priority, run_at or datetime.utcnow() + timedelta(seconds=delay))
+    if db is not None:
+        db.add(job)
+        await db.flush()
+    else:
+        async with async_session() as session:
+            session.add(job)
+            await session.commit()
+        job_queue.wake()
+    return job.id
+
+
+def backoff(attempts: int) -> timedelta:
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def _percentiles(samples) -> dict:
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None}
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+class JobQueue:
+    def __init__(self):
+        self.concurrency = 0
+        self._postgres = DIALECT == "postgresql"
+        self._claim_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._poller: Optional[asyncio.Task] = None
+        self._running: set[asyncio.Task] = set()
+        self._finished: list[tuple[str, Optional[dict]]] = []  # (job id, column values or None for done)
+        self._stopping = False
+        self._scheduled = False  # periodic rows checked by this process
+        self.processed = 0
+        self.failed = 0
+        self.wait_times: deque = deque(maxlen=LATENCY_WINDOW)  # run_at → start, seconds
+        self.run_times: deque = deque(maxlen=LATENCY_WINDOW)
+
+    # ─── Lifecycle ──────────────────────────────────────────────
+    async def start(self, concurrency: int = JOB_WORKERS):
+        if concurrency <= 0 or self._poller is not None:
+            return
+        self.concurrency = concurrency
+        self._stopping = False
+        self._wake = asyncio.Event()
+        await self._schedule_periodic()
+        self._poller = asyncio.create_task(self._poll_loop())
+
+    async def stop(self, timeout: float = DRAIN_TIMEOUT):
+        """Stop claiming, let running jobs finish (up to `timeout`), requeue the rest."""
+        if self._poller is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        await self._poller
+        self._poller = None
+        if self._running:
+            _, pending = await asyncio.wait(self._running, timeout=timeout)
+            for t in pending:
+                t.cancel()
+            if pending:
+                await asyncio.wait(pending)
+        await self._flush()
+
+    def wake(self):
+        self._wake.set()
+
+    async def run_due(self, limit: int = max(JOB_WORKERS, 1)) -> int:
+        """One round without workers (a cron tick): claim up to `limit` due jobs, run them, record the outcomes."""
+        await self._schedule_periodic()
+        await self._reap()
+        jobs = await self._claim(limit)
+        await asyncio.gather(*(self._run(job) for job in jobs))
+        await self._flush()
+        return len(jobs)
+
+    async def _schedule_periodic(self):
+        if self._scheduled:
+            return
+        now = datetime.utcnow()
+        for spec in TASKS.values():
+            if spec.every is None:
+                continue
+            async with async_session() as db:
+                if await db.scalar(select(Job.id).where(Job.key == f"periodic:{spec.name}")):
+                    continue
+                job = _new_job(spec.name, None, None, now)
+                job.key = f"periodic:{spec.name}"
+                db.add(job)
+                try:
+                    await db.commit()
+                except IntegrityError:
+                    await db.rollback()  # another worker created it first
+        self._scheduled = True
+
+    # ─── Claim / run ────────────────────────────────────────────
+    async def _claim(self, limit: int) -> list[Job]:
+        """Write finished outcomes and claim up to `limit` due jobs — one transaction per poll."""
+        now = datetime.utcnow()
+        query = (
+            select(Job)
+            .where(Job.status == "queued", Job.run_at <= now)
+            .order_by(Job.priority.desc(), Job.run_at)
+            .limit(limit)
+        )
+        if self._postgres:
+            query = query.with_for_update(skip_locked=True)
+        finished, self._finished = self._finished, []
+        try:
+            async with nullcontext() if self._postgres else self._claim_lock:
+                async with async_session() as db:
+                    await self._write_finished(db, finished)
+                    jobs = (await db.execute(query)).scalars().all() if limit > 0 else []
+                    claimed = set()
+                    if jobs:
+                        claimed = set((await db.execute(
+                            update(Job)
+                            .where(Job.id.in_([j.id for j in jobs]), Job.status == "queued")
+                            .values(status="running", attempts=Job.attempts + 1, started_at=now, locked_until=now + JOB_LEASE)
+                            .returning(Job.id)
+                            .execution_options(synchronize_session=False)
+                        )).scalars().all())
+                    await db.commit()
+        except BaseException:
+            self._finished[:0] = finished  # written on the next poll
+            raise
+        jobs = [j for j in jobs if j.id in claimed]
+        for j in jobs:
+            j.attempts += 1
+            self.wait_times.append(max(0.0, (now - j.run_at).total_seconds()))
+        return jobs
+
+    async def _run(self, job: Job):
+        spec = TASKS.get(job.name)
+        started = time.perf_counter()
+        now = datetime.utcnow
+        try:
+            if spec is None:
+                raise KeyError(f"Unknown job: {job.name}")
+            with span(f"job {job.name}", CONSUMER, **{"job.id": job.id, "job.attempt": job.attempts}):
+                await asyncio.wait_for(spec.fn(**(job.args or {})), timeout=spec.timeout)
+        except asyncio.CancelledError:
+            # Drain timed out — put it back without counting the attempt
+            self._finished.append((job.id, {"status": "queued", "attempts": job.attempts - 1, "run_at": now()}))
+            raise
+        except Exception as e:
+            self.failed += 1
+            error = f"{type(e).__name__}: {e}"
+            if spec is not None and spec.every is not None:
+                values = {"status": "queued", "attempts": 0, "run_at": now() + timedelta(seconds=spec.every)}
+            elif job.attempts < job.max_attempts:
+                values = {"status": "queued", "run_at": now() + backoff(job.attempts)}
+            else:
+                values = {"status": "dead", "finished_at": now()}
+            self._finished.append((job.id, {**values, "last_error": error, "locked_until": None}))
+        else:
+            self.processed += 1
+            if spec.every is not None:
+                values = {"status": "queued", "attempts": 0, "run_at": now() + timedelta(seconds=spec.every)}
+                self._finished.append((job.id, {**values, "last_error": None, "locked_until": None}))
+            else:
+                self._finished.append((job.id, None))  # done — written in bulk
+        finally:
+            self.run_times.append(time.perf_counter() - started)
+            self._wake.set()
+
+    @staticmethod
+    async def _write_finished(db: AsyncSession, finished: list[tuple[str, Optional[dict]]]):
+        done = [job_id for job_id, values in finished if values is None]
+        if done:
+            await db.execute(
+                update(Job).where(Job.id.in_(done))
+                .values(status="done", finished_at=datetime.utcnow(), last_error=None, locked_until=None)
+            )
+        for job_id, values in finished:
+            if values is not None:
+                await db.execute(update(Job).where(Job.id == job_id).values(**values))
+
+    async def _flush(self):
+        """Write outstanding outcomes without claiming more (shutdown)."""
+        if self._finished:
+            await self._claim(0)
+
+    async def _reap(self):
+        """Requeue jobs whose worker died mid-run (lease expired)."""
+        now = datetime.utcnow()
+        async with async_session() as db:
+            await db.execute(
+                update(Job)
+                .where(Job.status == "running", Job.locked_until < now)
+                .values(status="queued", run_at=now, locked_until=None)
+            )
+            await db.commit()
+
+    async def _poll_loop(self):
+        last_reap = 0.0
+        while not self._stopping:
+            claimed = 0
+            try:
+                if time.monotonic() - last_reap > REAP_INTERVAL:
+                    await self._reap()
+                    last_reap = time.monotonic()
+                free = self.concurrency - len(self._running)
+                if free > 0 or self._finished:
+                    for job in await self._claim(free):
+                        t = asyncio.create_task(self._run(job))
+                        self._running.add(t)
+                        t.add_done_callback(self._running.discard)
+                        claimed += 1
+            except Exception:
+                pass  # database hiccup — try again next poll
+            if claimed and len(self._running) < self.concurrency:
+                continue  # there may be more due jobs
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    # ─── Metrics ────────────────────────────────────────────────
+    async def metrics(self) -> dict:
+        """Depth counts unfinished and dead jobs only (an index range, not the whole table); done ones are purged."""
+        now = datetime.utcnow()
+        async with async_session() as db:
+            rows = (await db.execute(
+                select(Job.status, Job.run_at <= now, func.count())
+                .where(Job.status.in_(("queued", "running", "dead")))
+                .group_by(Job.status, Job.run_at <= now)
+            )).all()
+        depth = {"ready": 0, "scheduled": 0, "running": 0, "dead": 0}
+        for status, due, count in rows:
+            key = ("ready" if due else "scheduled") if status == "queued" else status
+            depth[key] = depth.get(key, 0) + count
+        return {
+            "depth": depth,
+            "workers": self.concurrency,
+            "in_flight": len(self._running),
+            "processed": self.processed,
+            "failed": self.failed,
+            "wait_ms": _percentiles(self.wait_times),
+            "run_ms": _percentiles(self.run_times),
+        }
+
+
+job_queue = JobQueue()
+
+
+# ─── Retention ───────────────────────────────────────────────────
+@task("jobs.purge_finished", every=3600)
+async def purge_finished(batch: int = PURGE_BATCH) -> int:
+    """Delete done jobs older than JOB_RETENTION and dead ones older than JOB_DEAD_RETENTION."""
+    now = datetime.utcnow()
+    purged = 0
+    for status, keep in (("done", JOB_RETENTION), ("dead", JOB_DEAD_RETENTION)):
+        while True:
+            old = (
+                select(Job.id)
+                .where(Job.status == status, Job.finished_at < now - keep)
+                .limit(batch)
+            )
+            async with async_session() as db:
+                result = await db.execute(
+                    delete(Job).where(Job.id.in_(old.scalar_subquery())).execution_options(synchronize_session=False)
+                )
+                await db.commit()
+            purged += result.rowcount or 0
+            if (result.rowcount or 0) < batch:
+                break
+    return purged
@@ -3,9 +3,10 @@ ModestStyle.pk — FastAPI Backend
 Auth, Cart, Orders, Payments, AI proxy
 """
 
+import hmac
 import os
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
@@ -15,20 +16,46 @@ from routes.orders import router as orders_router
 from routes.ai import router as ai_router
 from routes.admin import router as admin_router
 from routes.payment import router as payment_router
-from database import engine, Base
+from routes.catalog import router as catalog_router
+from routes.products import router as products_router
+from routes.search import router as search_router
+from routes.promo import router as promo_router
+from compression import CompressionMiddleware
+from database import SERVERLESS
+from images import shutdown_pool
+from responses import FastJSONResponse
+from sql_stats import QueryStatsMiddleware
+from catalog import load_snapshot
+from metrics import MetricsMiddleware, metrics_endpoint, route_started
+from migrate import ensure_migrated
+from tracing import TracingMiddleware
+
+# Run worker.py's loops and job workers in this process too — off on serverless,
+# where instances are frozen between requests (run worker.py or the cron instead)
+BACKGROUND_IN_WEB = os.getenv("BACKGROUND_IN_WEB", "0" if SERVERLESS else "1") == "1"
+CRON_SECRET = os.getenv("CRON_SECRET", "")  # Vercel sends it as a bearer token on cron calls
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    load_snapshot()
+    background = None
+    if BACKGROUND_IN_WEB:
+        from worker import background  # the loops and every @task module — only where they run
+
+        await background.start()
     yield
+    if background is not None:
+        await background.stop()
+    shutdown_pool()
 
 
 app = FastAPI(
     title="ModestStyle.pk API",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=FastJSONResponse,
+    dependencies=[Depends(route_started)],
 )
 
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
@@ -48,11 +75,21 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)  # added last: outermost, so it times everything else
 
-app.include_router(orders_router, prefix="/api/orders", tags=["orders"])
-app.include_router(ai_router, prefix="/api/ai", tags=["ai"])
-app.include_router(admin_router, prefix="/api/admin", tags=["admin"])
-app.include_router(payment_router, prefix="/api/payment", tags=["payment"])
+# Routes that touch the database migrate it first on an instance no deploy step migrated
+db_routes = [Depends(ensure_migrated)]
+app.include_router(orders_router, prefix="/api/orders", tags=["orders"], dependencies=db_routes)
+app.include_router(ai_router, prefix="/api/ai", tags=["ai"], dependencies=db_routes)
+app.include_router(admin_router, prefix="/api/admin", tags=["admin"], dependencies=db_routes)
+app.include_router(payment_router, prefix="/api/payment", tags=["payment"], dependencies=db_routes)
+app.include_router(catalog_router, prefix="/api/catalog", tags=["catalog"])
+app.include_router(products_router, prefix="/api/products", tags=["products"])
+app.include_router(search_router, prefix="/api/search", tags=["search"])
+app.include_router(promo_router, prefix="/api/promo", tags=["promo"], dependencies=db_routes)
 
 
 @app.get("/")
@@ -60,6 +97,21 @@ def root():
     return {"message": "ModestStyle.pk API", "version": "1.0.0"}
 
 
+app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+
+@app.get("/internal/tick", include_in_schema=False)
+async def cron_tick(request: Request):
+    """One round of background work, for deployments with no worker process (vercel.json cron)."""
+    if not CRON_SECRET:
+        raise HTTPException(503, "CRON_SECRET not configured")
+    if not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {CRON_SECRET}"):
+        raise HTTPException(401, "Invalid cron secret")
+    from worker import tick  # first tick on an instance pays for the background modules, not every cold start
+
+    return await tick()
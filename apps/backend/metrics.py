@@ -0,0 +1,405 @@
+"""
+Prometheus metrics — request latency, outbound HTTP, DB pool and business counters.
+
+    GET /metrics   text exposition format 0.0.4 (Bearer METRICS_TOKEN if set)
+
+Everything is recorded on the event loop thread, so the hot path is a
+dict lookup and a few integer adds — no locks. Histograms keep one count
+per bucket and are made cumulative only when scraped. State that already
+lives elsewhere (the DB pool, the response cache, the job queue,
+reconciliation) is read at scrape time rather than mirrored.
+
+Requests are labelled by route template (/api/admin/orders/{order_id}),
+never the raw path, so label sets stay bounded; unmatched paths share
+one "unmatched" series. Outbound calls go through `http_client()`, whose
+transport labels them by upstream (safepay, jazzcash, groq, ...).
+
+Business counters recorded against a session are applied on commit —
+`count_on_commit(db, orders_created, "cod")` — so a rolled-back order is
+never counted.
+"""
+
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable, Optional
+
+import httpx
+from fastapi import HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from tracing import CLIENT, child_span, end_span, inject
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UPSTREAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+# ─── Metric types ───────────────────────────────────────────────
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _num(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labels
+        self.values: dict = {}  # label values tuple → value
+        registry.append(self)
+
+    def clear(self):
+        self.values.clear()
+
+    def samples(self) -> Iterable[str]:
+        for key, value in self.values.items():
+            yield f"{self.name}{_labels(self.labelnames, key)} {_num(value)}"
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, *labels, value: float):
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = REQUEST_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, *labels, value: float):
+        series = self.values.get(labels)
+        if series is None:
+            # per-bucket counts (+Inf last), then sum and count
+            series = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def samples(self) -> Iterable[str]:
+        bounds = [_num(b) for b in self.buckets] + ["+Inf"]
+        for key, series in self.values.items():
+            running = 0
+            for bound, count in zip(bounds, series):
+                running += count
+                le = 'le="' + bound + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {running}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_num(series[-2])}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}"
+
+
+registry: list[Metric] = []
+collectors: list[Callable[[], None]] = []  # refresh pull-time gauges before a scrape
+
+
+def collector(fn: Callable[[], None]):
+    collectors.append(fn)
+    return fn
+
+
+def render() -> str:
+    for collect in collectors:
+        try:
+            collect()
+        except Exception:
+            pass  # one broken source must not take the whole scrape down
+    return "\n".join(m.render() for m in registry) + "\n"
+
+
+# ─── Metrics ────────────────────────────────────────────────────
+http_requests = Histogram(
+    "http_request_duration_seconds", "API request latency by route template and status.",
+    ("method", "route", "status"),
+)
+http_in_flight = Gauge("http_requests_in_flight", "API requests being handled, by route template.", ("method", "route"))
+
+upstream_requests = Histogram(
+    "upstream_request_duration_seconds", "Outbound HTTP latency by upstream and status class.",
+    ("upstream", "status"), buckets=UPSTREAM_BUCKETS,
+)
+upstream_errors = Counter(
+    "upstream_errors_total", "Outbound HTTP failures: 5xx responses, timeouts and connection errors.",
+    ("upstream", "kind"),
+)
+
+orders_created = Counter("orders_created_total", "Orders committed, by payment method.", ("payment_method",))
+payments = Counter(
+    "payments_total", "Payment status changes, by method and new status (paid, failed, expired).",
+    ("payment_method", "status"),
+)
+
+db_pool = Gauge("db_pool_connections", "Database pool connections by state.", ("state",))
+response_cache_requests = Counter(
+    "response_cache_requests_total", "Cached route lookups by namespace and result.", ("namespace", "result"),
+)
+response_cache_bytes = Gauge("response_cache_bytes", "Bytes held by the response cache.")
+jobs_total = Counter("jobs_total", "Background jobs finished, by outcome.", ("outcome",))
+jobs_in_flight = Gauge("jobs_in_flight", "Background jobs running in this process.")
+db_statements = Counter("db_statements_total", "SQL statements run, by route template.", ("route",))
+db_time = Counter("db_time_seconds_total", "Time spent in SQL statements, by route template.", ("route",))
+reconcile_total = Counter("reconcile_orders_total", "Pending orders checked by reconciliation, by result.", ("result",))
+trace_spans = Counter("trace_spans_total", "Trace spans recorded, by outcome.", ("outcome",))
+
+
+# ─── Request middleware ─────────────────────────────────────────
+_templates: dict[int, str] = {}  # id(route) → full path template; routes live as long as the app
+
+
+def _template_for(route, path: str) -> str:
+    """
+    The route's template with its router prefix. Included routes only know
+    their own path (/orders/{order_id}), so the prefix is the part of the
+    request path in front of where the route's pattern matches.
+    """
+    path_format = getattr(route, "path_format", None)
+    regex = getattr(route, "path_regex", None)
+    if path_format is None:
+        return "unmatched"
+    if regex is None:
+        return path_format
+    starts = [i for i, c in enumerate(path) if c == "/"] + [len(path)]  # a "" route matches the empty tail
+    return next((path[:i] + path_format for i in starts if regex.match(path[i:])), path_format)
+
+
+def route_template(scope) -> str:
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    template = _templates.get(id(route))
+    if template is None:
+        template = _templates[id(route)] = _template_for(route, scope["path"])  # each router is included once
+    return template
+
+
+async def route_started(request: Request):
+    """App-level dependency: the route is known once it runs, so in-flight is counted per template."""
+    scope = request.scope
+    scope["metrics.in_flight"] = (scope["method"], route_template(scope))
+    http_in_flight.inc(*scope["metrics.in_flight"])
+
+
+class MetricsMiddleware:
+    """Outermost user middleware: times every HTTP request to the last body byte."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight = scope.get("metrics.in_flight")
+            if in_flight:
+                http_in_flight.dec(*in_flight)
+            http_requests.observe(scope["method"], route_template(scope), str(status), value=time.perf_counter() - started)
+
+
+def metrics_endpoint(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(401, "Invalid metrics token")
+    return PlainTextResponse(render(), media_type=CONTENT_TYPE)
+
+
+# ─── Outbound HTTP ──────────────────────────────────────────────
+UPSTREAMS = (  # host substring → upstream label, first match wins
+    ("getsafepay", "safepay"),
+    ("jazzcash", "jazzcash"),
+    ("easypaisa", "easypaisa"),
+    ("easypay", "easypaisa"),
+    ("stripe.com", "stripe"),
+    ("api.groq.com", "groq"),
+    ("api.x.ai", "grok"),
+    ("api.openai.com", "openai"),
+    ("huggingface", "hf"),
+    ("replicate", "replicate"),
+    ("sanity.io", "sanity"),
+    ("clerk", "clerk"),
+)
+_upstream_by_host: dict[str, str] = {}
+
+
+def upstream_for(host: str) -> str:
+    name = _upstream_by_host.get(host)
+    if name is None:
+        name = next((label for part, label in UPSTREAMS if part in host), "other")
+        if len(_upstream_by_host) < 1000:
+            _upstream_by_host[host] = name
+    return name
+
+
+def observe_upstream(upstream: str, started: float, status: Optional[int] = None, error: Optional[BaseException] = None):
+    elapsed = time.perf_counter() - started
+    if error is not None:
+        kind = "timeout" if isinstance(error, httpx.TimeoutException) else type(error).__name__
+        upstream_errors.inc(upstream, kind)
+        upstream_requests.observe(upstream, "error", value=elapsed)
+        return
+    if status >= 500:
+        upstream_errors.inc(upstream, "5xx")
+    upstream_requests.observe(upstream, f"{status // 100}xx", value=elapsed)
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """Wraps a transport; times each request (to the response headers) per upstream, in a CLIENT span."""
+
+    def __init__(self, inner: Optional[httpx.AsyncBaseTransport] = None, **kwargs):
+        self.inner = inner or httpx.AsyncHTTPTransport(**kwargs)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        upstream = upstream_for(request.url.host)
+        span = child_span(request.method, CLIENT)
+        if span is not None:
+            span.set("http.request.method", request.method)
+            span.set("server.address", request.url.host)
+            span.set("url.path", request.url.path)  # no query string — it can carry credentials
+            span.set("upstream", upstream)
+        inject(request.headers)
+        started = time.perf_counter()
+        try:
+            response = await self.inner.handle_async_request(request)
+        except Exception as e:
+            observe_upstream(upstream, started, error=e)
+            end_span(span, e)
+            raise
+        observe_upstream(upstream, started, response.status_code)
+        if span is not None:
+            span.set("http.response.status_code", response.status_code)
+            if response.status_code >= 500:
+                span.fail(f"HTTP {response.status_code}")
+            end_span(span)
+        return response
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+def http_client(transport: Optional[httpx.AsyncBaseTransport] = None, **kwargs) -> httpx.AsyncClient:
+    """httpx.AsyncClient whose requests are recorded per upstream."""
+    return httpx.AsyncClient(transport=InstrumentedTransport(transport), **kwargs)
+
+
+# ─── Business counters ──────────────────────────────────────────
+def count_on_commit(db: AsyncSession, counter: Counter, *labels):
+    """Increment `counter` once `db` commits; a rollback discards it."""
+    db.sync_session.info.setdefault("metrics", []).append((counter, labels))
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session):
+    for counter, labels in session.info.pop("metrics", ()):
+        counter.inc(*labels)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session):
+    session.info.pop("metrics", None)
+
+
+# ─── Pull-time collectors ───────────────────────────────────────
+@collector
+def _collect_pool():
+    import database
+
+    engine = database._engine  # never create the engine just to report on it
+    pool = getattr(engine, "pool", None) if engine is not None else None
+    if pool is None or not hasattr(pool, "checkedout"):
+        return
+    db_pool.set("size", value=pool.size())
+    db_pool.set("checked_out", value=pool.checkedout())
+    db_pool.set("checked_in", value=pool.checkedin())
+    db_pool.set("overflow", value=max(0, pool.overflow()))
+
+
+@collector
+def _collect_response_cache():
+    from response_cache import response_cache
+
+    for namespace, c in response_cache.counters.items():
+        for result in ("hits", "stale", "misses", "coalesced"):
+            response_cache_requests.values[(namespace, result)] = getattr(c, result)
+    response_cache_bytes.set(value=response_cache.bytes)
+
+
+@collector
+def _collect_jobs():
+    from jobs import job_queue
+
+    jobs_total.values[("succeeded",)] = job_queue.processed
+    jobs_total.values[("failed",)] = job_queue.failed
+    jobs_in_flight.set(value=len(job_queue._running))
+
+
+@collector
+def _collect_reconcile():
+    from reconcile import stats
+
+    for result in ("paid", "failed", "still_pending", "errors"):
+        reconcile_total.values[(result,)] = getattr(stats, result)
+
+
+@collector
+def _collect_sql():
+    from sql_stats import BACKGROUND, sql_stats
+
+    for route, s in sql_stats.routes.items():
+        db_statements.values[(route,)] = s.statements
+        db_time.values[(route,)] = s.seconds
+    db_statements.values[(BACKGROUND,)] = sql_stats.background.count
+    db_time.values[(BACKGROUND,)] = sql_stats.background.seconds
+
+
+@collector
+def _collect_tracing():
+    from tracing import stats
+
+    for outcome in ("started", "exported", "dropped"):
+        trace_spans.values[(outcome,)] = getattr(stats, outcome)
@@ -0,0 +1,185 @@
+"""
+Bring an existing database up to models.py.
+
+    python migrate.py [--dry-run]
+
+Base.metadata.create_all only creates missing tables: an index or column
+added to a table that already exists (ix_orders_user_created, the
+order_items.order_id, orders.updated_at and users.updated_at indexes,
+ix_jobs_status_finished_at) never reaches a database created before it.
+This adds, in order:
+
+  * missing tables, with their indexes
+  * missing columns, as nullable (backfill, then tighten by hand if needed)
+  * missing indexes — on PostgreSQL with CREATE INDEX CONCURRENTLY, so
+    orders and order_items keep taking writes while they build. A build
+    that failed partway leaves an INVALID index behind under the same
+    name; that one is dropped and built again.
+
+Every step checks the live schema first, so a re-run applies nothing
+once a run has completed.
+Run it on deploy (Procfile `release:`) before the new code serves traffic.
+Where a deploy has no such step (Vercel), the routes that use the database
+call ensure_migrated() first, so each cold instance migrates once before
+its first query. That run is one transaction under an advisory lock, so
+instances starting together apply it once — and indexes are built without
+CONCURRENTLY there, so run this script by hand before deploying an index
+on a large table.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import inspect, text  # noqa: E402
+from sqlalchemy.engine import Connection  # noqa: E402
+
+import models  # noqa: E402,F401 — registers every table on Base.metadata
+from database import SERVERLESS, Base, get_engine  # noqa: E402
+
+log = logging.getLogger("migrate")
+
+MIGRATE_ON_FIRST_USE = os.getenv("MIGRATE_ON_FIRST_USE", "1" if SERVERLESS else "0") == "1"
+MIGRATE_LOCK_KEY = 0x6D6967726174  # pg_advisory_xact_lock key shared by every instance
+
+
+def _tables_and_columns(conn: Connection, dry_run: bool) -> list[str]:
+    inspector = inspect(conn)
+    existing = set(inspector.get_table_names())
+    applied = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing:
+            applied.append(f"create table {table.name}")
+            if not dry_run:
+                table.create(conn)
+            continue
+        columns = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            preparer = conn.dialect.identifier_preparer
+            ddl = (f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+                   f"{preparer.format_column(column)} {column.type.compile(dialect=conn.dialect)}")
+            applied.append(ddl)
+            if not dry_run:
+                conn.execute(text(ddl))
+    return applied
+
+
+def _invalid_indexes(conn: Connection) -> set[str]:
+    """Indexes PostgreSQL marks INVALID — left by a CREATE INDEX CONCURRENTLY that failed."""
+    if conn.dialect.name != "postgresql":
+        return set()
+    return set(conn.execute(text(
+        "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE NOT i.indisvalid AND n.nspname = current_schema()"
+    )).scalars())
+
+
+def _missing_indexes(conn: Connection) -> list[tuple]:
+    """(index, invalid) for every model index the database lacks or only has an invalid build of."""
+    inspector = inspect(conn)
+    existing = set(inspector.get_table_names())
+    invalid = _invalid_indexes(conn)
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        names = {i["name"] for i in inspector.get_indexes(table.name)} - invalid
+        missing.extend((index, index.name in invalid) for index in table.indexes if index.name not in names)
+    return missing
+
+
+def _drop_index(conn: Connection, index, concurrently: bool = True) -> None:
+    preparer = conn.dialect.identifier_preparer
+    conn.execute(text(f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {preparer.quote(index.name)}"))
+
+
+def _create_index(conn: Connection, index, concurrently: bool = True) -> None:
+    if conn.dialect.name != "postgresql" or not concurrently:
+        index.create(conn)
+        return
+    index.dialect_kwargs["postgresql_concurrently"] = True
+    try:
+        index.create(conn)
+    finally:
+        index.dialect_kwargs["postgresql_concurrently"] = False
+
+
+def _indexes(conn: Connection, dry_run: bool, concurrently: bool) -> list[str]:
+    applied = []
+    for index, invalid in _missing_indexes(conn):
+        if invalid:
+            applied.append(f"drop invalid index {index.name}")
+            if not dry_run:
+                _drop_index(conn, index, concurrently)
+        applied.append(f"create index {index.name} on {index.table.name}")
+        if not dry_run:
+            _create_index(conn, index, concurrently)
+    return applied
+
+
+async def migrate(dry_run: bool = False, concurrently: bool = True) -> list[str]:
+    """
+    Apply (or with dry_run, only list) the DDL the database is missing.
+    concurrently=False applies it all in one transaction under an advisory
+    lock instead — safe for several processes to run at once.
+    """
+    engine = get_engine()
+    if concurrently:
+        async with engine.begin() as conn:
+            applied = await conn.run_sync(_tables_and_columns, dry_run)
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            applied += await conn.run_sync(_indexes, dry_run, True)
+    else:
+        async with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":  # a transaction lock, so it holds behind a pooler too
+                await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATE_LOCK_KEY})
+            applied = await conn.run_sync(_tables_and_columns, dry_run)
+            applied += await conn.run_sync(_indexes, dry_run, False)
+    for step in applied:
+        log.info("migrate: %s%s", step, " (dry run)" if dry_run else "")
+    return applied
+
+
+_migrated = not MIGRATE_ON_FIRST_USE
+_migrate_lock = asyncio.Lock()
+
+
+async def ensure_migrated():
+    """
+    Route dependency: migrate once per process before the first database
+    use, where no deploy step does (MIGRATE_ON_FIRST_USE, on by default on
+    serverless). A no-op after the first success.
+    """
+    global _migrated
+    if _migrated:
+        return
+    async with _migrate_lock:
+        if not _migrated:
+            await migrate(concurrently=False)
+            _migrated = True
+
+
+async def run(args) -> None:
+    applied = await migrate(args.dry_run)
+    print("\n".join(applied) if applied else "schema up to date")
+    await get_engine().dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--dry-run", action="store_true", help="only list what would change")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
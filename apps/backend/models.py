@@ -2,7 +2,7 @@
 
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Float, Integer, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import Column, String, Float, Integer, Boolean, DateTime, ForeignKey, Text, JSON, Index, LargeBinary, UniqueConstraint
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -20,6 +20,7 @@ class User(Base):
     name = Column(String, default="")
     role = Column(String, default="user")  # "user" | "admin"
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # indexed: max() is the ETag version
 
     orders = relationship("Order", back_populates="user")
     addresses = relationship("Address", back_populates="user")
@@ -43,6 +44,7 @@ class Address(Base):
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (Index("ix_orders_user_created", "user_id", "created_at", "id"),)
 
     id = Column(String, primary_key=True, default=gen_uuid)
     user_id = Column(String, ForeignKey("users.id"), nullable=True)
@@ -55,7 +57,7 @@ class Order(Base):
     total = Column(Float, default=0)
     promo_code = Column(String, nullable=True)
     payment_method = Column(String, default="cod")  # safepay, jazzcash, easypaisa, cod
-    payment_status = Column(String, default="unpaid")  # unpaid, pending, paid, failed, refunded
+    payment_status = Column(String, default="unpaid")  # unpaid, pending, paid, failed, expired, refunded
     transaction_id = Column(String, nullable=True)  # gateway transaction/tracker ID
     gateway_session_id = Column(String, nullable=True)  # gateway checkout session ID
     customer_phone = Column(String, nullable=True)
@@ -63,7 +65,7 @@ class Order(Base):
     stripe_session_id = Column(String, nullable=True)
     stripe_payment_intent = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # indexed: max() is the ETag version
 
     user = relationship("User", back_populates="orders")
     items = relationship("OrderItem", back_populates="order")
@@ -73,7 +75,7 @@ class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(String, primary_key=True, default=gen_uuid)
-    order_id = Column(String, ForeignKey("orders.id"), nullable=False)
+    order_id = Column(String, ForeignKey("orders.id"), nullable=False, index=True)
     product_id = Column(String, nullable=False)  # Sanity product ID
     name = Column(String)
     price = Column(Float)
@@ -93,3 +95,167 @@ class AIUsage(Base):
     ip_address = Column(String, nullable=True)
     feature = Column(String, nullable=False)  # "chat" | "imagine"
     created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class IdempotencyKey(Base):
+    """Stored responses for Idempotency-Key retries on order/payment creation"""
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)  # "{scope}:{user id or guest}:{Idempotency-Key header}"
+    request_hash = Column(String, nullable=False)
+    status = Column(String, default="in_progress")  # in_progress, completed
+    response_code = Column(Integer, nullable=True)
+    response_body = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class GeneratedImage(Base):
+    """One encoded try-on variant, shared by every instance that may be asked to serve it"""
+    __tablename__ = "generated_images"
+
+    image_id = Column(String, primary_key=True)
+    name = Column(String, primary_key=True)  # "{width}.{format}", e.g. "640.webp"
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class StoredChatSession(Base):
+    """Server-side chat history (chat_store.DatabaseChatStore), shared by every instance"""
+    __tablename__ = "chat_sessions"
+
+    id = Column(String, primary_key=True)
+    messages = Column(JSON, nullable=False)  # [{"role", "content"}], newest last
+    summary = Column(Text, nullable=False, default="")
+    updated_at = Column(Float, nullable=False, index=True)  # epoch seconds, as ChatSession.updated_at
+
+
+class InventoryShard(Base):
+    """Per-SKU stock counter. Hot SKUs are split over several shards to spread write contention."""
+    __tablename__ = "inventory_shards"
+
+    sku = Column(String, primary_key=True)  # "{product_id}:{size}:{color}"
+    shard = Column(Integer, primary_key=True, default=0)
+    available = Column(Integer, nullable=False, default=0)
+
+
+class InventoryReservation(Base):
+    """Stock held for an order; expires unless the payment completes"""
+    __tablename__ = "inventory_reservations"
+    __table_args__ = (Index("ix_inventory_reservations_status_expires", "status", "expires_at"),)
+
+    id = Column(String, primary_key=True, default=gen_uuid)
+    order_id = Column(String, nullable=False, index=True)
+    sku = Column(String, nullable=False)
+    shard = Column(Integer, nullable=False, default=0)
+    quantity = Column(Integer, nullable=False)
+    status = Column(String, default="reserved")  # reserved, committed, released
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=True)
+
+
+class Promotion(Base):
+    """Promo code rule; compiled into the in-memory promo engine"""
+    __tablename__ = "promotions"
+
+    code = Column(String, primary_key=True)  # stored upper-case
+    kind = Column(String, default="percent")  # percent, flat
+    value = Column(Float, nullable=False)
+    max_discount = Column(Float, nullable=True)  # cap for percent codes
+    min_subtotal = Column(Float, default=0)
+    categories = Column(JSON, nullable=True)  # category slugs the discount applies to, null = all
+    starts_at = Column(DateTime, nullable=True)
+    ends_at = Column(DateTime, nullable=True)
+    usage_limit = Column(Integer, nullable=True)  # global redemptions, null = unlimited
+    per_user_limit = Column(Integer, nullable=True)
+    used_count = Column(Integer, nullable=False, default=0)
+    active = Column(Boolean, default=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class PromoUsage(Base):
+    """Per-customer redemption counter for promo codes with a per-user limit"""
+    __tablename__ = "promo_usage"
+
+    code = Column(String, primary_key=True)
+    user_key = Column(String, primary_key=True)  # normalised email, or phone for guests
+    count = Column(Integer, nullable=False, default=0)
+
+
+class PromoRedemption(Base):
+    """One promo use by an order; cancelled (and counters returned) if the order fails"""
+    __tablename__ = "promo_redemptions"
+
+    id = Column(String, primary_key=True, default=gen_uuid)
+    code = Column(String, nullable=False)
+    order_id = Column(String, nullable=False, index=True)
+    user_key = Column(String, nullable=True)
+    status = Column(String, default="redeemed")  # redeemed, cancelled
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class OutboxEvent(Base):
+    """Side effect recorded in the same transaction as the order change; delivered by outbox.py"""
+    __tablename__ = "outbox_events"
+    __table_args__ = (Index("ix_outbox_events_status_next_attempt", "status", "next_attempt_at"),)
+
+    id = Column(String, primary_key=True, default=gen_uuid)
+    topic = Column(String, nullable=False)  # order.created, order.confirmed, order.payment_failed
+    aggregate_id = Column(String, nullable=False, index=True)  # order id
+    payload = Column(JSON, nullable=True)
+    status = Column(String, default="pending")  # pending, sent, dead
+    attempts = Column(Integer, nullable=False, default=0)
+    completed = Column(JSON, nullable=True)  # handler names already delivered, skipped on retry
+    last_error = Column(Text, nullable=True)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+
+class Job(Base):
+    """Background job; claimed and run by the workers in jobs.py"""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_status_priority_run_at", "status", "priority", "run_at"),
+        Index("ix_jobs_status_finished_at", "status", "finished_at"),  # retention purge
+    )
+
+    id = Column(String, primary_key=True, default=gen_uuid)
+    name = Column(String, nullable=False)  # registered task name
+    args = Column(JSON, nullable=True)
+    key = Column(String, unique=True, nullable=True)  # set for periodic jobs so only one row exists
+    priority = Column(Integer, nullable=False, default=0)  # higher runs first
+    status = Column(String, default="queued")  # queued, running, done, dead
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_at = Column(DateTime, default=datetime.utcnow)  # not before
+    locked_until = Column(DateTime, nullable=True)  # lease while running
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class WebhookEvent(Base):
+    """Gateway callback, stored on receipt and applied asynchronously by webhook_inbox.py"""
+    __tablename__ = "webhook_events"
+    __table_args__ = (
+        UniqueConstraint("gateway", "event_id", name="uq_webhook_events_gateway_event"),
+        Index("ix_webhook_events_status_next_attempt", "status", "next_attempt_at"),
+        Index("ix_webhook_events_gateway_order_ref", "gateway", "order_ref"),
+    )
+
+    id = Column(String, primary_key=True, default=gen_uuid)
+    gateway = Column(String, nullable=False)  # safepay, jazzcash, easypaisa
+    event_id = Column(String, nullable=False)  # gateway event id, or a hash of the body
+    order_ref = Column(String, nullable=False)  # tracker token / txn ref / "MS-xxxxxxxx"
+    payload = Column(JSON, nullable=False)  # parsed fields
+    raw = Column(Text, nullable=True)  # body as received
+    verified = Column(Boolean, default=True)  # False: unsigned, cross-checked by the processor before it applies
+    status = Column(String, default="received")  # received, processing, processed, unmatched, rejected, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    received_at = Column(DateTime, default=datetime.utcnow, index=True)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
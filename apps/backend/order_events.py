@@ -0,0 +1,126 @@
+"""
+Order side effects — handlers the outbox dispatcher runs for each order event.
+
+Every handler may run more than once for the same event (delivery is at
+least once), so each either is idempotent on the receiving side or sends
+the event id along for the receiver to de-duplicate. A handler whose
+endpoint isn't configured does nothing and counts as delivered.
+"""
+
+import os
+from typing import Awaitable, Callable
+
+import httpx
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from catalog import SANITY_API_URL, SANITY_API_VERSION, SANITY_DATASET, SANITY_PROJECT_ID, SANITY_TOKEN
+from database import async_session
+from models import Order
+
+NOTIFY_WEBHOOK_URL = os.getenv("NOTIFY_WEBHOOK_URL", "")  # SMS/email confirmation sender
+ANALYTICS_WEBHOOK_URL = os.getenv("ANALYTICS_WEBHOOK_URL", "")
+COURIER_BOOKING_URL = os.getenv("COURIER_BOOKING_URL", "")
+COURIER_API_KEY = os.getenv("COURIER_API_KEY", "")
+SANITY_STOCK_WRITEBACK = os.getenv("SANITY_STOCK_WRITEBACK", "false").lower() == "true"
+
+
+async def _load_order(order_id: str) -> Order:
+    async with async_session() as db:
+        result = await db.execute(select(Order).options(selectinload(Order.items)).where(Order.id == order_id))
+        order = result.scalar_one_or_none()
+    if order is None:
+        raise LookupError(f"Order {order_id} not found")
+    return order
+
+
+def order_summary(order: Order) -> dict:
+    return {
+        "id": order.id,
+        "customer_name": order.customer_name,
+        "customer_email": order.customer_email,
+        "customer_phone": order.customer_phone,
+        "total": order.total,
+        "payment_method": order.payment_method,
+        "payment_status": order.payment_status,
+        "shipping_address": order.shipping_address,
+        "items": [
+            {"product_id": i.product_id, "name": i.name, "price": i.price,
+             "quantity": i.quantity, "size": i.size, "color": i.color}
+            for i in order.items
+        ],
+        "created_at": order.created_at.isoformat() if order.created_at else None,
+    }
+
+
+async def _post(client: httpx.AsyncClient, url: str, event: dict, body: dict, headers: dict = None):
+    resp = await client.post(url, json=body, headers={"Idempotency-Key": event["id"], **(headers or {})})
+    resp.raise_for_status()
+
+
+# ─── Handlers ────────────────────────────────────────────────────
+async def send_confirmation(event: dict, client: httpx.AsyncClient):
+    """Order confirmation SMS/email, via whatever sender NOTIFY_WEBHOOK_URL points at"""
+    if not NOTIFY_WEBHOOK_URL:
+        return
+    order = await _load_order(event["aggregate_id"])
+    await _post(client, NOTIFY_WEBHOOK_URL, event, {"event": event["topic"], "order": order_summary(order)})
+
+
+async def track_analytics(event: dict, client: httpx.AsyncClient):
+    if not ANALYTICS_WEBHOOK_URL:
+        return
+    await _post(client, ANALYTICS_WEBHOOK_URL, event, {
+        "event": event["topic"],
+        "event_id": event["id"],
+        "order_id": event["aggregate_id"],
+        "properties": event.get("payload") or {},
+    })
+
+
+async def book_courier(event: dict, client: httpx.AsyncClient):
+    if not COURIER_BOOKING_URL:
+        return
+    order = await _load_order(event["aggregate_id"])
+    headers = {"Authorization": f"Bearer {COURIER_API_KEY}"} if COURIER_API_KEY else {}
+    await _post(client, COURIER_BOOKING_URL, event, {
+        "reference": f"MS-{order.id[:8]}",
+        "order": order_summary(order),
+        "cod_amount": order.total if order.payment_method == "cod" else 0,
+    }, headers)
+
+
+async def write_back_stock(event: dict, client: httpx.AsyncClient):
+    """Decrement the product's `stock` field in Sanity so the storefront shows low stock"""
+    if not (SANITY_STOCK_WRITEBACK and SANITY_TOKEN and (SANITY_PROJECT_ID or SANITY_API_URL)):
+        return
+    order = await _load_order(event["aggregate_id"])
+    mutations = [{"patch": {"id": i.product_id, "dec": {"stock": i.quantity}}} for i in order.items]
+    base = SANITY_API_URL or f"https://{SANITY_PROJECT_ID}.api.sanity.io"
+    resp = await client.post(
+        f"{base}/v{SANITY_API_VERSION}/data/mutate/{SANITY_DATASET}",
+        # Fixed transaction id: a retry after a lost response is rejected as a duplicate, not applied twice
+        params={"transactionId": f"stock-{event['id']}"},
+        json={"mutations": mutations},
+        headers={"Authorization": f"Bearer {SANITY_TOKEN}"},
+    )
+    if resp.status_code == 409:
+        return
+    resp.raise_for_status()
+
+
+Handler = Callable[[dict, httpx.AsyncClient], Awaitable[None]]
+
+# topic → [(name, handler)]; names are recorded per event so a retry skips handlers that already succeeded
+SUBSCRIBERS: dict[str, list[tuple[str, Handler]]] = {
+    "order.created": [("analytics", track_analytics)],
+    "order.confirmed": [
+        ("confirmation", send_confirmation),
+        ("stock_writeback", write_back_stock),
+        ("courier", book_courier),
+        ("analytics", track_analytics),
+    ],
+    "order.payment_failed": [("analytics", track_analytics)],
+    # Paid after its stock was sold to someone else: the customer is told, the payment is refunded by hand
+    "order.oversold": [("confirmation", send_confirmation), ("analytics", track_analytics)],
+}
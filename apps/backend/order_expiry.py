@@ -0,0 +1,95 @@
+"""
+Order expiry — cancels gateway checkouts that were abandoned before payment.
+
+Safepay/JazzCash/EasyPaisa/Stripe orders still `unpaid` or `pending` after
+ORDER_EXPIRY_HOURS are marked payment_status="expired", status="cancelled"
+and their stock and promo use are returned. Each batch is one
+`UPDATE … WHERE id IN (SELECT … LIMIT n) RETURNING id` in its own short
+transaction, so the sweep never holds locks on more than ORDER_EXPIRY_BATCH
+orders. The expiry age should be well past RECONCILE_MIN_AGE so the
+reconciler gets to settle late payments first.
+
+COD orders stay unpaid until delivery, so they are not touched. Stripe
+checkout sessions are created to expire no later than their order.
+"""
+
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from database import async_session
+from inventory import release_many
+from jobs import task
+from metrics import count_on_commit, payments
+from models import Order
+from payment_events import ONLINE_GATEWAYS
+from promo import cancel_redemptions
+from response_cache import orders_changed
+
+ORDER_EXPIRY_HOURS = float(os.getenv("ORDER_EXPIRY_HOURS", "24"))
+ORDER_EXPIRY_BATCH = int(os.getenv("ORDER_EXPIRY_BATCH", "200"))
+ORDER_EXPIRY_INTERVAL = 600  # seconds between sweeps
+UNPAID_STATUSES = ("unpaid", "pending")
+
+runs: deque = deque(maxlen=50)  # recent sweeps, newest last
+
+
+async def _expire_batch(cutoff: datetime, batch: int) -> int:
+    stale = (
+        select(Order.id)
+        .where(
+            Order.payment_method.in_(ONLINE_GATEWAYS),
+            Order.payment_status.in_(UNPAID_STATUSES),
+            Order.created_at < cutoff,
+        )
+        .order_by(Order.created_at)
+        .limit(batch)
+    )
+    async with async_session() as db:
+        # Status re-checked in the UPDATE so an order paid since the SELECT is kept
+        expired = (await db.execute(
+            update(Order)
+            .where(Order.id.in_(stale.scalar_subquery()), Order.payment_status.in_(UNPAID_STATUSES))
+            .values(payment_status="expired", status="cancelled", updated_at=datetime.utcnow())
+            .returning(Order.id, Order.payment_method)
+            .execution_options(synchronize_session=False)
+        )).all()
+        if expired:
+            await release_many(db, [row.id for row in expired])
+            for row in expired:
+                await cancel_redemptions(db, row.id)
+                count_on_commit(db, payments, row.payment_method, "expired")
+            orders_changed(db, all_users=True)
+        await db.commit()
+    return len(expired)
+
+
+@task("orders.expire_unpaid", every=ORDER_EXPIRY_INTERVAL)
+async def expire_unpaid(max_age_hours: float = ORDER_EXPIRY_HOURS, batch: int = ORDER_EXPIRY_BATCH) -> dict:
+    """Expire stale unpaid gateway orders, batch by batch. Returns this run's counts."""
+    started = time.perf_counter()
+    cutoff = datetime.utcnow() - timedelta(hours=max_age_hours)
+    expired = batches = 0
+    slowest = 0.0
+    while True:
+        batch_started = time.perf_counter()
+        n = await _expire_batch(cutoff, batch)
+        slowest = max(slowest, time.perf_counter() - batch_started)
+        if not n:
+            break
+        expired += n
+        batches += 1
+        if n < batch:
+            break
+    run = {
+        "at": datetime.utcnow().isoformat(),
+        "expired": expired,
+        "batches": batches,
+        "seconds": round(time.perf_counter() - started, 3),
+        "slowest_batch_ms": round(slowest * 1000, 1),
+    }
+    runs.append(run)
+    return run
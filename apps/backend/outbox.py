@@ -0,0 +1,127 @@
+"""
+Transactional outbox — side effects of order changes, delivered at least once.
+
+Routes call `enqueue()` in the same session as the order change, so the
+event exists iff the change committed and the request never waits on an
+SMS gateway or courier API. The dispatcher claims due events in batches
+with a lease (a crashed worker's events become due again when it runs
+out), runs the topic's handlers, and retries failures with exponential
+backoff until OUTBOX_MAX_ATTEMPTS, after which the event is parked as dead.
+"""
+
+import asyncio
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Optional
+
+import httpx
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import async_session
+from jobs import task
+from metrics import http_client
+from models import OutboxEvent
+from order_events import SUBSCRIBERS
+
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "50"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))  # seconds between polls when idle
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+LEASE = timedelta(seconds=60)  # a claimed event is retried if not finished within this
+BACKOFF_BASE = 5  # seconds; doubles per attempt
+BACKOFF_MAX = 3600
+RETENTION = timedelta(days=7)  # sent events are purged after this
+
+
+def enqueue(db: AsyncSession, topic: str, aggregate_id: str, payload: Optional[dict] = None):
+    """Record an event in the caller's transaction (caller commits)."""
+    db.add(OutboxEvent(topic=topic, aggregate_id=aggregate_id, payload=payload, next_attempt_at=datetime.utcnow()))
+
+
+def backoff(attempts: int) -> timedelta:
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+async def _claim(batch: int) -> list[OutboxEvent]:
+    now = datetime.utcnow()
+    async with async_session() as db:
+        due = select(OutboxEvent.id).where(
+            OutboxEvent.status == "pending", OutboxEvent.next_attempt_at <= now
+        ).order_by(OutboxEvent.next_attempt_at).limit(batch)
+        ids = (await db.execute(due)).scalars().all()
+        if not ids:
+            return []
+        # Re-check the due condition in the UPDATE so two dispatchers never claim the same event
+        claimed = (await db.execute(
+            update(OutboxEvent)
+            .where(OutboxEvent.id.in_(ids), OutboxEvent.status == "pending", OutboxEvent.next_attempt_at <= now)
+            .values(next_attempt_at=now + LEASE, attempts=OutboxEvent.attempts + 1)
+            .returning(OutboxEvent.id)
+        )).scalars().all()
+        events = (await db.execute(select(OutboxEvent).where(OutboxEvent.id.in_(claimed)))).scalars().all()
+        await db.commit()
+        return list(events)
+
+
+async def _deliver(event: OutboxEvent, client: httpx.AsyncClient) -> tuple[list[str], list[str]]:
+    """Run the handlers not yet completed for this event. Returns (completed, errors)."""
+    completed = list(event.completed or [])
+    errors = []
+    data = {"id": event.id, "topic": event.topic, "aggregate_id": event.aggregate_id, "payload": event.payload}
+    for name, handler in SUBSCRIBERS.get(event.topic, ()):
+        if name in completed:
+            continue
+        try:
+            await handler(data, client)
+            completed.append(name)
+        except Exception as e:
+            errors.append(f"{name}: {type(e).__name__}: {e}")
+    return completed, errors
+
+
+async def dispatch_batch(client: httpx.AsyncClient, batch: int = OUTBOX_BATCH) -> int:
+    """Deliver one batch of due events. Returns the number claimed."""
+    events = await _claim(batch)
+    if not events:
+        return 0
+    results = await asyncio.gather(*(_deliver(e, client) for e in events))
+    now = datetime.utcnow()
+    async with async_session() as db:
+        for event, (completed, errors) in zip(events, results):
+            if not errors:
+                values = {"status": "sent", "sent_at": now, "completed": completed, "last_error": None}
+            elif event.attempts >= OUTBOX_MAX_ATTEMPTS:
+                values = {"status": "dead", "completed": completed, "last_error": "\n".join(errors)}
+            else:
+                values = {
+                    "next_attempt_at": now + backoff(event.attempts),
+                    "completed": completed,
+                    "last_error": "\n".join(errors),
+                }
+            await db.execute(update(OutboxEvent).where(OutboxEvent.id == event.id).values(**values))
+        await db.commit()
+    return len(events)
+
+
+@task("outbox.purge_sent", every=3600)
+async def purge_sent(older_than: timedelta = RETENTION) -> int:
+    async with async_session() as db:
+        result = await db.execute(
+            delete(OutboxEvent).where(OutboxEvent.status == "sent", OutboxEvent.sent_at < datetime.utcnow() - older_than)
+        )
+        await db.commit()
+        return result.rowcount
+
+
+async def dispatcher_loop():
+    """Background task run by worker.py."""
+    async with http_client(timeout=10.0) as client:
+        while True:
+            try:
+                claimed = await dispatch_batch(client)
+            except Exception:
+                claimed = 0
+            if claimed < OUTBOX_BATCH:  # a full batch means more are waiting
+                await asyncio.sleep(OUTBOX_POLL_INTERVAL)
@@ -0,0 +1,128 @@
+"""
+Payment status changes — shared by the gateway webhooks (via the inbox) and checkout routes.
+
+mark_paid / mark_failed are the only places an order's payment status
+flips, so stock, promo counters and outbox events always move with it.
+Both are safe to repeat: a replayed or duplicated event changes nothing,
+and a decline arriving after the payment settled (a late or out-of-order
+callback) leaves the order as it is.
+"""
+
+import hashlib
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from inventory import commit_reservations, release_reservations
+from metrics import count_on_commit, payments
+from models import Order
+from outbox import enqueue
+from promo import cancel_redemptions
+from response_cache import orders_changed
+from tracing import traced
+
+GATEWAYS = ("safepay", "jazzcash", "easypaisa")  # confirm by webhook
+ONLINE_GATEWAYS = (*GATEWAYS, "stripe")  # paid online: settled by webhook or reconcile.py, expired if abandoned
+
+
+def event_payload(order: Order) -> dict:
+    return {"payment_method": order.payment_method, "total": order.total, "promo_code": order.promo_code}
+
+
+@traced()
+async def mark_paid(db: AsyncSession, order: Order, transaction_id: str):
+    """
+    Gateway confirmed the payment — keep the stock and queue the follow-up work (caller commits).
+    A payment for an order whose stock was returned and sold since cancels the
+    order instead, with an "order.oversold" event so the payment gets refunded.
+    """
+    if order.payment_status == "paid":
+        return
+    order.payment_status = "paid"
+    order.transaction_id = transaction_id
+    orders_changed(db, order.user_id)
+    count_on_commit(db, payments, order.payment_method, "paid")
+    if await commit_reservations(db, order.id):
+        order.status = "processing"
+        enqueue(db, "order.confirmed", order.id, event_payload(order))
+    else:
+        order.status = "cancelled"
+        enqueue(db, "order.oversold", order.id, event_payload(order))
+
+
+@traced()
+async def mark_failed(db: AsyncSession, order: Order):
+    """Gateway declined the payment — return stock and promo use (caller commits). Only a pending payment can fail."""
+    if order.payment_status != "pending":
+        return
+    enqueue(db, "order.payment_failed", order.id, event_payload(order))
+    count_on_commit(db, payments, order.payment_method, "failed")
+    order.payment_status = "failed"
+    orders_changed(db, order.user_id)
+    await release_reservations(db, order.id)
+    await cancel_redemptions(db, order.id)
+
+
+# ─── Webhook payloads ────────────────────────────────────────────
+def webhook_keys(gateway: str, data: dict, raw: bytes) -> tuple[str, Optional[str]]:
+    """
+    (event id for de-duplication, order reference for ordering) of a
+    webhook payload. Gateways that send no event id are keyed on a hash
+    of the body — their retries resend it byte for byte.
+    """
+    body_hash = hashlib.sha256(raw).hexdigest()
+    if gateway == "safepay":
+        inner = data.get("data") or {}
+        return str(data.get("id") or inner.get("id") or body_hash), inner.get("token") or None
+    if gateway == "jazzcash":
+        ref = data.get("pp_TxnRefNo") or None
+        return (f"{ref}:{data.get('pp_ResponseCode', '')}" if ref else body_hash), ref
+    if gateway == "easypaisa":
+        ref = data.get("orderId") or None
+        return (f"{ref}:{data.get('status', '')}:{data.get('transactionId', '')}" if ref else body_hash), ref
+    raise ValueError(f"Unknown gateway: {gateway}")
+
+
+def claimed_outcome(gateway: str, data: dict) -> str:
+    """"paid" or "failed" — what an EasyPaisa callback says happened (checked against the inquiry API)."""
+    if gateway != "easypaisa":
+        raise ValueError(f"No unsigned callbacks from {gateway}")
+    return "paid" if data.get("status", "") in ("0000", "0001") else "failed"
+
+
+async def _find_order(db: AsyncSession, gateway: str, order_ref: str) -> Optional[Order]:
+    if gateway == "easypaisa":
+        # order_ref is "MS-{order.id[:8]}" format
+        short_id = order_ref.replace("MS-", "")
+        result = await db.execute(
+            select(Order).where(Order.payment_method == "easypaisa", Order.id.like(f"{short_id}%"))
+        )
+    else:
+        result = await db.execute(select(Order).where(Order.gateway_session_id == order_ref))
+    return result.scalar_one_or_none()
+
+
+async def apply_webhook(db: AsyncSession, gateway: str, data: dict, order_ref: str) -> bool:
+    """Apply one gateway callback to its order (caller commits). False if no order matched."""
+    order = await _find_order(db, gateway, order_ref)
+    if not order:
+        return False
+
+    if gateway == "safepay":
+        event_type = data.get("type", "")
+        if event_type == "payment:created" or event_type == "payment:completed":
+            await mark_paid(db, order, (data.get("data") or {}).get("tracker", {}).get("id", ""))
+        elif event_type == "payment:failed":
+            await mark_failed(db, order)
+    elif gateway == "jazzcash":
+        if data.get("pp_ResponseCode", "") == "000":
+            await mark_paid(db, order, data.get("pp_RetreivalReferenceNo", order_ref))
+        else:
+            await mark_failed(db, order)
+    elif gateway == "easypaisa":
+        if claimed_outcome(gateway, data) == "paid":
+            await mark_paid(db, order, data.get("transactionId", ""))
+        else:
+            await mark_failed(db, order)
+    return True
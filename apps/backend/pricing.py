@@ -0,0 +1,126 @@
+"""Server-side cart pricing — prices from the catalog index, never from the client"""
+
+import asyncio
+import os
+from typing import Iterable, NamedTuple, Optional
+
+from catalog import PriceIndex, ensure_catalog, price_index
+from promo import PromoEngine, PromoError, ensure_promotions, normalize_code, promo_engine
+from tracing import traced
+
+FREE_SHIPPING_THRESHOLD = 5000  # PKR
+STANDARD_SHIPPING = 250
+EXPRESS_SHIPPING = 500
+COD_FEE = 200
+# Local dev without a catalog only: price carts from the prices the client sent
+PRICING_TRUST_CLIENT_PRICES = os.getenv("PRICING_TRUST_CLIENT_PRICES", "false").lower() == "true"
+
+
+class PricingError(ValueError):
+    pass
+
+
+class CatalogUnavailable(PricingError):
+    """No full catalog snapshot is loaded yet, so there is nothing to price against."""
+
+
+async def ensure_loaded():
+    """Catalog and promo rules, loaded on first use where no background loop keeps them current."""
+    await asyncio.gather(ensure_catalog(), ensure_promotions())
+
+
+class PricedLine(NamedTuple):
+    product_id: str
+    name: str
+    unit_price: float
+    quantity: int
+    line_total: float
+    category_slug: Optional[str] = None
+
+
+class Quote(NamedTuple):
+    lines: list[PricedLine]
+    subtotal: float
+    shipping: float
+    discount: float
+    cod_fee: float
+    total: float
+    promo_code: Optional[str] = None  # normalised code, set only when a discount applied
+
+    def as_dict(self) -> dict:
+        return {
+            "subtotal": self.subtotal,
+            "shipping": self.shipping,
+            "discount": self.discount,
+            "cod_fee": self.cod_fee,
+            "total": self.total,
+            "items": [
+                {"product_id": l.product_id, "name": l.name, "price": l.unit_price,
+                 "quantity": l.quantity, "line_total": l.line_total}
+                for l in self.lines
+            ],
+        }
+
+
+def shipping_for(subtotal: float, shipping_method: str = "standard") -> float:
+    if shipping_method == "express":
+        return EXPRESS_SHIPPING
+    return 0 if subtotal >= FREE_SHIPPING_THRESHOLD else STANDARD_SHIPPING
+
+
+def promo_discount(
+    lines: list[PricedLine], subtotal: float, promo_code: Optional[str], promos: PromoEngine = promo_engine,
+) -> float:
+    if not promo_code:
+        return 0
+    try:
+        return promos.evaluate(promo_code, lines, subtotal)
+    except PromoError as e:
+        raise PricingError(str(e))
+
+
+@traced()
+def price_cart(
+    items: Iterable,
+    shipping_method: str = "standard",
+    payment_method: Optional[str] = None,
+    promo_code: Optional[str] = None,
+    index: PriceIndex = price_index,
+    promos: PromoEngine = promo_engine,
+) -> Quote:
+    """
+    Recompute a cart. `items` need `product_id` and `quantity`; their
+    `name`/`price` are used only with PRICING_TRUST_CLIENT_PRICES while no
+    catalog snapshot has been loaded. Without the flag that is refused.
+    """
+    prices = index.prices
+    trusted = index.loaded
+    if not trusted and not PRICING_TRUST_CLIENT_PRICES:
+        raise CatalogUnavailable("Catalog is not loaded yet, please try again shortly")
+    lines = []
+    subtotal = 0.0
+    for item in items:
+        qty = item.quantity
+        if qty < 1 or qty > 100:
+            raise PricingError(f"Invalid quantity for {item.product_id}")
+        if trusted:
+            entry = prices.get(item.product_id)
+            if entry is None:
+                raise PricingError(f"Product {item.product_id} is no longer available")
+            unit, name, category = entry.price, entry.name or item.name, entry.category_slug
+        else:
+            unit, name, category = item.price, item.name, None
+        line_total = unit * qty
+        subtotal += line_total
+        lines.append(PricedLine(item.product_id, name, unit, qty, line_total, category))
+    if not lines:
+        raise PricingError("Cart is empty")
+
+    shipping = shipping_for(subtotal, shipping_method)
+    discount = promo_discount(lines, subtotal, promo_code, promos)
+    cod_fee = COD_FEE if payment_method == "cod" else 0
+    total = subtotal + shipping - discount + cod_fee
+    return Quote(
+        lines, round(subtotal, 2), shipping, discount, cod_fee, round(total, 2),
+        normalize_code(promo_code) if promo_code else None,
+    )
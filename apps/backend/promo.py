@@ -0,0 +1,313 @@
+"""
+Promo codes — rules compiled into in-memory evaluators, counters enforced in the DB.
+
+Each Promotion row is compiled once into a closure that only runs the
+checks that rule actually has (window, minimum cart, categories), so
+pricing a cart with a code is a dict lookup plus a few comparisons.
+Redemptions take the global and per-user counters with conditional
+UPDATEs in a short transaction of their own, and are returned if the
+order fails. Admin edits reload the engine; other workers pick the
+change up from the refresh loop, or — where no loop runs (serverless) —
+from ensure_promotions() on the next checkout.
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import async_session
+from models import PromoRedemption, PromoUsage, Promotion
+from tracing import traced
+
+PROMO_REFRESH_INTERVAL = int(os.getenv("PROMO_REFRESH_INTERVAL", "30"))  # seconds
+
+# Seeded on first start so the codes the storefront already advertises keep working
+DEFAULT_PROMOS = [
+    {"code": "MODEST10", "kind": "percent", "value": 10},
+    {"code": "WELCOME10", "kind": "percent", "value": 10, "per_user_limit": 1},
+]
+
+
+class PromoError(ValueError):
+    pass
+
+
+def normalize_code(code: Optional[str]) -> str:
+    return (code or "").strip().upper()
+
+
+def user_key_for(email: Optional[str] = None, phone: Optional[str] = None) -> Optional[str]:
+    """Identity a per-user limit is counted against — email, else the phone digits."""
+    if email and email.strip():
+        return email.strip().lower()
+    digits = "".join(c for c in phone or "" if c.isdigit())
+    return digits[-10:] or None
+
+
+class CompiledPromo:
+    __slots__ = ("code", "usage_limit", "per_user_limit", "used_count", "evaluate", "description")
+
+    def __init__(self, code, usage_limit, per_user_limit, used_count, evaluate, description):
+        self.code = code
+        self.usage_limit = usage_limit
+        self.per_user_limit = per_user_limit
+        self.used_count = used_count
+        self.evaluate: Callable[[list, float, datetime], float] = evaluate
+        self.description = description
+
+
+def _get(rule, field, default=None):
+    value = rule.get(field) if isinstance(rule, dict) else getattr(rule, field, None)
+    return default if value is None else value
+
+
+def compile_rule(rule) -> CompiledPromo:
+    """Build the evaluator for one Promotion row (or dict with the same fields)."""
+    code = normalize_code(_get(rule, "code"))
+    kind = _get(rule, "kind", "percent")
+    value = float(_get(rule, "value", 0))
+    max_discount = _get(rule, "max_discount")
+    min_subtotal = float(_get(rule, "min_subtotal", 0))
+    starts_at = _get(rule, "starts_at")
+    ends_at = _get(rule, "ends_at")
+    categories = frozenset(_get(rule, "categories") or ())
+
+    checks: list[Callable[[float, datetime], Optional[str]]] = []
+    if starts_at:
+        checks.append(lambda subtotal, now: "This code is not active yet" if now < starts_at else None)
+    if ends_at:
+        checks.append(lambda subtotal, now: "This code has expired" if now >= ends_at else None)
+    if min_subtotal:
+        checks.append(
+            lambda subtotal, now: f"Add PKR {min_subtotal - subtotal:,.0f} more to use this code"
+            if subtotal < min_subtotal else None
+        )
+
+    if categories:
+        def eligible(lines, subtotal):
+            return sum(l.line_total for l in lines if l.category_slug in categories)
+    else:
+        def eligible(lines, subtotal):
+            return subtotal
+
+    if kind == "flat":
+        def discount_for(base):
+            return min(value, base)
+        description = f"PKR {value:,.0f} off"
+    else:
+        def discount_for(base):
+            d = round(base * value / 100)
+            return min(d, max_discount) if max_discount is not None else d
+        description = f"{value:g}% off"
+
+    def evaluate(lines, subtotal: float, now: datetime) -> float:
+        for check in checks:
+            reason = check(subtotal, now)
+            if reason:
+                raise PromoError(reason)
+        base = eligible(lines, subtotal)
+        if base <= 0:
+            raise PromoError("This code doesn't apply to the items in your cart")
+        return discount_for(base)
+
+    return CompiledPromo(
+        code, _get(rule, "usage_limit"), _get(rule, "per_user_limit"),
+        _get(rule, "used_count", 0), evaluate, description,
+    )
+
+
+class PromoEngine:
+    """code → CompiledPromo for every active promotion."""
+
+    def __init__(self):
+        self.rules: dict[str, CompiledPromo] = {
+            p["code"]: compile_rule(p) for p in DEFAULT_PROMOS
+        }
+        self.loaded = False
+        self.version = 0
+        self.stamp = None  # (max updated_at, total used) of the last load
+        self.checked_at = 0.0  # monotonic, last time the stamp was compared
+
+    def load(self, rows: Iterable):
+        self.rules = {normalize_code(_get(r, "code")): compile_rule(r) for r in rows if _get(r, "active", True)}
+        self.loaded = True
+        self.version += 1
+
+    def get(self, code: Optional[str]) -> Optional[CompiledPromo]:
+        return self.rules.get(normalize_code(code))
+
+    def evaluate(self, code: str, lines: list, subtotal: float, now: Optional[datetime] = None) -> float:
+        """Discount for a priced cart; raises PromoError with a customer-facing reason."""
+        rule = self.rules.get(normalize_code(code))
+        if rule is None:
+            raise PromoError("Invalid promo code")
+        if rule.usage_limit is not None and rule.used_count >= rule.usage_limit:
+            raise PromoError("This code has been fully redeemed")
+        return rule.evaluate(lines, subtotal, now or datetime.utcnow())
+
+
+promo_engine = PromoEngine()
+
+
+# ─── Loading / invalidation ──────────────────────────────────────
+async def _stamp(db: AsyncSession):
+    row = (await db.execute(
+        select(func.max(Promotion.updated_at), func.coalesce(func.sum(Promotion.used_count), 0))
+    )).one()
+    return tuple(row)
+
+
+async def load_promotions():
+    """(Re)load the engine from the DB, seeding DEFAULT_PROMOS into an empty table."""
+    async with async_session() as db:
+        if not await db.scalar(select(func.count()).select_from(Promotion)):
+            for p in DEFAULT_PROMOS:
+                db.add(Promotion(**p))
+            await db.commit()
+        rows = (await db.execute(select(Promotion))).scalars().all()
+        promo_engine.load(rows)
+        promo_engine.stamp = await _stamp(db)
+    promo_engine.checked_at = time.monotonic()
+
+
+async def refresh_promotions():
+    """Reload if the rules changed on another worker; keeps the last good rules on error."""
+    try:
+        async with async_session() as db:
+            stamp = await _stamp(db)
+        if stamp != promo_engine.stamp:
+            await load_promotions()
+    except Exception:
+        pass
+    promo_engine.checked_at = time.monotonic()
+
+
+_load_lock = asyncio.Lock()
+
+
+async def ensure_promotions():
+    """First-use load, then a stamp check once two refresh intervals pass without one (a no-op while the loop runs)."""
+    def fresh() -> bool:
+        return promo_engine.loaded and time.monotonic() - promo_engine.checked_at < 2 * PROMO_REFRESH_INTERVAL
+
+    if fresh():
+        return
+    async with _load_lock:  # one load however many requests find the engine cold
+        if fresh():
+            return
+        if promo_engine.loaded:
+            await refresh_promotions()
+        else:
+            await load_promotions()
+
+
+async def refresh_loop():
+    """Background task run by worker.py — picks up edits made on other workers."""
+    while True:
+        await asyncio.sleep(PROMO_REFRESH_INTERVAL)
+        await refresh_promotions()
+
+
+# ─── Redemption ──────────────────────────────────────────────────
+async def usage_count(db: AsyncSession, code: str, user_key: Optional[str]) -> int:
+    if not user_key:
+        return 0
+    return await db.scalar(
+        select(PromoUsage.count).where(PromoUsage.code == normalize_code(code), PromoUsage.user_key == user_key)
+    ) or 0
+
+
+async def _take_user_slot(db: AsyncSession, code: str, user_key: str, limit: int):
+    result = await db.execute(
+        update(PromoUsage)
+        .where(PromoUsage.code == code, PromoUsage.user_key == user_key, PromoUsage.count < limit)
+        .values(count=PromoUsage.count + 1)
+    )
+    if result.rowcount == 1:
+        return
+    if await db.scalar(select(PromoUsage.count).where(PromoUsage.code == code, PromoUsage.user_key == user_key)) is not None:
+        raise PromoError("You have already used this code")
+    db.add(PromoUsage(code=code, user_key=user_key, count=1))
+    await db.flush()  # IntegrityError if another checkout inserted it first
+
+
+@traced()
+async def redeem(code: str, order_id: str, user_key: Optional[str] = None):
+    """
+    Count one use of `code` for `order_id` in its own short transaction.
+    Raises PromoError when the global or per-user limit is reached.
+    """
+    code = normalize_code(code)
+    rule = promo_engine.get(code)
+    if rule is None:
+        raise PromoError("Invalid promo code")
+    if rule.per_user_limit and not user_key:
+        raise PromoError("Enter your email to use this code")
+
+    for _ in range(3):
+        async with async_session() as db:
+            try:
+                result = await db.execute(
+                    update(Promotion)
+                    .where(
+                        Promotion.code == code,
+                        Promotion.active.is_(True),
+                        or_(Promotion.usage_limit.is_(None), Promotion.used_count < Promotion.usage_limit),
+                    )
+                    .values(used_count=Promotion.used_count + 1)
+                )
+                if result.rowcount != 1:
+                    raise PromoError("This code has been fully redeemed")
+                if rule.per_user_limit:
+                    await _take_user_slot(db, code, user_key, rule.per_user_limit)
+                db.add(PromoRedemption(code=code, order_id=order_id, user_key=user_key))
+                await db.commit()
+                rule.used_count += 1
+                return
+            except IntegrityError:
+                await db.rollback()  # lost the race to create the per-user row — retry as an UPDATE
+            except BaseException:
+                await db.rollback()
+                raise
+    raise PromoError("Could not apply this code, please try again")
+
+
+async def cancel_redemptions(db: AsyncSession, order_id: str):
+    """Order failed — return its promo use to the counters (caller commits)."""
+    rows = (await db.execute(
+        select(PromoRedemption.id, PromoRedemption.code, PromoRedemption.user_key)
+        .where(PromoRedemption.order_id == order_id, PromoRedemption.status == "redeemed")
+    )).all()
+    for r in rows:
+        result = await db.execute(
+            update(PromoRedemption)
+            .where(PromoRedemption.id == r.id, PromoRedemption.status == "redeemed")
+            .values(status="cancelled")
+        )
+        if result.rowcount != 1:
+            continue
+        await db.execute(
+            update(Promotion).where(Promotion.code == r.code).values(used_count=Promotion.used_count - 1)
+        )
+        if r.user_key:
+            await db.execute(
+                update(PromoUsage)
+                .where(PromoUsage.code == r.code, PromoUsage.user_key == r.user_key)
+                .values(count=PromoUsage.count - 1)
+            )
+        rule = promo_engine.get(r.code)
+        if rule is not None and rule.used_count > 0:
+            rule.used_count -= 1
+
+
+async def release_promo(order_id: str):
+    """cancel_redemptions in its own transaction, for request error paths."""
+    async with async_session() as db:
+        await cancel_redemptions(db, order_id)
+        await db.commit()
@@ -0,0 +1,344 @@
+"""
+Payment reconciliation — settles gateway orders whose webhook never arrived.
+
+A periodic job walks `pending` Safepay/JazzCash/EasyPaisa/Stripe orders older
+than RECONCILE_MIN_AGE in keyset batches, asks each gateway's status
+inquiry API about them (bounded concurrency overall, a request-rate cap
+per gateway), and applies the answers per batch: one conditional UPDATE
+flips every paid order and one every failed order, so an order a webhook
+settled in the meantime is left alone. Stock, promo use and outbox events
+then follow exactly as in payment_events.mark_paid / mark_failed.
+
+Stock stays reserved until the order expires (ORDER_EXPIRY_HOURS), so a
+late payment found here normally still has it; one found after the stock
+was sold again cancels the order as oversold, as mark_paid does. Stripe
+sends no webhook here, so this is how its checkouts get settled.
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+import httpx
+from sqlalchemy import bindparam, select, update
+
+from database import async_session
+from inventory import commit_reservations, release_reservations
+from jobs import task
+from metrics import count_on_commit, http_client, payments
+from models import Order
+from outbox import enqueue
+from payment_events import ONLINE_GATEWAYS, event_payload
+from promo import cancel_redemptions
+from response_cache import orders_changed
+
+RECONCILE_INTERVAL = int(os.getenv("RECONCILE_INTERVAL", "300"))  # seconds between runs
+RECONCILE_MIN_AGE = timedelta(minutes=int(os.getenv("RECONCILE_MIN_AGE_MINUTES", "5")))
+RECONCILE_BATCH = int(os.getenv("RECONCILE_BATCH", "100"))
+RECONCILE_CONCURRENCY = int(os.getenv("RECONCILE_CONCURRENCY", "10"))  # in-flight inquiries across gateways
+RECONCILE_RATE = {  # inquiries per second, per gateway
+    "safepay": float(os.getenv("RECONCILE_RATE_SAFEPAY", "10")),
+    "jazzcash": float(os.getenv("RECONCILE_RATE_JAZZCASH", "5")),
+    "easypaisa": float(os.getenv("RECONCILE_RATE_EASYPAISA", "5")),
+    "stripe": float(os.getenv("RECONCILE_RATE_STRIPE", "20")),
+}
+LAG_WINDOW = 1000  # recently settled orders kept for the lag percentiles
+
+# Gateway credentials (same variables as routes/payment.py)
+SAFEPAY_SECRET = os.getenv("SAFEPAY_SECRET_KEY", "")
+SAFEPAY_BASE = os.getenv("SAFEPAY_BASE_URL", "https://sandbox.api.getsafepay.com")
+JAZZCASH_MERCHANT_ID = os.getenv("JAZZCASH_MERCHANT_ID", "")
+JAZZCASH_PASSWORD = os.getenv("JAZZCASH_PASSWORD", "")
+JAZZCASH_SALT = os.getenv("JAZZCASH_INTEGRITY_SALT", "")
+JAZZCASH_INQUIRY_URL = os.getenv(
+    "JAZZCASH_INQUIRY_URL", "https://sandbox.jazzcash.com.pk/ApplicationAPI/API/PaymentInquiry/Inquire"
+)
+EASYPAISA_STORE_ID = os.getenv("EASYPAISA_STORE_ID", "")
+EASYPAISA_ACCOUNT_NUM = os.getenv("EASYPAISA_ACCOUNT_NUM", "")
+EASYPAISA_USERNAME = os.getenv("EASYPAISA_USERNAME", "")
+EASYPAISA_PASSWORD = os.getenv("EASYPAISA_PASSWORD", "")
+EASYPAISA_INQUIRY_URL = os.getenv(
+    "EASYPAISA_INQUIRY_URL", "https://easypay.easypaisa.com.pk/easypay-service/rest/v4/inquire-transaction"
+)
+STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY", "")
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "") or "https://api.stripe.com"
+
+# An inquiry answers ("paid", transaction id), ("failed", None) or None while still pending
+Outcome = Optional[tuple[str, Optional[str]]]
+
+
+# ─── Status inquiries ────────────────────────────────────────────
+async def inquire_safepay(client: httpx.AsyncClient, ref: str) -> Outcome:
+    res = await client.get(
+        f"{SAFEPAY_BASE}/reporter/api/v1/payments/{ref}",
+        headers={"X-SFPY-MERCHANT-SECRET": SAFEPAY_SECRET},
+    )
+    res.raise_for_status()
+    data = res.json().get("data") or {}
+    state = data.get("state", "")
+    if state in ("TRACKER_ENDED", "PAID"):
+        return "paid", data.get("reference") or ref
+    if state in ("TRACKER_EXPIRED", "TRACKER_CANCELLED", "FAILED"):
+        return "failed", None
+    return None
+
+
+def jazzcash_hash(fields: dict, salt: Optional[str] = None) -> str:
+    """pp_SecureHash: salt & the non-empty pp_ values in key order (pp_SecureHash itself left out), HMAC-SHA256 with the salt."""
+    salt = JAZZCASH_SALT if salt is None else salt
+    values = [str(fields[k]) for k in sorted(fields) if k.startswith("pp_") and k != "pp_SecureHash" and fields[k] != ""]
+    message = "&".join([salt, *values])
+    return hmac.new(salt.encode(), message.encode(), hashlib.sha256).hexdigest().upper()
+
+
+async def inquire_jazzcash(client: httpx.AsyncClient, ref: str) -> Outcome:
+    payload = {"pp_TxnRefNo": ref, "pp_MerchantID": JAZZCASH_MERCHANT_ID, "pp_Password": JAZZCASH_PASSWORD}
+    payload["pp_SecureHash"] = jazzcash_hash(payload)
+    res = await client.post(JAZZCASH_INQUIRY_URL, json=payload)
+    res.raise_for_status()
+    data = res.json()
+    if data.get("pp_ResponseCode") != "000":  # the inquiry itself failed
+        raise RuntimeError(f"JazzCash inquiry {data.get('pp_ResponseCode')}: {data.get('pp_ResponseMessage', '')}")
+    status = data.get("pp_PaymentResponseCode", "")
+    if status == "121":
+        return "paid", data.get("pp_RetreivalReferenceNo") or ref
+    if status in ("124", "157"):  # awaiting customer approval
+        return None
+    return "failed", None
+
+
+async def inquire_easypaisa(client: httpx.AsyncClient, ref: str) -> Outcome:
+    credentials = base64.b64encode(f"{EASYPAISA_USERNAME}:{EASYPAISA_PASSWORD}".encode()).decode()
+    res = await client.post(
+        EASYPAISA_INQUIRY_URL,
+        json={"orderId": ref, "storeId": EASYPAISA_STORE_ID, "accountNum": EASYPAISA_ACCOUNT_NUM},
+        headers={"Credentials": credentials},
+    )
+    res.raise_for_status()
+    data = res.json()
+    if data.get("responseCode") != "0000":
+        raise RuntimeError(f"EasyPaisa inquiry {data.get('responseCode')}: {data.get('responseDesc', '')}")
+    status = data.get("transactionStatus", "")
+    if status == "PAID":
+        return "paid", data.get("transactionId") or ref
+    if status in ("FAILED", "REVERSED", "EXPIRED"):
+        return "failed", None
+    return None
+
+
+async def inquire_stripe(client: httpx.AsyncClient, ref: str) -> Outcome:
+    res = await client.get(
+        f"{STRIPE_API_BASE}/v1/checkout/sessions/{ref}",
+        headers={"Authorization": f"Bearer {STRIPE_SECRET_KEY}"},
+    )
+    res.raise_for_status()
+    data = res.json()
+    if data.get("payment_status") in ("paid", "no_payment_required"):
+        return "paid", data.get("payment_intent") or ref
+    if data.get("status") == "expired":
+        return "failed", None
+    return None
+
+
+INQUIRIES: dict[str, Callable[[httpx.AsyncClient, str], Awaitable[Outcome]]] = {
+    "safepay": inquire_safepay,
+    "jazzcash": inquire_jazzcash,
+    "easypaisa": inquire_easypaisa,
+    "stripe": inquire_stripe,
+}
+
+
+def configured_gateways() -> list[str]:
+    """Gateways with inquiry credentials — the others are skipped."""
+    configured = {
+        "safepay": bool(SAFEPAY_SECRET),
+        "jazzcash": bool(JAZZCASH_MERCHANT_ID and JAZZCASH_PASSWORD),
+        "easypaisa": bool(EASYPAISA_STORE_ID and EASYPAISA_USERNAME),
+        "stripe": bool(STRIPE_SECRET_KEY),
+    }
+    return [g for g in ONLINE_GATEWAYS if configured[g]]
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart (no bursts — gateways count per second)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# ─── Metrics ─────────────────────────────────────────────────────
+@dataclass
+class ReconcileStats:
+    runs: int = 0
+    checked: int = 0
+    paid: int = 0
+    failed: int = 0
+    still_pending: int = 0
+    errors: int = 0
+    last_run_at: Optional[datetime] = None
+    last_run_seconds: Optional[float] = None
+    lags: deque = field(default_factory=lambda: deque(maxlen=LAG_WINDOW))  # pending → settled, seconds
+
+    def snapshot(self) -> dict:
+        ordered = sorted(self.lags)
+        pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1) if ordered else None
+        return {
+            "runs": self.runs,
+            "checked": self.checked,
+            "paid": self.paid,
+            "failed": self.failed,
+            "still_pending": self.still_pending,
+            "errors": self.errors,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_run_seconds": self.last_run_seconds,
+            "lag_seconds": {"p50": pick(0.50), "p95": pick(0.95), "max": pick(1.0)},
+        }
+
+
+stats = ReconcileStats()
+
+
+# ─── Reconcile ───────────────────────────────────────────────────
+async def _pending_batch(gateways: list[str], cutoff: datetime, after: Optional[tuple]) -> list:
+    query = (
+        select(Order.id, Order.payment_method, Order.gateway_session_id, Order.total, Order.promo_code, Order.updated_at)
+        .where(
+            Order.payment_status == "pending",
+            Order.payment_method.in_(gateways),
+            Order.gateway_session_id.is_not(None),
+            Order.updated_at < cutoff,
+        )
+        .order_by(Order.updated_at, Order.id)
+        .limit(RECONCILE_BATCH)
+    )
+    if after is not None:
+        updated_at, order_id = after
+        query = query.where(
+            (Order.updated_at > updated_at) | ((Order.updated_at == updated_at) & (Order.id > order_id))
+        )
+    async with async_session() as db:
+        return (await db.execute(query)).all()
+
+
+async def _apply(rows: list, outcomes: list[Outcome]) -> tuple[int, int]:
+    """Settle a batch in one transaction. Only orders still pending are changed."""
+    paid = {row.id: (row, outcome[1]) for row, outcome in zip(rows, outcomes) if outcome and outcome[0] == "paid"}
+    failed = {row.id: row for row, outcome in zip(rows, outcomes) if outcome and outcome[0] == "failed"}
+    now = datetime.utcnow()
+    async with async_session() as db:
+        paid_ids = []
+        if paid:
+            paid_ids = (await db.execute(
+                update(Order).where(Order.id.in_(list(paid)), Order.payment_status == "pending")
+                .values(payment_status="paid", status="processing", updated_at=now)
+                .returning(Order.id)
+                .execution_options(synchronize_session=False)
+            )).scalars().all()
+        failed_ids = []
+        if failed:
+            failed_ids = (await db.execute(
+                update(Order).where(Order.id.in_(list(failed)), Order.payment_status == "pending")
+                .values(payment_status="failed", updated_at=now)
+                .returning(Order.id)
+                .execution_options(synchronize_session=False)
+            )).scalars().all()
+        if paid_ids:
+            await db.execute(
+                update(Order.__table__).where(Order.__table__.c.id == bindparam("order_id"))
+                .values(transaction_id=bindparam("transaction_id")),
+                [{"order_id": i, "transaction_id": paid[i][1]} for i in paid_ids],
+            )
+        for order_id in paid_ids:
+            row = paid[order_id][0]
+            if await commit_reservations(db, order_id):
+                enqueue(db, "order.confirmed", order_id, event_payload(row))
+            else:
+                await db.execute(update(Order).where(Order.id == order_id).values(status="cancelled"))
+                enqueue(db, "order.oversold", order_id, event_payload(row))
+            count_on_commit(db, payments, row.payment_method, "paid")
+            stats.lags.append((now - row.updated_at).total_seconds())
+        for order_id in failed_ids:
+            row = failed[order_id]
+            await release_reservations(db, order_id)
+            await cancel_redemptions(db, order_id)
+            enqueue(db, "order.payment_failed", order_id, event_payload(row))
+            count_on_commit(db, payments, row.payment_method, "failed")
+            stats.lags.append((now - row.updated_at).total_seconds())
+        if paid_ids or failed_ids:
+            orders_changed(db, all_users=True)
+        await db.commit()
+    return len(paid_ids), len(failed_ids)
+
+
+async def reconcile_pending(
+    client: Optional[httpx.AsyncClient] = None,
+    gateways: Optional[list[str]] = None,
+    min_age: timedelta = RECONCILE_MIN_AGE,
+) -> dict:
+    """One pass over pending gateway orders. Returns this run's counts."""
+    gateways = configured_gateways() if gateways is None else gateways
+    run = {"checked": 0, "paid": 0, "failed": 0, "still_pending": 0, "errors": 0}
+    if not gateways:
+        return run
+    started = time.perf_counter()
+    cutoff = datetime.utcnow() - min_age
+    limiters = {g: RateLimiter(RECONCILE_RATE.get(g, 0)) for g in gateways}
+    slots = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+
+    async def inquire(row) -> Outcome:
+        async with slots:
+            await limiters[row.payment_method].wait()
+            try:
+                return await INQUIRIES[row.payment_method](client, row.gateway_session_id)
+            except Exception:
+                run["errors"] += 1
+                return None
+
+    own_client = client is None
+    if own_client:
+        client = http_client(timeout=15.0)
+    try:
+        after = None
+        while True:
+            rows = await _pending_batch(gateways, cutoff, after)
+            if not rows:
+                break
+            outcomes = await asyncio.gather(*(inquire(r) for r in rows))
+            paid, failed = await _apply(rows, outcomes)
+            run["checked"] += len(rows)
+            run["paid"] += paid
+            run["failed"] += failed
+            run["still_pending"] += sum(1 for o in outcomes if o is None)
+            after = (rows[-1].updated_at, rows[-1].id)
+    finally:
+        if own_client:
+            await client.aclose()
+
+    stats.runs += 1
+    for key, value in run.items():
+        setattr(stats, key, getattr(stats, key) + value)
+    stats.last_run_at = datetime.utcnow()
+    stats.last_run_seconds = round(time.perf_counter() - started, 3)
+    return run
+
+
+@task("payments.reconcile", every=RECONCILE_INTERVAL)
+async def reconcile_job():
+    await reconcile_pending()
@@ -0,0 +1,65 @@
+"""
+Re-apply stored gateway webhooks for a time range.
+
+    python replay_webhooks.py --since 2025-06-01T00:00 [--until 2025-06-02] [--gateway safepay]
+                              [--status failed unmatched] [--dry-run]
+
+Events are put back in the inbox and applied here, in order per order
+(a running backend's processor may pick some up too — the inbox claims
+keep that safe). Applying an event twice is harmless.
+"""
+
+import argparse
+import asyncio
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlalchemy import func, select  # noqa: E402
+
+from database import async_session  # noqa: E402
+from models import WebhookEvent  # noqa: E402
+from payment_events import GATEWAYS  # noqa: E402
+from webhook_inbox import drain, replay  # noqa: E402
+
+
+async def count(since, until, gateway, statuses) -> dict:
+    conditions = [WebhookEvent.received_at >= since, WebhookEvent.status.in_(statuses)]
+    if until:
+        conditions.append(WebhookEvent.received_at < until)
+    if gateway:
+        conditions.append(WebhookEvent.gateway == gateway)
+    async with async_session() as db:
+        rows = (await db.execute(
+            select(WebhookEvent.status, func.count()).where(*conditions).group_by(WebhookEvent.status)
+        )).all()
+    return dict(rows)
+
+
+async def run(args) -> None:
+    statuses = tuple(args.status)
+    matching = await count(args.since, args.until, args.gateway, statuses)
+    print(f"matching events: {matching or 'none'}")
+    if args.dry_run or not matching:
+        return
+    queued = await replay(args.since, args.until, args.gateway, statuses)
+    applied = await drain()
+    after = await count(args.since, args.until, args.gateway, ("processed", "unmatched", "failed", "received"))
+    print(f"queued {queued}, applied {applied}; now {after}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--since", type=datetime.fromisoformat, required=True, help="UTC, ISO 8601")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="UTC, ISO 8601 (exclusive)")
+    parser.add_argument("--gateway", choices=GATEWAYS)
+    parser.add_argument("--status", nargs="+", default=["processed", "unmatched", "failed"],
+                        choices=["processed", "unmatched", "failed"])
+    parser.add_argument("--dry-run", action="store_true", help="only count matching events")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Response cache for read-heavy GET routes — stale-while-revalidate, with tag invalidation.
+
+    @router.get("/stats")
+    @cached("admin.stats", ttl=15, stale=60, tags=lambda **_: ("orders", "users"))
+    async def get_stats(db: AsyncSession = Depends(get_db)): ...
+
+A fresh entry is served as is. Once its ttl passes it is still served for
+`stale` more seconds while one background refresh recomputes it; after
+that it is a miss. Concurrent misses for a key share one computation.
+Write paths drop entries by tag — `invalidate_on_commit(db, "orders")`
+fires when the session commits, so a reader never re-caches the old rows.
+Entries are encoded response bodies in an LRU bounded by bytes and count.
+
+The cache is per process: other workers see a write within their ttl.
+Under @conditional, though, an entry is served only while it was computed
+at the data version the ETag is built from (conditional.current_version);
+a newer version — a write here or on another worker — makes it a miss.
+Auth dependencies still run on every request; only the handler is cached.
+"""
+
+import asyncio
+import functools
+import inspect
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, NamedTuple, Optional, Union
+
+from fastapi import Response
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from conditional import current_version
+from database import async_session
+from responses import dumps
+
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 2**20)))  # 0 disables
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+MAX_ENTRY_FRACTION = 8  # one body may take at most 1/8 of the budget
+
+
+class Entry(NamedTuple):
+    body: bytes
+    media_type: str
+    fresh_until: float  # monotonic
+    stale_until: float
+    tags: frozenset
+    version: Optional[tuple] = None  # data version the body was computed at, under @conditional
+
+
+class Flight:
+    """A computation in progress for one key; invalidating its tags discards the result."""
+
+    def __init__(self, tags: frozenset, version: Optional[tuple] = None):
+        self.tags = tags
+        self.version = version
+        self.invalidated = False
+        self.background = False  # a stale-while-revalidate refresh rather than a miss
+        self.task: Optional[asyncio.Task] = None
+
+
+class Counters:
+    __slots__ = ("hits", "stale", "misses", "coalesced", "refreshes", "refresh_errors")
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, Entry] = OrderedDict()  # LRU order, oldest first
+        self.bytes = 0
+        self.flights: dict[str, Flight] = {}
+        self.counters: dict[str, Counters] = {}
+        self.evictions = 0
+        self.invalidated = 0
+
+    def get(self, key: str) -> Optional[Entry]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.stale_until <= time.monotonic():
+            self._drop(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: Entry):
+        size = len(entry.body)
+        if size > self.max_bytes // MAX_ENTRY_FRACTION:
+            return
+        self._drop(key)
+        self.entries[key] = entry
+        self.bytes += size
+        while self.bytes > self.max_bytes or len(self.entries) > self.max_entries:
+            self._drop(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _drop(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry.body)
+
+    def invalidate(self, *tags: str) -> int:
+        """Drop every entry carrying any of `tags`, and discard results being computed for them."""
+        wanted = set(tags)
+        stale = [key for key, entry in self.entries.items() if entry.tags & wanted]
+        for key in stale:
+            self._drop(key)
+        for flight in self.flights.values():
+            if flight.tags & wanted:
+                flight.invalidated = True
+        self.invalidated += len(stale)
+        return len(stale)
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+        for flight in self.flights.values():
+            flight.invalidated = True
+
+    def counters_for(self, namespace: str) -> Counters:
+        counters = self.counters.get(namespace)
+        if counters is None:
+            counters = self.counters[namespace] = Counters()
+        return counters
+
+    def snapshot(self) -> dict:
+        routes = {}
+        for namespace, c in sorted(self.counters.items()):
+            served = c.hits + c.stale + c.misses + c.coalesced
+            routes[namespace] = {
+                "hits": c.hits,
+                "stale_hits": c.stale,
+                "misses": c.misses,
+                "coalesced": c.coalesced,
+                "refreshes": c.refreshes,
+                "refresh_errors": c.refresh_errors,
+                "hit_rate": round((c.hits + c.stale) / served, 4) if served else None,
+            }
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "invalidated": self.invalidated,
+            "in_flight": len(self.flights),
+            "routes": routes,
+        }
+
+
+response_cache = ResponseCache()
+
+
+# ─── Invalidation hooks ──────────────────────────────────────────
+def invalidate(*tags: str) -> int:
+    return response_cache.invalidate(*tags)
+
+
+def invalidate_on_commit(db: AsyncSession, *tags: str):
+    """Invalidate `tags` once `db` commits; a rollback discards them."""
+    db.sync_session.info.setdefault("invalidate_tags", set()).update(tags)
+
+
+def orders_changed(db: AsyncSession, user_id: Optional[str] = None, all_users: bool = False):
+    """Order rows changed in `db`: admin lists and stats, plus the owner's history (or everyone's)."""
+    if all_users:
+        invalidate_on_commit(db, "orders", "my-orders")
+    else:
+        invalidate_on_commit(db, "orders", *([f"my-orders:{user_id}"] if user_id else []))
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session):
+    tags = session.info.pop("invalidate_tags", None)
+    if tags:
+        response_cache.invalidate(*tags)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session):
+    session.info.pop("invalidate_tags", None)
+
+
+# ─── Route decorator ─────────────────────────────────────────────
+def _default_key(**kwargs) -> str:
+    return repr(sorted(kwargs.items()))
+
+
+def _stored(result) -> Optional[tuple[bytes, str]]:
+    """(body, media type) of a handler result, or None if it must not be cached."""
+    if isinstance(result, Response):
+        if result.status_code != 200 or not hasattr(result, "body"):
+            return None  # errors and streams
+        return bytes(result.body), result.media_type or "application/json"
+    return dumps(result), "application/json"
+
+
+def cached(
+    namespace: str,
+    *,
+    ttl: Union[float, Callable[..., float]],
+    stale: float = 0,
+    key: Callable[..., str] = _default_key,
+    tags: Callable[..., Iterable[str]] = lambda **_: (),
+    cache: Optional[ResponseCache] = None,
+):
+    """
+    Route decorator: serve a cached 200 response for ttl seconds, then
+    stale-while-revalidate for `stale` more. `ttl`, `key` and `tags` are
+    called with the handler's arguments (minus database sessions), so a
+    TTL can depend on the request. The handler may return a Response or
+    anything FastJSONResponse can encode.
+    """
+    def decorator(func):
+        sessions = [
+            name for name, p in inspect.signature(func).parameters.items() if p.annotation is AsyncSession
+        ]
+
+        async def run(store: ResponseCache, full_key: str, flight: Flight, kwargs: dict, params: dict):
+            # Own session: the flight may outlive the request that started it, or serve several
+            async with async_session() as db:
+                result = await func(**{**kwargs, **{name: db for name in sessions}})
+            stored = _stored(result)
+            # A flight replaced by one for a newer version must not overwrite its entry
+            if stored is not None and not flight.invalidated and store.flights.get(full_key) is flight:
+                seconds = ttl(**params) if callable(ttl) else ttl
+                now = time.monotonic()
+                store.put(full_key, Entry(
+                    stored[0], stored[1], now + seconds, now + seconds + stale, flight.tags, flight.version
+                ))
+            return result, stored
+
+        def launch(store: ResponseCache, full_key: str, kwargs: dict, params: dict, version: Optional[tuple]) -> Flight:
+            flight = store.flights[full_key] = Flight(frozenset(tags(**params)), version)
+            flight.task = asyncio.ensure_future(run(store, full_key, flight, kwargs, params))
+
+            def done(task: asyncio.Task):
+                if store.flights.get(full_key) is flight:
+                    del store.flights[full_key]
+                failed = not task.cancelled() and task.exception() is not None
+                if failed and flight.background:
+                    store.counters_for(namespace).refresh_errors += 1  # stale entry served until it expires
+
+            flight.task.add_done_callback(done)
+            return flight
+
+        @functools.wraps(func)
+        async def wrapper(**kwargs):
+            store = cache or response_cache
+            if store.max_bytes <= 0:  # disabled
+                return await func(**kwargs)
+            counters = store.counters_for(namespace)
+            params = {name: value for name, value in kwargs.items() if name not in sessions}
+            full_key = f"{namespace}:{key(**params)}"
+            version = current_version.get()
+
+            entry = store.get(full_key)
+            if entry is not None and entry.version != version:
+                entry = None  # computed before a write the ETag already reflects
+            if entry is not None:
+                if entry.fresh_until > time.monotonic():
+                    counters.hits += 1
+                    return Response(entry.body, media_type=entry.media_type, headers={"X-Cache": "HIT"})
+                counters.stale += 1
+                if full_key not in store.flights:
+                    counters.refreshes += 1
+                    launch(store, full_key, kwargs, params, version).background = True
+                return Response(entry.body, media_type=entry.media_type, headers={"X-Cache": "STALE"})
+
+            flight = store.flights.get(full_key)
+            if flight is not None and flight.version == version:
+                counters.coalesced += 1
+            else:
+                counters.misses += 1
+                flight = launch(store, full_key, kwargs, params, version)
+            result, stored = await asyncio.shield(flight.task)
+            if stored is None:
+                return result
+            return Response(stored[0], media_type=stored[1], headers={"X-Cache": "MISS"})
+
+        return wrapper
+    return decorator
@@ -0,0 +1,37 @@
+"""
+JSON responses encoded with orjson.
+
+FastJSONResponse is the app's default response class (see main.py).
+orjson writes datetimes, dates, UUIDs and dataclasses itself, in C;
+Decimals and Pydantic models go through `_default`. Routes that return
+large lists build them with raw column values and return a
+FastJSONResponse directly, which also skips FastAPI's jsonable_encoder
+walk over every row.
+"""
+
+from decimal import Decimal
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
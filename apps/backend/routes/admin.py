@@ -1,30 +1,104 @@
-"""Admin routes — order management, user management"""
+"""Admin routes — order management, user management (admins only)"""
 
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import contains_eager
 from pydantic import BaseModel
 from typing import Optional
+from datetime import datetime
 
+from auth import forget_user, require_admin
+from conditional import conditional
 from database import get_db
-from models import Order, OrderItem, User
+from inventory import get_stock, set_stock, sku_for
+from jobs import job_queue
+from models import Order, OrderItem, Promotion, User
+from order_expiry import expire_unpaid, runs as expiry_runs
+from promo import load_promotions, normalize_code, promo_engine
+from reconcile import reconcile_pending, stats as reconcile_stats
+from response_cache import cached, orders_changed, response_cache
+from responses import FastJSONResponse
+from sql_stats import sql_stats
+from tracing import TracedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute, dependencies=[Depends(require_admin)])
 
 
 class UpdateOrderStatus(BaseModel):
     status: str
 
 
+class UpdateUserRole(BaseModel):
+    role: str  # "user" | "admin"
+
+
+class SetStock(BaseModel):
+    product_id: str
+    size: Optional[str] = None
+    color: Optional[str] = None
+    stock: int
+    shards: int = 1  # >1 for hot items so concurrent checkouts don't contend on one row
+
+
+class PromotionBody(BaseModel):
+    kind: str = "percent"  # percent | flat
+    value: float
+    max_discount: Optional[float] = None
+    min_subtotal: float = 0
+    categories: Optional[list[str]] = None
+    starts_at: Optional[datetime] = None
+    ends_at: Optional[datetime] = None
+    usage_limit: Optional[int] = None
+    per_user_limit: Optional[int] = None
+    active: bool = True
+
+
+# ─── Versions for ETags — one aggregate query instead of the full response ───
+async def _orders_version(db: AsyncSession, **_) -> tuple:
+    # Separate subqueries so max() stays an index seek instead of joining count()'s scan
+    return tuple((await db.execute(select(
+        select(func.count()).select_from(Order).scalar_subquery(),
+        select(func.max(Order.updated_at)).scalar_subquery(),
+    ))).one())
+
+
+async def _order_version(order_id: str, db: AsyncSession, **_) -> Optional[tuple]:
+    updated_at = await db.scalar(select(Order.updated_at).where(Order.id == order_id))
+    return (order_id, updated_at) if updated_at else None
+
+
+async def _users_version(db: AsyncSession, **_) -> tuple:
+    # name and email are only written when the row is created; a role change bumps updated_at
+    return tuple((await db.execute(select(
+        func.count(User.id), func.max(User.created_at), func.max(User.updated_at),
+    ))).one())
+
+
+async def _stats_version(db: AsyncSession, **_) -> tuple:
+    users = (await db.execute(select(func.count(User.id), func.max(User.created_at)))).one()
+    return await _orders_version(db) + tuple(users)
+
+
+async def _promos_version(db: AsyncSession, **_) -> tuple:
+    return tuple((await db.execute(select(
+        func.count(Promotion.code), func.max(Promotion.updated_at), func.coalesce(func.sum(Promotion.used_count), 0),
+    ))).one())
+
+
 @router.get("/orders")
+@conditional("admin.orders", version=_orders_version)
+@cached("admin.orders", ttl=10, stale=60, tags=lambda **_: ("orders",))
 async def list_orders(db: AsyncSession = Depends(get_db)):
     """List all orders for admin"""
+    items_count = (
+        select(func.count(OrderItem.id)).where(OrderItem.order_id == Order.id).correlate(Order).scalar_subquery()
+    )
     result = await db.execute(
-        select(Order).options(selectinload(Order.items)).order_by(Order.created_at.desc()).limit(50)
+        select(Order, items_count).order_by(Order.created_at.desc()).limit(50)
     )
-    orders = result.scalars().all()
-    return {
+    orders = result.all()
+    return FastJSONResponse({
         "orders": [
             {
                 "id": o.id,
@@ -36,12 +110,12 @@ async def list_orders(db: AsyncSession = Depends(get_db)):
                 "payment_method": o.payment_method,
                 "payment_status": o.payment_status,
                 "transaction_id": o.transaction_id,
-                "created_at": o.created_at.isoformat(),
-                "items_count": len(o.items) if o.items else 0,
+                "created_at": o.created_at,
+                "items_count": n,
             }
-            for o in orders
+            for o, n in orders
         ]
-    }
+    })
 
 
 @router.patch("/orders/{order_id}")
@@ -56,24 +130,23 @@ async def update_order(
     if not order:
         raise HTTPException(404, "Order not found")
     order.status = body.status
+    orders_changed(db, order.user_id)
     await db.commit()
     return {"success": True, "status": order.status}
 
 
 @router.get("/orders/{order_id}")
+@conditional("admin.order", version=_order_version)
 async def get_order(order_id: str, db: AsyncSession = Depends(get_db)):
     """Get order details"""
-    result = await db.execute(select(Order).where(Order.id == order_id))
-    order = result.scalar_one_or_none()
+    result = await db.execute(
+        select(Order).outerjoin(Order.items).options(contains_eager(Order.items)).where(Order.id == order_id)
+    )
+    order = result.unique().scalar_one_or_none()
     if not order:
         raise HTTPException(404, "Order not found")
 
-    items_result = await db.execute(
-        select(OrderItem).where(OrderItem.order_id == order_id)
-    )
-    items = items_result.scalars().all()
-
-    return {
+    return FastJSONResponse({
         "id": order.id,
         "customer_name": order.customer_name,
         "customer_email": order.customer_email,
@@ -88,7 +161,7 @@ async def get_order(order_id: str, db: AsyncSession = Depends(get_db)):
         "transaction_id": order.transaction_id,
         "promo_code": order.promo_code,
         "shipping_address": order.shipping_address,
-        "created_at": order.created_at.isoformat(),
+        "created_at": order.created_at,
         "items": [
             {
                 "id": i.id,
@@ -99,20 +172,22 @@ async def get_order(order_id: str, db: AsyncSession = Depends(get_db)):
                 "size": i.size,
                 "color": i.color,
             }
-            for i in items
+            for i in order.items
         ],
-    }
+    })
 
 
 @router.get("/stats")
+@conditional("admin.stats", version=_stats_version)
+@cached("admin.stats", ttl=15, stale=60, tags=lambda **_: ("orders", "users"))
 async def get_stats(db: AsyncSession = Depends(get_db)):
     """Dashboard stats"""
-    total_orders = await db.scalar(select(func.count(Order.id))) or 0
-    total_revenue = await db.scalar(select(func.sum(Order.total))) or 0
-    pending_orders = await db.scalar(
-        select(func.count(Order.id)).where(Order.status == "pending")
-    ) or 0
-    total_users = await db.scalar(select(func.count(User.id))) or 0
+    total_orders, total_revenue, pending_orders, total_users = (await db.execute(select(
+        select(func.count(Order.id)).scalar_subquery(),
+        select(func.coalesce(func.sum(Order.total), 0)).scalar_subquery(),
+        select(func.count(Order.id)).where(Order.status == "pending").scalar_subquery(),
+        select(func.count(User.id)).scalar_subquery(),
+    ))).one()
 
     return {
         "total_orders": total_orders,
@@ -123,11 +198,12 @@ async def get_stats(db: AsyncSession = Depends(get_db)):
 
 
 @router.get("/users")
+@conditional("admin.users", version=_users_version)
 async def list_users(db: AsyncSession = Depends(get_db)):
     """List all users"""
     result = await db.execute(select(User).order_by(User.created_at.desc()))
     users = result.scalars().all()
-    return {
+    return FastJSONResponse({
         "users": [
             {
                 "id": u.id,
@@ -135,8 +211,146 @@ async def list_users(db: AsyncSession = Depends(get_db)):
                 "email": u.email,
                 "name": u.name,
                 "role": u.role,
-                "created_at": u.created_at.isoformat(),
+                "created_at": u.created_at,
             }
             for u in users
         ]
+    })
+
+
+@router.patch("/users/{user_id}")
+async def update_user_role(
+    user_id: str,
+    body: UpdateUserRole,
+    db: AsyncSession = Depends(get_db),
+):
+    """Grant or revoke admin"""
+    if body.role not in ("user", "admin"):
+        raise HTTPException(400, "Role must be 'user' or 'admin'")
+    user = await db.scalar(select(User).where(User.id == user_id))
+    if not user:
+        raise HTTPException(404, "User not found")
+    user.role = body.role
+    await db.commit()
+    forget_user(user.clerk_id)  # immediate here; other instances pick it up within AUTH_ROLE_CACHE_TTL
+    return {"success": True, "role": user.role}
+
+
+@router.put("/inventory")
+async def update_inventory(body: SetStock, db: AsyncSession = Depends(get_db)):
+    """Set stock for a product variant"""
+    if body.stock < 0 or not 1 <= body.shards <= 64:
+        raise HTTPException(400, "Invalid stock or shard count")
+    sku = sku_for(body.product_id, body.size, body.color)
+    await set_stock(db, sku, body.stock, body.shards)
+    await db.commit()
+    return await get_stock(db, sku)
+
+
+@router.get("/inventory/{product_id}")
+async def get_inventory(
+    product_id: str,
+    size: Optional[str] = None,
+    color: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """Available and reserved stock for a product variant"""
+    return await get_stock(db, sku_for(product_id, size, color))
+
+
+def _promotion_dict(p: Promotion) -> dict:
+    return {
+        "code": p.code,
+        "kind": p.kind,
+        "value": p.value,
+        "max_discount": p.max_discount,
+        "min_subtotal": p.min_subtotal,
+        "categories": p.categories,
+        "starts_at": p.starts_at.isoformat() if p.starts_at else None,
+        "ends_at": p.ends_at.isoformat() if p.ends_at else None,
+        "usage_limit": p.usage_limit,
+        "per_user_limit": p.per_user_limit,
+        "used_count": p.used_count,
+        "active": p.active,
     }
+
+
+@router.get("/promos")
+@conditional("admin.promos", version=_promos_version)
+async def list_promos(db: AsyncSession = Depends(get_db)):
+    """List promo codes with their redemption counts"""
+    result = await db.execute(select(Promotion).order_by(Promotion.code))
+    return {"promos": [_promotion_dict(p) for p in result.scalars().all()]}
+
+
+@router.put("/promos/{code}")
+async def upsert_promo(code: str, body: PromotionBody, db: AsyncSession = Depends(get_db)):
+    """Create or update a promo code"""
+    if body.kind not in ("percent", "flat") or body.value <= 0 or (body.kind == "percent" and body.value > 100):
+        raise HTTPException(400, "Invalid discount")
+    code = normalize_code(code)
+    promo = await db.get(Promotion, code)
+    if not promo:
+        promo = Promotion(code=code, used_count=0)
+        db.add(promo)
+    for field, value in body.model_dump().items():
+        setattr(promo, field, value)
+    promo.updated_at = datetime.utcnow()
+    await db.commit()
+    await load_promotions()  # recompile now; other workers follow via the refresh loop
+    return _promotion_dict(promo)
+
+
+@router.delete("/promos/{code}")
+async def deactivate_promo(code: str, db: AsyncSession = Depends(get_db)):
+    """Deactivate a promo code (kept for order history)"""
+    promo = await db.get(Promotion, normalize_code(code))
+    if not promo:
+        raise HTTPException(404, "Promo code not found")
+    promo.active = False
+    promo.updated_at = datetime.utcnow()
+    await db.commit()
+    await load_promotions()
+    return {"success": True, "version": promo_engine.version}
+
+
+@router.get("/jobs")
+async def job_stats():
+    """Background job queue depth and latency"""
+    return await job_queue.metrics()
+
+
+@router.get("/cache")
+async def cache_stats():
+    """Response cache size and per-route hit rates"""
+    return response_cache.snapshot()
+
+
+@router.get("/queries")
+async def query_stats():
+    """SQL statements and DB time per route, repeated statement shapes (N+1) and slow statements"""
+    return sql_stats.snapshot()
+
+
+@router.get("/reconcile")
+async def reconciliation_stats():
+    """Payment reconciliation totals and how long settled orders had been stuck"""
+    return reconcile_stats.snapshot()
+
+
+@router.post("/reconcile")
+async def run_reconciliation():
+    """Check pending gateway orders now instead of waiting for the next run"""
+    return await reconcile_pending()
+
+
+@router.get("/expiry")
+async def expiry_runs_list():
+    """Recent abandoned-order sweeps: orders expired, batches and duration"""
+    return {"runs": list(expiry_runs)}
+
+
+@router.post("/expiry")
+async def run_expiry():
+    """Expire stale unpaid gateway orders now"""
+    return await expire_unpaid()
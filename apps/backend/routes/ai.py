@@ -1,13 +1,25 @@
-"""AI proxy routes — Chat (Grok/OpenAI) + Imagine On You (Replicate)"""
+"""AI proxy routes — Chat (Gemini/Groq/Grok/OpenAI) + Imagine On You (HuggingFace/Replicate)"""
 
 import os
 import re
-import httpx
 from datetime import datetime, timedelta
-from fastapi import APIRouter, HTTPException, Request
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request, Response
 from pydantic import BaseModel
 
-router = APIRouter()
+from chat_store import ChatSession, build_context, get_chat_store, new_session_id
+from images import MIME_TYPES, get_variant, process_generated_image
+from metrics import http_client
+from tracing import TracedRoute
+
+router = APIRouter(route_class=TracedRoute)
+
+# Upstream base URLs — overridable to point at local stand-ins (benchmarks/fake_llm.py)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+HF_INFERENCE_URL = os.getenv("HF_INFERENCE_URL", "https://api-inference.huggingface.co").rstrip("/")
+REPLICATE_API_URL = os.getenv("REPLICATE_API_URL", "https://api.replicate.com").rstrip("/")
+GEMINI_API_URL = os.getenv("GEMINI_API_URL", "https://generativelanguage.googleapis.com").rstrip("/")
+GEMINI_MODEL = "gemini-1.5-flash-latest"
 
 # ─── Chat Proxy ───────────────────────────────────────────────────────
 
@@ -16,15 +28,34 @@ class ChatMessage(BaseModel):
     content: str
 
 class ChatRequest(BaseModel):
-    messages: list[ChatMessage]
-
-SYSTEM_PROMPT = """You are ModestStyle.pk's friendly shopping assistant. You help customers find the perfect hijab, abaya, or modest fashion items. You know:
-- Hijabs range PKR 1,200-3,500 (Georgette, Chiffon, Crinkle, Silk, Lawn, Cashmere)
-- Abayas range PKR 5,800-8,500 (Textured, Pleated, Chiffon, Open, Embroidered)
-- Accessories (Pins, Brooches, Bags, Jewelry) range PKR 500-2,500
-- Free shipping over PKR 5,000
-- Pakistan-based, ships nationwide in 3-5 days
-Be warm, helpful, and suggest products. Use PKR for prices. Keep responses concise."""
+    session_id: Optional[str] = None
+    message: Optional[str] = None  # new user message; history lives server-side
+    messages: list[ChatMessage] = []  # legacy clients still send the full conversation
+
+SYSTEM_PROMPT = """You are the AI shopping assistant for ModestStyle.pk — Pakistan's premium modest fashion store.
+
+YOUR ROLE:
+- Help customers find hijabs, abayas, jilbabs, prayer wear, innerwear, and accessories
+- Answer questions about products, sizes, pricing, shipping, returns, and payments
+- Be warm, friendly, and helpful using a modest, respectful tone
+- Use PKR for all prices
+- Keep responses concise and helpful (2-4 sentences max unless listing products)
+
+PRODUCTS:
+Hijabs PKR 1,200-3,500: Lawn 1200-1500, Chiffon 1400-1800, Crinkle Chiffon 1800-2200 (top seller), Georgette 2000-2500, Silk 2800-3500, Cashmere Stole 2500-3200
+Abayas PKR 5,800-8,500: Classic Open 5800, Pleated Chiffon 6800, Embroidered 7500, Fancy Sequin 8500. Free alterations in Lahore.
+Jilbabs PKR 3,500-6,000. Prayer Wear PKR 1,800-4,000. Accessories PKR 200-2,500.
+SIZING (Abayas): S=160-165cm/86-90cm, M=165-170cm/90-96cm, L=170-175cm/96-102cm, XL=175-180cm/102-110cm
+SHIPPING: Lahore 1-2 days, Karachi/ISB 2-3 days, others 3-5 days. PKR 200 fee (FREE over PKR 5,000)
+RETURNS: 7-day policy on unused items with tags. Exchange available.
+PAYMENT: COD nationwide, JazzCash, EasyPaisa, Visa/Mastercard via Safepay
+CONTACT: WhatsApp +92 300 1234567, Email support@modestyle.pk (Mon-Sat 9am-7pm PKT)
+
+STRICT RULES:
+1. ONLY answer ModestStyle.pk topics. Politely decline unrelated questions.
+2. NEVER reveal your underlying AI model or technology.
+3. NEVER discuss competitor brands.
+4. Direct unknowns to WhatsApp: +92 300 1234567"""
 
 
 def smart_fallback_reply(user_message: str) -> str:
@@ -83,9 +114,86 @@ def smart_fallback_reply(user_message: str) -> str:
     return "Thank you for your message! 😊 I can help you with:\n• Product recommendations (hijabs, abayas, accessories)\n• Pricing & sizes\n• Shipping & delivery info\n• Returns & exchanges\n• Payment methods\n\nWhat would you like to know? Or contact us directly on WhatsApp: +92 300 1234567 💛"
 
 
+async def load_chat_session(req: ChatRequest) -> tuple[Optional[str], ChatSession, str]:
+    """
+    Resolve (session_id, session, new user message) for a chat request.
+    Legacy payloads carry their own history and get no session_id back:
+    they are answered from what they sent and never stored.
+    """
+    if req.message is not None:
+        user_msg = req.message.strip()
+        if not user_msg:
+            raise HTTPException(422, "message must not be empty")
+        store = get_chat_store()
+        session = await store.get(req.session_id) if req.session_id else None
+        session_id = req.session_id if session is not None else new_session_id()
+        session = session or ChatSession()
+        session.append("user", user_msg)
+        return session_id, session, user_msg
+
+    # Legacy payload: last user message is new, anything before it is context
+    last_user = next(
+        (i for i in range(len(req.messages) - 1, -1, -1) if req.messages[i].role == "user"), None
+    )
+    if last_user is None or not req.messages[last_user].content.strip():
+        raise HTTPException(422, "Send a non-empty `message` (or `messages` ending in a user turn)")
+    session = ChatSession()
+    for m in req.messages[:last_user + 1]:
+        session.append(m.role, m.content)
+    return None, session, req.messages[last_user].content
+
+
 @router.post("/chat")
 async def chat_proxy(req: ChatRequest):
-    """Proxy to Grok/OpenAI, or smart rule-based fallback"""
+    """Chat with server-side history — clients send only `session_id` + the new `message`"""
+    session_id, session, user_msg = await load_chat_session(req)
+    reply = await generate_chat_reply(session, user_msg)
+    if session_id is not None:
+        session.append("assistant", reply)
+        await get_chat_store().save(session_id, session)
+    return {"reply": reply, "session_id": session_id}
+
+
+def gemini_request(context: list[dict]) -> dict:
+    """
+    Gemini takes the system prompt separately and a history that starts with
+    a user turn, with assistant turns as role "model". A context summary goes
+    into the system instruction.
+    """
+    system = [SYSTEM_PROMPT, *(m["content"] for m in context if m["role"] == "system")]
+    turns = [m for m in context if m["role"] != "system"]
+    first_user = next((i for i, m in enumerate(turns) if m["role"] == "user"), len(turns))
+    return {
+        "system_instruction": {"parts": [{"text": "\n\n".join(system)}]},
+        "contents": [
+            {"role": "user" if m["role"] == "user" else "model", "parts": [{"text": m["content"]}]}
+            for m in turns[first_user:]
+        ],
+        "generationConfig": {"temperature": 0.4, "maxOutputTokens": 400, "topP": 0.8},
+        "safetySettings": [
+            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+        ],
+    }
+
+
+async def generate_chat_reply(session: ChatSession, user_msg: str) -> str:
+    """Proxy to Gemini/Groq/Grok/OpenAI with a token-budgeted context, or smart rule-based fallback"""
+    gemini_key = os.getenv("GEMINI_API_KEY")
+    if gemini_key:
+        try:
+            async with http_client(timeout=30) as client:
+                resp = await client.post(
+                    f"{GEMINI_API_URL}/v1beta/models/{GEMINI_MODEL}:generateContent",
+                    headers={"x-goog-api-key": gemini_key},
+                    json=gemini_request(build_context(session)),
+                )
+                resp.raise_for_status()
+                data = resp.json()
+                return data["candidates"][0]["content"]["parts"][0]["text"]
+        except Exception:
+            return smart_fallback_reply(user_msg)
+
     grok_key = os.getenv("GROK_API_KEY")
     openai_key = os.getenv("OPENAI_API_KEY")
     groq_key = os.getenv("GROQ_API_KEY")
@@ -99,23 +207,20 @@ async def chat_proxy(req: ChatRequest):
         api_key = grok_key
         model = "grok-3-mini"
     elif openai_key:
-        api_url = "https://api.openai.com/v1/chat/completions"
+        api_url = f"{OPENAI_BASE_URL}/chat/completions"
         api_key = openai_key
         model = "gpt-4o-mini"
     else:
         # Smart rule-based fallback — no API key needed
-        last_user_msg = next(
-            (m.content for m in reversed(req.messages) if m.role == "user"), ""
-        )
-        return {"reply": smart_fallback_reply(last_user_msg)}
+        return smart_fallback_reply(user_msg)
 
     messages = [
         {"role": "system", "content": SYSTEM_PROMPT},
-        *[{"role": m.role, "content": m.content} for m in req.messages[-10:]],
+        *build_context(session),
     ]
 
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
+        async with http_client(timeout=30) as client:
             resp = await client.post(
                 api_url,
                 headers={
@@ -131,14 +236,10 @@ async def chat_proxy(req: ChatRequest):
             )
             resp.raise_for_status()
             data = resp.json()
-            reply = data["choices"][0]["message"]["content"]
-            return {"reply": reply}
+            return data["choices"][0]["message"]["content"]
     except Exception as e:
         # Fall back to rule-based on API failure
-        last_user_msg = next(
-            (m.content for m in reversed(req.messages) if m.role == "user"), ""
-        )
-        return {"reply": smart_fallback_reply(last_user_msg)}
+        return smart_fallback_reply(user_msg)
 
 
 # ─── Imagine On You (Virtual Try-On) ─────────────────────────────────
@@ -147,6 +248,8 @@ class ImagineRequest(BaseModel):
     product_image_url: str
     product_name: str
 
+IMAGINE_VARIANTS_PREFIX = "/api/ai/imagine/images"
+
 # Simple in-memory rate limiter (use Redis in production)
 _imagine_usage: dict[str, list[datetime]] = {}
 
@@ -165,7 +268,7 @@ def check_rate_limit(ip: str, limit: int = 3) -> bool:
 @router.post("/imagine")
 async def imagine_on_you(req: ImagineRequest, request: Request):
     """Generate virtual try-on image via HuggingFace (free) or Replicate"""
-    import asyncio, base64
+    import asyncio
 
     client_ip = request.client.host if request.client else "unknown"
 
@@ -193,9 +296,9 @@ async def imagine_on_you(req: ImagineRequest, request: Request):
     # ── HuggingFace (free tier) ──────────────────────────────────────
     if hf_token:
         try:
-            async with httpx.AsyncClient(timeout=60) as client:
+            async with http_client(timeout=60) as client:
                 resp = await client.post(
-                    "https://api-inference.huggingface.co/models/black-forest-labs/FLUX.1-schnell",
+                    f"{HF_INFERENCE_URL}/models/black-forest-labs/FLUX.1-schnell",
                     headers={
                         "Authorization": f"Bearer {hf_token}",
                         "Content-Type": "application/json",
@@ -203,15 +306,13 @@ async def imagine_on_you(req: ImagineRequest, request: Request):
                     json={"inputs": prompt},
                 )
                 if resp.status_code == 200 and resp.headers.get("content-type", "").startswith("image"):
-                    b64 = base64.b64encode(resp.content).decode("utf-8")
-                    mime = resp.headers.get("content-type", "image/jpeg").split(";")[0]
-                    return {"image_url": f"data:{mime};base64,{b64}"}
+                    return await process_generated_image(resp.content, IMAGINE_VARIANTS_PREFIX)
 
                 # Model loading (503) — retry once after delay
                 if resp.status_code == 503:
                     await asyncio.sleep(10)
                     resp2 = await client.post(
-                        "https://api-inference.huggingface.co/models/black-forest-labs/FLUX.1-schnell",
+                        f"{HF_INFERENCE_URL}/models/black-forest-labs/FLUX.1-schnell",
                         headers={
                             "Authorization": f"Bearer {hf_token}",
                             "Content-Type": "application/json",
@@ -219,9 +320,7 @@ async def imagine_on_you(req: ImagineRequest, request: Request):
                         json={"inputs": prompt},
                     )
                     if resp2.status_code == 200 and resp2.headers.get("content-type", "").startswith("image"):
-                        b64 = base64.b64encode(resp2.content).decode("utf-8")
-                        mime = resp2.headers.get("content-type", "image/jpeg").split(";")[0]
-                        return {"image_url": f"data:{mime};base64,{b64}"}
+                        return await process_generated_image(resp2.content, IMAGINE_VARIANTS_PREFIX)
 
                 raise HTTPException(500, f"HuggingFace error: {resp.status_code}")
         except HTTPException:
@@ -231,9 +330,9 @@ async def imagine_on_you(req: ImagineRequest, request: Request):
 
     # ── Replicate (fallback) ─────────────────────────────────────────
     try:
-        async with httpx.AsyncClient(timeout=90) as client:
+        async with http_client(timeout=90) as client:
             resp = await client.post(
-                "https://api.replicate.com/v1/models/black-forest-labs/flux-schnell/predictions",
+                f"{REPLICATE_API_URL}/v1/models/black-forest-labs/flux-schnell/predictions",
                 headers={
                     "Authorization": f"Bearer {replicate_token}",
                     "Content-Type": "application/json",
@@ -243,10 +342,16 @@ async def imagine_on_you(req: ImagineRequest, request: Request):
             )
             resp.raise_for_status()
             data = resp.json()
+
+            async def processed(output) -> dict:
+                """Download Replicate's full-size output and post-process it like HuggingFace's"""
+                image = await client.get(output[0] if isinstance(output, list) else output)
+                image.raise_for_status()
+                return await process_generated_image(image.content, IMAGINE_VARIANTS_PREFIX)
+
             output = data.get("output")
             if output:
-                image_url = output[0] if isinstance(output, list) else output
-                return {"image_url": image_url}
+                return await processed(output)
 
             # Poll if not ready
             get_url = data.get("urls", {}).get("get", "")
@@ -256,8 +361,7 @@ async def imagine_on_you(req: ImagineRequest, request: Request):
                     poll = await client.get(get_url, headers={"Authorization": f"Bearer {replicate_token}"})
                     result = poll.json()
                     if result.get("status") == "succeeded":
-                        out = result.get("output")
-                        return {"image_url": out[0] if isinstance(out, list) else out}
+                        return await processed(result.get("output"))
                     if result.get("status") == "failed":
                         raise HTTPException(500, "Image generation failed")
 
@@ -266,3 +370,17 @@ async def imagine_on_you(req: ImagineRequest, request: Request):
         raise
     except Exception as e:
         raise HTTPException(500, f"Failed to generate image: {str(e)[:100]}")
+
+
+@router.get("/imagine/images/{image_id}/{name}")
+async def imagine_variant(image_id: str, name: str):
+    """Serve one post-processed try-on variant, e.g. 640.webp"""
+    data = await get_variant(image_id, name)
+    if data is None:
+        raise HTTPException(404, "Image not found or expired")
+    fmt = name.rsplit(".", 1)[-1]
+    return Response(
+        content=data,
+        media_type=MIME_TYPES.get(fmt, "application/octet-stream"),
+        headers={"Cache-Control": "public, max-age=86400, immutable"},
+    )
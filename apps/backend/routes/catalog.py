@@ -0,0 +1,36 @@
+"""Catalog sync routes — Sanity webhook into the in-memory price index"""
+
+import json
+
+from fastapi import APIRouter, HTTPException, Request
+
+from catalog import SANITY_WEBHOOK_SECRET, apply_webhook, price_index, verify_webhook_signature
+from tracing import TracedRoute
+
+router = APIRouter(route_class=TracedRoute)
+
+
+@router.post("/webhook/sanity")
+async def sanity_webhook(request: Request):
+    """Apply a product create/update/delete from a Sanity GROQ webhook."""
+    if not SANITY_WEBHOOK_SECRET:
+        raise HTTPException(503, "Sanity webhook secret not configured")
+    body = await request.body()
+    if not verify_webhook_signature(body, request.headers.get("sanity-webhook-signature", "")):
+        raise HTTPException(401, "Invalid webhook signature")
+
+    doc = json.loads(body or b"{}")
+    operation = request.headers.get("sanity-operation", "update")
+    apply_webhook(doc, operation)
+    return {"received": True, "version": price_index.version}
+
+
+@router.get("/status")
+async def catalog_status():
+    """Price index freshness, for monitoring"""
+    return {
+        "loaded": price_index.loaded,
+        "products": len(price_index.prices),
+        "version": price_index.version,
+        "last_updated_at": price_index.last_updated_at,
+    }
@@ -1,20 +1,66 @@
 """Orders + Stripe Checkout routes"""
 
+import base64
 import os
-import stripe
-from fastapi import APIRouter, Depends, HTTPException
+import time
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import contains_eager
 from pydantic import BaseModel
 from typing import Optional
 
+from auth import Principal, current_user, optional_user
+from conditional import conditional
 from database import get_db
-from models import Order, OrderItem
+from idempotency import idempotent
+from inventory import release_order, reserve_or_409
+from metrics import count_on_commit, observe_upstream, orders_created
+from models import Order, OrderItem, gen_uuid
+from order_expiry import ORDER_EXPIRY_HOURS
+from outbox import enqueue
+from pricing import CatalogUnavailable, PricingError, ensure_loaded, price_cart
+from promo import PromoError, redeem, release_promo, user_key_for
+from response_cache import cached, orders_changed
+from responses import FastJSONResponse
+from tracing import CLIENT, TracedRoute, child_span, end_span
 
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY", "")
+STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY", "")
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "")  # override for a local stand-in server
+# Sessions expire with their order (Stripe allows 30 minutes to 24 hours)
+STRIPE_SESSION_TTL = min(max(ORDER_EXPIRY_HOURS * 3600, 1800), 24 * 3600 - 60)
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
+
+_stripe = None
+
+
+def get_stripe():
+    """The Stripe SDK, imported on first checkout — it is the heaviest import in the app."""
+    global _stripe
+    if _stripe is None:
+        import stripe
+        stripe.api_key = STRIPE_SECRET_KEY
+        if STRIPE_API_BASE:
+            stripe.api_base = STRIPE_API_BASE
+        _stripe = stripe
+    return _stripe
+
+
+def _stripe_call(resource: str, create, **params):
+    """One Stripe SDK create call, timed and traced like the other gateway requests."""
+    started = time.perf_counter()
+    trace = child_span(f"POST stripe {resource}.create", CLIENT)
+    try:
+        result = create(**params)
+    except Exception as e:
+        observe_upstream("stripe", started, error=e)
+        end_span(trace, e)
+        raise
+    observe_upstream("stripe", started, 200)  # the SDK raises on anything else
+    end_span(trace)
+    return result
 
 
 class CheckoutItem(BaseModel):
@@ -28,43 +74,83 @@ class CheckoutItem(BaseModel):
 
 class CheckoutRequest(BaseModel):
     items: list[CheckoutItem]
-    subtotal: float
-    shipping: float
-    discount: float
-    total: float
+    # Client-side totals are informational only — the order is priced server-side
+    subtotal: float = 0
+    shipping: float = 0
+    discount: float = 0
+    total: float = 0
+    shipping_method: str = "standard"
     promo_code: Optional[str] = None
     customer_email: Optional[str] = None
     customer_name: Optional[str] = None
 
 
 @router.post("/checkout")
-async def create_checkout(req: CheckoutRequest, db: AsyncSession = Depends(get_db)):
+@idempotent("orders.checkout")
+async def create_checkout(
+    req: CheckoutRequest,
+    db: AsyncSession = Depends(get_db),
+    user: Optional[Principal] = Depends(optional_user),
+):
     """Create order + Stripe Checkout session"""
+    await ensure_loaded()
+    try:
+        quote = price_cart(req.items, req.shipping_method, "stripe", req.promo_code)
+    except CatalogUnavailable as e:
+        raise HTTPException(503, str(e))
+    except PricingError as e:
+        raise HTTPException(400, str(e))
 
-    # Create order in DB
-    order = Order(
-        customer_name=req.customer_name or "Guest",
-        customer_email=req.customer_email or "",
-        subtotal=req.subtotal,
-        shipping=req.shipping,
-        discount=req.discount,
-        total=req.total,
-        promo_code=req.promo_code,
-    )
-    db.add(order)
-    await db.flush()
-
-    # Create order items
-    for item in req.items:
-        db.add(OrderItem(
-            order_id=order.id,
-            product_id=item.product_id,
-            name=item.name,
-            price=item.price,
-            quantity=item.quantity,
-            size=item.size,
-            color=item.color,
-        ))
+    order_id = gen_uuid()
+    if quote.promo_code:
+        try:
+            await redeem(quote.promo_code, order_id, user_key_for(req.customer_email))
+        except PromoError as e:
+            raise HTTPException(400, str(e))
+    # Stock is held until reconcile.py sees the session paid, or the order expires unpaid
+    try:
+        await reserve_or_409(order_id, req.items)
+    except BaseException:  # out of stock, or a DB error/timeout — the use must not be burnt
+        await release_promo(order_id)
+        raise
+
+    try:
+        # Create order in DB
+        order = Order(
+            id=order_id,
+            user_id=user.id if user else None,
+            customer_name=req.customer_name or "Guest",
+            customer_email=req.customer_email or "",
+            subtotal=quote.subtotal,
+            shipping=quote.shipping,
+            discount=quote.discount,
+            total=quote.total,
+            promo_code=quote.promo_code,
+            payment_method="stripe",
+            payment_status="pending",
+        )
+        db.add(order)
+        await db.flush()
+
+        # Create order items
+        for item, line in zip(req.items, quote.lines):
+            db.add(OrderItem(
+                order_id=order.id,
+                product_id=line.product_id,
+                name=line.name,
+                price=line.unit_price,
+                quantity=line.quantity,
+                size=item.size,
+                color=item.color,
+            ))
+        orders_changed(db, order.user_id)
+        count_on_commit(db, orders_created, "stripe")
+        enqueue(db, "order.created", order.id, {"payment_method": "stripe", "total": order.total, "promo_code": order.promo_code})
+    except Exception:
+        await db.rollback()  # the order never reached the database: hand back its stock and promo
+        await release_order(order_id)
+        await release_promo(order_id)
+        raise
 
     # Create Stripe Checkout session
     try:
@@ -73,52 +159,131 @@ async def create_checkout(req: CheckoutRequest, db: AsyncSession = Depends(get_d
             {
                 "price_data": {
                     "currency": "pkr",
-                    "product_data": {"name": item.name},
-                    "unit_amount": int(item.price * 100),  # Stripe uses smallest currency unit
+                    "product_data": {"name": line.name},
+                    "unit_amount": int(round(line.unit_price * 100)),  # Stripe uses smallest currency unit
                 },
-                "quantity": item.quantity,
+                "quantity": line.quantity,
             }
-            for item in req.items
+            for line in quote.lines
         ]
 
         # Add shipping as line item if not free
-        if req.shipping > 0:
+        if quote.shipping > 0:
             line_items.append({
                 "price_data": {
                     "currency": "pkr",
                     "product_data": {"name": "Shipping"},
-                    "unit_amount": int(req.shipping * 100),
+                    "unit_amount": int(round(quote.shipping * 100)),
                 },
                 "quantity": 1,
             })
 
-        session = stripe.checkout.Session.create(
+        stripe = get_stripe()
+        # Lines are charged at list price; the promo discount goes on as a single-use coupon
+        # so Stripe charges exactly quote.total, the amount stored on the order
+        extra = {}
+        if quote.discount > 0:
+            coupon = _stripe_call(
+                "coupons", stripe.Coupon.create,
+                amount_off=int(round(quote.discount * 100)),
+                currency="pkr",
+                duration="once",
+                max_redemptions=1,
+                name=quote.promo_code or "Discount",
+            )
+            extra["discounts"] = [{"coupon": coupon.id}]
+        session = _stripe_call(
+            "checkout.Session", stripe.checkout.Session.create,
             payment_method_types=["card"],
             line_items=line_items,
             mode="payment",
             success_url=f"{frontend_url}/checkout/success?order_id={order.id}",
             cancel_url=f"{frontend_url}/checkout",
             metadata={"order_id": order.id},
+            expires_at=int(time.time() + STRIPE_SESSION_TTL),
+            **extra,
         )
 
         order.stripe_session_id = session.id
+        order.gateway_session_id = session.id  # what reconcile.py asks Stripe about
         await db.commit()
 
         return {"checkout_url": session.url, "order_id": order.id}
 
     except Exception as e:
         await db.rollback()
+        await release_order(order.id)
+        await release_promo(order.id)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/mine")
-async def get_my_orders(db: AsyncSession = Depends(get_db)):
-    """Get orders for current user (simplified — no auth check for MVP)"""
+# ─── Order history ──────────────────────────────────────────────
+def _encode_cursor(order: Order) -> str:
+    raw = f"{order.created_at.isoformat()}|{order.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, order_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), order_id
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
+
+
+async def orders_page(
+    db: AsyncSession, user_id: str, limit: int, cursor: Optional[str] = None
+) -> tuple[list[Order], Optional[str]]:
+    """
+    One page of a user's orders, newest first, with their items — a single
+    query: the page is a keyset range on ix_orders_user_created
+    (user_id, created_at, id), joined to its items.
+    """
+    page = select(Order.id).where(Order.user_id == user_id)
+    if cursor:
+        created_at, order_id = _decode_cursor(cursor)
+        page = page.where(tuple_(Order.created_at, Order.id) < tuple_(created_at, order_id))
+    page = page.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit + 1).subquery()
+
     result = await db.execute(
-        select(Order).options(selectinload(Order.items)).order_by(Order.created_at.desc()).limit(20)
+        select(Order)
+        .join(page, Order.id == page.c.id)
+        .outerjoin(Order.items)
+        .options(contains_eager(Order.items))
+        .order_by(Order.created_at.desc(), Order.id.desc())
     )
-    orders = result.scalars().all()
-    return {
+    orders = result.unique().scalars().all()
+    next_cursor = _encode_cursor(orders[limit - 1]) if len(orders) > limit else None
+    return orders[:limit], next_cursor
+
+
+async def _my_orders_version(user: Principal, db: AsyncSession, **_) -> tuple:
+    # The user's own rows via ix_orders_user_created; the id keeps a shared browser from reusing another user's body
+    row = (await db.execute(
+        select(func.count(Order.id), func.max(Order.updated_at)).where(Order.user_id == user.id)
+    )).one()
+    return (user.id, *row)
+
+
+@router.get("/mine")
+@conditional("orders.mine", version=_my_orders_version)
+@cached(
+    "orders.mine",
+    ttl=lambda cursor, **_: 300 if cursor else 60,  # older pages only change when invalidated
+    stale=300,
+    key=lambda user, cursor, limit: f"{user.id}:{cursor or ''}:{limit}",
+    tags=lambda user, **_: ("my-orders", f"my-orders:{user.id}"),
+)
+async def get_my_orders(
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    user: Principal = Depends(current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Signed-in user's orders, newest first. Pass `next_cursor` back as `cursor` for the next page."""
+    orders, next_cursor = await orders_page(db, user.id, limit, cursor)
+    return FastJSONResponse({
         "orders": [
             {
                 "id": o.id,
@@ -126,9 +291,23 @@ async def get_my_orders(db: AsyncSession = Depends(get_db)):
                 "customer_email": o.customer_email,
                 "total": o.total,
                 "status": o.status,
-                "created_at": o.created_at.isoformat(),
-                "items_count": len(o.items) if o.items else 0,
+                "payment_method": o.payment_method,
+                "payment_status": o.payment_status,
+                "created_at": o.created_at,
+                "items_count": len(o.items),
+                "items": [
+                    {
+                        "product_id": item.product_id,
+                        "name": item.name,
+                        "price": item.price,
+                        "quantity": item.quantity,
+                        "size": item.size,
+                        "color": item.color,
+                    }
+                    for item in o.items
+                ],
             }
             for o in orders
-        ]
-    }
+        ],
+        "next_cursor": next_cursor,
+    })
@@ -14,17 +14,29 @@ import json
 import time
 from datetime import datetime
 from typing import Optional
+from urllib.parse import parse_qsl
 
 import httpx
 from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 from pydantic import BaseModel
 
+from auth import Principal, optional_user
 from database import get_db
-from models import Order, OrderItem
-
-router = APIRouter()
+from idempotency import idempotent
+from inventory import release_order, reserve_or_409
+from metrics import count_on_commit, http_client, orders_created
+from models import Order, OrderItem, gen_uuid
+from outbox import enqueue
+from payment_events import event_payload
+from pricing import CatalogUnavailable, PricingError, ensure_loaded, price_cart
+from promo import PromoError, redeem, release_promo, user_key_for
+from reconcile import configured_gateways, jazzcash_hash
+from response_cache import orders_changed
+from tracing import TracedRoute, traced
+from webhook_inbox import ingest
+
+router = APIRouter(route_class=TracedRoute)
 
 # ─── Config ──────────────────────────────────────────────────────
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
@@ -67,10 +79,12 @@ class ShippingAddress(BaseModel):
 
 class PaymentRequest(BaseModel):
     items: list[CheckoutItem]
-    subtotal: float
-    shipping: float
-    discount: float
-    total: float
+    # Client-side totals are informational only — the order is priced server-side
+    subtotal: float = 0
+    shipping: float = 0
+    discount: float = 0
+    total: float = 0
+    shipping_method: str = "standard"  # standard | express
     customer_email: Optional[str] = None
     customer_name: Optional[str] = None
     customer_phone: Optional[str] = None
@@ -80,40 +94,91 @@ class PaymentRequest(BaseModel):
     mobile_number: Optional[str] = None  # for wallet payments
 
 
-async def create_order_in_db(req: PaymentRequest, payment_method: str, db: AsyncSession) -> Order:
-    """Create order + items in DB, returns the Order object (not yet committed)."""
-    order = Order(
-        customer_name=req.customer_name or "Guest",
-        customer_email=req.customer_email or "",
-        customer_phone=req.customer_phone or "",
-        subtotal=req.subtotal,
-        shipping=req.shipping,
-        discount=req.discount,
-        total=req.total,
-        promo_code=req.promo_code,
-        payment_method=payment_method,
-        payment_status="unpaid",
-        shipping_address=req.shipping_address.model_dump() if req.shipping_address else None,
-    )
-    db.add(order)
-    await db.flush()  # get order.id
-
-    for item in req.items:
-        db.add(OrderItem(
-            order_id=order.id,
-            product_id=item.product_id,
-            name=item.name,
-            price=item.price,
-            quantity=item.quantity,
-            size=item.size,
-            color=item.color,
-        ))
+async def abandon_order(order_id: str):
+    """The order was never created — return its stock and promo use."""
+    await release_order(order_id)
+    await release_promo(order_id)
+
+
+@traced()
+async def create_order_in_db(
+    req: PaymentRequest, payment_method: str, db: AsyncSession, user: Optional[Principal] = None, hold: bool = True
+) -> Order:
+    """
+    Create order + items in DB, returns the Order object (not yet committed).
+    Stock is held until the payment settles, or taken for good with `hold=False`.
+    """
+    await ensure_loaded()
+    try:
+        quote = price_cart(req.items, req.shipping_method, payment_method, req.promo_code)
+    except CatalogUnavailable as e:
+        raise HTTPException(503, str(e))
+    except PricingError as e:
+        raise HTTPException(400, str(e))
+
+    # Promo use and stock are taken in short transactions of their own before the order row is written
+    order_id = gen_uuid()
+    if quote.promo_code:
+        try:
+            await redeem(quote.promo_code, order_id, user_key_for(req.customer_email, req.customer_phone))
+        except PromoError as e:
+            raise HTTPException(400, str(e))
+    try:
+        await reserve_or_409(order_id, req.items, hold)
+    except BaseException:  # out of stock, or a DB error/timeout — the use must not be burnt
+        await release_promo(order_id)
+        raise
+
+    # From here on the stock and promo are taken: an order that fails to reach
+    # the database hands them back, or a COD reservation (which never expires)
+    # would lose the units for good
+    try:
+        order = Order(
+            id=order_id,
+            user_id=user.id if user else None,
+            customer_name=req.customer_name or "Guest",
+            customer_email=req.customer_email or "",
+            customer_phone=req.customer_phone or "",
+            subtotal=quote.subtotal,
+            shipping=quote.shipping + quote.cod_fee,
+            discount=quote.discount,
+            total=quote.total,
+            promo_code=quote.promo_code,
+            payment_method=payment_method,
+            payment_status="unpaid",
+            shipping_address=req.shipping_address.model_dump() if req.shipping_address else None,
+        )
+        db.add(order)
+        await db.flush()  # get order.id
+
+        for item, line in zip(req.items, quote.lines):
+            db.add(OrderItem(
+                order_id=order.id,
+                product_id=line.product_id,
+                name=line.name,
+                price=line.unit_price,
+                quantity=line.quantity,
+                size=item.size,
+                color=item.color,
+            ))
+        orders_changed(db, order.user_id)
+        count_on_commit(db, orders_created, payment_method)
+        enqueue(db, "order.created", order.id, event_payload(order))
+    except Exception:
+        await db.rollback()
+        await abandon_order(order_id)
+        raise
     return order
 
 
 # ─── Safepay (Card Payments) ────────────────────────────────────
 @router.post("/safepay/create")
-async def create_safepay_payment(req: PaymentRequest, db: AsyncSession = Depends(get_db)):
+@idempotent("payment.safepay")
+async def create_safepay_payment(
+    req: PaymentRequest,
+    db: AsyncSession = Depends(get_db),
+    user: Optional[Principal] = Depends(optional_user),
+):
     """
     Create a Safepay checkout session for card payments.
     Redirects customer to Safepay's hosted checkout page.
@@ -121,16 +186,16 @@ async def create_safepay_payment(req: PaymentRequest, db: AsyncSession = Depends
     if not SAFEPAY_API_KEY or not SAFEPAY_SECRET:
         raise HTTPException(400, "Safepay not configured. Use Cash on Delivery instead.")
 
-    order = await create_order_in_db(req, "safepay", db)
+    order = await create_order_in_db(req, "safepay", db, user)
 
     try:
-        async with httpx.AsyncClient() as client:
+        async with http_client() as client:
             # Step 1: Create a Safepay tracker (payment intent)
             tracker_res = await client.post(
                 f"{SAFEPAY_BASE}/order/payments/v3/",
                 json={
                     "client": SAFEPAY_API_KEY,
-                    "amount": int(req.total),  # Safepay takes integer PKR
+                    "amount": int(order.total),  # Safepay takes integer PKR
                     "currency": "PKR",
                     "environment": SAFEPAY_ENV,
                 },
@@ -174,17 +239,26 @@ async def create_safepay_payment(req: PaymentRequest, db: AsyncSession = Depends
 
     except httpx.HTTPError as e:
         await db.rollback()
+        await abandon_order(order.id)
         raise HTTPException(502, f"Safepay connection error: {str(e)}")
     except HTTPException:
+        await db.rollback()
+        await abandon_order(order.id)
         raise
     except Exception as e:
         await db.rollback()
+        await abandon_order(order.id)
         raise HTTPException(500, f"Payment error: {str(e)}")
 
 
 # ─── JazzCash (Mobile Wallet) ───────────────────────────────────
 @router.post("/jazzcash/create")
-async def create_jazzcash_payment(req: PaymentRequest, db: AsyncSession = Depends(get_db)):
+@idempotent("payment.jazzcash")
+async def create_jazzcash_payment(
+    req: PaymentRequest,
+    db: AsyncSession = Depends(get_db),
+    user: Optional[Principal] = Depends(optional_user),
+):
     """
     Create a JazzCash MWALLET payment.
     Sends OTP to customer's JazzCash mobile number.
@@ -195,11 +269,11 @@ async def create_jazzcash_payment(req: PaymentRequest, db: AsyncSession = Depend
     if not req.mobile_number or len(req.mobile_number) < 11:
         raise HTTPException(400, "Valid JazzCash mobile number required (11 digits)")
 
-    order = await create_order_in_db(req, "jazzcash", db)
+    order = await create_order_in_db(req, "jazzcash", db, user)
 
     try:
         txn_ref = f"MS-{order.id[:8]}-{int(time.time())}"
-        amount = str(int(req.total))
+        amount = str(int(order.total))
         txn_datetime = datetime.now().strftime("%Y%m%d%H%M%S")
         expiry = datetime.now().strftime("%Y%m%d%H%M%S")  # same for immediate
 
@@ -231,7 +305,7 @@ async def create_jazzcash_payment(req: PaymentRequest, db: AsyncSession = Depend
             "pp_SecureHash": secure_hash,
         }
 
-        async with httpx.AsyncClient() as client:
+        async with http_client() as client:
             res = await client.post(JAZZCASH_BASE, data=payload, timeout=30.0)
             data = res.json() if res.status_code == 200 else {}
 
@@ -248,21 +322,27 @@ async def create_jazzcash_payment(req: PaymentRequest, db: AsyncSession = Depend
                 "message": "Payment request sent to your JazzCash app. Please approve.",
             }
         else:
-            order.payment_status = "failed"
-            await db.commit()
-            msg = data.get("pp_ResponseMessage", "JazzCash payment failed")
-            raise HTTPException(400, msg)
+            # Declined up front: the order never reached the gateway as a pending payment, so drop it
+            raise HTTPException(400, data.get("pp_ResponseMessage", "JazzCash payment failed"))
 
     except HTTPException:
+        await db.rollback()
+        await abandon_order(order.id)
         raise
     except Exception as e:
         await db.rollback()
+        await abandon_order(order.id)
         raise HTTPException(500, f"JazzCash error: {str(e)}")
 
 
 # ─── EasyPaisa (Mobile Wallet) ──────────────────────────────────
 @router.post("/easypaisa/create")
-async def create_easypaisa_payment(req: PaymentRequest, db: AsyncSession = Depends(get_db)):
+@idempotent("payment.easypaisa")
+async def create_easypaisa_payment(
+    req: PaymentRequest,
+    db: AsyncSession = Depends(get_db),
+    user: Optional[Principal] = Depends(optional_user),
+):
     """
     Create an EasyPaisa mobile account payment.
     """
@@ -272,11 +352,11 @@ async def create_easypaisa_payment(req: PaymentRequest, db: AsyncSession = Depen
     if not req.mobile_number or len(req.mobile_number) < 11:
         raise HTTPException(400, "Valid EasyPaisa mobile number required (11 digits)")
 
-    order = await create_order_in_db(req, "easypaisa", db)
+    order = await create_order_in_db(req, "easypaisa", db, user)
 
     try:
         order_id = f"MS-{order.id[:8]}"
-        amount = f"{req.total:.2f}"
+        amount = f"{order.total:.2f}"
         post_back_url = f"{FRONTEND_URL}/api/payment/webhook?gateway=easypaisa"
 
         # EasyPaisa HMAC hash
@@ -298,42 +378,56 @@ async def create_easypaisa_payment(req: PaymentRequest, db: AsyncSession = Depen
             "merchantHashedReq": secure_hash,
         }
 
-        async with httpx.AsyncClient() as client:
+        async with http_client() as client:
             res = await client.post(
                 f"{EASYPAISA_BASE}",
                 data=payload,
                 timeout=30.0,
             )
 
+        # Nothing is committed unless EasyPaisa accepted the request: a 502 frees the
+        # Idempotency-Key for a retry, which must not find a live order behind it
+        if res.status_code != 200:
+            raise HTTPException(502, "EasyPaisa payment initiation failed")
+
         order.gateway_session_id = order_id
         order.payment_status = "pending"
         await db.commit()
-
-        # EasyPaisa may return redirect URL or direct response
-        if res.status_code == 200:
-            return {
-                "order_id": order.id,
-                "status": "pending",
-                "message": "Payment request sent to your EasyPaisa account. Please approve.",
-            }
-        else:
-            raise HTTPException(502, "EasyPaisa payment initiation failed")
+        return {
+            "order_id": order.id,
+            "status": "pending",
+            "message": "Payment request sent to your EasyPaisa account. Please approve.",
+        }
 
     except HTTPException:
+        await db.rollback()
+        await abandon_order(order.id)
         raise
     except Exception as e:
         await db.rollback()
+        await abandon_order(order.id)
         raise HTTPException(500, f"EasyPaisa error: {str(e)}")
 
 
 # ─── Cash on Delivery ───────────────────────────────────────────
 @router.post("/cod/create")
-async def create_cod_order(req: PaymentRequest, db: AsyncSession = Depends(get_db)):
+@idempotent("payment.cod")
+async def create_cod_order(
+    req: PaymentRequest,
+    db: AsyncSession = Depends(get_db),
+    user: Optional[Principal] = Depends(optional_user),
+):
     """Create a Cash on Delivery order. No payment gateway needed."""
-    order = await create_order_in_db(req, "cod", db)
-    order.payment_status = "unpaid"  # will be marked paid on delivery
-    order.status = "processing"
-    await db.commit()
+    order = await create_order_in_db(req, "cod", db, user, hold=False)  # confirmed now, stock must not expire
+    try:
+        order.payment_status = "unpaid"  # will be marked paid on delivery
+        order.status = "processing"
+        enqueue(db, "order.confirmed", order.id, event_payload(order))
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        await abandon_order(order.id)
+        raise
 
     return {
         "order_id": order.id,
@@ -343,100 +437,65 @@ async def create_cod_order(req: PaymentRequest, db: AsyncSession = Depends(get_d
 
 
 # ─── Webhooks ────────────────────────────────────────────────────
-@router.post("/webhook/safepay")
-async def safepay_webhook(request: Request, db: AsyncSession = Depends(get_db)):
-    """Handle Safepay payment status webhooks."""
-    body = await request.body()
-    data = json.loads(body)
-
-    # Verify signature if webhook secret is configured
-    if SAFEPAY_WEBHOOK_SECRET:
-        signature = request.headers.get("x-sfpy-signature", "")
-        expected = hmac.new(
-            SAFEPAY_WEBHOOK_SECRET.encode(),
-            body,
-            hashlib.sha256,
-        ).hexdigest()
-        if not hmac.compare_digest(signature, expected):
-            raise HTTPException(401, "Invalid webhook signature")
-
-    event_type = data.get("type", "")
-    tracker = data.get("data", {}).get("token", "")
+# Callbacks are verified and stored, then applied by the webhook inbox
+# processor — the gateway gets its ack without waiting on order updates.
+def _form_fields(body: bytes) -> dict:
+    """Gateways post application/x-www-form-urlencoded; parsed directly from the stored body."""
+    return dict(parse_qsl(body.decode("utf-8", "replace"), keep_blank_values=True))
 
-    if not tracker:
-        return {"received": True}
 
-    result = await db.execute(
-        select(Order).where(Order.gateway_session_id == tracker)
-    )
-    order = result.scalar_one_or_none()
-    if not order:
-        return {"received": True}
+@router.post("/webhook/safepay")
+async def safepay_webhook(request: Request):
+    """Handle Safepay payment status webhooks (signed with the webhook secret)."""
+    if not SAFEPAY_WEBHOOK_SECRET:
+        raise HTTPException(503, "Safepay webhook secret not configured")
+    body = await request.body()
 
-    if event_type == "payment:created" or event_type == "payment:completed":
-        order.payment_status = "paid"
-        order.status = "processing"
-        order.transaction_id = data.get("data", {}).get("tracker", {}).get("id", "")
-    elif event_type == "payment:failed":
-        order.payment_status = "failed"
+    signature = request.headers.get("x-sfpy-signature", "")
+    expected = hmac.new(
+        SAFEPAY_WEBHOOK_SECRET.encode(),
+        body,
+        hashlib.sha256,
+    ).hexdigest()
+    if not hmac.compare_digest(signature, expected):
+        raise HTTPException(401, "Invalid webhook signature")
 
-    await db.commit()
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise HTTPException(400, "Malformed webhook body")
+    if not isinstance(data, dict):
+        raise HTTPException(400, "Malformed webhook body")
+    await ingest("safepay", data, body)
     return {"received": True}
 
 
 @router.post("/webhook/jazzcash")
-async def jazzcash_webhook(request: Request, db: AsyncSession = Depends(get_db)):
-    """Handle JazzCash payment callback."""
-    data = await request.form()
-    txn_ref = data.get("pp_TxnRefNo", "")
-    response_code = data.get("pp_ResponseCode", "")
-
-    if not txn_ref:
-        return {"received": True}
-
-    result = await db.execute(
-        select(Order).where(Order.gateway_session_id == txn_ref)
-    )
-    order = result.scalar_one_or_none()
-    if not order:
-        return {"received": True}
-
-    if response_code == "000":
-        order.payment_status = "paid"
-        order.status = "processing"
-        order.transaction_id = data.get("pp_RetreivalReferenceNo", txn_ref)
-    else:
-        order.payment_status = "failed"
-
-    await db.commit()
+async def jazzcash_webhook(request: Request):
+    """Handle JazzCash payment callback (pp_SecureHash keyed by the integrity salt)."""
+    if not JAZZCASH_SALT:
+        raise HTTPException(503, "JazzCash integrity salt not configured")
+    body = await request.body()
+    fields = _form_fields(body)
+    expected = jazzcash_hash(fields, JAZZCASH_SALT)
+    if not hmac.compare_digest(fields.get("pp_SecureHash", "").upper(), expected):
+        raise HTTPException(401, "Invalid pp_SecureHash")
+    await ingest("jazzcash", fields, body)
     return {"received": True}
 
 
 @router.post("/webhook/easypaisa")
-async def easypaisa_webhook(request: Request, db: AsyncSession = Depends(get_db)):
-    """Handle EasyPaisa payment callback."""
-    data = await request.form()
-    order_id = data.get("orderId", "")
-    status = data.get("status", "")
-
-    if not order_id:
-        return {"received": True}
-
-    # order_id is "MS-{order.id[:8]}" format
-    short_id = order_id.replace("MS-", "")
-    result = await db.execute(
-        select(Order).where(Order.id.like(f"{short_id}%"))
-    )
-    order = result.scalar_one_or_none()
-    if not order:
-        return {"received": True}
-
-    if status in ("0000", "0001"):  # success codes
-        order.payment_status = "paid"
-        order.status = "processing"
-        order.transaction_id = data.get("transactionId", "")
-    else:
-        order.payment_status = "failed"
-
-    await db.commit()
+async def easypaisa_webhook(request: Request):
+    """
+    Handle EasyPaisa payment callback. EasyPaisa does not sign its
+    callbacks, so one is stored unverified and only applied once the
+    transaction inquiry API reports the same outcome for the order.
+    """
+    if "easypaisa" not in configured_gateways():
+        raise HTTPException(503, "EasyPaisa inquiry credentials not configured")
+    body = await request.body()
+    fields = _form_fields(body)
+    if not fields.get("orderId"):
+        raise HTTPException(400, "Malformed callback")
+    await ingest("easypaisa", fields, body, verified=False)
     return {"received": True}
@@ -0,0 +1,48 @@
+"""Product listing routes — served from the local catalog mirror"""
+
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from catalog_mirror import SORTS, product_mirror
+from responses import FastJSONResponse
+from tracing import TracedRoute
+
+router = APIRouter(route_class=TracedRoute)
+
+
+@router.get("")
+async def list_products(
+    category: list[str] = Query([]),
+    material: list[str] = Query([]),
+    size: list[str] = Query([]),
+    color: list[str] = Query([]),
+    occasion: list[str] = Query([]),
+    min_price: Optional[float] = Query(None, alias="minPrice"),
+    max_price: Optional[float] = Query(None, alias="maxPrice"),
+    filter: Optional[str] = None,  # new | bestseller | featured
+    sort: str = "newest",
+    limit: int = Query(24, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    """Filtered product listing with facet counts (same params as the /products page)"""
+    if sort not in SORTS:
+        raise HTTPException(400, f"sort must be one of: {', '.join(SORTS)}")
+    return FastJSONResponse(product_mirror.query(
+        {"category": category, "material": material, "size": size, "color": color, "occasion": occasion},
+        min_price=min_price,
+        max_price=max_price,
+        flag=filter,
+        sort=sort,
+        limit=limit,
+        offset=offset,
+    ))
+
+
+@router.get("/{slug}")
+async def get_product(slug: str):
+    """Single product by slug"""
+    product = product_mirror.get_by_slug(slug)
+    if product is None:
+        raise HTTPException(404, "Product not found")
+    return FastJSONResponse(product)
@@ -0,0 +1,62 @@
+"""Promo code routes — validation for the cart/checkout page"""
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_db
+from pricing import CatalogUnavailable, PricingError, ensure_loaded, price_cart
+from promo import PromoError, promo_engine, usage_count, user_key_for
+from tracing import TracedRoute
+
+router = APIRouter(route_class=TracedRoute)
+
+
+class PromoItem(BaseModel):
+    product_id: str
+    name: str = ""
+    price: float = 0
+    quantity: int = 1
+
+
+class ValidatePromoRequest(BaseModel):
+    code: str
+    items: list[PromoItem]
+    shipping_method: str = "standard"
+    payment_method: Optional[str] = None
+    customer_email: Optional[str] = None
+    customer_phone: Optional[str] = None
+
+
+@router.post("/validate")
+async def validate_promo(req: ValidatePromoRequest, db: AsyncSession = Depends(get_db)):
+    """Check a code against the cart and return the discount it would give"""
+    await ensure_loaded()
+    try:
+        quote = price_cart(req.items, req.shipping_method, req.payment_method)
+    except CatalogUnavailable as e:
+        raise HTTPException(503, str(e))
+    except PricingError as e:
+        raise HTTPException(400, str(e))
+
+    rule = promo_engine.get(req.code)
+    try:
+        discount = promo_engine.evaluate(req.code, quote.lines, quote.subtotal)
+        if rule.per_user_limit:
+            user_key = user_key_for(req.customer_email, req.customer_phone)
+            if user_key and await usage_count(db, rule.code, user_key) >= rule.per_user_limit:
+                raise PromoError("You have already used this code")
+    except PromoError as e:
+        return {"valid": False, "code": req.code.strip().upper(), "message": str(e)}
+
+    return {
+        "valid": True,
+        "code": rule.code,
+        "description": rule.description,
+        "discount": discount,
+        "subtotal": quote.subtotal,
+        "shipping": quote.shipping,
+        "total": round(quote.total - discount, 2),
+    }
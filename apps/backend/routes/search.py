@@ -0,0 +1,30 @@
+"""Product search routes — full-text search + autocomplete"""
+
+from fastapi import APIRouter, Query
+
+from responses import FastJSONResponse
+from search import search_index, search_products
+from tracing import TracedRoute
+
+router = APIRouter(route_class=TracedRoute)
+
+
+@router.get("")
+async def search(q: str = Query(..., min_length=1, max_length=100), limit: int = Query(20, ge=1, le=50)):
+    """Ranked product search (handles Roman Urdu and typos, e.g. "kala abya")"""
+    return FastJSONResponse({"query": q, "products": search_products(q, limit=limit)})
+
+
+@router.get("/autocomplete")
+async def autocomplete(q: str = Query(..., min_length=1, max_length=100), limit: int = Query(6, ge=1, le=20)):
+    """Search-as-you-type: word completions + top matching products"""
+    products = search_products(q, limit=limit, prefix=True)
+    return {
+        "query": q,
+        "suggestions": search_index.suggest(q),
+        "products": [
+            {"_id": p["_id"], "name": p.get("name"), "slug": p.get("slug"),
+             "price": p.get("price"), "image": p.get("image")}
+            for p in products
+        ],
+    }
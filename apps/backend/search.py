@@ -0,0 +1,293 @@
+"""
+Product search — in-process inverted index with BM25 ranking.
+
+Indexes name, category, material, colours and tags. Queries are expanded
+with a Roman-Urdu ↔ English synonym map, unknown words are corrected via
+a trigram index over the vocabulary (edit distance ≤ 1–2), and the last
+word of an autocomplete query is matched as a prefix. Documents are added
+and removed incrementally as the catalog changes.
+"""
+
+import heapq
+import math
+import re
+from bisect import bisect_left, insort
+from typing import Optional
+
+from catalog_mirror import product_mirror
+
+K1 = 1.2
+B = 0.75
+FIELD_WEIGHTS = {"name": 3.0, "category": 2.0, "material": 2.0, "colors": 1.5, "tags": 1.0}
+SYNONYM_WEIGHT = 0.8
+PREFIX_WEIGHT = 0.9
+FUZZY_WEIGHT = 0.7
+MAX_EXPANSIONS = 20
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Roman Urdu (and common spellings) → English catalog vocabulary
+ROMAN_URDU = {
+    "kala": ["black"], "kaala": ["black"], "kali": ["black"], "kaali": ["black"],
+    "safaid": ["white"], "safed": ["white"], "sufaid": ["white"],
+    "neela": ["blue", "navy"], "nila": ["blue", "navy"], "neeli": ["blue", "navy"],
+    "laal": ["red", "maroon"], "lal": ["red", "maroon"], "surkh": ["red"],
+    "hara": ["green", "olive"], "hari": ["green", "olive"],
+    "peela": ["yellow", "mustard"], "peeli": ["yellow", "mustard"],
+    "gulabi": ["pink"], "bhoora": ["brown"], "bhura": ["brown"],
+    "sleti": ["grey"], "surmai": ["grey"], "badami": ["beige"],
+    "dupatta": ["hijab", "stole", "scarf"], "orhni": ["hijab", "scarf"],
+    "chadar": ["shawl", "stole"], "chaddar": ["shawl", "stole"],
+    "burqa": ["abaya"], "burka": ["abaya"], "gown": ["abaya"],
+    "namaz": ["prayer"], "janamaz": ["prayer"], "jaa": ["prayer"],
+    "reshmi": ["silk"], "resham": ["silk"], "sooti": ["cotton"], "lawn": ["lawn"],
+    "shadi": ["bridal", "wedding"], "dulhan": ["bridal"], "mehndi": ["party"],
+    "sasta": ["everyday"], "daily": ["everyday", "casual"],
+    "pin": ["pins"], "brooch": ["brooches"],
+}
+# English → Roman Urdu, so catalog tags written in Roman Urdu are found too
+SYNONYMS: dict[str, list[str]] = {k: list(v) for k, v in ROMAN_URDU.items()}
+for _urdu, _english in ROMAN_URDU.items():
+    for _word in _english:
+        if _word != _urdu:
+            SYNONYMS.setdefault(_word, []).append(_urdu)
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _trigrams(term: str) -> set[str]:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Damerau-Levenshtein (adjacent transpositions), bailing out above `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2: list[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def _doc_fields(doc: dict) -> dict[str, str]:
+    return {
+        "name": doc.get("name") or "",
+        "category": doc.get("category") or "",
+        "material": doc.get("material") or "",
+        "colors": " ".join(c.get("name", "") for c in doc.get("colors") or [] if isinstance(c, dict)),
+        "tags": " ".join(doc.get("tags") or []),
+    }
+
+
+class SearchIndex:
+    def __init__(self):
+        self.postings: dict[str, dict[str, float]] = {}  # term → {product_id: weighted tf}
+        self.doc_terms: dict[str, dict[str, float]] = {}  # product_id → {term: weighted tf}
+        self.doc_len: dict[str, float] = {}
+        self.total_len = 0.0
+        self.vocab: list[str] = []  # sorted, for prefix lookups
+        self.trigrams: dict[str, set[str]] = {}  # trigram → terms
+        self.avg_len = 0.0  # frozen between >10% drifts so cached impacts stay valid
+        self._impact_cache: dict[str, dict[str, float]] = {}
+
+    # ─── Incremental updates ─────────────────────────────────────
+    def add(self, doc: dict):
+        product_id = doc["_id"]
+        if product_id in self.doc_terms:
+            self.remove(product_id)
+        terms: dict[str, float] = {}
+        for field, text in _doc_fields(doc).items():
+            weight = FIELD_WEIGHTS[field]
+            for token in tokenize(text):
+                terms[token] = terms.get(token, 0.0) + weight
+        length = sum(terms.values())
+        self.doc_terms[product_id] = terms
+        self.doc_len[product_id] = length
+        self.total_len += length
+        for term, tf in terms.items():
+            self._impact_cache.pop(term, None)
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                insort(self.vocab, term)
+                for gram in _trigrams(term):
+                    self.trigrams.setdefault(gram, set()).add(term)
+            posting[product_id] = tf
+
+    def remove(self, product_id: str):
+        terms = self.doc_terms.pop(product_id, None)
+        if terms is None:
+            return
+        self.total_len -= self.doc_len.pop(product_id)
+        for term in terms:
+            self._impact_cache.pop(term, None)
+            posting = self.postings[term]
+            del posting[product_id]
+            if not posting:
+                del self.postings[term]
+                del self.vocab[bisect_left(self.vocab, term)]
+                for gram in _trigrams(term):
+                    self.trigrams[gram].discard(term)
+
+    def load(self, docs: list[dict]):
+        self.__init__()
+        for doc in docs:
+            if not doc.get("_id", "").startswith("drafts."):
+                self.add(doc)
+
+    # ─── Query expansion ─────────────────────────────────────────
+    def prefix_terms(self, prefix: str, limit: int = MAX_EXPANSIONS) -> list[str]:
+        i = bisect_left(self.vocab, prefix)
+        out = []
+        while i < len(self.vocab) and self.vocab[i].startswith(prefix) and len(out) < limit:
+            out.append(self.vocab[i])
+            i += 1
+        return out
+
+    def fuzzy_terms(self, term: str, limit: int = 5) -> list[str]:
+        if len(term) < 3:
+            return []
+        max_dist = 1 if len(term) <= 5 else 2
+        grams = _trigrams(term)
+        shared: dict[str, int] = {}
+        for gram in grams:
+            for candidate in self.trigrams.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        # Only candidates sharing enough trigrams are worth an edit-distance check
+        threshold = max(1, len(grams) - 3 * max_dist)
+        ranked = sorted((c for c, n in shared.items() if n >= threshold), key=lambda c: -shared[c])
+        out = []
+        for candidate in ranked[:50]:
+            if _edit_distance(term, candidate, max_dist) <= max_dist:
+                out.append(candidate)
+                if len(out) >= limit:
+                    break
+        return out
+
+    def expand(self, term: str, prefix: bool = False) -> list[tuple[str, float]]:
+        expansions: dict[str, float] = {}
+        if term in self.postings:
+            expansions[term] = 1.0
+        for synonym in SYNONYMS.get(term, ()):
+            if synonym in self.postings:
+                expansions.setdefault(synonym, SYNONYM_WEIGHT)
+        if prefix:
+            for completion in self.prefix_terms(term):
+                expansions.setdefault(completion, PREFIX_WEIGHT)
+        if not expansions:
+            for candidate in self.fuzzy_terms(term):
+                expansions[candidate] = FUZZY_WEIGHT
+                for synonym in SYNONYMS.get(candidate, ()):
+                    if synonym in self.postings:
+                        expansions.setdefault(synonym, FUZZY_WEIGHT * SYNONYM_WEIGHT)
+        return list(expansions.items())
+
+    # ─── Ranking ─────────────────────────────────────────────────
+    def _impacts(self, term: str) -> dict[str, float]:
+        """BM25 length-normalised tf per document, cached until the term's posting changes."""
+        cached = self._impact_cache.get(term)
+        if cached is None:
+            lens = self.doc_len
+            k = K1 * (1 - B)
+            kb = K1 * B / self.avg_len
+            cached = {pid: tf * (K1 + 1) / (tf + k + kb * lens[pid]) for pid, tf in self.postings[term].items()}
+            self._impact_cache[term] = cached
+        return cached
+
+    def _idf(self, term: str, n_docs: int) -> float:
+        df = len(self.postings[term])
+        return math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, limit: int = 20, prefix: bool = False) -> list[tuple[str, float]]:
+        """
+        (product_id, score) best first. Documents matching more of the query
+        words always rank above those matching fewer; BM25 breaks ties.
+        With `prefix`, the last word is also matched as a prefix.
+        """
+        tokens = tokenize(query)
+        if not tokens or not self.doc_terms:
+            return []
+        n_docs = len(self.doc_terms)
+        current_avg = self.total_len / n_docs
+        if abs(current_avg - self.avg_len) > 0.1 * current_avg:
+            self.avg_len = current_avg
+            self._impact_cache.clear()
+
+        # One (scale, {product_id: impact}) group per query word; synonyms,
+        # completions and typo fixes of the same word take the max, not the sum
+        groups: list[tuple[float, dict[str, float]]] = []
+        for i, token in enumerate(tokens):
+            expansions = self.expand(token, prefix=prefix and i == len(tokens) - 1)
+            if len(expansions) == 1:
+                term, weight = expansions[0]
+                groups.append((weight * self._idf(term, n_docs), self._impacts(term)))
+            elif expansions:
+                merged: dict[str, float] = {}
+                for term, weight in expansions:
+                    scale = weight * self._idf(term, n_docs)
+                    for pid, impact in self._impacts(term).items():
+                        contribution = scale * impact
+                        if contribution > merged.get(pid, 0.0):
+                            merged[pid] = contribution
+                groups.append((1.0, merged))
+        if not groups:
+            return []
+
+        if len(groups) == 1:
+            scale, impacts = groups[0]
+            best = heapq.nlargest(limit, impacts, key=impacts.__getitem__)
+            return [(pid, round(scale * impacts[pid], 4)) for pid in best]
+
+        groups.sort(key=lambda g: len(g[1]))
+        everywhere = set(groups[0][1])
+        for _, impacts in groups[1:]:
+            everywhere &= impacts.keys()
+
+        def score(pid: str) -> float:
+            return sum(scale * impacts.get(pid, 0.0) for scale, impacts in groups)
+
+        if len(everywhere) >= limit:
+            # Enough documents match every word — nothing else can outrank them
+            scores = {pid: score(pid) for pid in everywhere}
+            best = heapq.nlargest(limit, scores, key=scores.__getitem__)
+        else:
+            pool = set().union(*(impacts.keys() for _, impacts in groups))
+            scores = {pid: score(pid) for pid in pool}
+            matched = {pid: sum(pid in impacts for _, impacts in groups) for pid in pool}
+            best = heapq.nlargest(limit, pool, key=lambda pid: (matched[pid], scores[pid]))
+        return [(pid, round(scores[pid], 4)) for pid in best]
+
+    def suggest(self, query: str, limit: int = 8) -> list[str]:
+        """Vocabulary completions for the last word of `query`."""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        head = " ".join(tokens[:-1])
+        completions = self.prefix_terms(tokens[-1], limit * 4)
+        completions.sort(key=lambda t: -len(self.postings[t]))
+        return [f"{head} {t}".strip() for t in completions[:limit]]
+
+
+search_index = SearchIndex()
+
+
+def search_products(query: str, limit: int = 20, prefix: bool = False) -> list[dict]:
+    """Resolve search hits to catalog mirror documents."""
+    results = []
+    for product_id, score in search_index.search(query, limit=limit, prefix=prefix):
+        doc: Optional[dict] = product_mirror.docs.get(product_id)
+        if doc is not None:
+            results.append({**doc, "score": score})
+    return results
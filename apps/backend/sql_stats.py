@@ -0,0 +1,260 @@
+"""
+SQL instrumentation — statements per request, DB time, slow statements and N+1 shapes.
+
+Engine-wide cursor hooks attribute every statement to the request running
+it (a context variable set by QueryStatsMiddleware; background jobs and
+loops count as "(background)"). Per route template this keeps requests,
+statements, DB time and the most statements one request needed. A
+statement shape — the SQL text with placeholder lists collapsed — run
+N_PLUS_ONE_THRESHOLD or more times in one request is reported as an N+1
+pattern. Statements slower than SLOW_QUERY_MS are kept with their
+parameters reduced to type names; values never leave the process.
+
+With SQL_DEBUG=1 every response carries its own figures:
+
+    X-SQL-Stats: queries=3, time_ms=1.8, repeated=0
+    Server-Timing: db;dur=1.8
+
+For tests, `query_budget(n)` fails the block if it runs more than n
+statements or repeats a shape (requests made through httpx.ASGITransport
+run in the caller's context, so they are counted):
+
+    with query_budget(2):
+        res = await client.get(f"/api/admin/orders/{order_id}", headers=admin)
+"""
+
+import functools
+import os
+import re
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+from metrics import route_template
+
+SQL_DEBUG = os.getenv("SQL_DEBUG", "") == "1"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))  # same shape this many times in one request
+SLOW_LOG_SIZE = 100
+MAX_PATTERNS = 500
+MAX_SHAPE_CHARS = 400
+BACKGROUND = "(background)"
+
+# "IN (?, ?, ?)" and executemany VALUES lists differ only in length — one shape
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|%s|\$\d+|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|%s|\$\d+|:\w+))+\s*\)")
+
+
+@functools.lru_cache(maxsize=2048)  # statements come from SQLAlchemy's compiled cache — few distinct strings
+def shape_of(statement: str) -> str:
+    return _PLACEHOLDER_LIST.sub("(?, ...)", " ".join(statement.split()))[:MAX_SHAPE_CHARS]
+
+
+def redact(parameters, executemany: bool = False):
+    """Parameters with every value replaced by its type name."""
+    if executemany and isinstance(parameters, (list, tuple)):
+        return {"rows": len(parameters), "first": redact(parameters[0]) if parameters else None}
+    if isinstance(parameters, dict):
+        return {k: type(v).__name__ for k, v in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(v).__name__ for v in parameters]
+    return type(parameters).__name__
+
+
+class QueryLog:
+    """Statements run by one request (or one query_budget block)."""
+
+    __slots__ = ("count", "seconds", "shapes", "slow")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes: dict[str, int] = {}
+        self.slow: list[dict] = []
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> dict[str, int]:
+        return {shape: n for shape, n in self.shapes.items() if n >= threshold}
+
+    def merge(self, other: "QueryLog"):
+        self.count += other.count
+        self.seconds += other.seconds
+        for shape, n in other.shapes.items():
+            self.shapes[shape] = self.shapes.get(shape, 0) + n
+        self.slow.extend(other.slow)
+
+    def header(self) -> str:
+        return f"queries={self.count}, time_ms={self.seconds * 1000:.1f}, repeated={len(self.repeated())}"
+
+
+current: ContextVar[Optional[QueryLog]] = ContextVar("sql_query_log", default=None)
+
+
+# ─── Aggregates ─────────────────────────────────────────────────
+class RouteStats:
+    __slots__ = ("requests", "statements", "seconds", "max_statements", "flagged")
+
+    def __init__(self):
+        self.requests = 0
+        self.statements = 0
+        self.seconds = 0.0
+        self.max_statements = 0
+        self.flagged = 0  # requests with an N+1 pattern
+
+
+class SQLStats:
+    def __init__(self):
+        self.routes: dict[str, RouteStats] = {}
+        self.patterns: dict[tuple[str, str], dict] = {}  # (route, shape) → occurrences
+        self.slow: deque = deque(maxlen=SLOW_LOG_SIZE)  # newest last
+        self.background = QueryLog()
+
+    def record(self, route: str, log: QueryLog):
+        stats = self.routes.get(route)
+        if stats is None:
+            stats = self.routes[route] = RouteStats()
+        stats.requests += 1
+        stats.statements += log.count
+        stats.seconds += log.seconds
+        stats.max_statements = max(stats.max_statements, log.count)
+        repeated = log.repeated()
+        if repeated:
+            stats.flagged += 1
+        for shape, n in repeated.items():
+            pattern = self.patterns.get((route, shape))
+            if pattern is None:
+                if len(self.patterns) >= MAX_PATTERNS:
+                    continue
+                pattern = self.patterns[(route, shape)] = {"requests": 0, "max_repeats": 0}
+            pattern["requests"] += 1
+            pattern["max_repeats"] = max(pattern["max_repeats"], n)
+        for entry in log.slow:
+            self.slow.append({**entry, "route": route})
+
+    def clear(self):
+        self.routes.clear()
+        self.patterns.clear()
+        self.slow.clear()
+        self.background = QueryLog()
+
+    def snapshot(self) -> dict:
+        busiest = sorted(self.routes.items(), key=lambda kv: -kv[1].seconds)
+        return {
+            "slow_query_ms": SLOW_QUERY_MS,
+            "n_plus_one_threshold": N_PLUS_ONE_THRESHOLD,
+            "routes": {
+                route: {
+                    "requests": s.requests,
+                    "statements_per_request": round(s.statements / s.requests, 2),
+                    "max_statements": s.max_statements,
+                    "db_ms_per_request": round(s.seconds * 1000 / s.requests, 2),
+                    "n_plus_one_requests": s.flagged,
+                }
+                for route, s in busiest
+            },
+            "background": {"statements": self.background.count, "db_ms": round(self.background.seconds * 1000, 1)},
+            "n_plus_one": [
+                {"route": route, "statement": shape, **pattern}
+                for (route, shape), pattern in sorted(self.patterns.items(), key=lambda kv: -kv[1]["requests"])
+            ],
+            "slow": list(reversed(self.slow)),
+        }
+
+
+sql_stats = SQLStats()
+
+
+# ─── Engine hooks ───────────────────────────────────────────────
+@event.listens_for(Engine, "before_cursor_execute")
+def _before(conn, cursor, statement, parameters, context, executemany):
+    conn.info["sql_stats.started"] = time.perf_counter()  # one statement at a time per connection
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("sql_stats.started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    log = current.get()
+    if log is None:
+        sql_stats.background.count += 1
+        sql_stats.background.seconds += elapsed
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            sql_stats.slow.append({**_slow_entry(statement, parameters, executemany, elapsed), "route": BACKGROUND})
+        return
+    log.count += 1
+    log.seconds += elapsed
+    if not executemany:  # one executemany is one round trip, not a loop
+        shape = shape_of(statement)
+        log.shapes[shape] = log.shapes.get(shape, 0) + 1
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        log.slow.append(_slow_entry(statement, parameters, executemany, elapsed))
+
+
+def _slow_entry(statement: str, parameters, executemany: bool, elapsed: float) -> dict:
+    return {
+        "at": datetime.utcnow().isoformat(),
+        "ms": round(elapsed * 1000, 1),
+        "statement": shape_of(statement),
+        "parameters": redact(parameters, executemany),
+    }
+
+
+# ─── Request middleware ─────────────────────────────────────────
+class QueryStatsMiddleware:
+    """Gives each HTTP request its own QueryLog; adds X-SQL-Stats when SQL_DEBUG is on."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        parent = current.get()
+        log = QueryLog()
+        token = current.set(log)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("X-SQL-Stats", log.header())
+                headers.append("Server-Timing", f"db;dur={log.seconds * 1000:.1f}")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper if SQL_DEBUG else send)
+        finally:
+            current.reset(token)
+            sql_stats.record(route_template(scope), log)
+            if parent is not None:
+                parent.merge(log)
+
+
+# ─── Test helper ────────────────────────────────────────────────
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(max_queries: int, *, allow_repeats: bool = False):
+    """Fail the block if it runs more than `max_queries` statements, or (unless allowed) an N+1 shape."""
+    log = QueryLog()
+    token = current.set(log)
+    try:
+        yield log
+    finally:
+        current.reset(token)
+    problems = []
+    if log.count > max_queries:
+        problems.append(f"{log.count} statements, budget {max_queries}")
+    if not allow_repeats:
+        problems += [f"repeated {n}x: {shape}" for shape, n in log.repeated().items()]
+    if problems:
+        shapes = "\n  ".join(f"{n}x {shape}" for shape, n in sorted(log.shapes.items(), key=lambda kv: -kv[1]))
+        raise QueryBudgetExceeded("; ".join(problems) + f"\n  {shapes}")
@@ -0,0 +1,422 @@
+"""
+Tracing — OpenTelemetry-compatible spans for requests, SQL, outbound HTTP and jobs.
+
+    TRACE_EXPORTER=file   TRACE_FILE=traces.jsonl          OTLP/JSON, one batch per line
+    TRACE_EXPORTER=otlp   TRACE_OTLP_ENDPOINT=http://localhost:4318/v1/traces
+    TRACE_SAMPLE_RATE=0.1                                  share of new traces recorded
+
+Each request gets a SERVER span that continues the caller's W3C
+`traceparent` (the Next.js proxy routes forward theirs). Under it come
+the route handler (TracedRoute), functions marked @traced, every SQL
+statement, session flushes and commits, and outbound httpx calls, which
+pass `traceparent` on. Background jobs start traces of their own.
+
+Sampling is decided once per trace: a sampled parent is always followed,
+an unsampled one never; new traces are kept with TRACE_SAMPLE_RATE. In
+an unsampled trace every would-be span is the request's own placeholder
+— no ids, no clock reads, nothing queued. With no exporter configured
+nothing is traced at all.
+
+Spans are encoded as OTLP/JSON (ExportTraceServiceRequest), so the file
+can be replayed into any collector and the otlp exporter posts straight
+to one — or to benchmarks/fake_collector.py. A background task exports
+in batches (and once more at shutdown); where none runs (serverless), a
+request finishing after two missed intervals exports instead. If export
+falls behind, spans are dropped and counted.
+"""
+
+import asyncio
+import functools
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+import httpx
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from starlette.datastructures import MutableHeaders
+
+from responses import dumps
+
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "")  # "" (off) | file | otlp
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "modeststyle-backend")
+TRACE_FLUSH_INTERVAL = float(os.getenv("TRACE_FLUSH_INTERVAL", "2"))  # seconds
+TRACE_MAX_QUEUE = int(os.getenv("TRACE_MAX_QUEUE", "20000"))  # finished spans waiting for export
+MAX_BATCH = 2000
+
+# SpanKind / StatusCode values from the OTLP protobuf
+INTERNAL, SERVER, CLIENT, PRODUCER, CONSUMER = 1, 2, 3, 4, 5
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "status", "message", "sampled")
+
+    def __init__(self, trace_id: str, span_id: str, parent_id: str, name: str, kind: int, sampled: bool = True):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns() if sampled else 0
+        self.end_ns = 0
+        self.attributes: dict = {}
+        self.status = STATUS_UNSET
+        self.message = ""
+        self.sampled = sampled
+
+    def set(self, key: str, value):
+        if self.sampled and value is not None:
+            self.attributes[key] = value
+
+    def fail(self, error: BaseException | str):
+        if self.sampled:
+            self.status = STATUS_ERROR
+            self.message = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+current: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+
+class TraceStats:
+    __slots__ = ("started", "exported", "dropped", "export_errors")
+
+    def __init__(self):
+        self.started = 0
+        self.exported = 0
+        self.dropped = 0
+        self.export_errors = 0
+
+
+stats = TraceStats()
+_queue: list[Span] = []
+
+
+def _id(bits: int) -> str:
+    return f"{random.getrandbits(bits) or 1:0{bits // 4}x}"
+
+
+# ─── Spans ──────────────────────────────────────────────────────
+def start_span(name: str, kind: int = INTERNAL, parent: Optional[Span] = None, remote: Optional[str] = None) -> Optional[Span]:
+    """
+    A child of `parent` (default: the current span), or the root of a new
+    trace — continuing the `remote` traceparent header if one is given.
+    None when tracing is off; the parent itself when its trace is unsampled.
+    """
+    if not TRACE_EXPORTER:
+        return None
+    parent = parent or current.get()
+    if parent is not None:
+        if not parent.sampled:
+            return parent
+        stats.started += 1
+        return Span(parent.trace_id, _id(64), parent.span_id, name, kind)
+    match = TRACEPARENT.match(remote.strip().lower()) if remote else None
+    if match:
+        trace_id, parent_id, flags = match.groups()
+        sampled = bool(int(flags, 16) & 1)
+    else:
+        trace_id, parent_id = _id(128), ""
+        sampled = random.random() < TRACE_SAMPLE_RATE
+    if not sampled:
+        return Span(trace_id, parent_id or _id(64), "", name, kind, sampled=False)
+    stats.started += 1
+    return Span(trace_id, _id(64), parent_id, name, kind)
+
+
+def child_span(name: str, kind: int = INTERNAL) -> Optional[Span]:
+    """A span under the current one, or None outside a sampled trace — for spans never worth a trace of their own."""
+    parent = current.get()
+    if parent is None or not parent.sampled:
+        return None
+    stats.started += 1
+    return Span(parent.trace_id, _id(64), parent.span_id, name, kind)
+
+
+def end_span(span: Optional[Span], error: Optional[BaseException] = None):
+    if span is None or not span.sampled or span.end_ns:
+        return
+    if error is not None:
+        span.fail(error)
+    span.end_ns = time.time_ns()
+    if len(_queue) >= TRACE_MAX_QUEUE:
+        stats.dropped += 1
+        return
+    _queue.append(span)
+
+
+@contextmanager
+def span(name: str, kind: int = INTERNAL, **attributes):
+    """`with span("pricing", items=3) as s:` — s is None when tracing is off."""
+    s = start_span(name, kind)
+    if s is None:
+        yield None
+        return
+    if s.sampled:
+        s.attributes.update(attributes)
+    token = current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        end_span(s, e)
+        raise
+    finally:
+        current.reset(token)
+    end_span(s)
+
+
+def traced(name: Optional[str] = None):
+    """Run a function (sync or async) in a span of its own."""
+    def decorator(func):
+        label = name or func.__qualname__
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not TRACE_EXPORTER:
+                    return await func(*args, **kwargs)
+                with span(label):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not TRACE_EXPORTER:
+                    return func(*args, **kwargs)
+                with span(label):
+                    return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def inject(headers) -> None:
+    """Add the current span's traceparent to outgoing `headers`."""
+    s = current.get()
+    if s is not None:
+        headers["traceparent"] = s.traceparent
+
+
+# ─── Requests ───────────────────────────────────────────────────
+class TracingMiddleware:
+    """Outermost middleware: one SERVER span per HTTP request, continuing the caller's traceparent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACE_EXPORTER:
+            return await self.app(scope, receive, send)
+        remote = tracestate = None
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                remote = value.decode("latin-1")
+            elif key == b"tracestate":
+                tracestate = value.decode("latin-1")
+        s = start_span(scope["method"], SERVER, remote=remote)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if s.sampled:
+                    MutableHeaders(scope=message).append("X-Trace-Id", s.trace_id)
+            await send(message)
+
+        token = current.set(s)
+        error = None
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            current.reset(token)
+            if s.sampled:
+                from metrics import route_template
+
+                route = route_template(scope)
+                s.name = f"{scope['method']} {route}"
+                s.set("http.request.method", scope["method"])
+                s.set("url.path", scope["path"])
+                s.set("http.route", route)
+                s.set("http.response.status_code", status)
+                if tracestate:
+                    s.set("w3c.tracestate", tracestate)
+                if status >= 500 and error is None:
+                    s.fail(f"HTTP {status}")
+                end_span(s, error)
+            if time.monotonic() - _flushed_at > 2 * TRACE_FLUSH_INTERVAL:  # no exporter loop here
+                await flush()
+
+
+class TracedRoute(APIRoute):
+    """APIRoute whose endpoint runs in a "handler" span — time outside it is validation, dependencies and encoding."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, traced(f"handler {endpoint.__name__}")(endpoint), **kwargs)
+
+
+# ─── SQLAlchemy ─────────────────────────────────────────────────
+@event.listens_for(Engine, "before_cursor_execute")
+def _statement_started(conn, cursor, statement, parameters, context, executemany):
+    s = child_span("db", CLIENT) if TRACE_EXPORTER else None
+    if s is None:
+        return
+    from sql_stats import shape_of
+
+    text = shape_of(statement)
+    s.name = text.split(" ", 1)[0].upper() or "db"
+    s.set("db.system.name", conn.dialect.name)
+    s.set("db.query.text", text)  # placeholders only — parameter values are never recorded
+    if executemany:
+        s.set("db.operation.batch.size", len(parameters))
+    conn.info["trace.span"] = s
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _statement_finished(conn, cursor, statement, parameters, context, executemany):
+    if TRACE_EXPORTER:
+        end_span(conn.info.pop("trace.span", None))
+
+
+@event.listens_for(Engine, "handle_error")
+def _statement_failed(exception_context):
+    conn = exception_context.connection
+    if TRACE_EXPORTER and conn is not None:
+        end_span(conn.info.pop("trace.span", None), exception_context.original_exception)
+
+
+def _session_span(session: Session, key: str, name: str):
+    s = child_span(name) if TRACE_EXPORTER else None
+    if s is not None:
+        session.info[key] = s
+
+
+def _end_session_span(session: Session, key: str, error: Optional[str] = None):
+    s = session.info.pop(key, None)
+    if s is not None:
+        if error:
+            s.fail(error)
+        end_span(s)
+
+
+@event.listens_for(Session, "before_flush")
+def _flush_started(session, flush_context, instances):
+    _session_span(session, "trace.flush", "session.flush")
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _flush_finished(session, flush_context):
+    _end_session_span(session, "trace.flush")
+
+
+@event.listens_for(Session, "before_commit")
+def _commit_started(session):
+    _session_span(session, "trace.commit", "session.commit")
+
+
+@event.listens_for(Session, "after_commit")
+def _commit_finished(session):
+    _end_session_span(session, "trace.commit")
+
+
+@event.listens_for(Session, "after_rollback")
+def _rolled_back(session):
+    _end_session_span(session, "trace.flush", "rolled back")
+    _end_session_span(session, "trace.commit", "rolled back")
+
+
+# ─── Export ─────────────────────────────────────────────────────
+def _value(v) -> dict:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+
+def encode(spans: list[Span]) -> bytes:
+    """An OTLP/JSON ExportTraceServiceRequest."""
+    return dumps({
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+            "scopeSpans": [{
+                "scope": {"name": "modeststyle.tracing"},
+                "spans": [
+                    {
+                        "traceId": s.trace_id,
+                        "spanId": s.span_id,
+                        "parentSpanId": s.parent_id,
+                        "name": s.name,
+                        "kind": s.kind,
+                        "startTimeUnixNano": str(s.start_ns),
+                        "endTimeUnixNano": str(s.end_ns),
+                        "attributes": [{"key": k, "value": _value(v)} for k, v in s.attributes.items()],
+                        "status": {"code": s.status, "message": s.message} if s.status else {},
+                    }
+                    for s in spans
+                ],
+            }],
+        }],
+    })
+
+
+def _append(path: str, body: bytes):
+    with open(path, "ab") as f:
+        f.write(body + b"\n")
+
+
+_client: Optional[httpx.AsyncClient] = None
+_flushed_at = time.monotonic()
+
+
+async def flush() -> int:
+    """Export everything queued. Returns the number of spans sent."""
+    global _client, _flushed_at
+    _flushed_at = time.monotonic()
+    sent = 0
+    while _queue:
+        batch = _queue[:MAX_BATCH]
+        del _queue[:len(batch)]  # in place: spans ended on threadpool threads append to this same list
+        body = encode(batch)
+        try:
+            if TRACE_EXPORTER == "otlp":
+                if _client is None:
+                    _client = httpx.AsyncClient(timeout=10.0)  # plain client: exporting must not trace itself
+                res = await _client.post(TRACE_OTLP_ENDPOINT, content=body, headers={"Content-Type": "application/json"})
+                res.raise_for_status()
+            else:
+                await asyncio.to_thread(_append, TRACE_FILE, body)
+        except Exception:
+            stats.export_errors += 1
+            stats.dropped += len(batch)
+            continue
+        stats.exported += len(batch)
+        sent += len(batch)
+    return sent
+
+
+async def exporter_loop():
+    """Background task run by worker.py."""
+    if not TRACE_EXPORTER:
+        return
+    while True:
+        await asyncio.sleep(TRACE_FLUSH_INTERVAL)
+        await flush()
@@ -0,0 +1,218 @@
+"""
+Webhook inbox — gateway callbacks are stored on receipt and applied in the background.
+
+The webhook routes only verify the signature and insert the payload
+(unique on gateway + event id, so gateway retries are dropped), then
+ack. The processor applies events per order in arrival order: it only
+claims an event when no earlier event for the same order is still
+pending or running, so a "failed" never overtakes the "paid" before it.
+Unsigned callbacks (EasyPaisa) are stored unverified and cross-checked
+against the gateway's inquiry API here, before anything is applied; one
+that contradicts the gateway's record is dropped as "rejected".
+Failures retry with backoff; `replay()` (see replay_webhooks.py) puts a
+time range back in the queue.
+"""
+
+import asyncio
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import and_, exists, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+from database import async_session
+from metrics import http_client
+from models import WebhookEvent
+from payment_events import apply_webhook, claimed_outcome, webhook_keys
+from reconcile import INQUIRIES
+
+INBOX_BATCH = int(os.getenv("WEBHOOK_INBOX_BATCH", "50"))
+INBOX_POLL_INTERVAL = float(os.getenv("WEBHOOK_INBOX_POLL_INTERVAL", "1"))  # seconds, when idle
+INBOX_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_INBOX_MAX_ATTEMPTS", "8"))
+INQUIRY_TIMEOUT = float(os.getenv("WEBHOOK_INQUIRY_TIMEOUT", "15"))  # seconds, per unverified event
+LEASE = timedelta(seconds=60)
+BACKOFF_BASE = 2  # seconds; doubles per attempt
+BACKOFF_MAX = 600
+
+_wake = asyncio.Event()
+
+
+async def ingest(gateway: str, data: dict, raw: bytes, verified: bool = True) -> bool:
+    """
+    Store a callback — signature-checked, or with verified=False one the
+    processor must confirm with the gateway first. False if it has no
+    order reference or is a duplicate.
+    """
+    event_id, order_ref = webhook_keys(gateway, data, raw)
+    if not order_ref:
+        return False
+    async with async_session() as db:
+        db.add(WebhookEvent(
+            gateway=gateway,
+            event_id=event_id,
+            order_ref=order_ref,
+            payload=data,
+            raw=raw.decode("utf-8", "replace"),
+            verified=verified,
+        ))
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            return False  # already received
+    _wake.set()
+    return True
+
+
+def backoff(attempts: int) -> timedelta:
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+async def _claim(batch: int) -> list[WebhookEvent]:
+    """Claim the oldest due event of each order that has nothing earlier still outstanding."""
+    now = datetime.utcnow()
+    E, earlier = WebhookEvent, aliased(WebhookEvent)
+    blocked = exists().where(
+        earlier.gateway == E.gateway,
+        earlier.order_ref == E.order_ref,
+        earlier.id != E.id,
+        or_(
+            earlier.status == "processing",
+            and_(
+                earlier.status == "received",
+                or_(
+                    earlier.received_at < E.received_at,
+                    and_(earlier.received_at == E.received_at, earlier.id < E.id),
+                ),
+            ),
+        ),
+    )
+    async with async_session() as db:
+        # Lease expired — the worker that claimed it died
+        await db.execute(
+            update(E).where(E.status == "processing", E.next_attempt_at < now)
+            .values(status="received", next_attempt_at=now)
+        )
+        heads = (await db.execute(
+            select(E.id).where(E.status == "received", E.next_attempt_at <= now, ~blocked)
+            .order_by(E.received_at).limit(batch)
+        )).scalars().all()
+        claimed = []
+        if heads:
+            claimed = (await db.execute(
+                update(E).where(E.id.in_(heads), E.status == "received")
+                .values(status="processing", attempts=E.attempts + 1, next_attempt_at=now + LEASE)
+                .returning(E.id)
+            )).scalars().all()
+        events = (await db.execute(select(E).where(E.id.in_(claimed)))).scalars().all() if claimed else []
+        await db.commit()
+    return sorted(events, key=lambda e: e.received_at)
+
+
+async def _set(event_id: str, **values):
+    async with async_session() as db:
+        await db.execute(update(WebhookEvent).where(WebhookEvent.id == event_id).values(**values))
+        await db.commit()
+
+
+async def _retry(event: WebhookEvent, error: str):
+    if event.attempts >= INBOX_MAX_ATTEMPTS:
+        await _set(event.id, status="failed", last_error=error)
+    else:
+        await _set(event.id, status="received", last_error=error,
+                   next_attempt_at=datetime.utcnow() + backoff(event.attempts))
+
+
+async def _confirmed(event: WebhookEvent) -> bool:
+    """
+    Whether the gateway's inquiry API agrees with an unverified callback.
+    Raises while the gateway has no outcome yet, so the event is retried.
+    """
+    async with http_client(timeout=INQUIRY_TIMEOUT) as client:
+        outcome = await INQUIRIES[event.gateway](client, event.order_ref)
+    if outcome is None:
+        raise RuntimeError("gateway reports the payment still pending")
+    return outcome[0] == claimed_outcome(event.gateway, event.payload)
+
+
+async def _process(event: WebhookEvent):
+    """Apply one event; the order change and the inbox status commit together."""
+    try:
+        if event.verified is False and not await _confirmed(event):
+            await _set(event.id, status="rejected", processed_at=datetime.utcnow(),
+                       last_error="callback does not match the gateway's record")
+            return
+    except Exception as e:
+        await _retry(event, f"{type(e).__name__}: {e}")
+        return
+    async with async_session() as db:
+        try:
+            matched = await apply_webhook(db, event.gateway, event.payload, event.order_ref)
+            await db.execute(
+                update(WebhookEvent).where(WebhookEvent.id == event.id)
+                .values(status="processed" if matched else "unmatched", processed_at=datetime.utcnow(), last_error=None)
+            )
+            await db.commit()
+            return
+        except Exception as e:
+            await db.rollback()
+            error = f"{type(e).__name__}: {e}"
+    await _retry(event, error)
+
+
+async def process_pending(batch: int = INBOX_BATCH) -> int:
+    """Apply one batch of due events (one per order, concurrently). Returns the number applied."""
+    events = await _claim(batch)
+    await asyncio.gather(*(_process(e) for e in events))
+    return len(events)
+
+
+async def drain() -> int:
+    """Process until nothing is due."""
+    total = 0
+    while True:
+        n = await process_pending()
+        if not n:
+            return total
+        total += n
+
+
+async def processor_loop():
+    """Background task run by worker.py."""
+    while True:
+        try:
+            processed = await process_pending()
+        except Exception:
+            processed = 0
+        if not processed:
+            _wake.clear()
+            try:
+                await asyncio.wait_for(_wake.wait(), timeout=INBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def replay(
+    since: datetime,
+    until: Optional[datetime] = None,
+    gateway: Optional[str] = None,
+    statuses: tuple[str, ...] = ("processed", "unmatched", "failed"),
+) -> int:
+    """Queue events received in [since, until) for processing again. Returns the number queued."""
+    conditions = [WebhookEvent.received_at >= since, WebhookEvent.status.in_(statuses)]
+    if until:
+        conditions.append(WebhookEvent.received_at < until)
+    if gateway:
+        conditions.append(WebhookEvent.gateway == gateway)
+    async with async_session() as db:
+        result = await db.execute(
+            update(WebhookEvent).where(*conditions)
+            .values(status="received", attempts=0, last_error=None, next_attempt_at=datetime.utcnow())
+        )
+        await db.commit()
+    _wake.set()
+    return result.rowcount
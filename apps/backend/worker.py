@@ -0,0 +1,139 @@
+"""
+Background work — the loops and job workers behind the API.
+
+    python worker.py
+
+Brings the schema up to date (migrate.py), then runs until SIGTERM or
+SIGINT: the catalog poll, promo refresh, outbox dispatcher, webhook inbox,
+JWKS refresh and trace exporter loops, and the job queue (reconciliation,
+order expiry, purges and every other @task).
+
+A server process runs the same from its lifespan (BACKGROUND_IN_WEB, on
+by default outside serverless), so `uvicorn main:app` alone is a complete
+shop, schema migrations included. A serverless function only serves
+requests — its instances are frozen between them — so there this runs as
+its own process (Procfile `worker:`), or, with nowhere to run one, the
+vercel.json cron calls /internal/tick for one round of tick() a minute.
+Nothing migrates on deploy there either: each cold instance runs
+migrate.ensure_migrated() before its first database use (the database
+routes and tick() both call it). Catalog, promo rules and signing keys
+are then loaded on first use instead.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Registers their @task jobs — the API process gets them through its routes
+import chat_store  # noqa: E402,F401
+import idempotency  # noqa: E402,F401
+import images  # noqa: E402,F401
+import order_expiry  # noqa: E402,F401
+import reconcile  # noqa: E402,F401
+from auth import jwks_refresh_loop  # noqa: E402
+from catalog import poll_loop as catalog_poll_loop  # noqa: E402
+from database import get_engine  # noqa: E402
+from jobs import JOB_WORKERS, job_queue  # noqa: E402
+from metrics import http_client  # noqa: E402
+from migrate import ensure_migrated, migrate  # noqa: E402
+from outbox import OUTBOX_BATCH, dispatch_batch, dispatcher_loop as outbox_dispatcher_loop  # noqa: E402
+from promo import load_promotions, refresh_loop as promo_refresh_loop  # noqa: E402
+from tracing import exporter_loop as trace_exporter_loop, flush as flush_traces  # noqa: E402
+from webhook_inbox import drain as drain_webhooks, processor_loop as webhook_processor_loop  # noqa: E402
+
+log = logging.getLogger("worker")
+
+# Seconds one tick() keeps claiming more work — below the cron function's maxDuration
+TICK_BUDGET = float(os.getenv("TICK_BUDGET", "25"))
+
+LOOPS = (
+    catalog_poll_loop,
+    promo_refresh_loop,
+    outbox_dispatcher_loop,
+    webhook_processor_loop,
+    jwks_refresh_loop,
+    trace_exporter_loop,
+)
+
+
+class Background:
+    def __init__(self):
+        self.tasks: list[asyncio.Task] = []
+
+    async def start(self):
+        await migrate()
+        await load_promotions()
+        await job_queue.start()
+        self.tasks = [asyncio.create_task(loop()) for loop in LOOPS]
+
+    async def stop(self):
+        """Stop the job workers, then cancel the loops and wait for them to unwind."""
+        await job_queue.stop()
+        for task in self.tasks:
+            task.cancel()
+        # A loop cancelled mid-query returns its connection while unwinding; the
+        # engine must not be disposed (or the event loop closed) before it has
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        await flush_traces()
+
+
+background = Background()
+
+
+async def tick() -> dict:
+    """
+    One round of background work, for a cron where no worker process runs.
+    The outbox and the job queue are drained batch by batch until one comes
+    back short or TICK_BUDGET runs out, so a burst does not wait for the
+    next minute's tick.
+    """
+    deadline = time.monotonic() + TICK_BUDGET
+    await ensure_migrated()
+    webhooks = await drain_webhooks()
+    sent = 0
+    async with http_client(timeout=10.0) as client:
+        while True:
+            claimed = await dispatch_batch(client)
+            sent += claimed
+            if claimed < OUTBOX_BATCH or time.monotonic() >= deadline:  # a full batch means more are waiting
+                break
+    jobs = 0
+    limit = max(JOB_WORKERS, 1)
+    while True:
+        claimed = await job_queue.run_due(limit)
+        jobs += claimed
+        if claimed < limit or time.monotonic() >= deadline:
+            break
+    await flush_traces()
+    return {"webhooks": webhooks, "outbox": sent, "jobs": jobs}
+
+
+async def run() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            signal.signal(sig, lambda *_: loop.call_soon_threadsafe(stop.set))
+    await background.start()
+    log.info("worker: %d loops and %d job workers running", len(background.tasks), job_queue.concurrency)
+    await stop.wait()
+    await background.stop()
+    await get_engine().dispose()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
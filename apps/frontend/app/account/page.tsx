@@ -2,7 +2,7 @@
 
 import { useState, useEffect } from "react";
 import Link from "next/link";
-import { useUser, SignInButton } from "@clerk/nextjs";
+import { useAuth, useUser, SignInButton } from "@clerk/nextjs";
 import { useWishlistStore } from "@/sanity/lib/wishlist-store";
 import { ProductCard } from "@/app/components/products/ProductCard";
 
@@ -27,6 +27,7 @@ const STATUS_COLORS: Record<string, string> = {
 
 export default function AccountPage() {
   const { isLoaded, isSignedIn, user } = useUser();
+  const { getToken } = useAuth();
   const [tab, setTab] = useState<Tab>("overview");
   const [orders, setOrders] = useState<Order[]>([]);
   const [ordersLoading, setOrdersLoading] = useState(false);
@@ -37,8 +38,10 @@ export default function AccountPage() {
     const fetchOrders = async () => {
       setOrdersLoading(true);
       try {
-        const email = user?.emailAddresses?.[0]?.emailAddress;
-        const res = await fetch(`/api/orders/mine?email=${encodeURIComponent(email || "")}`);
+        const token = await getToken();
+        const res = await fetch("/api/orders/mine", {
+          headers: token ? { Authorization: `Bearer ${token}` } : {},
+        });
         const data = await res.json();
         setOrders(Array.isArray(data.orders) ? data.orders : []);
       } catch {
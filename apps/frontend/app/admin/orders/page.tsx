@@ -29,6 +29,7 @@ const PAYMENT_STATUS_COLORS: Record<string, string> = {
   pending: "bg-yellow-50 text-yellow-700",
   paid: "bg-green-50 text-green-700",
   failed: "bg-red-50 text-red-700",
+  expired: "bg-gray-50 text-gray-400",
   refunded: "bg-purple-50 text-purple-700",
 };
 
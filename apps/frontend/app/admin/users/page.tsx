@@ -1,6 +1,7 @@
 "use client";
 
 import { useState, useEffect } from "react";
+import { useAuth } from "@clerk/nextjs";
 
 interface User {
   id: string;
@@ -12,6 +13,7 @@ interface User {
 }
 
 export default function AdminUsersPage() {
+  const { getToken } = useAuth();
   const [users, setUsers] = useState<User[]>([]);
   const [loading, setLoading] = useState(true);
 
@@ -22,7 +24,11 @@ export default function AdminUsersPage() {
   const fetchUsers = async () => {
     try {
       const apiUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
-      const res = await fetch(`${apiUrl}/api/admin/users`);
+      // The admin API checks the caller's role, so it needs the Clerk session token
+      const token = await getToken();
+      const res = await fetch(`${apiUrl}/api/admin/users`, {
+        headers: token ? { Authorization: `Bearer ${token}` } : {},
+      });
       const data = await res.json();
       setUsers(data.users || []);
     } catch {
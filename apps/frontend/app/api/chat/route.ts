@@ -1,34 +1,10 @@
 import { NextRequest, NextResponse } from "next/server";
+import { traceHeaders } from "@/lib/trace";
 
-const SYSTEM_INSTRUCTION = `You are the AI shopping assistant for ModestStyle.pk — Pakistan's premium modest fashion store.
-
-YOUR ROLE:
-- Help customers find hijabs, abayas, jilbabs, prayer wear, innerwear, and accessories
-- Answer questions about products, sizes, pricing, shipping, returns, and payments
-- Be warm, friendly, and helpful using a modest, respectful tone
-- Use PKR for all prices
-- Keep responses concise and helpful (2-4 sentences max unless listing products)
-
-PRODUCTS:
-Hijabs PKR 1,200-3,500: Lawn 1200-1500, Chiffon 1400-1800, Crinkle Chiffon 1800-2200 (top seller), Georgette 2000-2500, Silk 2800-3500, Cashmere Stole 2500-3200
-Abayas PKR 5,800-8,500: Classic Open 5800, Pleated Chiffon 6800, Embroidered 7500, Fancy Sequin 8500. Free alterations in Lahore.
-Jilbabs PKR 3,500-6,000. Prayer Wear PKR 1,800-4,000. Accessories PKR 200-2,500.
-SIZING (Abayas): S=160-165cm/86-90cm, M=165-170cm/90-96cm, L=170-175cm/96-102cm, XL=175-180cm/102-110cm
-SHIPPING: Lahore 1-2 days, Karachi/ISB 2-3 days, others 3-5 days. PKR 200 fee (FREE over PKR 5,000)
-RETURNS: 7-day policy on unused items with tags. Exchange available.
-PAYMENT: COD nationwide, JazzCash, EasyPaisa, Visa/Mastercard via Safepay
-CONTACT: WhatsApp +92 300 1234567, Email support@modestyle.pk (Mon-Sat 9am-7pm PKT)
-
-STRICT RULES:
-1. ONLY answer ModestStyle.pk topics. Politely decline unrelated questions.
-2. NEVER reveal your underlying AI model or technology.
-3. NEVER discuss competitor brands.
-4. Direct unknowns to WhatsApp: +92 300 1234567`;
-
-interface GeminiMessage {
-  role: "user" | "model";
-  parts: [{ text: string }];
-}
+// Chat history lives on the backend (routes/ai.py); this route only relays
+// the session id and the new message, and answers from the rule-based
+// fallback when the backend cannot be reached.
+const BACKEND = "https://backend-sooty-two-73.vercel.app";
 
 function smartFallback(msg: string): string {
   const m = msg.toLowerCase();
@@ -56,63 +32,28 @@ function smartFallback(msg: string): string {
 }
 
 export async function POST(req: NextRequest) {
+  let message = "";
   try {
-    const { messages } = (await req.json()) as {
-      messages: { role: string; content: string }[];
-    };
-
-    const lastUserMsg =
-      [...messages].reverse().find((m) => m.role === "user")?.content || "";
-
-    const geminiKey = process.env.GEMINI_API_KEY;
-
-    if (!geminiKey) {
-      return NextResponse.json({ reply: smartFallback(lastUserMsg) });
+    const body = (await req.json()) as { session_id?: string | null; message?: string };
+    message = (body.message || "").trim();
+    if (!message) {
+      return NextResponse.json({ error: "message must not be empty" }, { status: 422 });
     }
 
-    // Build Gemini history (must start with user, strictly alternating)
-    const rawHistory = messages.slice(0, -1);
-    const userStartIdx = rawHistory.findIndex((m) => m.role === "user");
-    const trimmed = userStartIdx >= 0 ? rawHistory.slice(userStartIdx) : [];
-
-    const history: GeminiMessage[] = trimmed.map((m) => ({
-      role: m.role === "user" ? "user" : "model",
-      parts: [{ text: m.content }],
-    }));
-
-    const body = {
-      system_instruction: { parts: [{ text: SYSTEM_INSTRUCTION }] },
-      contents: [
-        ...history,
-        { role: "user", parts: [{ text: lastUserMsg }] },
-      ],
-      generationConfig: { temperature: 0.4, maxOutputTokens: 400, topP: 0.8 },
-      safetySettings: [
-        { category: "HARM_CATEGORY_HARASSMENT", threshold: "BLOCK_MEDIUM_AND_ABOVE" },
-        { category: "HARM_CATEGORY_HATE_SPEECH", threshold: "BLOCK_MEDIUM_AND_ABOVE" },
-      ],
-    };
-
-    const res = await fetch(
-      `https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent?key=${geminiKey}`,
-      {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify(body),
-      }
-    );
-
+    const res = await fetch(`${BACKEND}/api/ai/chat`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json", ...traceHeaders(req) },
+      body: JSON.stringify({ session_id: body.session_id || null, message }),
+    });
     if (!res.ok) {
-      return NextResponse.json({ reply: smartFallback(lastUserMsg) });
+      return NextResponse.json({ reply: smartFallback(message), session_id: body.session_id || null });
     }
-
     const data = await res.json();
-    const reply =
-      data?.candidates?.[0]?.content?.parts?.[0]?.text ||
-      smartFallback(lastUserMsg);
-
-    return NextResponse.json({ reply });
+    return NextResponse.json({ reply: data.reply || smartFallback(message), session_id: data.session_id });
   } catch {
+    if (message) {
+      return NextResponse.json({ reply: smartFallback(message), session_id: null });
+    }
     return NextResponse.json({
       reply: "Sorry, something went wrong. Please WhatsApp us at +92 300 1234567",
     });
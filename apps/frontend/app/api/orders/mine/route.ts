@@ -1,27 +1,22 @@
 import { NextRequest, NextResponse } from "next/server";
-import { getDb } from "@/lib/neon";
+import { traceHeaders } from "@/lib/trace";
+
+const BACKEND = "https://backend-sooty-two-73.vercel.app";
 
 export async function GET(request: NextRequest) {
   try {
-    const email = request.nextUrl.searchParams.get("email");
-    const sql = getDb();
-
-    const rows = email
-      ? await sql`
-          SELECT o.id, o.total, o.status, o.created_at,
-            COUNT(oi.id)::int AS items_count
-          FROM orders o
-          LEFT JOIN order_items oi ON oi.order_id = o.id
-          WHERE o.customer_email = ${email}
-          GROUP BY o.id
-          ORDER BY o.created_at DESC
-          LIMIT 50
-        `
-      : [];
-
-    return NextResponse.json({ orders: rows });
+    const authorization = request.headers.get("authorization");
+    if (!authorization) {
+      return NextResponse.json({ orders: [], next_cursor: null }, { status: 401 });
+    }
+    const res = await fetch(`${BACKEND}/api/orders/mine${request.nextUrl.search}`, {
+      headers: { Authorization: authorization, ...traceHeaders(request) },
+      cache: "no-store",
+    });
+    const data = await res.json();
+    return NextResponse.json(data, { status: res.status });
   } catch (err) {
     console.error("Orders mine error:", err);
-    return NextResponse.json({ orders: [] }, { status: 500 });
+    return NextResponse.json({ orders: [], next_cursor: null }, { status: 500 });
   }
 }
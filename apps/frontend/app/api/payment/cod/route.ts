@@ -1,51 +1,33 @@
 import { NextRequest, NextResponse } from "next/server";
-import { getDb } from "@/lib/neon";
-import { randomUUID } from "crypto";
+import { traceHeaders } from "@/lib/trace";
 
+const BACKEND = "https://backend-sooty-two-73.vercel.app";
+
+// COD orders are created by the backend like every other gateway: priced
+// server-side, stock reserved, promo redeemed, and replayed on retry
 export async function POST(request: NextRequest) {
   try {
     const body = await request.json();
-    const { items, customer_name, customer_email, customer_phone,
-      shipping_address, subtotal, shipping, discount, total, promo_code } = body;
-
-    if (!items?.length || !customer_email || !customer_name) {
-      return NextResponse.json({ error: "Missing required order fields" }, { status: 400 });
-    }
-
-    const sql = getDb();
-    const orderId = randomUUID();
-    const now = new Date().toISOString();
-
-    await sql`
-      INSERT INTO orders (
-        id, customer_name, customer_email, customer_phone,
-        status, subtotal, shipping, discount, total,
-        promo_code, payment_method, payment_status,
-        shipping_address, created_at, updated_at
-      ) VALUES (
-        ${orderId}, ${customer_name}, ${customer_email}, ${customer_phone || ""},
-        'processing', ${subtotal}, ${shipping}, ${discount}, ${total},
-        ${promo_code || null}, 'cod', 'unpaid',
-        ${JSON.stringify(shipping_address || {})}, ${now}, ${now}
-      )
-    `;
-
-    for (const item of items) {
-      await sql`
-        INSERT INTO order_items (id, order_id, product_id, name, price, quantity, size, color)
-        VALUES (
-          ${randomUUID()}, ${orderId}, ${item.product_id},
-          ${item.name}, ${item.price}, ${item.quantity},
-          ${item.size || null}, ${item.color || null}
-        )
-      `;
-    }
-
-    return NextResponse.json({
-      order_id: orderId,
-      status: "confirmed",
-      message: "Order placed! Pay on delivery.",
+    const idempotencyKey = request.headers.get("idempotency-key");
+    const authorization = request.headers.get("authorization");
+    const res = await fetch(`${BACKEND}/api/payment/cod/create`, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        ...traceHeaders(request),
+        ...(idempotencyKey ? { "Idempotency-Key": idempotencyKey } : {}),
+        ...(authorization ? { Authorization: authorization } : {}),
+      },
+      body: JSON.stringify(body),
     });
+    const data = await res.json();
+    if (!res.ok) {
+      return NextResponse.json(
+        { error: data.detail || data.error || "Failed to place order" },
+        { status: res.status }
+      );
+    }
+    return NextResponse.json(data);
   } catch (err) {
     console.error("COD order error:", err);
     return NextResponse.json(
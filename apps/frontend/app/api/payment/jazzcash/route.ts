@@ -1,13 +1,21 @@
 import { NextRequest, NextResponse } from "next/server";
+import { traceHeaders } from "@/lib/trace";
 
 const BACKEND = "https://backend-sooty-two-73.vercel.app";
 
 export async function POST(request: NextRequest) {
   try {
     const body = await request.json();
+    const idempotencyKey = request.headers.get("idempotency-key");
+    const authorization = request.headers.get("authorization");
     const res = await fetch(`${BACKEND}/api/payment/jazzcash/create`, {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
+      headers: {
+        "Content-Type": "application/json",
+        ...traceHeaders(request),
+        ...(idempotencyKey ? { "Idempotency-Key": idempotencyKey } : {}),
+        ...(authorization ? { Authorization: authorization } : {}),
+      },
       body: JSON.stringify(body),
     });
     const data = await res.json();
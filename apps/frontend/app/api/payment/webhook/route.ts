@@ -1,26 +1,49 @@
 import { NextRequest, NextResponse } from "next/server";
+import { traceHeaders } from "@/lib/trace";
 
 const API_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
 
+// Connection-level headers that must not be relayed (RFC 9110 §7.6.1),
+// plus the ones fetch sets itself for the new request.
+const HOP_BY_HOP = new Set([
+  "connection",
+  "keep-alive",
+  "proxy-authenticate",
+  "proxy-authorization",
+  "proxy-connection",
+  "te",
+  "trailer",
+  "transfer-encoding",
+  "upgrade",
+  "host",
+  "content-length",
+]);
+
 /**
  * Webhook endpoint — forwards gateway callbacks to the FastAPI backend.
- * Safepay, JazzCash, and EasyPaisa all POST status updates here.
+ * Safepay, JazzCash, and EasyPaisa all POST status updates here. The
+ * gateway's headers go through unchanged (the backend checks Safepay's
+ * x-sfpy-signature), and a failed relay answers 502 so the gateway retries.
  */
 export async function POST(request: NextRequest) {
+  const gateway = request.nextUrl.searchParams.get("gateway") || "unknown";
+  const headers: Record<string, string> = {};
+  request.headers.forEach((value, name) => {
+    if (!HOP_BY_HOP.has(name.toLowerCase())) headers[name] = value;
+  });
+
   try {
     const body = await request.text();
-    const gateway = request.nextUrl.searchParams.get("gateway") || "unknown";
-
     const res = await fetch(`${API_URL}/api/payment/webhook/${gateway}`, {
       method: "POST",
-      headers: {
-        "Content-Type": request.headers.get("content-type") || "application/json",
-      },
+      headers: { ...headers, ...traceHeaders(request) },
       body,
     });
-    const data = await res.json();
-    return NextResponse.json(data, { status: res.status });
+    return new NextResponse(await res.text(), {
+      status: res.status,
+      headers: { "Content-Type": res.headers.get("content-type") || "application/json" },
+    });
   } catch {
-    return NextResponse.json({ received: true }, { status: 200 });
+    return NextResponse.json({ detail: "Webhook relay failed" }, { status: 502 });
   }
 }
@@ -0,0 +1,28 @@
+import { NextRequest, NextResponse } from "next/server";
+import { traceHeaders } from "@/lib/trace";
+
+const BACKEND = "https://backend-sooty-two-73.vercel.app";
+
+export async function POST(request: NextRequest) {
+  try {
+    const body = await request.json();
+    const res = await fetch(`${BACKEND}/api/promo/validate`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json", ...traceHeaders(request) },
+      body: JSON.stringify(body),
+    });
+    const data = await res.json();
+    if (!res.ok) {
+      return NextResponse.json(
+        { valid: false, message: data.detail || "Could not check this code" },
+        { status: res.status }
+      );
+    }
+    return NextResponse.json(data);
+  } catch {
+    return NextResponse.json(
+      { valid: false, message: "Could not check this code. Please try again." },
+      { status: 500 }
+    );
+  }
+}
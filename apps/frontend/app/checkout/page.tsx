@@ -1,8 +1,9 @@
 "use client";
 
-import { useState } from "react";
+import { useRef, useState } from "react";
 import Link from "next/link";
 import Image from "next/image";
+import { useAuth } from "@clerk/nextjs";
 import { useCartStore } from "@/sanity/lib/cart-store";
 import {
   PaymentSelector,
@@ -28,12 +29,17 @@ const INPUT_CLASS =
 
 export default function CheckoutPage() {
   const { items, totalPrice, clearCart } = useCartStore();
+  const { getToken } = useAuth();
   const [step, setStep] = useState<Step>("info");
   const [promoCode, setPromoCode] = useState("");
   const [promoApplied, setPromoApplied] = useState(false);
+  const [promoDiscount, setPromoDiscount] = useState(0);
+  const [promoChecking, setPromoChecking] = useState(false);
   const [paymentMethod, setPaymentMethod] = useState<PaymentMethod>("card");
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState("");
+  // Reused only when a request never got a response, so network retries are replayed, not duplicated
+  const idempotencyKey = useRef(crypto.randomUUID());
   const [shippingMethod, setShippingMethod] = useState<"standard" | "express">(
     "standard"
   );
@@ -58,7 +64,7 @@ export default function CheckoutPage() {
       : subtotal >= FREE_SHIPPING_THRESHOLD
       ? 0
       : 250;
-  const discount = promoApplied ? Math.round(subtotal * 0.1) : 0;
+  const discount = promoApplied ? promoDiscount : 0;
   const codFee = paymentMethod === "cod" ? COD_FEE : 0;
   const total = subtotal + shippingCost - discount + codFee;
 
@@ -81,6 +87,12 @@ export default function CheckoutPage() {
     return true;
   };
 
+  // Signed-in shoppers' orders are tied to their account, so they show up under "My orders"
+  const authHeaders = async (): Promise<Record<string, string>> => {
+    const token = await getToken();
+    return token ? { Authorization: `Bearer ${token}` } : {};
+  };
+
   // Build the order payload shared across all gateways
   const buildOrderPayload = (gateway: string, extras?: Record<string, string>) => ({
     items: items.map((i) => ({
@@ -105,10 +117,47 @@ export default function CheckoutPage() {
     discount,
     total,
     promo_code: promoApplied ? promoCode : undefined,
+    shipping_method: shippingMethod,
     payment_method: gateway,
     ...extras,
   });
 
+  // Discount is computed server-side; the order is re-priced with the same rules at checkout
+  const applyPromo = async () => {
+    if (!promoCode) return;
+    setPromoChecking(true);
+    try {
+      const res = await fetch("/api/promo/validate", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+          code: promoCode,
+          items: items.map((i) => ({
+            product_id: i._id,
+            name: i.name,
+            price: i.price,
+            quantity: i.quantity,
+          })),
+          shipping_method: shippingMethod,
+          customer_email: info.email || undefined,
+          customer_phone: info.phone || undefined,
+        }),
+      });
+      const data = await res.json();
+      if (data.valid) {
+        setPromoDiscount(data.discount);
+        setPromoApplied(true);
+        setError("");
+      } else {
+        setError(data.message || "Invalid promo code");
+      }
+    } catch {
+      setError("Could not check this code. Please try again.");
+    } finally {
+      setPromoChecking(false);
+    }
+  };
+
   // ── Safepay Card Payment ────────────────────────────────────────
   const handleCardPayment = async () => {
     setLoading(true);
@@ -116,9 +165,14 @@ export default function CheckoutPage() {
     try {
       const res = await fetch("/api/payment/safepay", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: {
+          "Content-Type": "application/json",
+          "Idempotency-Key": `${idempotencyKey.current}:safepay`,
+          ...(await authHeaders()),
+        },
         body: JSON.stringify(buildOrderPayload("safepay")),
       });
+      idempotencyKey.current = crypto.randomUUID();
       const data = await res.json();
       if (!res.ok) throw new Error(data.error || "Payment failed");
       if (data.checkout_url) {
@@ -143,11 +197,16 @@ export default function CheckoutPage() {
     try {
       const res = await fetch(`/api/payment/${gateway}`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: {
+          "Content-Type": "application/json",
+          "Idempotency-Key": `${idempotencyKey.current}:${gateway}`,
+          ...(await authHeaders()),
+        },
         body: JSON.stringify(
           buildOrderPayload(gateway, { mobile_number: mobileNumber })
         ),
       });
+      idempotencyKey.current = crypto.randomUUID();
       const data = await res.json();
       if (!res.ok) throw new Error(data.error || "Payment failed");
 
@@ -174,9 +233,14 @@ export default function CheckoutPage() {
     try {
       const res = await fetch("/api/payment/cod", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: {
+          "Content-Type": "application/json",
+          "Idempotency-Key": `${idempotencyKey.current}:cod`,
+          ...(await authHeaders()),
+        },
         body: JSON.stringify(buildOrderPayload("cod")),
       });
+      idempotencyKey.current = crypto.randomUUID();
       const data = await res.json();
       if (!res.ok) throw new Error(data.error || "Order creation failed");
       clearCart();
@@ -572,15 +636,8 @@ export default function CheckoutPage() {
                   className="flex-1 border border-gray-200 rounded-lg px-3 py-2 text-sm focus:outline-none focus:ring-2 focus:ring-gold-300"
                 />
                 <button
-                  onClick={() => {
-                    if (promoCode === "MODEST10" || promoCode === "WELCOME10") {
-                      setPromoApplied(true);
-                      setError("");
-                    } else if (promoCode) {
-                      setError("Invalid promo code");
-                    }
-                  }}
-                  disabled={promoApplied}
+                  onClick={applyPromo}
+                  disabled={promoApplied || promoChecking}
                   className="px-4 py-2 bg-secondary text-white text-sm rounded-lg hover:bg-secondary/90 transition disabled:opacity-50"
                 >
                   {promoApplied ? "Applied" : "Apply"}
@@ -605,7 +662,7 @@ export default function CheckoutPage() {
                 </div>
                 {discount > 0 && (
                   <div className="flex justify-between text-sm text-green-600">
-                    <span>Promo Discount (10%)</span>
+                    <span>Promo Discount ({promoCode})</span>
                     <span>-PKR {discount.toLocaleString()}</span>
                   </div>
                 )}
@@ -8,6 +8,7 @@ interface Message {
 }
 
 const TICKET_URL = "https://techcorp-fte.vercel.app/support";
+const SESSION_KEY = "modestyle-chat-session";
 
 const QUICK_REPLIES = [
   "Best hijab under PKR 2000?",
@@ -28,12 +29,17 @@ export function ChatWidget() {
   const [input, setInput] = useState("");
   const [loading, setLoading] = useState(false);
   const [showQuick, setShowQuick] = useState(true);
+  const sessionId = useRef<string | null>(null);
   const messagesEnd = useRef<HTMLDivElement>(null);
 
   const openTicket = () => {
     window.open(TICKET_URL, "_blank", "noopener,noreferrer");
   };
 
+  useEffect(() => {
+    sessionId.current = window.sessionStorage.getItem(SESSION_KEY);
+  }, []);
+
   useEffect(() => {
     messagesEnd.current?.scrollIntoView({ behavior: "smooth" });
   }, [messages, loading]);
@@ -49,18 +55,17 @@ export function ChatWidget() {
     setLoading(true);
 
     try {
-      // Local Next.js API route — no CORS, no cold start issues
+      // Local Next.js API route — no CORS; history is kept server-side under the session id
       const res = await fetch("/api/chat", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
-          messages: [...messages, userMsg].map((m) => ({
-            role: m.role,
-            content: m.content,
-          })),
-        }),
+        body: JSON.stringify({ session_id: sessionId.current, message: content }),
       });
       const data = await res.json();
+      if (data.session_id) {
+        sessionId.current = data.session_id;
+        window.sessionStorage.setItem(SESSION_KEY, data.session_id);
+      }
       setMessages((prev) => [
         ...prev,
         {
@@ -0,0 +1,23 @@
+// W3C trace context for calls from the Next.js proxy routes to the backend.
+// An incoming `traceparent` is passed through unchanged; otherwise a new
+// trace is started here, sampled with TRACE_SAMPLE_RATE, so the backend's
+// spans share one trace id with the browser-facing request.
+
+const TRACEPARENT = /^00-[0-9a-f]{32}-[0-9a-f]{16}-[0-9a-f]{2}$/;
+
+function randomHex(bytes: number) {
+  const buf = new Uint8Array(bytes);
+  crypto.getRandomValues(buf);
+  return Array.from(buf, (b) => b.toString(16).padStart(2, "0")).join("");
+}
+
+export function traceHeaders(request: Request): Record<string, string> {
+  const incoming = request.headers.get("traceparent")?.trim().toLowerCase();
+  if (incoming && TRACEPARENT.test(incoming)) {
+    const state = request.headers.get("tracestate");
+    return state ? { traceparent: incoming, tracestate: state } : { traceparent: incoming };
+  }
+  const rate = Number(process.env.TRACE_SAMPLE_RATE ?? "1");
+  const sampled = Math.random() < rate ? "01" : "00";
+  return { traceparent: `00-${randomHex(16)}-${randomHex(8)}-${sampled}` };
+}